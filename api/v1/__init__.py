@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
 
-from . import messages, devices, sync
\ No newline at end of file
+from . import messages, devices, sync, jobs, threads
\ No newline at end of file
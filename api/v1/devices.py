@@ -1,9 +1,10 @@
 from flask import jsonify, request, current_app
 from marshmallow import ValidationError
 from datetime import datetime, timezone
-import secrets
 from . import api_v1
 from models import db, Device
+from models.device import generate_api_key, hash_api_key
+from services.auth import authenticated_device, rotate_api_key
 from schemas.device_schema import DeviceRegisterSchema, DeviceResponseSchema, DeviceListSchema
 
 device_register_schema = DeviceRegisterSchema()
@@ -41,15 +42,15 @@ def register_device():
         if existing_device:
             return jsonify({'error': 'Device with this ID already exists'}), 409
         
-        # Generate API key for MVP (simple approach)
-        api_key = f"dev-key-{data['id']}-{secrets.token_hex(8)}"
+        # Generate an API key; only its hash is stored
+        api_key = generate_api_key(data['id'])
         
         # Create new device
         device = Device(
             id=data['id'],
             name=data['name'],
             type=data['type'],
-            api_key=api_key,
+            api_key_hash=hash_api_key(api_key),
             is_active=True
         )
         
@@ -68,4 +69,28 @@ def register_device():
     except Exception as e:
         current_app.logger.error(f"Error registering device: {str(e)}")
         db.session.rollback()
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/devices/<device_id>/rotate-key', methods=['POST'])
+def rotate_device_key(device_id):
+    """Issue a new API key, revoking the old one; with auth on, only the device itself may"""
+    try:
+        if current_app.config['API_AUTH'] != 'off' and authenticated_device() != device_id:
+            return jsonify({'error': "Authenticate with the device's current API key"}), 403
+        
+        device = db.session.get(Device, device_id)
+        if device is None:
+            return jsonify({'error': 'Device not found'}), 404
+        
+        api_key = rotate_api_key(device)
+        
+        return jsonify({
+            'message': 'API key rotated',
+            'device_id': device.id,
+            'api_key': api_key  # Only returned this once
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error rotating API key: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
@@ -0,0 +1,16 @@
+from flask import jsonify, current_app
+from . import api_v1
+from models import db, Job
+
+@api_v1.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify(job.to_dict())
+        
+    except Exception as e:
+        current_app.logger.error(f"Error getting job {job_id}: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
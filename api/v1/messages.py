@@ -1,15 +1,41 @@
-from flask import jsonify, request, current_app
+from flask import Response, jsonify, request, current_app, stream_with_context, url_for
 from marshmallow import ValidationError
 from datetime import datetime, timezone
+from dateutil import parser
 from . import api_v1
 from models import db, Message
-from schemas.message_schema import MessageCreateSchema, MessageResponseSchema, MessageListSchema
+from models.types import isoformat_utc
+from schemas.message_schema import (
+    MessageBatchItemSchema, MessageCreateSchema, MessageResponseSchema, MessageListSchema
+)
+from services.archive import search_messages as search_live_and_archived
+from services.auth import authenticated_device
+from services.coalesce import coalesce_notification, coalescing_enabled, remember_notification
+from services.dedup import dedup_key, insert_message
+from services.export import FORMATS as EXPORT_FORMATS, export_chunk, export_stream
+from services.ingest import insert_batch
+from services.jobs import start_job
+from services.partitions import MessageFilter, count_messages, find_message, select_by_received_at
+from services.purge import run_purge
+from services.read_state import (
+    newest_sequence_id, read_client, read_state, unread_counts, update_read_state, with_read_state
+)
+from services.result_cache import cached_response
 
 message_create_schema = MessageCreateSchema()
 message_response_schema = MessageResponseSchema()
 message_list_schema = MessageListSchema()
+message_batch_schema = MessageBatchItemSchema(many=True)
+
+CREATE_OUTCOMES = {
+    'created': 'Message created successfully',
+    'coalesced': 'Message replaced an earlier notification',
+    'superseded': 'A newer version of this notification is already stored',
+    'duplicate': 'Message already exists'
+}
 
 @api_v1.route('/messages', methods=['GET'])
+@cached_response('page', 'per_page', 'device', 'type', 'unread')
 def get_messages():
     try:
         # Get query parameters
@@ -17,33 +43,35 @@ def get_messages():
         per_page = min(request.args.get('per_page', 50, type=int), 1000)
         device_filter = request.args.get('device')
         type_filter = request.args.get('type')
+        unread_only = request.args.get('unread', 'false').lower() == 'true'
         
-        # Build query
-        query = Message.query
+        # is_read and the unread filter are per client
+        state = read_state()
         
-        if device_filter:
-            query = query.filter(Message.source_device_id == device_filter)
-        if type_filter:
-            query = query.filter(Message.type == type_filter)
-            
-        # Order by received_at desc (newest first)
-        query = query.order_by(Message.received_at.desc())
-        
-        # Paginate
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        # Route the query to the hot table and any partitions it spans
+        message_filter = MessageFilter(
+            device=device_filter,
+            message_type=type_filter,
+            unread_for=state if unread_only else None
+        )
+        total = count_messages(message_filter)
+        
+        # Newest first (received_at desc), serializing straight from rows
+        rows = select_by_received_at(
+            message_filter,
+            limit=per_page,
+            offset=(max(page, 1) - 1) * per_page,
+            newest_first=True
         )
         
-        messages = [message.to_dict() for message in pagination.items]
+        messages = with_read_state([Message.serialize_row(row) for row in rows], state)
         
         return jsonify({
             'messages': messages,
-            'total': pagination.total,
+            'total': total,
             'page': page,
             'per_page': per_page,
-            'has_more': pagination.has_next
+            'has_more': max(page, 1) * per_page < total
         })
         
     except Exception as e:
@@ -52,6 +80,14 @@ def get_messages():
 
 @api_v1.route('/messages', methods=['POST'])
 def create_message():
+    """
+    Create a message
+    Posting the same client_message_id (or, without one, the same message)
+    again returns the stored message with 200 instead of creating another.
+    With COALESCE_WINDOW_SECONDS set, a re-posted notification replaces the
+    one it updates, keeping its id (200). One older than the stored
+    notification is not stored; the stored one is returned (200).
+    """
     try:
         # Validate request data
         json_data = request.get_json()
@@ -61,6 +97,11 @@ def create_message():
         # Validate against schema
         data = message_create_schema.load(json_data)
         
+        # An authenticated device only posts as itself
+        device_id = authenticated_device()
+        if device_id is not None and data['source_device_id'] != device_id:
+            return jsonify({'error': f"This API key belongs to device '{device_id}'"}), 403
+        
         # Create new message
         message = Message(
             source_device_id=data['source_device_id'],
@@ -69,17 +110,21 @@ def create_message():
             content=data['content'],
             timestamp=data['timestamp'],
             message_metadata=data.get('metadata', {}),
-            received_at=datetime.now(timezone.utc)
+            received_at=datetime.now(timezone.utc),
+            dedup_key=dedup_key(data)
         )
         
-        db.session.add(message)
-        db.session.commit()
+        # A re-posted notification may replace the one it updates
+        coalescing = coalescing_enabled()
+        message, outcome = insert_message(message, coalesce_notification if coalescing else None)
+        if coalescing and outcome in ('created', 'coalesced'):
+            remember_notification(message)
         
         return jsonify({
-            'message': 'Message created successfully',
+            'message': CREATE_OUTCOMES[outcome],
             'id': message.id,
             'data': message.to_dict()
-        }), 201
+        }), 201 if outcome == 'created' else 200
         
     except ValidationError as e:
         return jsonify({'error': 'Validation error', 'details': e.messages}), 400
@@ -88,14 +133,211 @@ def create_message():
         db.session.rollback()
         return jsonify({'error': 'Internal server error'}), 500
 
+@api_v1.route('/messages/batch', methods=['POST'])
+def create_messages():
+    """
+    Create up to BATCH_MAX_MESSAGES messages in one transaction
+    A message may carry its own id; ids already stored are not inserted
+    again, so a retried batch is safe. Like a single POST, a message whose
+    client_message_id (or content) is already stored isn't stored again
+    and gets the stored message's id. Returns every id in order.
+    """
+    try:
+        json_data = request.get_json()
+        if not json_data or not isinstance(json_data.get('messages'), list):
+            return jsonify({'error': 'Expected {"messages": [...]}'}), 400
+        
+        max_messages = current_app.config['BATCH_MAX_MESSAGES']
+        if len(json_data['messages']) > max_messages:
+            return jsonify({'error': f'At most {max_messages} messages per batch'}), 413
+        
+        # Validate every message before inserting any
+        items = message_batch_schema.load(json_data['messages'])
+        
+        # An authenticated device only posts as itself
+        device_id = authenticated_device()
+        if device_id is not None and any(item['source_device_id'] != device_id for item in items):
+            return jsonify({'error': f"This API key belongs to device '{device_id}'"}), 403
+        
+        ids, created = insert_batch(items)
+        
+        return jsonify({
+            'ids': ids,
+            'created': created,
+            'existing': len(ids) - created
+        }), 200
+        
+    except ValidationError as e:
+        return jsonify({'error': 'Validation error', 'details': e.messages}), 400
+    except Exception as e:
+        current_app.logger.error(f"Error creating message batch: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/messages', methods=['DELETE'])
+def purge_messages():
+    """
+    Delete every message matching device (may contain *), type and/or before
+    (received_at, ISO 8601), including archived ones. Runs as a background
+    job in short batches; poll the returned status_url for progress.
+    """
+    try:
+        # Get query parameters
+        device_filter = request.args.get('device')
+        type_filter = request.args.get('type')
+        before_param = request.args.get('before')
+        
+        if not (device_filter or type_filter or before_param):
+            return jsonify({'error': 'At least one of device, type or before is required'}), 400
+        
+        # Parse 'before' timestamp
+        before_timestamp = None
+        if before_param:
+            try:
+                before_timestamp = parser.isoparse(before_param)
+                if before_timestamp.tzinfo is None:
+                    before_timestamp = before_timestamp.replace(tzinfo=timezone.utc)
+            except (ValueError, TypeError):
+                return jsonify({
+                    'error': 'Invalid before parameter. Use ISO 8601 format (e.g., 2024-01-01T12:00:00Z)'
+                }), 400
+        
+        job = start_job('purge', {
+            'device': device_filter,
+            'type': type_filter,
+            'before': isoformat_utc(before_timestamp) if before_timestamp else None
+        }, run_purge)
+        
+        return jsonify({
+            'message': 'Purge started',
+            'job': job.to_dict(),
+            'status_url': url_for('api_v1.get_job', job_id=job.id)
+        }), 202
+        
+    except Exception as e:
+        current_app.logger.error(f"Error starting purge: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/messages/search', methods=['GET'])
+def search_messages():
+    """
+    Search message content and sender (case-insensitive), newest first
+    Archived messages are included unless archived=false
+    """
+    try:
+        # Get query parameters
+        query_text = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', 50, type=int), 1000)
+        device_filter = request.args.get('device')
+        type_filter = request.args.get('type')
+        since_param = request.args.get('since')
+        include_archived = request.args.get('archived', 'true').lower() != 'false'
+        
+        if not query_text:
+            return jsonify({'error': 'Missing search query parameter: q'}), 400
+        
+        # Parse 'since' timestamp
+        since_timestamp = None
+        if since_param:
+            try:
+                since_timestamp = parser.isoparse(since_param)
+                if since_timestamp.tzinfo is None:
+                    since_timestamp = since_timestamp.replace(tzinfo=timezone.utc)
+            except (ValueError, TypeError):
+                return jsonify({
+                    'error': 'Invalid since parameter. Use ISO 8601 format (e.g., 2024-01-01T12:00:00Z)'
+                }), 400
+        
+        message_filter = MessageFilter(
+            device=device_filter,
+            message_type=type_filter,
+            received_after=since_timestamp,
+            text_query=query_text
+        )
+        messages, archived_count = search_live_and_archived(message_filter, limit, include_archived)
+        messages = with_read_state(messages)
+        
+        return jsonify({
+            'messages': messages,
+            'query': query_text,
+            'returned': len(messages),
+            'archived_returned': archived_count,
+            'limit': limit
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error searching messages: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/messages/export', methods=['GET'])
+def export_messages():
+    """
+    Stream messages oldest first by received_at, as NDJSON or CSV
+    One response holds at most EXPORT_CHUNK_ROWS messages (or limit); when
+    more remain, X-Export-Next is the since for the next one. gzip=true
+    compresses the body, header=false leaves out the CSV header row.
+    """
+    try:
+        # Get query parameters
+        export_format = request.args.get('format', 'ndjson')
+        since_param = request.args.get('since')
+        device_filter = request.args.get('device')
+        type_filter = request.args.get('type')
+        compress = request.args.get('gzip', 'false').lower() == 'true'
+        header = request.args.get('header', 'true').lower() != 'false'
+        max_rows = current_app.config['EXPORT_CHUNK_ROWS']
+        chunk_rows = min(request.args.get('limit', max_rows, type=int), max_rows)
+        
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"Invalid format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+        if chunk_rows < 1:
+            return jsonify({'error': 'limit must be at least 1'}), 400
+        
+        # Parse 'since' timestamp
+        since_timestamp = None
+        if since_param:
+            try:
+                since_timestamp = parser.isoparse(since_param)
+                if since_timestamp.tzinfo is None:
+                    since_timestamp = since_timestamp.replace(tzinfo=timezone.utc)
+            except (ValueError, TypeError):
+                return jsonify({
+                    'error': 'Invalid since parameter. Use ISO 8601 format (e.g., 2024-01-01T12:00:00Z)'
+                }), 400
+        
+        message_filter = MessageFilter(
+            device=device_filter,
+            message_type=type_filter,
+            received_after=since_timestamp
+        )
+        chunk_filter, next_since = export_chunk(message_filter, chunk_rows)
+        state = read_state()
+        
+        def stream():
+            try:
+                yield from export_stream(chunk_filter, state, export_format, header, compress)
+            except Exception as e:
+                # Headers are sent; the client sees the body end early
+                current_app.logger.error(f"Error exporting messages: {str(e)}")
+                raise
+        
+        headers = {'X-Export-Next': next_since} if next_since else {}
+        return Response(stream_with_context(stream()), headers=headers,
+                        content_type='application/gzip' if compress else EXPORT_FORMATS[export_format])
+        
+    except Exception as e:
+        current_app.logger.error(f"Error exporting messages: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
 @api_v1.route('/messages/<message_id>', methods=['GET'])
 def get_message(message_id):
     try:
-        message = Message.query.get(message_id)
+        message, _ = find_message(message_id)
         if not message:
             return jsonify({'error': 'Message not found'}), 404
             
-        return jsonify(message.to_dict())
+        return jsonify(with_read_state([message.to_dict()])[0])
         
     except Exception as e:
         current_app.logger.error(f"Error getting message {message_id}: {str(e)}")
@@ -103,21 +345,77 @@ def get_message(message_id):
 
 @api_v1.route('/messages/<message_id>/read', methods=['PUT'])
 def mark_message_read(message_id):
+    """Mark a message read for the requesting client (archived messages too)"""
+    return _set_read(message_id, True)
+
+@api_v1.route('/messages/<message_id>/unread', methods=['PUT'])
+def mark_message_unread(message_id):
+    """Mark a message unread again for the requesting client"""
+    return _set_read(message_id, False)
+
+def _set_read(message_id, is_read):
     try:
-        message = Message.query.get(message_id)
+        message, _ = find_message(message_id)
         if not message:
             return jsonify({'error': 'Message not found'}), 404
-            
-        message.is_read = True
-        message.updated_at = datetime.now(timezone.utc)
-        db.session.commit()
+        
+        sequence_id = message.sequence_id
+        data = message.to_dict()
+        update_read_state(read_client(), lambda state: (
+            state.mark_read(sequence_id) if is_read else state.mark_unread(sequence_id)
+        ))
         
         return jsonify({
-            'message': f'Message {message_id} marked as read',
-            'data': message.to_dict()
+            'message': f"Message {message_id} marked as {'read' if is_read else 'unread'}",
+            'data': dict(data, is_read=is_read)
         })
         
     except Exception as e:
-        current_app.logger.error(f"Error marking message {message_id} as read: {str(e)}")
+        current_app.logger.error(f"Error marking message {message_id} as {'read' if is_read else 'unread'}: {str(e)}")
         db.session.rollback()
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/messages/read-all', methods=['PUT'])
+def mark_all_read():
+    """
+    Mark every message up to up_to (a sequence_id, default the newest) read
+    for the requesting client: a watermark move, not a per-message update
+    """
+    try:
+        with db.engine.connect() as connection:
+            newest = newest_sequence_id(connection)
+        up_to = request.args.get('up_to', newest, type=int)
+        up_to = min(up_to, newest)
+        
+        state = update_read_state(read_client(), lambda state: state.mark_all_read(up_to))
+        
+        return jsonify({
+            'message': f'Messages up to {up_to} marked as read',
+            'read_state': state.to_dict()
+        })
+        
+    except Exception as e:
+        current_app.logger.error(f"Error marking all messages as read: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/read-state', methods=['GET'])
+def get_read_state():
+    """
+    The requesting client's watermark, exception counts and unread count
+    With ids=true, also the exceptions themselves, for local copies (the CLI
+    mirror); count=false skips the unread count.
+    """
+    try:
+        state = read_state()
+        result = state.to_dict()
+        if request.args.get('count', 'true').lower() != 'false':
+            result['unread_count'] = sum(unread_counts(state).values())
+        if request.args.get('ids', 'false').lower() == 'true':
+            result['read_above_ids'] = state.read_above.tolist()
+            result['unread_below_ids'] = state.unread_below.tolist()
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        current_app.logger.error(f"Error getting read state: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
@@ -1,22 +1,40 @@
 from flask import jsonify, request, current_app
 from datetime import datetime, timezone
 from dateutil import parser
-from sqlalchemy import and_
 from . import api_v1
-from models import db, Message
+from models import Message
+from models.types import isoformat_micros, isoformat_utc
+from services.hot_tail import messages_after
+from services.partitions import (
+    MessageFilter, count_messages, latest_sequence_id, latest_time, message_counts,
+    select_by_received_at, select_by_sequence
+)
+from services.read_state import read_state, unread_counts, with_read_state
+from services.result_cache import cached_response
 
 @api_v1.route('/sync/messages', methods=['GET'])
+@cached_response('since', 'since_sequence', 'limit', 'device', 'type', 'after_sequence', 'before_sequence', 'count')
 def sync_messages():
     """
     Delta sync endpoint for efficient message synchronization
-    Supports timestamp-based sync with deduplication
+    Supports timestamp-based sync with deduplication. To page, pass the
+    previous page's last_timestamp as since and its last_sequence_id as
+    since_sequence: messages sharing that received_at continue on the next
+    page instead of being skipped. With after_sequence (and optionally
+    before_sequence, exclusive) it returns that sequence ID range in
+    sequence order instead, so a client can fetch several ranges at once.
+    count=false skips the total_count query.
     """
     try:
         # Get query parameters
         since_param = request.args.get('since')
+        since_sequence = request.args.get('since_sequence', type=int)
         limit = min(request.args.get('limit', 50, type=int), 1000)
         device_filter = request.args.get('device')
         type_filter = request.args.get('type')
+        after_sequence = request.args.get('after_sequence', type=int)
+        before_sequence = request.args.get('before_sequence', type=int)
+        with_count = request.args.get('count', 'true').lower() != 'false'
         
         # Parse 'since' timestamp
         since_timestamp = None
@@ -29,58 +47,61 @@ def sync_messages():
                 return jsonify({
                     'error': 'Invalid since parameter. Use ISO 8601 format (e.g., 2024-01-01T12:00:00Z)'
                 }), 400
-        
-        # Build query - use received_at for sync (server timestamp)
-        query = Message.query
-        
-        # Filter by timestamp (only get messages after 'since')
-        if since_timestamp:
-            query = query.filter(Message.received_at > since_timestamp)
-        
-        # Additional filters
-        if device_filter:
-            query = query.filter(Message.source_device_id == device_filter)
-        if type_filter:
-            query = query.filter(Message.type == type_filter)
-        
-        # Order by received_at (oldest first for sync)
-        query = query.order_by(Message.received_at.asc())
-        
-        # Apply limit
-        messages = query.limit(limit).all()
-        
-        # Check if there are more messages
-        has_more = len(messages) == limit
-        if has_more:
-            # Check if there are actually more beyond the limit
-            next_query = query.offset(limit).limit(1)
-            has_more = next_query.first() is not None
-        
-        # Get the last timestamp for the next sync
+        if since_sequence is not None and since_timestamp is None:
+            return jsonify({'error': 'since_sequence needs since (the last_timestamp it came with)'}), 400
+        
+        # Use received_at for sync (server timestamp), only messages after 'since';
+        # partitions entirely before 'since' are never read
+        message_filter = MessageFilter(
+            device=device_filter,
+            message_type=type_filter,
+            received_after=since_timestamp,
+            received_after_sequence=since_sequence,
+            sequence_after=after_sequence,
+            sequence_before=before_sequence
+        )
+        
+        # Clients that are nearly up to date are answered from the in-process
+        # tail, without SQL unless another worker has stored messages since
+        # (never for sequence ranges, which the tail doesn't index)
+        tail = messages_after(message_filter)
+        if tail is not None:
+            messages = tail[:limit]
+            has_more = len(tail) > limit
+            message_list = with_read_state([entry.payload for entry in messages])
+            total_count = len(tail)
+        elif after_sequence is not None:
+            # Range fetch in primary key order, one extra row tells whether there are more
+            rows = select_by_sequence(message_filter, limit=limit + 1)
+            has_more = len(rows) > limit
+            messages = rows[:limit]
+            message_list = with_read_state([Message.serialize_row(row) for row in messages])
+            total_count = count_messages(message_filter) if with_count else None
+        else:
+            # Oldest first for sync, one extra row tells whether there are more
+            rows = select_by_received_at(message_filter, limit=limit + 1)
+            has_more = len(rows) > limit
+            messages = rows[:limit]
+            
+            # Convert to dict, serializing straight from rows
+            message_list = with_read_state([Message.serialize_row(row) for row in messages])
+            
+            # Get total count for since timestamp (for informational purposes)
+            total_count = count_messages(message_filter) if with_count else None
+        
+        # Get the last timestamp and sequence ID (the cursor for the next page)
         last_timestamp = None
+        last_sequence_id = None
         if messages:
-            last_timestamp = messages[-1].received_at.isoformat()
-        
-        # Convert to dict
-        message_list = [msg.to_dict() for msg in messages]
-        
-        # Get total count for since timestamp (for informational purposes)
-        total_query = Message.query
-        if since_timestamp:
-            total_query = total_query.filter(Message.received_at > since_timestamp)
-        if device_filter:
-            total_query = total_query.filter(Message.source_device_id == device_filter)
-        if type_filter:
-            total_query = total_query.filter(Message.type == type_filter)
-        
-        total_count = total_query.count()
+            last_timestamp = isoformat_micros(messages[-1].received_at)
+            last_sequence_id = messages[-1].sequence_id
         
         # Sync response format
         response = {
             'messages': message_list,
             'has_more': has_more,
             'last_timestamp': last_timestamp,
-            'total_count': total_count,
+            'last_sequence_id': last_sequence_id,
             'sync_info': {
                 'since': since_param,
                 'limit': limit,
@@ -91,6 +112,8 @@ def sync_messages():
                 }
             }
         }
+        if with_count:
+            response['total_count'] = total_count
         
         return jsonify(response)
         
@@ -104,26 +127,26 @@ def sync_status():
     Get sync status information - latest message timestamp, total count
     """
     try:
-        # Get latest message timestamp
-        latest_message = Message.query.order_by(Message.received_at.desc()).first()
-        latest_timestamp = latest_message.received_at.isoformat() if latest_message else None
-        
-        # Get total message count
-        total_messages = Message.query.count()
+        # Get latest message timestamp and sequence ID
+        latest_timestamp = isoformat_utc(latest_time('received_at'))
+        latest_sequence = latest_sequence_id()
         
-        # Get count by device
-        device_counts = db.session.query(
-            Message.source_device_id, 
-            db.func.count(Message.id)
-        ).group_by(Message.source_device_id).all()
+        # Get total and per-device counts (sealed partitions come from the catalog)
+        device_stats = {}
+        for (device, _), count in message_counts().items():
+            device_stats[device] = device_stats.get(device, 0) + count
+        total_messages = sum(device_stats.values())
         
-        device_stats = {device: count for device, count in device_counts}
+        # Unread for the requesting client
+        unread_count = sum(unread_counts(read_state()).values())
         
         return jsonify({
             'latest_timestamp': latest_timestamp,
+            'latest_sequence_id': latest_sequence,
             'total_messages': total_messages,
+            'unread_count': unread_count,
             'device_stats': device_stats,
-            'server_time': datetime.now(timezone.utc).isoformat()
+            'server_time': isoformat_utc(datetime.now(timezone.utc))
         })
         
     except Exception as e:
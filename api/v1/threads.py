@@ -0,0 +1,77 @@
+from flask import jsonify, request, current_app
+from . import api_v1
+from models import db, Message, Thread
+from models.types import to_epoch_micros
+from services.partitions import MessageFilter, select_by_sequence
+from services.read_state import read_state, with_read_state
+from services.threads import decode_cursor, encode_cursor, list_threads, thread_unread_counts
+
+@api_v1.route('/threads', methods=['GET'])
+def get_threads():
+    """
+    List conversations by last activity, newest first
+    Keyset paginated: pass next_before from the previous page as before.
+    unread_count is for the requesting client.
+    """
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 1000)
+        device_filter = request.args.get('device')
+        before = request.args.get('before')
+        if before:
+            try:
+                before = decode_cursor(before)
+            except ValueError:
+                return jsonify({'error': 'Invalid before cursor, use next_before from the previous page'}), 400
+
+        # One extra row tells whether there are more
+        threads = list_threads(limit + 1, before=before, device=device_filter)
+        has_more = len(threads) > limit
+        threads = threads[:limit]
+        unread = thread_unread_counts(threads, read_state())
+
+        return jsonify({
+            'threads': [thread.to_dict(unread[thread.id]) for thread in threads],
+            'has_more': has_more,
+            'next_before': encode_cursor(threads[-1]) if has_more else None
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting threads: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@api_v1.route('/threads/<thread_id>/messages', methods=['GET'])
+def get_thread_messages(thread_id):
+    """
+    Get a conversation's messages, newest first by arrival
+    Keyset paginated on sequence ID: pass next_before as before. Only the
+    partitions since the thread's first message are read.
+    """
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 1000)
+        before = request.args.get('before', type=int)
+
+        thread = db.session.get(Thread, thread_id)
+        if not thread:
+            return jsonify({'error': 'Thread not found'}), 404
+
+        state = read_state()
+        message_filter = MessageFilter(
+            device=thread.source_device_id,
+            thread=thread.id,
+            received_after=to_epoch_micros(thread.first_received_at) - 1,
+            sequence_before=before
+        )
+        rows = select_by_sequence(message_filter, limit=limit + 1, newest_first=True)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        return jsonify({
+            'thread': thread.to_dict(thread_unread_counts([thread], state)[thread.id]),
+            'messages': with_read_state([Message.serialize_row(row) for row in rows], state),
+            'has_more': has_more,
+            'next_before': rows[-1].sequence_id if has_more else None
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"Error getting thread messages: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
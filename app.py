@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request, redirect, url_for
+from flask import Flask, Response, jsonify, request, redirect, url_for
 from flask_cors import CORS
 from flask_migrate import Migrate
 import os
@@ -8,6 +8,16 @@ from logging.handlers import RotatingFileHandler
 from models import db
 from api.v1 import api_v1
 from web import web
+from services.archive import archive_cli, init_archiver
+from services.auth import devices_cli, init_auth
+from services.versions import init_write_versions
+from services.replica import init_read_routing, replica_status
+from services.result_cache import result_cache_stats
+from services.metrics import init_metrics, render_metrics
+from services.query_log import init_query_log, query_log_cli
+from services.profiler import init_profiler
+from services.partitions import partitions_cli
+from services.threads import init_threads, threads_cli
 
 def create_app():
     app = Flask(__name__)
@@ -16,21 +26,50 @@ def create_app():
     # Load configuration
     app.config.from_object('config.Config')
     
+    # Request metrics (before the engines are created: they get a timed pool)
+    init_metrics(app)
+    
     # Initialize database
     db.init_app(app)
     migrate = Migrate(app, db)
+    init_write_versions()
+    init_threads()
+    init_read_routing(app)
+    init_query_log(app)
+    init_profiler(app)
+    init_auth(app)
     
     # Register blueprints
     app.register_blueprint(api_v1)
     app.register_blueprint(web)
     
+    # Register maintenance commands
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(query_log_cli)
+    app.cli.add_command(devices_cli)
+    app.cli.add_command(threads_cli)
+    
+    # Background archiver in server processes, when a retention policy is configured
+    init_archiver(app)
+    
     # Setup logging
     setup_logging(app)
     
     # Health check endpoint
     @app.route('/health')
     def health_check():
-        return jsonify({'status': 'healthy', 'service': 'message-hub'})
+        return jsonify({
+            'status': 'healthy',
+            'service': 'message-hub',
+            'replica': replica_status(),
+            'result_cache': result_cache_stats()
+        })
+    
+    # Prometheus metrics, summed over all gunicorn workers
+    @app.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
     
     # Root endpoint - redirect to web interface
     @app.route('/')
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark retention archival
+Loads a year of messages, archives everything older than 90 days into
+compressed segments and times on-demand reads of archived messages
+
+Usage: python -m benchmarks.archive --rows 500000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'archive.db')}"
+os.environ['ARCHIVE_DIR'] = os.path.join(WORKDIR, 'archive')
+os.environ['RETENTION_RULES'] = json.dumps([{'days': 90}])
+os.environ['ARCHIVER_INTERVAL'] = '0'
+os.environ.setdefault('ARCHIVER_CHUNK_PAUSE', '0')
+
+from sqlalchemy import text
+
+from app import create_app
+from models import db
+from services.archive import archive_stats, run_archiver
+from benchmarks.data import load_messages
+
+def table_bytes():
+    """Size of the messages table and its indexes"""
+    return db.session.execute(text(
+        "SELECT SUM(pgsize) FROM dbstat WHERE name = 'messages' OR name IN "
+        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages')"
+    )).scalar()
+
+def mean_ms(client, paths):
+    t0 = time.perf_counter()
+    for path in paths:
+        response = client.get(path)
+        assert response.status_code == 200, response.data
+    return (time.perf_counter() - t0) / len(paths) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000, help='Messages to load, spread over a year')
+    parser.add_argument('--lookups', type=int, default=200, help='Archived messages to fetch by ID')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    now = datetime.now(timezone.utc)
+
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Loading {args.rows} messages over 365 days into {WORKDIR}")
+        load_messages(args.rows, now)
+
+        # Give a slice of old messages pre-UUIDv7 IDs, as migrated databases have
+        db.session.execute(text(
+            "UPDATE messages SET id = :id WHERE sequence_id = :sequence_id"
+        ), [{'id': str(uuid.uuid4()), 'sequence_id': sequence_id} for sequence_id in range(1, args.rows // 4, 97)])
+        db.session.commit()
+        cutoff = datetime.now(timezone.utc) - timedelta(days=90)
+        archived_ids = [row[0] for row in db.session.execute(
+            text("SELECT id FROM messages WHERE received_at < :cutoff"), {'cutoff': int(cutoff.timestamp() * 1e6)}
+        ).all()]
+        bytes_before = table_bytes()
+
+        print("🗄️  Archiving messages older than 90 days")
+        t0 = time.perf_counter()
+        archived = run_archiver()
+        seconds = time.perf_counter() - t0
+        stats = archive_stats()
+        db.session.execute(text('VACUUM'))
+        bytes_after = table_bytes()
+
+    sample = random.sample(archived_ids, min(args.lookups, len(archived_ids)))
+    uuid7_ids = [message_id for message_id in sample if message_id[14] == '7']
+    legacy_ids = [message_id for message_id in sample if message_id[14] != '7'] or uuid7_ids
+
+    lookup_uuid7 = mean_ms(client, [f'/api/v1/messages/{message_id}' for message_id in uuid7_ids])
+    lookup_legacy = mean_ms(client, [f'/api/v1/messages/{message_id}' for message_id in legacy_ids])
+    search_recent = mean_ms(client, ['/api/v1/messages/search?q=Lorem&limit=50'] * 20)
+    search_archive = mean_ms(client, [f'/api/v1/messages/search?q=message {random.choice(range(args.rows // 2))} &limit=10' for _ in range(5)])
+
+    print()
+    print(f"   archived {archived} messages in {seconds:.1f}s ({archived / seconds:.0f} messages/s)")
+    print(f"📐 Live table + indexes: {bytes_before / 2**20:.1f} MiB -> {bytes_after / 2**20:.1f} MiB")
+    print(f"   Archive segments: {stats['compressed_bytes'] / 2**20:.1f} MiB for {stats['messages']} messages "
+          f"in {stats['blocks']} blocks ({stats['compressed_bytes'] / stats['messages']:.0f} bytes/message)")
+    print("⚡ Mean request latency (ms):")
+    print(f"   {'get archived message (UUIDv7 ID)':<40} {lookup_uuid7:>8.2f}")
+    print(f"   {'get archived message (legacy UUID4 ID)':<40} {lookup_legacy:>8.2f}")
+    print(f"   {'search, matches in live messages':<40} {search_recent:>8.2f}")
+    print(f"   {'search, one match deep in the archive':<40} {search_archive:>8.2f}")
+
+if __name__ == '__main__':
+    main()
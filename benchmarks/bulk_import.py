@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark `message-hub import` against one POST per message
+Writes an NDJSON dump of historic messages, then imports it as the CLI does
+at several batch sizes and request concurrencies, and posts a slice of it one
+message per request from a thread pool, as test_performance.py does. Every
+run inserts its messages anew.
+
+--latency adds a delay to every request, in the requesting thread, as a
+server across a network would. On one machine the server and the CLI share
+the CPUs, so without it concurrency only helps as far as there are cores.
+
+The server is gunicorn with sync workers, as in the Docker image.
+
+Usage: python -m benchmarks.bulk_import --rows 100000 --latency 0,20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'import.db')}"
+
+from app import create_app
+from models import db
+from benchmarks.data import SENDERS, TYPES
+from benchmarks.server import start_gunicorn
+from cli import main as cli_main
+from cli.importer import Checkpoint, run_import
+
+def write_dump(path, rows):
+    """An NDJSON file of rows messages, a minute apart, ending a year ago"""
+    start = datetime.now(timezone.utc) - timedelta(days=365, minutes=rows)
+    with open(path, 'w') as f:
+        for i in range(rows):
+            f.write(json.dumps({
+                'source_device_id': f'old-phone-{i % 5}', 'type': random.choice(TYPES),
+                'sender': random.choice(SENDERS), 'content': f'Historic message {i} - Lorem ipsum dolor sit amet.',
+                'timestamp': (start + timedelta(minutes=i)).isoformat(), 'metadata': {'priority': 'normal'}
+            }) + '\n')
+
+def cli_import(path, batch_size, concurrency, latency):
+    """Seconds for one import of the whole file, with a new checkpoint (so new IDs)"""
+    checkpoint = Checkpoint.open(os.path.join(WORKDIR, 'checkpoint'), path, cli_main.config.server_url, restart=True)
+
+    def send(endpoint, data):
+        time.sleep(latency / 1000)
+        return cli_main.send_request(endpoint, 'POST', data)
+
+    cli_main._session = None
+    cli_main.get_session(concurrency)
+    t0 = time.perf_counter()
+    run_import(send, path, 'ndjson', checkpoint, concurrency, max_rows=batch_size)
+    elapsed = time.perf_counter() - t0
+    checkpoint.remove()
+    return elapsed
+
+def single_posts(server_url, path, rows, threads, latency):
+    """Seconds to POST the first rows messages one per request, from threads threads"""
+    # A fresh client_message_id per run, or repeated runs would be answered as duplicates
+    run = f'{time.time_ns():x}'
+    with open(path) as f:
+        messages = [dict(json.loads(next(f)), client_message_id=f'{run}-{i}') for i in range(rows)]
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=threads))
+
+    def post(message):
+        time.sleep(latency / 1000)
+        if session.post(f'{server_url}/api/v1/messages', json=message, timeout=30).status_code != 201:
+            raise RuntimeError('POST failed')
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(post, messages))
+    return time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help='Messages in the dump')
+    parser.add_argument('--single-rows', type=int, default=5_000, help='Messages posted one per request')
+    parser.add_argument('--batch-sizes', default='100,500,1000', help='Comma-separated messages per request')
+    parser.add_argument('--concurrency', default='1,4', help='Comma-separated requests in flight')
+    parser.add_argument('--latency', default='0,20', help='Comma-separated delays per request, in ms')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    path = os.path.join(WORKDIR, 'dump.ndjson')
+    write_dump(path, args.rows)
+    print(f"📦 {args.rows} messages, {os.path.getsize(path) / 2**20:.1f} MB, in {path}")
+    cli_main.config.server_url, server = start_gunicorn(args.workers)
+    try:
+        print(f"\n{'Write path':<40}{'Latency':>10}{'Messages':>10}{'Time':>10}{'Messages/s':>12}")
+        for latency in (float(value) for value in args.latency.split(',')):
+            for threads in (5, 16):
+                elapsed = single_posts(cli_main.config.server_url, path, args.single_rows, threads, latency)
+                label = f'POST per message, {threads} threads'
+                print(f"{label:<40}{latency:>7.0f} ms{args.single_rows:>10}"
+                      f"{elapsed:>8.1f} s{args.single_rows / elapsed:>12,.0f}")
+            for concurrency in (int(value) for value in args.concurrency.split(',')):
+                for batch_size in (int(value) for value in args.batch_sizes.split(',')):
+                    elapsed = cli_import(path, batch_size, concurrency, latency)
+                    label = f'import, {batch_size} per batch, {concurrency} in flight'
+                    print(f"{label:<40}{latency:>7.0f} ms{args.rows:>10}{elapsed:>8.1f} s{args.rows / elapsed:>12,.0f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
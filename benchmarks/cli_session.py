@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark the CLI request layer
+Times the requests the multi-call commands (status, test, sync) make: a new
+connection per call (plain requests.get, as the CLI used to), the pooled
+keep-alive session, and the session with independent calls sent together
+(make_requests). Every run starts from a fresh session, as each CLI
+invocation does.
+
+The server is gunicorn in a subprocess, with gthread workers: sync workers
+close every connection, so there would be nothing to keep alive.
+--server-url measures a running server instead (e.g. one behind TLS).
+
+Usage: python -m benchmarks.cli_session --rows 20000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'cli_session.db')}"
+
+from app import create_app
+from models import db
+from benchmarks.data import load_messages
+from benchmarks.server import start_gunicorn
+from cli import main as cli_main
+
+def commands():
+    since = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    return {
+        'status': [('/health', None), ('/api/v1/sync/status', None)],
+        'test': [('/health', None), ('/api/v1/sync/status', None), ('/api/v1/messages', {'per_page': 1})],
+        'sync': [('/api/v1/sync/status', None), ('/api/v1/sync/messages', {'since': since, 'limit': 20})],
+    }
+
+def per_call(calls):
+    headers = {'X-Client-Id': cli_main.config.client_id}
+    for endpoint, params in calls:
+        requests.get(f"{cli_main.config.server_url}{endpoint}", params=params, headers=headers, timeout=10)
+
+def pooled(calls):
+    for endpoint, params in calls:
+        cli_main.make_request(endpoint, params=params)
+
+def concurrent(calls):
+    cli_main.make_requests(*calls)
+
+def median_ms(send, calls, runs):
+    timings = []
+    for _ in range(runs + 1):
+        cli_main._session = None
+        t0 = time.perf_counter()
+        send(calls)
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings = sorted(timings[1:])  # first run is a warm-up
+    return timings[len(timings) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000, help='Messages to load, spread over 30 days')
+    parser.add_argument('--runs', type=int, default=50, help='Timed runs per command and mode')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--server-url', help='Measure this running server instead of starting one')
+    args = parser.parse_args()
+
+    server = None
+    if args.server_url:
+        cli_main.config.server_url = args.server_url
+    else:
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            print(f"📦 Loading {args.rows} messages over 30 days into {WORKDIR}")
+            load_messages(args.rows, datetime.now(timezone.utc), days=30)
+        cli_main.config.server_url, server = start_gunicorn(args.workers, 'gthread')
+    try:
+        modes = [('new connection per call', per_call), ('pooled session', pooled),
+                 ('pooled + concurrent', concurrent)]
+        print(f"\n{'Command':<10}" + ''.join(f"{label:>26}" for label, _ in modes))
+        for name, calls in commands().items():
+            row = [median_ms(send, calls, args.runs) for _, send in modes]
+            print(f"{name:<10}" + ''.join(f"{value:>23.2f} ms" for value in row))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark notification coalescing on a replayed trace
+Generates a notification trace: chat apps re-posting "N new messages" per
+conversation, mixed with one-off notifications. Replays it through
+POST /api/v1/messages with coalescing off and on, with a client syncing by
+sequence ID every --sync-every posts, and reports rows and bytes stored,
+messages and bytes synced, and post latency.
+
+Usage: python -m benchmarks.coalesce --events 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'coalesce.db')}"
+
+from sqlalchemy import text
+
+from app import create_app
+from models import db
+from models.types import isoformat_micros
+
+CHAT_APPS = [('com.whatsapp', 'WhatsApp'), ('org.telegram.messenger', 'Telegram'),
+             ('com.slack', 'Slack'), ('com.google.android.gm', 'Gmail')]
+ONE_OFF_APPS = [('com.ubercab', 'Uber'), ('com.bank.app', 'Bank'), ('com.weather', 'Weather'),
+                ('com.amazon.mShop.android', 'Amazon')]
+
+def notification_trace(events, devices=5, conversations=60, chat_share=0.65, mean_gap=3.0, seed=1):
+    """Post bodies in arrival order; a conversation's count restarts after 30 quiet minutes"""
+    rng = random.Random(seed)
+    threads = [(f'phone-{rng.randrange(devices) + 1}', *rng.choice(CHAT_APPS), f'chat-{i}')
+               for i in range(conversations)]
+    weights = [1 / (rank + 1) for rank in range(conversations)]
+    counts, last_seen = {}, {}
+    now = 1_700_000_000_000_000
+    for i in range(events):
+        now += int(rng.expovariate(1 / mean_gap) * 1_000_000)
+        if rng.random() < chat_share:
+            device, package, app, tag = rng.choices(threads, weights)[0]
+            if now - last_seen.get(tag, now) > 1800 * 1_000_000:
+                counts[tag] = 0
+            counts[tag] = counts.get(tag, 0) + 1
+            last_seen[tag] = now
+            content = f'{counts[tag]} new messages'
+            metadata = {'app_package': package, 'notification_tag': tag}
+        else:
+            device, (package, app) = f'phone-{rng.randrange(devices) + 1}', rng.choice(ONE_OFF_APPS)
+            content = f'{app} update {i}'
+            metadata = {'app_package': package}
+        yield {'source_device_id': device, 'type': 'PUSH_NOTIFICATION', 'sender': app,
+               'content': content, 'timestamp': isoformat_micros(now), 'metadata': metadata}
+
+def replay(app, trace, sync_every):
+    """Replay the trace into an empty database; returns the measurements"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    synced = synced_bytes = 0
+    cursor = 0
+    post_seconds = 0.0
+
+    def sync():
+        nonlocal synced, synced_bytes, cursor
+        while True:
+            response = client.get(f'/api/v1/sync/messages?after_sequence={cursor}&limit=1000&count=false')
+            messages = response.json['messages']
+            synced += len(messages)
+            synced_bytes += len(response.data)
+            if not messages:
+                return
+            cursor = messages[-1]['sequence_id']
+
+    for i, body in enumerate(trace):
+        t0 = time.perf_counter()
+        response = client.post('/api/v1/messages', json=body)
+        post_seconds += time.perf_counter() - t0
+        assert response.status_code in (200, 201), response.data
+        if (i + 1) % sync_every == 0:
+            sync()
+    sync()
+
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+            rows = connection.execute(text('SELECT count(*) FROM messages')).scalar()
+            pages = connection.execute(text('PRAGMA page_count')).scalar()
+            free = connection.execute(text('PRAGMA freelist_count')).scalar()
+            page_size = connection.execute(text('PRAGMA page_size')).scalar()
+    return {
+        'rows': rows,
+        'bytes': (pages - free) * page_size,
+        'synced': synced,
+        'synced_bytes': synced_bytes,
+        'post_ms': post_seconds / len(trace) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=20_000, help='Notifications in the trace')
+    parser.add_argument('--window', type=float, default=600, help='COALESCE_WINDOW_SECONDS when on')
+    parser.add_argument('--sync-every', type=int, default=20, help='Posts between client syncs (~1 minute)')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    trace = list(notification_trace(args.events))
+    tagged = sum('notification_tag' in body['metadata'] for body in trace)
+    print(f"📦 {len(trace)} notifications, {tagged} of them conversation updates, in {WORKDIR}")
+
+    results = {}
+    for name, window in (('off', 0), (f'{args.window:.0f} s window', args.window)):
+        app.config['COALESCE_WINDOW_SECONDS'] = window
+        app.extensions.pop('notification_coalescing', None)
+        results[name] = replay(app, trace, args.sync_every)
+
+    (off_name, off), (on_name, on) = results.items()
+    print()
+    print(f"⚡ Coalescing off vs {on_name}, client syncing every {args.sync_every} posts:")
+    for label, key, unit in (('rows stored', 'rows', ''), ('bytes stored', 'bytes', ''),
+                             ('messages synced', 'synced', ''), ('bytes synced', 'synced_bytes', '')):
+        saved = 1 - on[key] / off[key] if off[key] else 0
+        print(f"   {label:<18}{off[key]:>14,}{on[key]:>14,}   -{saved:.0%}")
+    print(f"   {'ms per post':<18}{off['post_ms']:>14.3f}{on['post_ms']:>14.3f}")
+
+if __name__ == '__main__':
+    main()
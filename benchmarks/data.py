@@ -0,0 +1,39 @@
+"""
+Synthetic message data shared by the benchmarks
+"""
+
+import random
+from datetime import timedelta
+
+from sqlalchemy import insert
+
+from models import db, Message
+from models.ids import uuid7
+from models.types import to_epoch_micros
+
+TYPES = ['SMS', 'PUSH_NOTIFICATION', 'EMAIL', 'CALL_LOG']
+SENDERS = ['+1234567890', '+0987654321', 'WhatsApp', 'Gmail', 'Slack']
+
+def load_messages(rows, now, days=365, devices=20, batch_size=10_000):
+    """Insert messages spread evenly over the given number of days before now, in arrival order"""
+    step = timedelta(days=days) / rows
+    start = now - timedelta(days=days)
+    batch = []
+    with db.engine.begin() as connection:
+        for i in range(rows):
+            value = to_epoch_micros(start + step * i)
+            batch.append({
+                'id': uuid7(), 'source_device_id': f'device-{random.randrange(devices)}',
+                'type': random.choice(TYPES), 'sender': random.choice(SENDERS),
+                'content': f'Benchmark message {i} - Lorem ipsum dolor sit amet.',
+                'timestamp': value, 'received_at': value, 'message_metadata': {'priority': 'normal'},
+                'is_read': False, 'created_at': value, 'updated_at': value
+            })
+            if len(batch) == batch_size:
+                connection.execute(insert(Message.__table__), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(Message.__table__), batch)
+
+# Realistic datasets come from the seeding service, shared with init_db.py
+from services.seed import DEFAULT_PROFILE, load_realistic_messages, realistic_devices, realistic_rows, seed_devices
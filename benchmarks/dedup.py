@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark idempotent ingest
+Loads messages, then times POST /api/v1/messages for new messages without a
+dedup key, with a key looked up before every insert, and with the Bloom
+prefilter (the default), plus retries of stored messages. Also reports the
+prefilter's false positive rate and size.
+
+Usage: python -m benchmarks.dedup --rows 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'dedup.db')}"
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db
+from models.types import isoformat_micros
+from services.dedup import RecentKeys
+from benchmarks.data import load_messages
+
+class ProbeEveryKey(RecentKeys):
+    """Reports every key as possibly seen, so each post looks its key up first"""
+
+    def __contains__(self, key):
+        return True
+
+def post_body(i):
+    return {'source_device_id': f'device-{i % 20}', 'type': 'SMS', 'sender': 'bench',
+            'content': f'Dedup benchmark message {i}', 'timestamp': isoformat_micros(1_700_000_000_000_000 + i)}
+
+def timed_posts(client, bodies, expected):
+    """(mean ms, SQL statements per post) for posting bodies in order"""
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    with client.application.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        t0 = time.perf_counter()
+        for body in bodies:
+            response = client.post('/api/v1/messages', json=body)
+            assert response.status_code == expected, response.data
+        elapsed = time.perf_counter() - t0
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    return elapsed / len(bodies) * 1000, statements[0] / len(bodies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000, help='Messages to load first')
+    parser.add_argument('--posts', type=int, default=2000, help='Posts per measurement')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Loading {args.rows} messages into {WORKDIR}")
+        load_messages(args.rows, datetime.now(timezone.utc), days=30)
+
+    results = []
+    start = 0
+    for name, content_hash, keys in (
+        ('no dedup key', False, None),
+        ('key, looked up before insert', True, ProbeEveryKey(app.config['DEDUP_FILTER_KEYS'])),
+        ('key, Bloom prefilter', True, None),
+    ):
+        app.config['DEDUP_CONTENT_HASH'] = content_hash
+        app.extensions.pop('message_dedup', None)
+        if keys is not None:
+            app.extensions['message_dedup'] = keys
+        bodies = [post_body(i) for i in range(start, start + args.posts)]
+        start += args.posts
+        results.append((f'new, {name}', *timed_posts(client, bodies, 201)))
+    stored = bodies
+
+    # A retry in the same worker, and in a worker that has not seen the key
+    results.append(('retry, same worker', *timed_posts(client, stored, 200)))
+    other = create_app()
+    other.testing = True
+    results.append(('retry, other worker', *timed_posts(other.test_client(), stored, 200)))
+
+    print()
+    print(f"⚡ POST /api/v1/messages, {args.posts} posts each:")
+    print(f"   {'':<36}{'ms/post':>10}{'SQL/post':>10}")
+    for name, mean, statements in results:
+        print(f"   {name:<36}{mean:>10.3f}{statements:>10.2f}")
+
+    capacity = app.config['DEDUP_FILTER_KEYS']
+    keys = RecentKeys(capacity)
+    for _ in range(2 * capacity):
+        keys.add(uuid.uuid4().hex)
+    false_positives = sum(uuid.uuid4().hex in keys for _ in range(100_000))
+    print()
+    print(f"🔍 Prefilter with 2 x {capacity} keys: {false_positives / 1000:.2f}% false positives, "
+          f"{2 * len(keys.current.data) / 1024:.0f} KiB")
+
+if __name__ == '__main__':
+    main()
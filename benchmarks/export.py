@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark `message-hub export` against paging /api/v1/messages
+Exports every message with the CLI (a subprocess, writing to a file) in
+each format, and reads the same messages page by page from the list
+endpoint, the only way out before. Reports time, output size, and the peak
+memory of the CLI and of the busiest gunicorn worker after each export. The
+peaks are high-water marks, so a flat column means memory didn't grow with
+the export.
+
+The server is gunicorn with sync workers, as in the Docker image.
+
+Usage: python -m benchmarks.export --rows 1000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'export.db')}"
+
+from app import create_app
+from models import db
+from benchmarks.data import load_messages
+from benchmarks.server import start_gunicorn
+
+def peak_mb(pid):
+    """A process's peak RSS so far (VmHWM), 0 once it has exited"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return 0
+
+def worker_peak_mb(server):
+    """Highest peak RSS among the gunicorn workers (children of the master)"""
+    with open(f'/proc/{server.pid}/task/{server.pid}/children') as children:
+        return max(peak_mb(pid) for pid in children.read().split())
+
+def cli_export(server_url, options, path):
+    """(seconds, bytes written, CLI peak RSS in MB) for one CLI export"""
+    t0 = time.perf_counter()
+    cli = subprocess.Popen([sys.executable, os.path.join(ROOT, 'cli', 'main.py'), '--server', server_url, 'export',
+                            *options, '-o', path], stderr=subprocess.DEVNULL)
+    peak = 0
+    while cli.poll() is None:
+        peak = max(peak, peak_mb(cli.pid))
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    if cli.returncode:
+        raise RuntimeError(f'export {options} failed')
+    size = os.path.getsize(path)
+    os.remove(path)
+    return elapsed, size, peak
+
+def offset_paging(server_url):
+    """(seconds, messages, slowest page ms) for reading every message from the list endpoint"""
+    session = requests.Session()
+    page, count, slowest = 1, 0, 0
+    t0 = time.perf_counter()
+    while True:
+        started = time.perf_counter()
+        data = session.get(f'{server_url}/api/v1/messages', params={'page': page, 'per_page': 1000}, timeout=300).json()
+        slowest = max(slowest, (time.perf_counter() - started) * 1000)
+        count += len(data['messages'])
+        if not data['has_more']:
+            return time.perf_counter() - t0, count, slowest
+        page += 1
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Messages to load, spread over 90 days')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--skip-paging', action='store_true', help='Skip reading through the list endpoint')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Loading {args.rows} messages over 90 days into {WORKDIR}")
+        load_messages(args.rows, datetime.now(timezone.utc), days=90, devices=100)
+    server_url, server = start_gunicorn(args.workers)
+    path = os.path.join(WORKDIR, 'export.out')
+    try:
+        print(f"\n{'Export':<30}{'Time':>9}{'Rows/s':>10}{'Size':>10}{'CLI peak':>10}{'Worker peak':>13}")
+        runs = [
+            ('ndjson, 1 device', ['--device', 'device-7']),
+            ('ndjson', []),
+            ('csv', ['--format', 'csv']),
+            ('ndjson --gzip', ['--gzip']),
+            ('csv --gzip', ['--format', 'csv', '--gzip']),
+        ]
+        for label, options in runs:
+            elapsed, size, cli_peak = cli_export(server_url, options, path)
+            rows = args.rows / 100 if '--device' in options else args.rows
+            print(f"{label:<30}{elapsed:>7.1f} s{rows / elapsed:>10,.0f}{size / 2**20:>7,.0f} MB"
+                  f"{cli_peak:>7,.0f} MB{worker_peak_mb(server):>10,.0f} MB")
+        if not args.skip_paging:
+            elapsed, count, slowest = offset_paging(server_url)
+            print(f"{'list pages of 1000 (OFFSET)':<30}{elapsed:>7.1f} s{count / elapsed:>10,.0f}"
+                  f"{'':>10}{'':>10}{worker_peak_mb(server):>10,.0f} MB   slowest page {slowest:,.0f} ms")
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark `message-hub sync --full`: catching an empty mirror up
+Times a full sync into a fresh mirror with received_at pages one after
+another (what `mirror enable` did before), and with the sequence ID range
+split into K ranges fetched concurrently.
+
+--latency adds a delay to every request, in the requesting thread, as a
+server across a network would. On one machine the server and the CLI share
+the CPUs, so without it concurrency only helps as far as there are cores.
+
+The server is gunicorn with sync workers, as in the Docker image.
+
+Usage: python -m benchmarks.full_sync --rows 1000000 --workers 1,4,8 --latency 0,20
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'full_sync.db')}"
+
+from app import create_app
+from models import db
+from benchmarks.data import load_messages
+from benchmarks.server import start_gunicorn
+from cli import main as cli_main
+from cli.mirror import Mirror
+
+def full_sync(workers, latency):
+    """(seconds, messages, requests) for a full sync into a new mirror"""
+    path = os.path.join(WORKDIR, f'mirror-{workers}-{latency}.db')
+    mirror = Mirror(path)
+    requests_made = 0
+
+    def send(endpoint, params):
+        nonlocal requests_made
+        requests_made += 1
+        time.sleep(latency / 1000)
+        return cli_main.send_request(endpoint, params=params)
+
+    cli_main._session = None
+    cli_main.get_session()
+    t0 = time.perf_counter()
+    added = mirror.pull(send, cli_main.config.server_url, cli_main.config.client_id, workers=workers or None)
+    elapsed = time.perf_counter() - t0
+    mirror.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return elapsed, added, requests_made
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Messages to load, spread over 90 days')
+    parser.add_argument('--workers', default='1,4,8', help='Comma-separated range counts to compare')
+    parser.add_argument('--latency', default='0,20', help='Comma-separated delays per request, in ms')
+    parser.add_argument('--server-workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--server-url', help='Sync from this running server instead of starting one')
+    args = parser.parse_args()
+    worker_counts = [int(value) for value in args.workers.split(',')]
+    latencies = [float(value) for value in args.latency.split(',')]
+
+    server = None
+    if args.server_url:
+        cli_main.config.server_url = args.server_url
+    else:
+        app = create_app()
+        with app.app_context():
+            db.create_all()
+            print(f"📦 Loading {args.rows} messages over 90 days into {WORKDIR}")
+            load_messages(args.rows, datetime.now(timezone.utc), days=90, devices=100)
+        cli_main.config.server_url, server = start_gunicorn(args.server_workers)
+    cli_main.config.sync_workers = max(worker_counts)
+    try:
+        print(f"\n{'Fetching':<28}{'Latency':>10}{'Time':>10}{'Messages/s':>12}{'Requests':>10}")
+        for latency in latencies:
+            for workers in [0] + worker_counts:
+                label = f'{workers} sequence ranges' if workers else 'received_at pages'
+                elapsed, added, requests_made = full_sync(workers, latency)
+                print(f"{label:<28}{latency:>7.0f} ms{elapsed:>8.1f} s{added / elapsed:>12,.0f}{requests_made:>10}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark the in-process hot tail
+Loads a month of messages and times the endpoints up-to-date clients hit most,
+with the tail disabled and enabled, plus a sync right after another worker
+stored new messages
+
+Usage: python -m benchmarks.hot_tail --rows 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'hot_tail.db')}"
+
+from app import create_app
+from models import db
+from models.types import isoformat_micros
+from benchmarks.data import load_messages
+
+def mean_ms(client, path, runs=200):
+    client.get(path)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        response = client.get(path)
+        assert response.status_code == 200, response.data
+    return (time.perf_counter() - t0) / runs * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000, help='Messages to load, spread over 30 days')
+    args = parser.parse_args()
+
+    # Two workers sharing the database, as under gunicorn
+    app, writer = create_app(), create_app()
+    app.testing = writer.testing = True
+    client, writer_client = app.test_client(), writer.test_client()
+
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Loading {args.rows} messages over 30 days into {WORKDIR}")
+        load_messages(args.rows, datetime.now(timezone.utc), days=30)
+    newest = client.get('/api/v1/messages?per_page=21').json['messages']
+    paths = [
+        ('sync, 20 new messages', f"/api/v1/sync/messages?since={newest[-1]['received_at']}&limit=100"),
+        ('sync, nothing new', f"/api/v1/sync/messages?since={newest[0]['received_at']}&limit=100"),
+        ('web messages, page 1', '/messages'),
+    ]
+
+    results = {}
+    for size in (0, app.config['HOT_TAIL_SIZE']):
+        app.config['HOT_TAIL_SIZE'] = size
+        results[size] = {name: mean_ms(client, path) for name, path in paths}
+
+    # Another worker stores a message before every sync (a new timestamp each,
+    # or repeats would be answered as duplicates)
+    def post():
+        return {'source_device_id': 'device-0', 'type': 'SMS', 'sender': 'bench', 'content': 'new',
+                'timestamp': isoformat_micros(int(time.time() * 1e6))}
+    t0 = time.perf_counter()
+    for _ in range(100):
+        writer_client.post('/api/v1/messages', json=post())
+        client.get(paths[0][1])
+    interleaved = (time.perf_counter() - t0) / 100 * 1000
+    t0 = time.perf_counter()
+    for _ in range(100):
+        writer_client.post('/api/v1/messages', json=post())
+    interleaved -= (time.perf_counter() - t0) / 100 * 1000
+
+    print()
+    print(f"⚡ Mean request latency (ms), tail off vs HOT_TAIL_SIZE={size}:")
+    for name, _ in paths:
+        print(f"   {name:<34} {results[0][name]:>8.2f} {results[size][name]:>8.2f}")
+    print(f"   {'sync after another worker wrote':<34} {'':>8} {interleaved:>8.2f}")
+
+if __name__ == '__main__':
+    main()
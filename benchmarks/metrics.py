@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of request metrics
+Times a cached list request and a message post with the metrics hooks
+removed and installed, then one /metrics scrape
+
+Usage: python -m benchmarks.metrics --runs 3000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'metrics.db')}"
+
+from app import create_app
+from models import db
+from models.types import isoformat_micros
+
+def mean_ms(request, runs):
+    request()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        request()
+    return (time.perf_counter() - t0) / runs * 1000
+
+def make_client(hooks):
+    app = create_app()
+    app.testing = True
+    if not hooks:
+        for functions in (app.before_request_funcs, app.after_request_funcs, app.teardown_request_funcs):
+            functions[None] = [f for f in functions[None] if f.__module__ != 'services.metrics']
+    with app.app_context():
+        db.create_all()
+    return app.test_client()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3000, help='Requests per measurement')
+    args = parser.parse_args()
+
+    # A new timestamp per post, or repeats would be answered as duplicates
+    def post():
+        return {'source_device_id': 'device-0', 'type': 'SMS', 'sender': 'bench', 'content': 'new',
+                'timestamp': isoformat_micros(int(time.time() * 1e6))}
+    results = {}
+    for hooks in (False, True):
+        client = make_client(hooks)
+        results[hooks] = (
+            mean_ms(lambda: client.get('/api/v1/messages?device=device-1'), args.runs),
+            mean_ms(lambda: client.post('/api/v1/messages', json=post()), args.runs // 10)
+        )
+
+    t0 = time.perf_counter()
+    body = client.get('/metrics').data
+    scrape = (time.perf_counter() - t0) * 1000
+
+    print(f"⚡ Mean request latency (ms), metrics off vs on ({WORKDIR}):")
+    for index, name in enumerate(('cached list', 'post message')):
+        print(f"   {name:<16} {results[False][index]:>8.3f} {results[True][index]:>8.3f}")
+    print(f"   /metrics scrape {scrape:>8.2f} ms, {len(body.splitlines())} lines")
+
+if __name__ == '__main__':
+    main()
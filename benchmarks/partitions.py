@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark monthly message partitions
+Loads a year of messages into a fresh database, times the recent-data
+endpoints against a single messages table, seals every month outside the hot
+window and times them again
+
+Usage: python -m benchmarks.partitions --rows 1000000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'partitions.db')}"
+os.environ.setdefault('PARTITION_CATALOG_TTL', '60')
+
+from sqlalchemy import text
+
+from app import create_app
+from models import db
+from models.types import isoformat_utc
+from services.partitions import months_to_seal, seal_month
+from benchmarks.data import load_messages
+
+DAYS = 365
+
+def hot_index_bytes():
+    return db.session.execute(text(
+        "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+        "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages')"
+    )).scalar()
+
+def time_requests(client, paths, repeat):
+    """Best-of-repeat mean latency in milliseconds for each path"""
+    results = {}
+    for name, path in paths:
+        client.get(path)  # warm-up
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for _ in range(20):
+                response = client.get(path)
+            elapsed = (time.perf_counter() - t0) / 20 * 1000
+            assert response.status_code == 200, response.data
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Messages to load, spread over a year')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, best run is reported')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    now = datetime.now(timezone.utc)
+    since = isoformat_utc(now - timedelta(days=3))
+    paths = [
+        ('sync, since 3 days ago', f'/api/v1/sync/messages?since={since}&limit=100'),
+        ('sync, device filter', f'/api/v1/sync/messages?since={since}&device=device-3&limit=100'),
+        ('list, page 1', '/api/v1/messages?per_page=50'),
+        ('sync status', '/api/v1/sync/status'),
+        ('web dashboard', '/dashboard'),
+    ]
+
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Loading {args.rows} messages over {DAYS} days into {WORKDIR}")
+        load_messages(args.rows, now, days=DAYS)
+        db.session.execute(text('ANALYZE'))
+
+        before_bytes = hot_index_bytes()
+        before = time_requests(client, paths, args.repeat)
+
+        print("🧊 Sealing months outside the hot window")
+        t0 = time.perf_counter()
+        moved = sum(seal_month(start, wait_for_readers=False) for start in months_to_seal())
+        seal_seconds = time.perf_counter() - t0
+        print(f"   moved {moved} messages in {seal_seconds:.1f}s ({moved / seal_seconds:.0f} messages/s)")
+
+        after_bytes = hot_index_bytes()
+        after = time_requests(client, paths, args.repeat)
+
+    print()
+    print(f"📐 Hot table indexes: {before_bytes / 2**20:.1f} MiB -> {after_bytes / 2**20:.1f} MiB")
+    print(f"⚡ Mean request latency (ms), single table vs partitioned:")
+    for name, _ in paths:
+        print(f"   {name:<26} {before[name]:>8.2f} {after[name]:>8.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark messages primary key layouts on SQLite
+Compares the legacy random UUID4 text primary key with the integer sequence
+primary key plus time-ordered UUIDv7 external ID
+
+Usage: python -m benchmarks.pk_layout --rows 10000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.ids import uuid7
+
+COLUMNS = """
+    source_device_id VARCHAR(255) NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    sender VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    timestamp DATETIME NOT NULL,
+    received_at DATETIME NOT NULL,
+    message_metadata JSON,
+    is_read BOOLEAN,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL
+"""
+
+INDEXES = """
+    CREATE INDEX ix_messages_type ON messages (type);
+    CREATE INDEX ix_messages_timestamp ON messages (timestamp);
+    CREATE INDEX ix_messages_source_device_id ON messages (source_device_id);
+    CREATE INDEX ix_messages_received_at ON messages (received_at);
+"""
+
+LAYOUTS = {
+    'uuid4-text-pk': {
+        'schema': f"CREATE TABLE messages (id VARCHAR(36) NOT NULL, {COLUMNS}, PRIMARY KEY (id));",
+        'insert': "INSERT INTO messages (id, source_device_id, type, sender, content, timestamp, "
+                  "received_at, message_metadata, is_read, created_at, updated_at) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        'new_id': lambda: str(uuid.uuid4()),
+    },
+    'sequence-pk-uuid7': {
+        'schema': f"CREATE TABLE messages (sequence_id INTEGER NOT NULL, id VARCHAR(36) NOT NULL, "
+                  f"{COLUMNS}, PRIMARY KEY (sequence_id), UNIQUE (id));",
+        'insert': "INSERT INTO messages (id, source_device_id, type, sender, content, timestamp, "
+                  "received_at, message_metadata, is_read, created_at, updated_at) "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        'new_id': uuid7,
+    },
+}
+
+TYPES = ['SMS', 'PUSH_NOTIFICATION', 'EMAIL', 'CALL_LOG']
+SENDERS = ['+1234567890', '+0987654321', 'WhatsApp', 'Gmail', 'Slack']
+
+def generate_rows(count, new_id, start):
+    """Generate message rows arriving one millisecond apart"""
+    rows = []
+    for i in range(count):
+        ts = (start + timedelta(milliseconds=i)).strftime('%Y-%m-%d %H:%M:%S.%f')
+        rows.append((
+            new_id(), f'device-{random.randrange(20)}', random.choice(TYPES),
+            random.choice(SENDERS), f'Benchmark message {i} - Lorem ipsum dolor sit amet.',
+            ts, ts, '{}', 0, ts, ts
+        ))
+    return rows
+
+def index_sizes(connection):
+    """Return bytes used by each b-tree (table and indexes)"""
+    return dict(connection.execute(
+        "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY name"
+    ).fetchall())
+
+def run_layout(name, layout, rows, batch_size, workdir):
+    path = os.path.join(workdir, f'{name}.db')
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(layout['schema'] + INDEXES)
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    slice_size = max(rows // 10, batch_size)
+    inserted = 0
+    insert_seconds = 0.0
+    slice_rows = 0
+    slice_seconds = 0.0
+
+    while inserted < rows:
+        count = min(batch_size, rows - inserted)
+        batch = generate_rows(count, layout['new_id'], start + timedelta(milliseconds=inserted))
+
+        # Time the inserts only, not row generation
+        t0 = time.perf_counter()
+        connection.execute('BEGIN')
+        connection.executemany(layout['insert'], batch)
+        connection.execute('COMMIT')
+        elapsed = time.perf_counter() - t0
+
+        inserted += count
+        insert_seconds += elapsed
+        slice_rows += count
+        slice_seconds += elapsed
+
+        if slice_rows >= slice_size or inserted == rows:
+            print(f"  {name}: {inserted:>10} rows  {slice_rows / slice_seconds:>10.0f} rows/s (last slice)")
+            slice_rows = 0
+            slice_seconds = 0.0
+
+    sizes = index_sizes(connection)
+    connection.close()
+    return {
+        'rows': rows,
+        'seconds': insert_seconds,
+        'file_bytes': os.path.getsize(path),
+        'btree_bytes': sizes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Rows to insert per layout')
+    parser.add_argument('--batch-size', type=int, default=10_000, help='Rows per transaction')
+    parser.add_argument('--workdir', help='Directory for the benchmark databases (default: temp dir)')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='message-hub-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    print(f"📦 Inserting {args.rows} rows per layout into {workdir}")
+
+    results = {}
+    for name, layout in LAYOUTS.items():
+        results[name] = run_layout(name, layout, args.rows, args.batch_size, workdir)
+
+    print()
+    for name, result in results.items():
+        print(f"📊 {name}: {result['rows'] / result['seconds']:.0f} rows/s overall, "
+              f"file {result['file_bytes'] / 2**20:.1f} MiB")
+        for btree, size in sorted(result['btree_bytes'].items()):
+            print(f"     {btree:<40} {size / 2**20:>10.1f} MiB")
+
+if __name__ == '__main__':
+    main()
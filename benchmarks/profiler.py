@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the overhead of the stack sampling profiler
+Times requests with no sampler and with a sampler thread at the default
+and a higher rate, as a worker being profiled would serve them
+
+Usage: python -m benchmarks.profiler --runs 3000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'profiler.db')}"
+
+from app import create_app
+from models import db
+from models.types import isoformat_micros
+from services.profiler import StackSampler
+
+def mean_ms(request, runs):
+    request()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        request()
+    return (time.perf_counter() - t0) / runs * 1000
+
+def with_sampler(interval, measure):
+    """Run measure() while a sampler thread samples this process; returns (result, samples taken)"""
+    if interval is None:
+        return measure(), 0
+    sampler = StackSampler(interval, time.time() + 3600)
+    thread = threading.Thread(target=sampler.run, daemon=True)
+    thread.start()
+    try:
+        return measure(), sampler.ticks
+    finally:
+        sampler.deadline = 0
+        thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3000, help='Requests per measurement')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    with app.app_context():
+        db.create_all()
+    client, writer = app.test_client(), app.test_client()
+    # Posts go to another device and client, so the list stays cached and the
+    # same size; each gets a new timestamp, or repeats would be duplicates
+    def post():
+        return {'source_device_id': 'device-1', 'type': 'SMS', 'sender': 'bench', 'content': 'new',
+                'timestamp': isoformat_micros(int(time.time() * 1e6))}
+    requests = [
+        ('cached list', lambda: client.get('/api/v1/messages?device=device-0'), args.runs),
+        ('post message', lambda: writer.post('/api/v1/messages', json=post()), args.runs // 10),
+    ]
+
+    default = app.config['PROFILE_INTERVAL_MS'] / 1000
+    rates = [('off', None), (f'{1 / default:.0f} Hz (default)', default), (f'{1 / (default / 10):.0f} Hz', default / 10)]
+    print(f"⚡ Mean request latency (ms) while sampling ({WORKDIR}):")
+    print(f"   {'':<18}" + ''.join(f'{name:>16}' for name, _, _ in requests))
+    for rate_name, interval in rates:
+        results = [with_sampler(interval, lambda: mean_ms(request, runs))[0] for _, request, runs in requests]
+        print(f"   {rate_name:<18}" + ''.join(f'{result:>16.3f}' for result in results))
+
+    # Cost of one sample of a thread in a request
+    sampler = StackSampler(default, 0)
+    busy = threading.Event()
+    done = threading.Event()
+
+    def serve():
+        with app.test_request_context('/api/v1/messages'):
+            app.preprocess_request()
+            busy.set()
+            done.wait()
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    busy.wait()
+    t0 = time.perf_counter()
+    for _ in range(1000):
+        sampler.sample()
+    per_sample = (time.perf_counter() - t0) / 1000 * 1e6
+    done.set()
+    thread.join()
+    print(f"   one sample: {per_sample:.1f} us, {per_sample / default / 1e4:.3f}% of a CPU at the default rate")
+
+if __name__ == '__main__':
+    main()
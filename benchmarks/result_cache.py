@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark the response cache
+Loads a month of messages and times repeated identical list and sync
+requests with the cache disabled and enabled, then with a write to another
+device between requests
+
+Usage: python -m benchmarks.result_cache --rows 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'result_cache.db')}"
+
+from app import create_app
+from models import db
+from models.types import isoformat_micros
+from benchmarks.data import load_messages
+
+def mean_ms(client, path, runs=200, between=None):
+    client.get(path)  # warm-up
+    elapsed = 0.0
+    for _ in range(runs):
+        if between:
+            between()
+        t0 = time.perf_counter()
+        response = client.get(path)
+        elapsed += time.perf_counter() - t0
+        assert response.status_code == 200, response.data
+    return elapsed / runs * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200_000, help='Messages to load, spread over 30 days')
+    args = parser.parse_args()
+
+    # Two workers sharing the database, as under gunicorn
+    app, writer = create_app(), create_app()
+    app.testing = writer.testing = True
+    client = app.test_client()
+
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Loading {args.rows} messages over 30 days into {WORKDIR}")
+        load_messages(args.rows, datetime.now(timezone.utc), days=30)
+    since = client.get('/api/v1/messages?per_page=500').json['messages'][-1]['received_at']
+    paths = [
+        ('list, device and type filter', '/api/v1/messages?device=device-3&type=SMS&page=1'),
+        ('list, no filter', '/api/v1/messages?page=1'),
+        ('sync, 500 messages behind', f'/api/v1/sync/messages?since={since}&limit=100'),
+    ]
+    budget = app.config['RESULT_CACHE_BYTES']
+
+    def write_other_device():
+        writer.test_client().post('/api/v1/messages', json={
+            'source_device_id': 'device-4', 'type': 'SMS', 'sender': 'bench', 'content': 'new',
+            'timestamp': isoformat_micros(int(time.time() * 1e6))
+        })
+
+    results = {}
+    app.config['RESULT_CACHE_BYTES'] = 0
+    results['off'] = {name: mean_ms(client, path) for name, path in paths}
+    app.config['RESULT_CACHE_BYTES'] = budget
+    results['on'] = {name: mean_ms(client, path) for name, path in paths}
+    results['writes'] = {name: mean_ms(client, path, runs=50, between=write_other_device) for name, path in paths}
+    with app.app_context():
+        from services.result_cache import result_cache_stats
+        stats = result_cache_stats()
+
+    print()
+    print("⚡ Mean request latency (ms): cache off, cache on, cache on with a device-4 write before each request")
+    for name, _ in paths:
+        print(f"   {name:<30} {results['off'][name]:>8.2f} {results['on'][name]:>8.2f} {results['writes'][name]:>8.2f}")
+    print(f"📐 {stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB, hit ratio {stats['hit_ratio']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+gunicorn in a subprocess, for benchmarks that measure the app over HTTP
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_gunicorn(workers, worker_class='sync'):
+    """
+    Serve the app with gunicorn on a free port; returns (server URL, process)
+    The app reads DATABASE_URL from the environment, so set it first.
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+               '--worker-class', worker_class, '--log-level', 'warning']
+    if worker_class == 'gthread':
+        command += ['--threads', '4']
+    process = subprocess.Popen(command + ['app:create_app()'], cwd=ROOT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            requests.get(f"{url}/health", timeout=5)
+            return url, process
+        except requests.exceptions.RequestException:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.2)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite with a committed baseline
+Loads a realistic dataset (services.seed.realistic_rows) and runs ingest,
+list, sync, status and dashboard requests against create_app() through a
+direct WSGI harness and the Flask test client, with warm-up and repetitions.
+Results (p50/p90/p99 per scenario) are written as JSON. With --baseline
+they are compared against a saved run, and the exit status is 1 when a
+scenario's p50 or p90 got slower than the baseline's thresholds allow. p99
+is reported but not gated: over 50 requests it is the second-slowest one,
+and a single scheduler stall moves it several-fold.
+
+Usage:
+  python -m benchmarks.suite --rows 100000 --output results.json
+  python -m benchmarks.suite --rows 100000 --baseline benchmarks/baseline.json
+  python -m benchmarks.suite --rows 100000 --save-baseline benchmarks/baseline.json
+  python -m benchmarks.suite --database /tmp/10m.db --rows 10000000   # load once, reuse
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The gated statistics may grow by these factors, and by at least MIN_DELTA_MS,
+# before a scenario counts as a regression; a baseline file can override them
+DEFAULT_THRESHOLDS = {'default': {'p50': 2.0, 'p90': 3.0}, 'ingest': {'p50': 2.0, 'p90': 4.0},
+                      'ingest_auth': {'p50': 2.0, 'p90': 4.0}}
+MIN_DELTA_MS = 0.5
+# Ingest client_message_ids are unique per run, so a reused --database never answers them as duplicates
+RUN_ID = f'{time.time_ns():x}'
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 3),
+        'min_ms': round(ordered[0], 3),
+        'p50_ms': round(percentile(ordered, 0.50), 3),
+        'p90_ms': round(percentile(ordered, 0.90), 3),
+        'p99_ms': round(percentile(ordered, 0.99), 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+class WsgiHarness:
+    """Calls the WSGI app directly: no cookies, no response wrapping"""
+    name = 'wsgi'
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, path, body=None, headers=None):
+        from werkzeug.test import EnvironBuilder
+
+        builder = EnvironBuilder(path=path, method=method, json=body, headers=headers)
+        environ = builder.get_environ()
+        builder.close()
+        status = []
+        result = self.app(environ, lambda line, headers, exc_info=None: status.append(line))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split()[0])
+
+class ClientHarness:
+    """Flask test client; a fresh client (cookie jar) per scenario"""
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def reset(self):
+        self.client = self.app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        return self.client.open(path, method=method, json=body, headers=headers).status_code
+
+def unique_post(post, i):
+    """post with a client_message_id of its own, so repeating it is not answered as a duplicate"""
+    return dict(post, client_message_id=f'bench-{RUN_ID}-{i}')
+
+def build_scenarios(app, reps):
+    """(name, runs, request(i) -> (method, path, body[, headers]), expected status) after looking at the data"""
+    from sqlalchemy import func, select
+
+    from models import db, Message
+    from models.types import isoformat_micros, isoformat_utc
+    from benchmarks.data import realistic_rows
+
+    with app.app_context():
+        busiest = db.session.execute(
+            select(Message.source_device_id).group_by(Message.source_device_id)
+            .order_by(func.count().desc()).limit(1)
+        ).scalar()
+        newest = db.session.execute(
+            select(Message.received_at).order_by(Message.received_at.desc()).limit(5000)
+        ).scalars().all()
+        total = db.session.execute(select(func.count()).select_from(Message)).scalar()
+
+    recent = isoformat_utc(newest[min(20, len(newest) - 1)])
+    pages = max(1, total // 50)
+    posts = [
+        {'source_device_id': row['source_device_id'], 'type': row['type'], 'sender': row['sender'],
+         'content': row['content'], 'timestamp': isoformat_micros(row['timestamp']),
+         'metadata': row['message_metadata']}
+        for row in realistic_rows(1000, datetime.now(timezone.utc), days=1, seed=2)
+    ]
+    rng = random.Random(3)
+    deep_pages = [rng.randrange(pages // 2, pages + 1) for _ in range(1000)]
+    types = ('PUSH', 'SMS', 'EMAIL', 'CALL_LOG')
+    # services.seed.seed_devices gives every device the key seed-key-<device>
+    key = {'X-API-Key': f'seed-key-{busiest}'}
+
+    # Request i differs from every other one where the cache would otherwise
+    # answer (the list page 1 and recent sync scenarios measure hits on purpose).
+    # Reads go first: ingest makes the cached entries stale.
+    return [
+        ('list_page1', reps, lambda i: ('GET', '/api/v1/messages', None), 200),
+        ('list_page1_auth', reps, lambda i: ('GET', '/api/v1/messages', None, key), 200),
+        ('list_filtered', reps,
+         lambda i: ('GET', f'/api/v1/messages?device={busiest}&type={types[i % 4]}&page={i // 4 + 1}', None), 200),
+        ('list_deep_page', max(5, reps // 5),
+         lambda i: ('GET', f'/api/v1/messages?page={deep_pages[i % 1000]}', None), 200),
+        ('sync_recent', reps, lambda i: ('GET', f'/api/v1/sync/messages?since={recent}&limit=100', None), 200),
+        ('sync_backlog', reps,
+         lambda i: ('GET', f'/api/v1/sync/messages?since={isoformat_utc(newest[-1 - i % len(newest)])}'
+                           '&limit=500', None), 200),
+        ('list_unread', reps, lambda i: ('GET', f'/api/v1/messages?unread=true&page={i + 1}', None), 200),
+        ('unread_count', max(5, reps // 5), lambda i: ('GET', '/api/v1/read-state', None), 200),
+        ('mark_all_read', reps,
+         lambda i: ('PUT', '/api/v1/messages/read-all', None, {'X-Client-Id': f'bench-{i}'}), 200),
+        ('sync_status', max(5, reps // 5), lambda i: ('GET', '/api/v1/sync/status', None), 200),
+        ('status_page', max(5, reps // 5), lambda i: ('GET', '/status', None), 200),
+        ('dashboard', max(5, reps // 5), lambda i: ('GET', '/dashboard', None), 200),
+        ('ingest', reps, lambda i: ('POST', '/api/v1/messages', unique_post(posts[i % len(posts)], i)), 201),
+        ('ingest_auth', reps,
+         lambda i: ('POST', '/api/v1/messages', unique_post(posts[-1 - i % len(posts)], -1 - i),
+                    {'X-API-Key': f"seed-key-{posts[-1 - i % len(posts)]['source_device_id']}"}), 201),
+    ]
+
+def run_scenarios(harness, scenarios, warmup, only=None, start=0):
+    """Summaries by scenario name; request numbers begin at `start`, so harnesses don't share cached URLs"""
+    results = {}
+    for name, runs, make_request, expected in scenarios:
+        if only and name not in only:
+            continue
+        if hasattr(harness, 'reset'):
+            harness.reset()
+        timings = []
+        for i in range(warmup + runs):
+            method, path, body, *headers = make_request(start + i)
+            t0 = time.perf_counter()
+            status = harness.request(method, path, body, *headers)
+            elapsed = (time.perf_counter() - t0) * 1000
+            if status != expected:
+                raise RuntimeError(f'{name}: {method} {path} returned {status}, expected {expected}')
+            if i >= warmup:
+                timings.append(elapsed)
+        results[name] = summarize(timings)
+        print(f"   {harness.name:<7} {name:<16} p50 {results[name]['p50_ms']:>9.3f}  "
+              f"p90 {results[name]['p90_ms']:>9.3f}  p99 {results[name]['p99_ms']:>9.3f} ms")
+    return results
+
+def compare(results, baseline):
+    """Regression messages for every scenario slower than the baseline allows"""
+    thresholds = baseline.get('thresholds', DEFAULT_THRESHOLDS)
+    regressions = []
+    print()
+    print(f"📊 Against baseline from {baseline.get('created', '?')} ({baseline.get('rows', '?')} rows):")
+    for setting in ('rows', 'days', 'seed', 'sqlite'):
+        if baseline.get(setting) != results[setting]:
+            print(f"   ⚠️  {setting} differs: {baseline.get(setting)} in the baseline, {results[setting]} now")
+    for harness, scenarios in baseline['harnesses'].items():
+        for name, base in scenarios.items():
+            current = results['harnesses'].get(harness, {}).get(name)
+            if current is None:
+                continue
+            limits = thresholds.get(name, thresholds['default'])
+            verdicts = []
+            for stat in ('p50', 'p90', 'p99'):
+                before, after = base[f'{stat}_ms'], current[f'{stat}_ms']
+                ratio = after / before if before else float('inf')
+                # Statistics without a limit are shown, not gated
+                failed = stat in limits and ratio > limits[stat] and after - before > MIN_DELTA_MS
+                verdicts.append(f"{stat} {before:.3f} -> {after:.3f} ms (x{ratio:.2f}{' REGRESSION' if failed else ''})")
+                if failed:
+                    regressions.append(f'{harness}/{name} {stat} x{ratio:.2f} (limit x{limits[stat]})')
+            print(f"   {harness:<7} {name:<16} " + '   '.join(verdicts))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000, help='Messages to load (10k to 10M)')
+    parser.add_argument('--days', type=int, default=90, help='Days the messages are spread over')
+    parser.add_argument('--seed', type=int, default=1, help='Dataset seed')
+    parser.add_argument('--reps', type=int, default=50, help='Timed repetitions per scenario (heavy pages: 1/5)')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests before each scenario')
+    parser.add_argument('--harness', default='wsgi,client', help='Comma-separated: wsgi, client')
+    parser.add_argument('--scenario', action='append', help='Only run these scenarios (repeatable)')
+    parser.add_argument('--database', help='SQLite file to use; loaded on first use and reused afterwards')
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help='Compare against this results JSON; exit 1 on regressions')
+    parser.add_argument('--save-baseline', help='Write results, with thresholds, as a new baseline')
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix='message-hub-bench-'), 'suite.db')
+    reuse = os.path.exists(database)
+    # Configure the app before it is imported
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(database)}'
+
+    from app import create_app
+    from models import db
+    from benchmarks.data import load_realistic_messages, seed_devices
+    from services.read_state import DEFAULT_CLIENT, read_state_from_flags
+
+    app = create_app()
+    app.testing = True
+    if not reuse:
+        with app.app_context():
+            db.create_all()
+            print(f"📦 Loading {args.rows} messages over {args.days} days into {database}")
+            t0 = time.perf_counter()
+            load_realistic_messages(args.rows, datetime.now(timezone.utc), args.days, seed=args.seed,
+                                    progress=lambda loaded: loaded % 1_000_000 or print(f'   {loaded}'))
+            # The generated is_read flags become the default client's read state, as when seeding
+            with db.engine.begin() as connection:
+                read_state_from_flags(connection, DEFAULT_CLIENT)
+            print(f"   loaded in {time.perf_counter() - t0:.1f}s")
+    else:
+        print(f"📦 Reusing {database}")
+    with app.app_context():
+        seed_devices(25)
+
+    scenarios = build_scenarios(app, args.reps)
+    harnesses = {'wsgi': WsgiHarness, 'client': ClientHarness}
+    results = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'rows': args.rows,
+        'days': args.days,
+        'seed': args.seed,
+        'reps': args.reps,
+        'warmup': args.warmup,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'config': {name: app.config[name] for name in ('HOT_TAIL_SIZE', 'RESULT_CACHE_BYTES', 'RESULT_CACHE_TTL')},
+        'harnesses': {}
+    }
+    print(f"⚡ Request latency, {args.warmup} warm-up + up to {args.reps} timed requests per scenario:")
+    for number, name in enumerate(args.harness.split(',')):
+        results['harnesses'][name] = run_scenarios(harnesses[name](app), scenarios, args.warmup, args.scenario,
+                                                   start=number * (args.warmup + args.reps))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"💾 Results written to {args.output}")
+    if args.save_baseline:
+        thresholds = DEFAULT_THRESHOLDS
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as previous:
+                thresholds = json.load(previous).get('thresholds', thresholds)
+        with open(args.save_baseline, 'w') as output:
+            json.dump(dict(results, thresholds=thresholds), output, indent=2)
+        print(f"💾 Baseline written to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        if regressions:
+            print()
+            print('❌ Regressions:')
+            for regression in regressions:
+                print(f'   {regression}')
+            sys.exit(1)
+        print('✅ No regressions')
+
+if __name__ == '__main__':
+    main()
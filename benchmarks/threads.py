@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Benchmark the conversation index
+Loads messages spread over --threads conversations (metadata.thread_id),
+builds the threads table, then compares listing every conversation by
+grouping all messages (the only way before) with paging GET /api/v1/threads.
+Reports time, SQL statements and the query plan of a page, unread counts
+for a caught-up client and for one that has read nothing, a thread's
+messages, and what maintaining the index adds to POST /api/v1/messages.
+
+Usage: python -m benchmarks.threads --rows 500000 --threads 10000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKDIR = tempfile.mkdtemp(prefix='message-hub-bench-')
+# Configure the app before it is imported
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'threads.db')}"
+
+from sqlalchemy import event, func, insert, select, text
+from sqlalchemy.engine import Engine
+
+from app import create_app
+from models import db, Message, Thread
+from models.ids import uuid7
+from models.types import isoformat_micros, to_epoch_micros
+from services import threads as thread_index
+from services.threads import rebuild_threads
+
+def load_conversations(rows, threads, devices=10, days=60, batch_size=10_000):
+    """Insert messages over `threads` conversations, busier ones more often, in arrival order"""
+    rng = random.Random(1)
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(threads)]
+    start = to_epoch_micros(datetime.now(timezone.utc) - timedelta(days=days))
+    step = days * 86_400_000_000 // rows
+    chosen = rng.choices(range(threads), weights, k=rows)
+    # Every conversation gets at least one message
+    chosen[:threads] = range(threads)
+    with db.engine.begin() as connection:
+        batch = []
+        for i, conversation in enumerate(chosen):
+            value = start + step * i
+            batch.append({
+                'id': uuid7(), 'source_device_id': f'device-{conversation % devices}', 'type': 'SMS',
+                'sender': f'+1555{rng.randrange(10 ** 7):07d}', 'content': f'Message {i} in chat {conversation}',
+                'timestamp': value, 'received_at': value, 'is_read': False, 'created_at': value, 'updated_at': value,
+                'message_metadata': {'thread_id': f'chat-{conversation}'}
+            })
+            if len(batch) == batch_size:
+                connection.execute(insert(Message.__table__), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(Message.__table__), batch)
+
+class StatementCounter:
+    """Counts SQL statements on every engine (reads may be routed to a replica engine)"""
+
+    def __init__(self):
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(Engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, 'before_cursor_execute', self._count)
+
+def group_all_messages(app):
+    """Every conversation with its count and last message, grouped from the messages table"""
+    thread_id = Message.message_metadata['thread_id'].as_string()
+    statement = select(
+        Message.source_device_id, func.coalesce(thread_id, Message.sender), func.count(), func.max(Message.sequence_id)
+    ).group_by(Message.source_device_id, func.coalesce(thread_id, Message.sender)).order_by(
+        func.max(Message.sequence_id).desc()
+    )
+    with app.app_context():
+        return len(db.session.execute(statement).all())
+
+def page_through(client, limit):
+    """(threads listed, pages, seconds, statements) for walking every page of GET /api/v1/threads"""
+    listed = pages = 0
+    before = None
+    with StatementCounter() as counter:
+        t0 = time.perf_counter()
+        while True:
+            query = f'/api/v1/threads?limit={limit}' + (f'&before={before}' if before else '')
+            response = client.get(query)
+            assert response.status_code == 200, response.data
+            listed += len(response.json['threads'])
+            pages += 1
+            before = response.json['next_before']
+            if not before:
+                break
+        elapsed = time.perf_counter() - t0
+    return listed, pages, elapsed, counter.count
+
+def timed_posts(client, posts, start):
+    bodies = [{'source_device_id': f'device-{i % 10}', 'type': 'SMS', 'sender': 'bench',
+               'content': f'Threads benchmark post {i}', 'metadata': {'thread_id': f'chat-{i % 500}'},
+               'timestamp': isoformat_micros(to_epoch_micros(datetime.now(timezone.utc))),
+               'client_message_id': f'threads-bench-{i}'}
+              for i in range(start, start + posts)]
+    t0 = time.perf_counter()
+    for body in bodies:
+        assert client.post('/api/v1/messages', json=body).status_code == 201
+    return (time.perf_counter() - t0) / posts * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000, help='Messages to load')
+    parser.add_argument('--threads', type=int, default=10_000, help='Conversations they belong to')
+    parser.add_argument('--page', type=int, default=1000, help='Threads per page when listing them all')
+    parser.add_argument('--posts', type=int, default=2000, help='Posts per ingest measurement')
+    args = parser.parse_args()
+
+    app = create_app()
+    app.testing = True
+    client = app.test_client()
+    with app.app_context():
+        db.create_all()
+        engine = db.engine
+        print(f"📦 Loading {args.rows} messages in {args.threads} conversations into {WORKDIR}")
+        load_conversations(args.rows, args.threads)
+        t0 = time.perf_counter()
+        with db.engine.begin() as connection:
+            filled, built = rebuild_threads(connection)
+        print(f"   threads table built in {time.perf_counter() - t0:.1f}s: {built} threads")
+
+    print()
+    print(f"⚡ Listing all {args.threads} conversations:")
+    t0 = time.perf_counter()
+    grouped = group_all_messages(app)
+    print(f"   grouping every message        {(time.perf_counter() - t0) * 1000:>9.1f} ms   {grouped} groups, 1 query")
+    # Nothing read yet: every thread on a page has unread messages to count
+    listed, pages, elapsed, statements = page_through(client, args.page)
+    print(f"   /threads, nothing read        {elapsed * 1000:>9.1f} ms   {listed} threads, "
+          f"{pages} pages, {statements / pages:.1f} SQL/page")
+    client.put('/api/v1/messages/read-all')
+    listed, pages, elapsed, statements = page_through(client, args.page)
+    print(f"   /threads, caught-up client    {elapsed * 1000:>9.1f} ms   {listed} threads, "
+          f"{pages} pages, {statements / pages:.1f} SQL/page")
+
+    with app.app_context():
+        statement = select(Thread).order_by(Thread.last_activity.desc(), Thread.id.desc()).limit(args.page)
+        compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+        plan = [row[3] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {compiled}'))]
+        busiest = db.session.execute(select(Thread.id, Thread.message_count).order_by(
+            Thread.message_count.desc()).limit(1)).one()
+    print(f"   page query plan: {'; '.join(plan)}")
+
+    samples = []
+    for _ in range(20):
+        t0 = time.perf_counter()
+        response = client.get('/api/v1/threads?limit=50')
+        samples.append(time.perf_counter() - t0)
+    print(f"   first page of 50              {sorted(samples)[len(samples) // 2] * 1000:>9.2f} ms median")
+    samples = []
+    for _ in range(20):
+        t0 = time.perf_counter()
+        response = client.get(f'/api/v1/threads/{busiest.id}/messages?limit=50')
+        samples.append(time.perf_counter() - t0)
+    print(f"   busiest thread's newest 50    {sorted(samples)[len(samples) // 2] * 1000:>9.2f} ms median "
+          f"({busiest.message_count} messages)")
+
+    print()
+    print(f"📥 POST /api/v1/messages, {args.posts} posts each:")
+    timed_posts(client, 200, 0)  # warm up
+    with_index = timed_posts(client, args.posts, 200)
+    event.remove(db.session, 'before_flush', thread_index._before_flush)
+    event.remove(db.session, 'after_flush', thread_index._after_flush)
+    without = timed_posts(client, args.posts, 200 + args.posts)
+    print(f"   without the index {without:.3f} ms/post, maintaining it {with_index:.3f} ms/post")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark message timestamp storage on SQLite
+Compares the legacy DateTime text columns with integer epoch microseconds
+for sync range scans and response serialization
+
+Usage: python -m benchmarks.timestamps --rows 500000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Boolean
+
+from models import Message
+from models.ids import uuid7
+from models.types import to_epoch_micros
+
+LegacyBase = declarative_base()
+
+class LegacyMessage(LegacyBase):
+    __tablename__ = 'messages'
+
+    sequence_id = Column(Integer, primary_key=True)
+    id = Column(String(36), unique=True, nullable=False)
+    source_device_id = Column(String(255), nullable=False, index=True)
+    type = Column(String(50), nullable=False, index=True)
+    sender = Column(String(255), nullable=False)
+    content = Column(Text, nullable=False)
+    timestamp = Column(DateTime(timezone=True), nullable=False, index=True)
+    received_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    message_metadata = Column(JSON, default={})
+    is_read = Column(Boolean, default=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sequence_id': self.sequence_id,
+            'source_device': self.source_device_id,
+            'type': self.type,
+            'sender': self.sender,
+            'content': self.content,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'metadata': self.message_metadata or {},
+            'is_read': self.is_read
+        }
+
+TYPES = ['SMS', 'PUSH_NOTIFICATION', 'EMAIL', 'CALL_LOG']
+SENDERS = ['+1234567890', '+0987654321', 'WhatsApp', 'Gmail', 'Slack']
+
+def generate_rows(count, start, epoch_micros):
+    """Generate message rows arriving 10ms apart"""
+    for i in range(count):
+        ts = start + timedelta(milliseconds=10 * i)
+        value = to_epoch_micros(ts) if epoch_micros else ts
+        yield {
+            'id': uuid7(), 'source_device_id': f'device-{random.randrange(20)}',
+            'type': random.choice(TYPES), 'sender': random.choice(SENDERS),
+            'content': f'Benchmark message {i} - Lorem ipsum dolor sit amet.',
+            'timestamp': value, 'received_at': value, 'message_metadata': {'priority': 'normal'},
+            'is_read': False, 'created_at': value, 'updated_at': value
+        }
+
+def load(engine, table, rows, start, epoch_micros):
+    table.create(engine)
+    batch = []
+    with engine.begin() as connection:
+        for row in generate_rows(rows, start, epoch_micros):
+            batch.append(row)
+            if len(batch) == 10_000:
+                connection.execute(insert(table), batch)
+                batch = []
+        if batch:
+            connection.execute(insert(table), batch)
+
+def index_bytes(engine, name):
+    with engine.connect() as connection:
+        return connection.execute(
+            text("SELECT SUM(pgsize) FROM dbstat WHERE name = :name"), {'name': name}
+        ).scalar()
+
+def time_sync_pages(engine, fetch_page, sinces):
+    """Run one sync-style page fetch per since value, return (pages/s, rows/s)"""
+    rows = 0
+    with Session(engine) as session:
+        t0 = time.perf_counter()
+        for since in sinces:
+            rows += len(fetch_page(session, since))
+        elapsed = time.perf_counter() - t0
+    return len(sinces) / elapsed, rows / elapsed
+
+def time_serialization(items, serialize):
+    """Serialize every item, return items/s"""
+    t0 = time.perf_counter()
+    for item in items:
+        serialize(item)
+    return len(items) / (time.perf_counter() - t0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000, help='Messages to load per layout')
+    parser.add_argument('--pages', type=int, default=2_000, help='Sync pages to fetch')
+    parser.add_argument('--page-size', type=int, default=100, help='Messages per sync page')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, best run is reported')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='message-hub-bench-')
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    span_ms = 10 * args.rows
+    sinces = [start + timedelta(milliseconds=random.randrange(span_ms)) for _ in range(args.pages)]
+
+    print(f"📦 Loading {args.rows} messages per layout into {workdir}")
+    legacy = create_engine(f"sqlite:///{os.path.join(workdir, 'legacy.db')}")
+    current = create_engine(f"sqlite:///{os.path.join(workdir, 'epoch_micros.db')}")
+    load(legacy, LegacyMessage.__table__, args.rows, start, epoch_micros=False)
+    load(current, Message.__table__, args.rows, start, epoch_micros=True)
+
+    limit = args.page_size
+
+    def legacy_page(session, since):
+        messages = session.query(LegacyMessage).filter(
+            LegacyMessage.received_at > since.replace(tzinfo=None)
+        ).order_by(LegacyMessage.received_at.asc()).limit(limit).all()
+        return [message.to_dict() for message in messages]
+
+    def orm_page(session, since):
+        messages = session.query(Message).filter(
+            Message.received_at > since
+        ).order_by(Message.received_at.asc()).limit(limit).all()
+        return [message.to_dict() for message in messages]
+
+    def row_page(session, since):
+        rows = session.execute(
+            select(*Message.serialized_columns())
+            .where(Message.received_at > since)
+            .order_by(Message.received_at.asc())
+            .limit(limit)
+        ).all()
+        return [Message.serialize_row(row) for row in rows]
+
+    print()
+    print(f"📐 received_at index: DateTime text {index_bytes(legacy, 'ix_messages_received_at') / 2**20:.1f} MiB, "
+          f"epoch micros {index_bytes(current, 'ix_messages_received_at') / 2**20:.1f} MiB")
+
+    print(f"⚡ Sync range scans ({args.pages} pages of {limit}, received_at > since):")
+    for name, engine, fetch_page in [
+        ('DateTime text, ORM + to_dict', legacy, legacy_page),
+        ('epoch micros, ORM + to_dict', current, orm_page),
+        ('epoch micros, rows + serialize_row', current, row_page),
+    ]:
+        time_sync_pages(engine, fetch_page, sinces[:50])  # warm-up
+        pages_per_second, rows_per_second = max(
+            time_sync_pages(engine, fetch_page, sinces) for _ in range(args.repeat)
+        )
+        print(f"   {name:<38} {pages_per_second:>8.0f} pages/s {rows_per_second:>10.0f} messages/s")
+
+    print("🧾 Serialization only (100k messages already fetched):")
+    with Session(legacy) as session:
+        legacy_messages = session.query(LegacyMessage).limit(100_000).all()
+        legacy_rate = max(
+            time_serialization(legacy_messages, LegacyMessage.to_dict) for _ in range(args.repeat)
+        )
+    with Session(current) as session:
+        rows = session.execute(select(*Message.serialized_columns()).limit(100_000)).all()
+        row_rate = max(
+            time_serialization(rows, Message.serialize_row) for _ in range(args.repeat)
+        )
+    print(f"   {'DateTime text, to_dict':<38} {legacy_rate:>10.0f} messages/s")
+    print(f"   {'epoch micros, serialize_row':<38} {row_rate:>10.0f} messages/s")
+
+if __name__ == '__main__':
+    main()
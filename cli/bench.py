@@ -0,0 +1,286 @@
+"""
+Open-loop load generator for `message-hub bench`
+
+Requests are scheduled at a target arrival rate, whether or not earlier ones
+have completed. Each one's latency is measured from its intended send time,
+so time spent queued behind a slow server counts. A closed loop (N threads
+each waiting for their last reply) slows down with the server and leaves that
+time out (coordinated omission). Latencies go into HDR-style histograms with
+three significant digits.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import requests
+
+DEFAULT_SCENARIO = Path(__file__).resolve().parent.parent / 'benchmarks' / 'scenarios' / 'mixed.json'
+MESSAGE_TYPES = ['SMS', 'PUSH_NOTIFICATION', 'EMAIL', 'CALL_LOG']
+SENDERS = ['+1234567890', '+0987654321', 'WhatsApp', 'Gmail', 'Slack', 'Calendar']
+PERCENTILES = (50, 90, 99, 99.9)
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of integer microseconds, as in HdrHistogram
+    Values below 2048 are counted exactly. Above that, each power of two is
+    split into 1024 buckets, which keeps values to 3 significant digits
+    (0.1%) up to an hour in about 23k counters.
+    """
+    SUB_BUCKET_BITS = 11
+    HALF = 1 << (SUB_BUCKET_BITS - 1)
+    HIGHEST = 3_600_000_000
+
+    def __init__(self):
+        self.counts = [0] * (self._index(self.HIGHEST) + 1)
+        self.total = 0
+        self.sum = 0
+        self.max = 0
+
+    def _index(self, value):
+        shift = value.bit_length() - self.SUB_BUCKET_BITS
+        if shift <= 0:
+            return value
+        return (shift + 1) * self.HALF + (value >> shift) - self.HALF
+
+    def _highest_equivalent(self, index):
+        if index < 2 * self.HALF:
+            return index
+        shift = index // self.HALF - 1
+        return ((index % self.HALF + self.HALF + 1) << shift) - 1
+
+    def record(self, micros):
+        micros = min(max(int(micros), 0), self.HIGHEST)
+        self.counts[self._index(micros)] += 1
+        self.total += 1
+        self.sum += micros
+        self.max = max(self.max, micros)
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def value_at(self, percentile):
+        """Highest value (µs) at or below which `percentile` percent of the recorded values fall"""
+        if not self.total:
+            return 0
+        rank = max(1, math.ceil(percentile / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def distribution(self, ticks_per_half=5):
+        """(value µs, percentile, count so far) rows, denser towards the tail, as in .hgrm files"""
+        rows, percentile, seen = [], 0.0, 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            value = min(self._highest_equivalent(index), self.max)
+            # Each halving of the distance to 100% gets ticks_per_half rows
+            while percentile <= 100 * seen / self.total and 100 - percentile > 50 / self.total:
+                rows.append((value, percentile, seen))
+                percentile += 100 / (ticks_per_half * 2 ** (math.floor(math.log2(100 / (100 - percentile))) + 1))
+        rows.append((self.max, 100.0, self.total))
+        return rows
+
+def load_scenario(path=None):
+    """Scenario dict from a JSON file (default: benchmarks/scenarios/mixed.json)"""
+    with open(path or DEFAULT_SCENARIO) as scenario_file:
+        scenario = json.load(scenario_file)
+    if not scenario.get('requests'):
+        raise ValueError('A scenario needs at least one entry in "requests"')
+    for entry in scenario['requests']:
+        if 'name' not in entry or 'path' not in entry:
+            raise ValueError('Every request needs a "name" and a "path"')
+        entry.setdefault('method', 'GET')
+        entry.setdefault('weight', 1)
+        entry.setdefault('expect', [201] if entry['method'] == 'POST' else [200])
+    return scenario
+
+class Bench:
+    """One open-loop run of a scenario against a server"""
+
+    def __init__(self, server_url, scenario, rate, duration, warmup, connections, timeout, seed=None):
+        self.server_url = server_url.rstrip('/')
+        self.scenario = scenario
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.connections = connections
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.devices = [f"bench-device-{n}" for n in range(1, scenario.get('devices', 10) + 1)]
+        self.entries = scenario['requests']
+        self.weights = [entry['weight'] for entry in self.entries]
+        self.latency = {entry['name']: LatencyHistogram() for entry in self.entries}
+        self.service = LatencyHistogram()
+        self.errors = {entry['name']: 0 for entry in self.entries}
+        self.error_samples = []
+        self.late = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def _prepare(self, entry):
+        """Method, URL and JSON body for one request of an entry"""
+        now = datetime.now(timezone.utc)
+        device = self.random.choice(self.devices)
+        since = (now - timedelta(seconds=entry.get('since_seconds', 60))).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        path = entry['path'].format(device=device, since=since)
+        body = None
+        if entry.get('body') == 'message':
+            body = {
+                'source_device_id': device,
+                'type': self.random.choice(MESSAGE_TYPES),
+                'sender': self.random.choice(SENDERS),
+                'content': f"Load test message {self.random.getrandbits(32):08x}",
+                'timestamp': now.isoformat(),
+                'metadata': {'source': 'bench'}
+            }
+        elif entry.get('body') is not None:
+            body = entry['body']
+        return entry['method'], f"{self.server_url}{path}", body
+
+    def _send(self, entry, intended, record):
+        method, url, body = self._prepare(entry)
+        sent = time.perf_counter()
+        error = None
+        try:
+            response = self._session().request(method, url, json=body, timeout=self.timeout)
+            if response.status_code not in entry['expect']:
+                error = f"{entry['name']}: HTTP {response.status_code}"
+        except requests.exceptions.RequestException as e:
+            error = f"{entry['name']}: {type(e).__name__}"
+        done = time.perf_counter()
+        if not record:
+            return
+        with self.lock:
+            self.latency[entry['name']].record((done - intended) * 1e6)
+            self.service.record((done - sent) * 1e6)
+            if sent - intended > 0.01:
+                self.late += 1
+            if error:
+                self.errors[entry['name']] += 1
+                if len(self.error_samples) < 5:
+                    self.error_samples.append(error)
+
+    def _arrivals(self):
+        """Intended send times, relative to the start, for warm-up plus the measured window"""
+        poisson = self.scenario.get('arrivals', 'poisson') == 'poisson'
+        at, end = 0.0, self.warmup + self.duration
+        while True:
+            at += self.random.expovariate(self.rate) if poisson else 1 / self.rate
+            if at >= end:
+                return
+            yield at
+
+    def run(self, progress=None):
+        """Dispatch requests at their intended times; returns the measured wall time"""
+        executor = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix='bench')
+        start = time.perf_counter()
+        next_report = self.warmup + 5
+        for at in self._arrivals():
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            entry = self.random.choices(self.entries, self.weights)[0]
+            executor.submit(self._send, entry, start + at, at >= self.warmup)
+            if progress and at >= next_report:
+                progress(at - self.warmup)
+                next_report += 5
+        # Requests still queued were due inside the window: they run and count
+        executor.shutdown(wait=True)
+        return time.perf_counter() - start - self.warmup
+
+    def results(self, elapsed):
+        total = LatencyHistogram()
+        for histogram in self.latency.values():
+            total.merge(histogram)
+        rows = {name: histogram for name, histogram in self.latency.items()}
+        rows['all'] = total
+        errors = dict(self.errors, all=sum(self.errors.values()))
+        return {
+            'target_rate': self.rate,
+            'duration': self.duration,
+            'elapsed': round(elapsed, 3),
+            'late_sends': self.late,
+            'error_samples': self.error_samples,
+            'requests': {
+                name: {
+                    'count': histogram.total,
+                    'throughput': round(histogram.total / elapsed, 2) if elapsed else 0,
+                    'errors': errors[name],
+                    'error_rate': round(errors[name] / histogram.total, 4) if histogram.total else 0,
+                    'mean_ms': round(histogram.mean() / 1000, 3),
+                    **{f'p{p:g}_ms': round(histogram.value_at(p) / 1000, 3) for p in PERCENTILES},
+                    'max_ms': round(histogram.max / 1000, 3),
+                }
+                for name, histogram in rows.items()
+            },
+            'service_time': {f'p{p:g}_ms': round(self.service.value_at(p) / 1000, 3) for p in PERCENTILES},
+        }
+
+    def write_hgrm(self, path):
+        """Latency distribution of all requests in HdrHistogram's .hgrm text format (values in ms)"""
+        total = LatencyHistogram()
+        for histogram in self.latency.values():
+            total.merge(histogram)
+        with open(path, 'w') as hgrm:
+            hgrm.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+            for value, percentile, count in total.distribution():
+                fraction = percentile / 100
+                inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1 else f"{'inf':>14}"
+                hgrm.write(f"{value / 1000:12.3f} {fraction:14.12f} {count:10d} {inverse}\n")
+            hgrm.write(f"#[Mean    = {total.mean() / 1000:12.3f}, Max = {total.max / 1000:12.3f}]\n")
+            hgrm.write(f"#[Total count    = {total.total:12d}]\n")
+
+def start_local_server():
+    """
+    Serve create_app() from a thread on a free port, as a stand-in for a
+    deployed server; uses DATABASE_URL, or an empty temporary database
+    Returns (server URL, server); call server.shutdown() when done.
+    """
+    from werkzeug.serving import make_server
+
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    if not os.environ.get('DATABASE_URL'):
+        workdir = tempfile.mkdtemp(prefix='message-hub-bench-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    # One access-log line per request would swamp the report
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='bench-server', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
@@ -0,0 +1,248 @@
+"""
+Bulk import for `message-hub import`
+
+The input (NDJSON, or CSV with a header row, as `message-hub export` writes
+them) is read as a stream and cut into batches of at most BATCH_ROWS
+messages and BATCH_BYTES of input. Batches go to POST
+/api/v1/messages/batch over the pooled keep-alive session, up to
+`concurrency` at a time.
+
+Every message gets an ID derived from the import and the byte offset of its
+record (records from an export keep their own). A batch whose response was
+lost can be sent again: the server skips the IDs it already has.
+
+The checkpoint file holds the offset up to which every batch was stored,
+together with the derivation key. Batches complete out of order, so the
+offset only moves past a batch once every batch before it is in too. A
+killed import starts again from that offset; batches after it that made it
+in are sent again and skipped.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+BATCH_ROWS = 500
+# Input bytes per batch, bounding request size whatever the record length
+BATCH_BYTES = 1024 * 1024
+# Transient failures retried per batch, with full-jitter backoff
+RETRIES = 5
+MAX_RETRY_DELAY = 30
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Finished batches waiting for an earlier one, per concurrent request
+MAX_UNSETTLED = 4
+# Checkpoint writes at most this often (and at the end)
+CHECKPOINT_INTERVAL = 1.0
+
+class ImportFailed(Exception):
+    """A batch the server refused, or that failed after every retry"""
+
+def detect_format(path):
+    """'csv' for .csv files, else 'ndjson'"""
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+def message_id(key, started_ms, offset):
+    """
+    A UUIDv7 for the record at this byte offset of an import
+    The time bits are the import's start, as if the server had assigned it;
+    the rest come from hashing the key and offset.
+    """
+    digest = int.from_bytes(hashlib.blake2b(f'{key}:{offset}'.encode(), digest_size=10).digest(), 'big')
+    value = ((started_ms << 80) | (0x7 << 76) | ((digest >> 62) & 0xFFF) << 64
+             | (0b10 << 62) | (digest & (2**62 - 1)))
+    hexed = f'{value:032x}'
+    return f'{hexed[:8]}-{hexed[8:12]}-{hexed[12:16]}-{hexed[16:20]}-{hexed[20:]}'
+
+def to_message(record):
+    """A record in export or API form as a batch item (without id)"""
+    metadata = record.get('metadata') or {}
+    if isinstance(metadata, str):
+        metadata = json.loads(metadata)
+    return {
+        'source_device_id': record.get('source_device_id') or record.get('source_device'),
+        'type': record.get('type'),
+        'sender': record.get('sender'),
+        'content': record.get('content'),
+        'timestamp': record.get('timestamp'),
+        'metadata': metadata,
+    }
+
+def read_records(path, input_format, offset=0):
+    """
+    (record, start offset, end offset) for every record from offset on
+    offset must be 0 or a record boundary from an earlier read.
+    """
+    with open(path, 'rb') as f:
+        header = None
+        if input_format == 'csv':
+            first = f.readline()
+            header = next(csv.reader([first.decode('utf-8-sig')]))
+            offset = max(offset, len(first))
+        f.seek(offset)
+        position = offset
+
+        def lines():
+            nonlocal position
+            for line in f:
+                position += len(line)
+                yield line.decode('utf-8')
+
+        start = offset
+        if input_format == 'csv':
+            # The reader pulls lines one at a time, so position is the end
+            # of the row it just returned, however many lines that spanned
+            for row in csv.reader(lines()):
+                if row:
+                    yield dict(zip(header, row)), start, position
+                start = position
+        else:
+            for line in lines():
+                if line.strip():
+                    try:
+                        yield json.loads(line), start, position
+                    except ValueError:
+                        raise ImportFailed(f'Invalid JSON at byte {start}')
+                start = position
+
+def batches(records, key, started_ms, max_rows=BATCH_ROWS, max_bytes=BATCH_BYTES):
+    """(messages, start offset, end offset) batches, each message with its ID"""
+    batch, first, end = [], None, None
+    for record, start, end in records:
+        message = to_message(record)
+        message['id'] = record.get('id') or message_id(key, started_ms, start)
+        if not batch:
+            first = start
+        batch.append(message)
+        if len(batch) == max_rows or end - first >= max_bytes:
+            yield batch, first, end
+            batch = []
+    if batch:
+        yield batch, first, end
+
+class Checkpoint:
+    """The progress of one import, in a JSON file beside its input (written atomically)"""
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def open(cls, path, input_path, server_url, restart=False):
+        """The saved checkpoint for this input and server, or a new one"""
+        size = os.path.getsize(input_path)
+        if os.path.exists(path) and not restart:
+            with open(path) as f:
+                state = json.load(f)
+            if state['size'] != size or state['server_url'] != server_url:
+                raise ImportFailed(f'{path} belongs to another file or server (use --restart)')
+            return cls(path, state)
+        return cls(path, {
+            'input': os.path.abspath(input_path), 'size': size, 'server_url': server_url,
+            'key': os.urandom(8).hex(), 'started_ms': time.time_ns() // 1_000_000,
+            'offset': 0, 'created': 0, 'existing': 0,
+        })
+
+    def save(self):
+        partial = f'{self.path}.tmp'
+        with open(partial, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(partial, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def post_batch(send, messages, retries=RETRIES, backoff=0.5, stop=None):
+    """
+    (created, existing) for one batch; retries connection errors, timeouts and 429/5xx
+    Gives up without retrying once stop (a threading.Event) is set.
+    """
+    for attempt in range(retries + 1):
+        if attempt and stop is not None and stop.is_set():
+            raise ImportFailed('Stopped')
+        try:
+            response = send('/api/v1/messages/batch', {'messages': messages})
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code == 200:
+                data = response.json()
+                return data['created'], data['existing']
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                try:
+                    error = response.json()
+                except ValueError:
+                    error = {}
+                reason = error.get('error') or f'HTTP {response.status_code}'
+                if error.get('details'):
+                    reason += f": {json.dumps(error['details'])}"
+                raise ImportFailed(reason)
+        delay = random.uniform(0, min(MAX_RETRY_DELAY, backoff * 2 ** attempt))
+        if stop is not None:
+            stop.wait(delay)
+        else:
+            time.sleep(delay)
+
+def run_import(send, input_path, input_format, checkpoint, concurrency=4, progress=None,
+               max_rows=BATCH_ROWS, retries=RETRIES, backoff=0.5):
+    """
+    Send every record after the checkpoint's offset, moving the checkpoint along
+    send(endpoint, data) posts and returns the response. progress(offset,
+    created, existing) is called as the checkpoint moves. Raises ImportFailed
+    or requests exceptions; the checkpoint is saved either way.
+    """
+    state = checkpoint.state
+    records = read_records(input_path, input_format, state['offset'])
+    in_flight = deque()
+    saved = time.monotonic()
+    stop = threading.Event()
+
+    def send_batch(messages, start, end):
+        try:
+            return post_batch(send, messages, retries, backoff, stop)
+        except ImportFailed as e:
+            raise ImportFailed(f'{e} (records in bytes {start}-{end})') from None
+
+    def settle(block):
+        nonlocal saved
+        if block:
+            wait([future for future, _ in in_flight if not future.done()], return_when=FIRST_COMPLETED)
+        while in_flight and in_flight[0][0].done():
+            future, end = in_flight.popleft()
+            created, existing = future.result()
+            state['offset'] = end
+            state['created'] += created
+            state['existing'] += existing
+            if progress:
+                progress(end, state['created'], state['existing'])
+        if time.monotonic() - saved >= CHECKPOINT_INTERVAL:
+            checkpoint.save()
+            saved = time.monotonic()
+
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        for messages, start, end in batches(records, state['key'], state['started_ms'], max_rows):
+            # A slow batch holds the checkpoint back, not the batches after it
+            while (sum(not future.done() for future, _ in in_flight) >= concurrency
+                   or len(in_flight) >= MAX_UNSETTLED * concurrency):
+                settle(block=True)
+            in_flight.append((pool.submit(send_batch, messages, start, end), end))
+            settle(block=False)
+        while in_flight:
+            settle(block=True)
+    finally:
+        # Keep what finished before a failure or Ctrl-C; requests still
+        # running end after their current attempt
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        checkpoint.save()
+    return state
@@ -7,17 +7,43 @@ import click
 import requests
 import json
 import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 
 # Configuration
 DEFAULT_SERVER_URL = "http://127.0.0.1:5001"
+# Read state is kept per client on the server
+DEFAULT_CLIENT_ID = "cli"
+# 429 and 503 responses are retried with jittered exponential backoff
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 503)
+MAX_RETRY_DELAY = 30
+# Commands use the local mirror as is for this long after it synced
+DEFAULT_MIRROR_MAX_AGE = 10
+# Connections kept open to the server, enough for make_requests()
+POOL_SIZE = 4
+# Sequence ranges a full sync fetches at once
+DEFAULT_SYNC_WORKERS = 4
 CONFIG_DIR = Path.home() / ".message-hub"
 CONFIG_FILE = CONFIG_DIR / "config.json"
+MIRROR_FILE = CONFIG_DIR / "mirror.db"
 
 class Config:
     def __init__(self):
         self.server_url = DEFAULT_SERVER_URL
+        self.client_id = DEFAULT_CLIENT_ID
+        self.retries = DEFAULT_RETRIES
+        self.retry_backoff = DEFAULT_RETRY_BACKOFF
+        # Answer messages/search/status from the local mirror (cli/mirror.py)
+        self.mirror = False
+        self.mirror_max_age = DEFAULT_MIRROR_MAX_AGE
+        self.sync_workers = DEFAULT_SYNC_WORKERS
         self.load_config()
     
     def load_config(self):
@@ -27,6 +53,12 @@ class Config:
                 with open(CONFIG_FILE, 'r') as f:
                     config_data = json.load(f)
                     self.server_url = config_data.get('server_url', DEFAULT_SERVER_URL)
+                    self.client_id = config_data.get('client_id', DEFAULT_CLIENT_ID)
+                    self.retries = config_data.get('retries', DEFAULT_RETRIES)
+                    self.retry_backoff = config_data.get('retry_backoff', DEFAULT_RETRY_BACKOFF)
+                    self.mirror = config_data.get('mirror', False)
+                    self.mirror_max_age = config_data.get('mirror_max_age', DEFAULT_MIRROR_MAX_AGE)
+                    self.sync_workers = config_data.get('sync_workers', DEFAULT_SYNC_WORKERS)
             except (json.JSONDecodeError, IOError) as e:
                 click.echo(f"Warning: Could not load config: {e}", err=True)
     
@@ -36,7 +68,13 @@ class Config:
         try:
             with open(CONFIG_FILE, 'w') as f:
                 json.dump({
-                    'server_url': self.server_url
+                    'server_url': self.server_url,
+                    'client_id': self.client_id,
+                    'retries': self.retries,
+                    'retry_backoff': self.retry_backoff,
+                    'mirror': self.mirror,
+                    'mirror_max_age': self.mirror_max_age,
+                    'sync_workers': self.sync_workers
                 }, f, indent=2)
         except IOError as e:
             click.echo(f"Warning: Could not save config: {e}", err=True)
@@ -44,32 +82,134 @@ class Config:
 # Global config instance
 config = Config()
 
-def make_request(endpoint, method='GET', data=None, params=None):
-    """Make HTTP request to the server"""
-    url = f"{config.server_url}{endpoint}"
-    
+_session = None
+
+def get_session(connections=0):
+    """
+    The HTTP session every request goes through
+    Its pooled connections are kept alive between calls, so a command that
+    makes several requests connects (and negotiates TLS) once. A command
+    that runs more requests at once asks for that many connections on its
+    first call.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(POOL_SIZE, config.sync_workers, connections))
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+def retry_delay(response, attempt):
+    """Seconds to wait before retry number attempt: Retry-After, else full-jitter backoff"""
     try:
-        if method == 'GET':
-            response = requests.get(url, params=params, timeout=10)
-        elif method == 'POST':
-            response = requests.post(url, json=data, timeout=10)
-        elif method == 'PUT':
-            response = requests.put(url, json=data, timeout=10)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
-        
-        return response
+        return min(float(response.headers['Retry-After']), MAX_RETRY_DELAY)
+    except (KeyError, ValueError):
+        return random.uniform(0, min(MAX_RETRY_DELAY, config.retry_backoff * 2 ** (attempt - 1)))
+
+def send_request(endpoint, method='GET', data=None, params=None, stream=False):
+    """
+    Send a request, retrying 429/503 responses; raises requests exceptions
+    With stream, the body is read as it arrives (response.iter_content).
+    """
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        raise ValueError(f"Unsupported method: {method}")
+    url = f"{config.server_url}{endpoint}"
+    headers = {'X-Client-Id': config.client_id}
     
-    except requests.exceptions.ConnectionError:
+    for attempt in range(config.retries + 1):
+        response = get_session().request(method, url, json=data, params=params, headers=headers,
+                                         timeout=10, stream=stream)
+        if response.status_code not in RETRY_STATUSES or attempt == config.retries:
+            return response
+        # Give the connection back to the pool
+        response.close()
+        time.sleep(retry_delay(response, attempt + 1))
+
+def report_request_error(error):
+    if isinstance(error, requests.exceptions.ConnectionError):
         click.echo(f"❌ Error: Could not connect to server at {config.server_url}", err=True)
         click.echo("   Make sure the Message Hub server is running", err=True)
-        return None
-    except requests.exceptions.Timeout:
+    elif isinstance(error, requests.exceptions.Timeout):
         click.echo("❌ Error: Request timed out", err=True)
-        return None
+    else:
+        click.echo(f"❌ Error: {str(error)}", err=True)
+
+def make_request(endpoint, method='GET', data=None, params=None):
+    """Make HTTP request to the server"""
+    try:
+        return send_request(endpoint, method, data, params)
     except Exception as e:
-        click.echo(f"❌ Error: {str(e)}", err=True)
+        report_request_error(e)
+        return None
+
+def make_requests(*calls):
+    """
+    Make independent GET requests concurrently, over the session's pool
+    calls are endpoints or (endpoint, params) pairs. Returns the responses in
+    order, None for failed ones; an error is reported once, not per request.
+    """
+    calls = [(call, None) if isinstance(call, str) else call for call in calls]
+    # Create the session before the pool's threads share it
+    get_session()
+    with ThreadPoolExecutor(max_workers=min(len(calls), POOL_SIZE)) as pool:
+        futures = [pool.submit(send_request, endpoint, params=params) for endpoint, params in calls]
+    
+    responses, error = [], None
+    for future in futures:
+        try:
+            responses.append(future.result())
+        except Exception as e:
+            responses.append(None)
+            error = error or e
+    if error:
+        report_request_error(error)
+    return responses
+
+def open_mirror():
+    # Also run as `python cli/main.py`, where the project root isn't on the path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from cli.mirror import Mirror
+    CONFIG_DIR.mkdir(exist_ok=True)
+    return Mirror(MIRROR_FILE)
+
+def pull_mirror(mirror, progress=None, workers=None):
+    """Bring the mirror up to date, catching up with workers concurrent ranges; raises requests exceptions"""
+    # Create the session before the catch-up threads share it
+    get_session()
+    return mirror.pull(lambda endpoint, params: send_request(endpoint, params=params),
+                       config.server_url, config.client_id, progress, workers)
+
+def local_mirror(remote=False):
+    """
+    The mirror, if it is enabled and --remote wasn't given
+    It is brought up to date first unless it synced within mirror_max_age
+    seconds. When the server can't be reached, it answers as of its last sync.
+    """
+    if remote or not config.mirror:
         return None
+    mirror = open_mirror()
+    age = mirror.synced_seconds_ago()
+    if age is not None and age < config.mirror_max_age:
+        return mirror
+    try:
+        pull_mirror(mirror)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        click.echo(f"⚠️  Offline ({e.__class__.__name__}): answering from the mirror as of "
+                   f"{format_timestamp(mirror.meta('synced_at'))}", err=True)
+    return mirror
+
+def refresh_mirror_read_state():
+    """After marking messages, so the mirror shows the change without a full pull"""
+    if not config.mirror:
+        return
+    mirror = open_mirror()
+    try:
+        mirror.pull_read_state(lambda endpoint, params: send_request(endpoint, params=params))
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    finally:
+        mirror.close()
 
 def format_timestamp(timestamp_str):
     """Format timestamp for display"""
@@ -87,7 +227,7 @@ def format_timestamp(timestamp_str):
 
 def format_message(message, verbose=False):
     """Format message for display"""
-    msg_id = message.get('id', 'Unknown')[:8]  # Short ID
+    msg_id = message.get('id', 'Unknown')[-8:]  # Short ID (time-ordered IDs share their prefix)
     msg_type = message.get('type', 'Unknown')
     sender = message.get('sender', 'Unknown')
     content = message.get('content', '')
@@ -113,11 +253,14 @@ def format_message(message, verbose=False):
 
 @click.group()
 @click.option('--server', '-s', help='Message Hub server URL')
+@click.option('--retries', type=int, help='Retries on 429/503 responses (0 to disable)')
 @click.version_option(version='1.0.0', prog_name='message-hub')
-def cli(server):
+def cli(server, retries):
     """Message Hub CLI - Command line interface for the Message Hub Server"""
     if server:
         config.server_url = server
+    if retries is not None:
+        config.retries = retries
 
 @cli.command()
 @click.option('--limit', '-l', default=10, help='Number of messages to show')
@@ -125,48 +268,48 @@ def cli(server):
 @click.option('--device', '-d', help='Filter by source device')
 @click.option('--unread', is_flag=True, help='Show only unread messages')
 @click.option('--verbose', '-v', is_flag=True, help='Show detailed message information')
-def messages(limit, type, device, unread, verbose):
+@click.option('--remote', is_flag=True, help='Ask the server even if the local mirror is enabled')
+def messages(limit, type, device, unread, verbose, remote):
     """List messages from the hub"""
     
-    # Build query parameters
-    params = {'per_page': limit, 'page': 1}
-    if type:
-        params['type'] = type
-    if device:
-        params['device'] = device
-    
-    response = make_request('/api/v1/messages', params=params)
-    if not response:
-        return
-    
-    if response.status_code != 200:
-        click.echo(f"❌ Error getting messages: {response.status_code}", err=True)
-        try:
-            error_data = response.json()
-            error_msg = error_data.get('error', 'Unknown error')
-            click.echo(f"   Server error: {error_msg}", err=True)
-            
-            if response.status_code == 500:
-                click.echo("   💡 Try running: python init_db.py (on server)", err=True)
-        except:
-            click.echo(f"   Raw response: {response.text}", err=True)
-        return
-    
-    data = response.json()
-    messages = data.get('messages', [])
-    total = data.get('total', 0)
+    mirror = local_mirror(remote)
+    if mirror:
+        messages, total = mirror.messages(device=device, message_type=type, unread=unread, limit=limit)
+    else:
+        # Build query parameters
+        params = {'per_page': limit, 'page': 1}
+        if type:
+            params['type'] = type
+        if device:
+            params['device'] = device
+        if unread:
+            params['unread'] = 'true'
+        
+        response = make_request('/api/v1/messages', params=params)
+        if not response:
+            return
+        
+        if response.status_code != 200:
+            click.echo(f"❌ Error getting messages: {response.status_code}", err=True)
+            try:
+                error_data = response.json()
+                error_msg = error_data.get('error', 'Unknown error')
+                click.echo(f"   Server error: {error_msg}", err=True)
+                
+                if response.status_code == 500:
+                    click.echo("   💡 Try running: python init_db.py (on server)", err=True)
+            except:
+                click.echo(f"   Raw response: {response.text}", err=True)
+            return
+        
+        data = response.json()
+        messages = data.get('messages', [])
+        total = data.get('total', 0)
     
     if not messages:
-        click.echo("📭 No messages found")
+        click.echo("📭 No unread messages found" if unread else "📭 No messages found")
         return
     
-    # Filter unread if requested
-    if unread:
-        messages = [msg for msg in messages if not msg.get('is_read', False)]
-        if not messages:
-            click.echo("📭 No unread messages found")
-            return
-    
     # Display header
     if verbose:
         click.echo(f"📬 Found {len(messages)} messages (total: {total})")
@@ -180,76 +323,219 @@ def messages(limit, type, device, unread, verbose):
     for message in messages:
         format_message(message, verbose)
 
+@cli.command()
+@click.argument('query')
+@click.option('--limit', '-l', default=20, help='Maximum number of matches to show')
+@click.option('--type', '-t', help='Filter by message type')
+@click.option('--device', '-d', help='Filter by source device')
+@click.option('--no-archived', is_flag=True, help='Only search live messages (asks the server)')
+@click.option('--verbose', '-v', is_flag=True, help='Show detailed message information')
+@click.option('--remote', is_flag=True, help='Ask the server even if the local mirror is enabled')
+def search(query, limit, type, device, no_archived, verbose, remote):
+    """Search message content and senders, including archived messages"""
+    
+    # The mirror doesn't know which messages the server has archived
+    mirror = local_mirror(remote or no_archived)
+    if mirror:
+        messages = mirror.search(query, device=device, message_type=type, limit=limit)
+        archived = 'from the local mirror'
+    else:
+        params = {'q': query, 'limit': limit}
+        if type:
+            params['type'] = type
+        if device:
+            params['device'] = device
+        if no_archived:
+            params['archived'] = 'false'
+        
+        response = make_request('/api/v1/messages/search', params=params)
+        if not response:
+            return
+        
+        if response.status_code != 200:
+            click.echo(f"❌ Error searching messages: {response.status_code} - {response.text}", err=True)
+            return
+        
+        data = response.json()
+        messages = data.get('messages', [])
+        archived = f"{data.get('archived_returned', 0)} archived"
+    
+    if not messages:
+        click.echo(f"📭 No messages matching '{query}'")
+        return
+    
+    click.echo(f"🔍 {len(messages)} messages matching '{query}' ({archived})")
+    if not verbose:
+        click.echo(f"{'Status':<2} {'ID':<10} {'Type':<15} {'Sender':<20} {'Content'}")
+        click.echo("-" * 80)
+    
+    for message in messages:
+        format_message(message, verbose)
+
 @cli.command('mark-read')
 @click.argument('message_id')
 def mark_read(message_id):
-    """Mark a message as read"""
+    """Mark a message as read (for this CLI's client ID)"""
     
     response = make_request(f'/api/v1/messages/{message_id}/read', method='PUT')
     if not response:
         return
     
     if response.status_code == 200:
-        click.echo(f"✅ Message {message_id[:8]} marked as read")
+        click.echo(f"✅ Message {message_id[-8:]} marked as read")
+        refresh_mirror_read_state()
     elif response.status_code == 404:
         click.echo(f"❌ Message {message_id} not found", err=True)
     else:
         click.echo(f"❌ Error: {response.status_code} - {response.text}", err=True)
 
+@cli.command('mark-unread')
+@click.argument('message_id')
+def mark_unread(message_id):
+    """Mark a message as unread again"""
+    
+    response = make_request(f'/api/v1/messages/{message_id}/unread', method='PUT')
+    if not response:
+        return
+    
+    if response.status_code == 200:
+        click.echo(f"✅ Message {message_id[-8:]} marked as unread")
+        refresh_mirror_read_state()
+    elif response.status_code == 404:
+        click.echo(f"❌ Message {message_id} not found", err=True)
+    else:
+        click.echo(f"❌ Error: {response.status_code} - {response.text}", err=True)
+
+@cli.command('mark-all-read')
+@click.option('--up-to', type=int, help='Only messages up to this sequence ID (default: all)')
+def mark_all_read(up_to):
+    """Mark every message as read"""
+    
+    params = {'up_to': up_to} if up_to is not None else None
+    response = make_request('/api/v1/messages/read-all', method='PUT', params=params)
+    if not response:
+        return
+    
+    if response.status_code == 200:
+        click.echo(f"✅ {response.json().get('message')}")
+        refresh_mirror_read_state()
+    else:
+        click.echo(f"❌ Error: {response.status_code} - {response.text}", err=True)
+
 @cli.command()
-@click.option('--verbose', '-v', is_flag=True, help='Show detailed error information')
-def status(verbose):
-    """Show server status and statistics"""
+@click.option('--device', '-d', help='Source device to purge (* matches any characters)')
+@click.option('--type', '-t', help='Message type to purge')
+@click.option('--before', '-b', help='Only messages received before this time (ISO 8601)')
+@click.option('--yes', '-y', is_flag=True, help='Do not ask for confirmation')
+def purge(device, type, before, yes):
+    """Permanently delete matching messages, including archived ones"""
     
-    # Get health status
-    health_response = make_request('/health')
-    if not health_response:
+    if not (device or type or before):
+        click.echo("❌ Give at least one of --device, --type or --before", err=True)
         return
     
-    if health_response.status_code != 200:
-        click.echo(f"❌ Server unhealthy: {health_response.status_code}", err=True)
-        if verbose:
-            try:
-                error_data = health_response.json()
-                click.echo(f"   Error details: {error_data}", err=True)
-            except:
-                click.echo(f"   Raw response: {health_response.text}", err=True)
+    criteria = ', '.join(f"{name}={value}" for name, value in
+                         [('device', device), ('type', type), ('before', before)] if value)
+    if not yes:
+        click.confirm(f"Permanently delete all messages matching {criteria}?", abort=True)
+    
+    params = {key: value for key, value in [('device', device), ('type', type), ('before', before)] if value}
+    response = make_request('/api/v1/messages', method='DELETE', params=params)
+    if not response:
         return
     
-    # Get sync status
-    sync_response = make_request('/api/v1/sync/status')
-    if not sync_response:
+    if response.status_code != 202:
+        click.echo(f"❌ Error: {response.status_code} - {response.text}", err=True)
         return
     
-    if sync_response.status_code != 200:
-        click.echo(f"❌ Could not get sync status: {sync_response.status_code}", err=True)
+    # Poll the job until it finishes
+    job = response.json()['job']
+    click.echo(f"🗑️  Purge job {job['id']} started")
+    while job['status'] in ('pending', 'running'):
+        time.sleep(1)
+        job_response = make_request(f"/api/v1/jobs/{job['id']}")
+        if not job_response or job_response.status_code != 200:
+            click.echo(f"\n❌ Lost track of job {job['id']}", err=True)
+            return
+        job = job_response.json()
+        if job['total']:
+            click.echo(f"\r   {job['processed']}/{job['total']} messages deleted", nl=False)
+    click.echo()
+    
+    if job['status'] == 'completed':
+        result = job['result']
+        click.echo(f"✅ Deleted {result['deleted']} messages ({result['archived_deleted']} more from the archive)")
+    else:
+        click.echo(f"❌ Purge failed: {job['error']}", err=True)
+
+@cli.command()
+@click.option('--verbose', '-v', is_flag=True, help='Show detailed error information')
+@click.option('--remote', is_flag=True, help='Ask the server even if the local mirror is enabled')
+def status(verbose, remote):
+    """Show server status and statistics"""
+    
+    mirror = local_mirror(remote)
+    if mirror:
+        device_stats = {}
+        for (device, _), count in mirror.counts().items():
+            device_stats[device] = device_stats.get(device, 0) + count
+        sync_data = {
+            'total_messages': sum(device_stats.values()),
+            'unread_count': mirror.unread_count(),
+            'latest_timestamp': mirror.latest_received_at(),
+            'device_stats': device_stats
+        }
+        state = f"📦 Local mirror, synced {format_timestamp(mirror.meta('synced_at'))}"
+    else:
+        # Get health and sync status together
+        health_response, sync_response = make_requests('/health', '/api/v1/sync/status')
+        if not health_response:
+            return
+    
+        if health_response.status_code != 200:
+            click.echo(f"❌ Server unhealthy: {health_response.status_code}", err=True)
+            if verbose:
+                try:
+                    error_data = health_response.json()
+                    click.echo(f"   Error details: {error_data}", err=True)
+                except:
+                    click.echo(f"   Raw response: {health_response.text}", err=True)
+            return
+    
+        if not sync_response:
+            return
+    
+        if sync_response.status_code != 200:
+            click.echo(f"❌ Could not get sync status: {sync_response.status_code}", err=True)
         
-        # Show detailed error information
-        try:
-            error_data = sync_response.json()
-            error_msg = error_data.get('error', 'Unknown error')
-            click.echo(f"   Server error: {error_msg}", err=True)
+            # Show detailed error information
+            try:
+                error_data = sync_response.json()
+                error_msg = error_data.get('error', 'Unknown error')
+                click.echo(f"   Server error: {error_msg}", err=True)
             
-            if verbose or sync_response.status_code == 500:
-                click.echo(f"   Full response: {sync_response.text}", err=True)
+                if verbose or sync_response.status_code == 500:
+                    click.echo(f"   Full response: {sync_response.text}", err=True)
                 
-            # Provide helpful hints for common errors
-            if sync_response.status_code == 500:
-                click.echo("   💡 Common causes:", err=True)
-                click.echo("      - Database not initialized (run: python init_db.py)", err=True)
-                click.echo("      - Missing dependencies (run: pip install -r requirements.txt)", err=True)
-                click.echo("      - Server configuration issues", err=True)
-        except:
-            click.echo(f"   Raw response: {sync_response.text}", err=True)
-        return
+                # Provide helpful hints for common errors
+                if sync_response.status_code == 500:
+                    click.echo("   💡 Common causes:", err=True)
+                    click.echo("      - Database not initialized (run: python init_db.py)", err=True)
+                    click.echo("      - Missing dependencies (run: pip install -r requirements.txt)", err=True)
+                    click.echo("      - Server configuration issues", err=True)
+            except:
+                click.echo(f"   Raw response: {sync_response.text}", err=True)
+            return
     
-    sync_data = sync_response.json()
+        sync_data = sync_response.json()
+        state = "✅ Healthy"
     
     click.echo("🚀 Message Hub Server Status")
     click.echo("=" * 40)
     click.echo(f"Server URL: {config.server_url}")
-    click.echo(f"Status: ✅ Healthy")
+    click.echo(f"Status: {state}")
     click.echo(f"Total Messages: {sync_data.get('total_messages', 0)}")
+    click.echo(f"Unread ({config.client_id}): {sync_data.get('unread_count', 0)}")
     click.echo(f"Latest Message: {format_timestamp(sync_data.get('latest_timestamp'))}")
     
     device_stats = sync_data.get('device_stats', {})
@@ -259,11 +545,32 @@ def status(verbose):
             click.echo(f"  {device}: {count} messages")
 
 @cli.command()
-def sync():
+@click.option('--full', is_flag=True, help='Fetch every message into the local mirror (resumable)')
+@click.option('--workers', '-w', type=int, help='Ranges fetched at once with --full (default: sync_workers)')
+def sync(full, workers):
     """Perform a delta sync to show new messages"""
     
-    # Get sync status first
-    status_response = make_request('/api/v1/sync/status')
+    if full:
+        if workers:
+            config.sync_workers = workers
+        mirror = open_mirror()
+        pending = len(mirror.pending_ranges())
+        if pending:
+            click.echo(f"🔄 Resuming full sync of {config.server_url}: {pending} ranges left")
+        else:
+            click.echo(f"🔄 Full sync of {config.server_url} into {MIRROR_FILE}")
+        _pull_with_progress(mirror, config.sync_workers)
+        click.echo(f"   Mirror holds {sum(mirror.counts().values()):,} messages")
+        if not config.mirror:
+            click.echo("   Run `message-hub mirror enable` to answer messages, search and status from it")
+        return
+    
+    # Sync messages from 1 hour ago to now, fetched along with the sync status
+    from datetime import timedelta
+    one_hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    
+    params = {'since': one_hour_ago, 'limit': 20}
+    status_response, sync_response = make_requests('/api/v1/sync/status', ('/api/v1/sync/messages', params))
     if not status_response or status_response.status_code != 200:
         click.echo("❌ Could not get sync status", err=True)
         return
@@ -275,13 +582,6 @@ def sync():
         click.echo("📭 No messages to sync")
         return
     
-    # Perform sync - get messages from 1 hour ago to now
-    from datetime import timedelta
-    one_hour_ago = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
-    
-    params = {'since': one_hour_ago, 'limit': 20}
-    sync_response = make_request('/api/v1/sync/messages', params=params)
-    
     if not sync_response or sync_response.status_code != 200:
         click.echo("❌ Sync failed", err=True)
         return
@@ -301,16 +601,367 @@ def sync():
         for message in messages[-5:]:  # Show last 5
             format_message(message, verbose=False)
 
+@cli.command()
+@click.option('--format', 'export_format', type=click.Choice(['ndjson', 'csv']), default='ndjson',
+              help='One JSON message per line, or CSV with a header row')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress (on the server)')
+@click.option('--since', help='Only messages received after this time (ISO 8601)')
+@click.option('--device', '-d', help='Filter by source device')
+@click.option('--type', '-t', help='Filter by message type')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, writable=True),
+              help='File to write (default: standard output)')
+def export(export_format, compress, since, device, type, output):
+    """Export messages, oldest first, as they stream from the server"""
+    params = {'format': export_format}
+    for name, value in (('since', since), ('device', device), ('type', type)):
+        if value:
+            params[name] = value
+    if compress:
+        params['gzip'] = 'true'
+    
+    # Written under a temporary name, so an interrupted export never looks complete
+    partial = Path(f"{output}.part") if output else None
+    out = open(partial, 'wb') if partial else click.get_binary_stream('stdout')
+    started = time.perf_counter()
+    written = chunks = 0
+    shown = started
+    completed = False
+    try:
+        # Each response is one chunk; X-Export-Next says where the next one starts
+        while True:
+            response = send_request('/api/v1/messages/export', params=params, stream=True)
+            if response.status_code != 200:
+                try:
+                    error = response.json().get('error')
+                except ValueError:
+                    error = f"HTTP {response.status_code}"
+                raise click.ClickException(f"Export failed: {error}")
+            with response:
+                for data in response.iter_content(chunk_size=64 * 1024):
+                    out.write(data)
+                    written += len(data)
+                    now = time.perf_counter()
+                    if output and now - shown >= 0.5:
+                        shown = now
+                        click.echo(f"\r   {written / 2**20:,.1f} MB, {written / 2**20 / (now - started):,.1f} MB/s",
+                                   nl=False, err=True)
+            chunks += 1
+            next_since = response.headers.get('X-Export-Next')
+            if not next_since:
+                break
+            params.update(since=next_since, header='false')
+        completed = True
+    except requests.exceptions.RequestException as e:
+        report_request_error(e)
+        click.echo("   Export stopped before the end", err=True)
+        sys.exit(1)
+    finally:
+        if partial:
+            out.close()
+            if not completed:
+                partial.unlink()
+        else:
+            out.flush()
+    
+    if partial:
+        partial.replace(output)
+        elapsed = time.perf_counter() - started
+        click.echo(f"\r✅ Exported {written / 2**20:,.1f} MB in {elapsed:.1f}s "
+                   f"({written / 2**20 / max(elapsed, 1e-9):,.1f} MB/s, {chunks} responses) to {output}", err=True)
+
+@cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'input_format', type=click.Choice(['ndjson', 'csv']),
+              help='Input format (default: csv for .csv files, else ndjson)')
+@click.option('--batch-size', '-b', default=500, type=click.IntRange(1, 1000), help='Messages per request')
+@click.option('--concurrency', '-c', default=4, type=click.IntRange(1, 64), help='Requests in flight')
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help='Progress file for resuming (default: <path>.import-checkpoint)')
+@click.option('--restart', is_flag=True, help='Ignore a saved checkpoint and start from the beginning')
+def import_messages(path, input_format, batch_size, concurrency, checkpoint, restart):
+    """Import messages from an NDJSON or CSV file (resumable)"""
+    # Also run as `python cli/main.py`, where the project root isn't on the path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from cli.importer import Checkpoint, ImportFailed, detect_format, run_import
+    
+    input_format = input_format or detect_format(path)
+    try:
+        progress_file = Checkpoint.open(checkpoint or f"{path}.import-checkpoint", path, config.server_url, restart)
+    except ImportFailed as e:
+        click.echo(f"❌ {e}", err=True)
+        sys.exit(1)
+    state = progress_file.state
+    total = state['size']
+    resumed_from, done_before = state['offset'], state['created'] + state['existing']
+    if resumed_from:
+        click.echo(f"📥 Resuming import of {path} at {resumed_from / max(total, 1):.0%} "
+                   f"({done_before:,} messages in)")
+    else:
+        click.echo(f"📥 Importing {path} ({input_format}, {total / 2**20:,.1f} MB) into {config.server_url}")
+    
+    started = shown = time.perf_counter()
+    
+    def progress(offset, created, existing):
+        nonlocal shown
+        now = time.perf_counter()
+        if now - shown < 0.5:
+            return
+        shown = now
+        elapsed = now - started
+        rate = (created + existing - done_before) / elapsed
+        byte_rate = (offset - resumed_from) / elapsed
+        line = f"\r   {created + existing:,} messages ({offset / max(total, 1):.0%}), {rate:,.0f}/s"
+        if byte_rate:
+            line += f", ~{(total - offset) / byte_rate:.0f}s left"
+        click.echo(line + "   ", nl=False, err=True)
+    
+    # One pooled connection per request in flight
+    get_session(concurrency)
+    try:
+        state = run_import(lambda endpoint, data: send_request(endpoint, 'POST', data), path, input_format,
+                           progress_file, concurrency, progress, batch_size, backoff=config.retry_backoff)
+    except ImportFailed as e:
+        click.echo(f"\n❌ Import stopped: {e}", err=True)
+        click.echo(f"   Run it again to resume from byte {state['offset']:,} (with --restart if you edit the file)",
+                   err=True)
+        sys.exit(1)
+    except requests.exceptions.RequestException as e:
+        click.echo("", err=True)
+        report_request_error(e)
+        click.echo(f"   Run it again to resume from byte {state['offset']:,}", err=True)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        click.echo(f"\n⏸️  Interrupted; run it again to resume from byte {state['offset']:,}", err=True)
+        sys.exit(130)
+    progress_file.remove()
+    
+    elapsed = time.perf_counter() - started
+    imported = state['created'] + state['existing'] - done_before
+    click.echo(f"\r✅ Imported {imported:,} messages in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):,.0f}/s)"
+               + " " * 20, err=True)
+    if state['existing']:
+        click.echo(f"   {state['existing']:,} were already on the server and were skipped", err=True)
+
+@cli.command()
+@click.option('--since', help='Start from this time (ISO 8601) instead of the newest message')
+@click.option('--device', '-d', help='Filter by source device')
+@click.option('--type', '-t', help='Filter by message type')
+@click.option('--interval', default=1.0, help='Seconds between polls while messages arrive')
+@click.option('--max-interval', default=15.0, help='Longest wait between polls while idle')
+@click.option('--duration', type=float, help='Stop after this many seconds (default: until Ctrl-C)')
+@click.option('--verbose', '-v', is_flag=True, help='Show detailed message information')
+def watch(since, device, type, interval, max_interval, duration, verbose):
+    """Follow new messages as they arrive"""
+    # Also run as `python cli/main.py`, where the project root isn't on the path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from cli.watch import Follower, parse_time
+    
+    # Start from the server's clock, not ours
+    if since:
+        try:
+            start = parse_time(since)
+        except ValueError:
+            click.echo("❌ Invalid --since. Use ISO 8601 format (e.g., 2024-01-01T12:00:00Z)", err=True)
+            sys.exit(1)
+    else:
+        status_response = make_request('/api/v1/sync/status')
+        if not status_response or status_response.status_code != 200:
+            click.echo("❌ Could not get sync status", err=True)
+            sys.exit(1)
+        status_data = status_response.json()
+        start = parse_time(status_data.get('latest_timestamp') or status_data['server_time'])
+    
+    follower = Follower(lambda endpoint, params: send_request(endpoint, params=params), start, device, type)
+    click.echo(f"👀 Watching {config.server_url} for new messages (Ctrl-C to stop)")
+    
+    deadline = time.monotonic() + duration if duration else None
+    delay, failures, shown = interval, 0, 0
+    try:
+        while True:
+            try:
+                messages = follower.poll()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # Keep the cursor and retry with backoff; nothing is skipped
+                failures += 1
+                if failures == 1:
+                    click.echo(f"⚠️  Lost the server ({e.__class__.__name__}), reconnecting...", err=True)
+                delay = random.uniform(interval, min(max_interval, interval * 2 ** failures))
+            else:
+                if failures:
+                    click.echo("✅ Reconnected", err=True)
+                    failures = 0
+                for message in messages:
+                    format_message(message, verbose)
+                shown += len(messages)
+                # Poll again soon while messages arrive, back off while idle
+                delay = interval if messages else min(delay * 1.5, max_interval)
+            
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    break
+                delay = min(delay, deadline - time.monotonic())
+            time.sleep(max(delay, 0))
+    except KeyboardInterrupt:
+        pass
+    click.echo(f"\n📬 {shown} new messages")
+
+@cli.command()
+@click.option('--scenario', type=click.Path(exists=True, dir_okay=False),
+              help='Scenario JSON file (default: benchmarks/scenarios/mixed.json)')
+@click.option('--rate', '-r', type=float, help='Target requests per second (overrides the scenario)')
+@click.option('--duration', '-d', type=float, help='Measured seconds (overrides the scenario)')
+@click.option('--warmup', type=float, help='Unmeasured seconds first (overrides the scenario)')
+@click.option('--connections', '-c', default=32, help='Maximum requests in flight')
+@click.option('--timeout', default=10.0, help='Request timeout in seconds')
+@click.option('--local', is_flag=True, help='Start the app in this process as a stand-in server')
+@click.option('--seed', type=int, help='Random seed for arrivals and request mix')
+@click.option('--json', 'as_json', is_flag=True, help='Print results as JSON')
+@click.option('--hgrm', type=click.Path(dir_okay=False), help='Write the latency distribution (.hgrm) here')
+def bench(scenario, rate, duration, warmup, connections, timeout, local, seed, as_json, hgrm):
+    """Open-loop load test: send a request mix at a fixed rate and report latency percentiles"""
+    # Also run as `python cli/main.py`, where the project root isn't on the path
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from cli.bench import Bench, PERCENTILES, load_scenario, start_local_server
+
+    try:
+        settings = load_scenario(scenario)
+    except (OSError, ValueError) as e:
+        click.echo(f"❌ Invalid scenario: {e}", err=True)
+        sys.exit(1)
+    rate = rate or settings.get('rate', 50)
+    duration = duration or settings.get('duration', 30)
+    warmup = settings.get('warmup', 5) if warmup is None else warmup
+
+    server_url, server = config.server_url, None
+    if local:
+        server_url, server = start_local_server()
+        click.echo(f"🧪 Local stand-in server at {server_url} (one process, threaded)", err=as_json)
+    elif not make_request('/health'):
+        sys.exit(1)
+
+    run = Bench(server_url, settings, rate, duration, warmup, connections, timeout, seed)
+    click.echo(f"🚀 {rate:g} req/s for {duration:g}s (+{warmup:g}s warm-up) against {server_url}", err=as_json)
+    try:
+        elapsed = run.run(progress=lambda at: click.echo(f"   {at:.0f}s", err=True))
+    finally:
+        if server:
+            server.shutdown()
+    results = run.results(elapsed)
+    if hgrm:
+        run.write_hgrm(hgrm)
+
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+    else:
+        labels = [f'p{p:g}' for p in PERCENTILES]
+        click.echo(f"\n📊 Latency from intended send time (ms), over {elapsed:.1f}s:")
+        click.echo(f"{'Request':<14} {'Count':>7} {'Req/s':>8} {'Errors':>7} " +
+                   ' '.join(f'{label:>9}' for label in labels) + f" {'max':>9}")
+        click.echo("-" * (40 + 10 * (len(labels) + 1)))
+        for name, row in results['requests'].items():
+            click.echo(f"{name:<14} {row['count']:>7} {row['throughput']:>8.1f} {row['error_rate']:>7.1%} " +
+                       ' '.join(f"{row[label + '_ms']:>9.2f}" for label in labels) + f" {row['max_ms']:>9.2f}")
+        service = results['service_time']
+        click.echo(f"\nService time alone (from actual send): " +
+                   ', '.join(f"{label} {service[label + '_ms']:.2f}" for label in labels))
+        achieved = results['requests']['all']['throughput']
+        if results['late_sends'] > 0.01 * results['requests']['all']['count'] or achieved < rate * 0.95:
+            click.echo(f"⚠️  {achieved:.1f} of {rate:g} req/s completed, {results['late_sends']} requests waited "
+                       f">10ms for a connection: the server (or --connections) is saturated")
+        for sample in results['error_samples']:
+            click.echo(f"   error: {sample}", err=True)
+        if hgrm:
+            click.echo(f"💾 Latency distribution written to {hgrm}")
+
+@cli.group('mirror')
+def mirror_group():
+    """Local copy of the messages for offline, instant queries"""
+
+def _pull_with_progress(mirror, workers=None):
+    started = time.perf_counter()
+    
+    def progress(added, expected):
+        rate = added / max(time.perf_counter() - started, 1e-9)
+        line = f"\r   {added:,} messages"
+        if expected:
+            # Ranges are sized by sequence ID, so purged messages make this an upper bound
+            line += f" of ~{expected:,} ({min(added / expected, 1):.0%}), {rate:,.0f}/s"
+            if rate:
+                line += f", ~{max(expected - added, 0) / rate:.0f}s left"
+        else:
+            line += f", {rate:,.0f}/s"
+        click.echo(line + "   ", nl=False, err=True)
+    
+    try:
+        added = pull_mirror(mirror, progress, workers)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        click.echo(f"\n❌ Sync stopped ({e.__class__.__name__}); run it again to resume", err=True)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        click.echo("\n⏸️  Interrupted; run it again to resume", err=True)
+        sys.exit(130)
+    elapsed = time.perf_counter() - started
+    click.echo(f"\r✅ {added:,} new messages in {elapsed:.1f}s ({added / max(elapsed, 1e-9):,.0f}/s)" + " " * 20, err=True)
+
+@mirror_group.command('enable')
+def mirror_enable():
+    """Copy every message locally; messages, search and status then use the copy"""
+    mirror = open_mirror()
+    click.echo(f"📦 Mirroring {config.server_url} into {MIRROR_FILE}")
+    _pull_with_progress(mirror, config.sync_workers)
+    config.mirror = True
+    config.save_config()
+    click.echo("   Use --remote on messages, search or status to ask the server instead")
+
+@mirror_group.command('sync')
+@click.option('--rebuild', is_flag=True, help='Start over (drops messages since purged on the server)')
+def mirror_sync(rebuild):
+    """Pull new messages and the read state into the mirror"""
+    mirror = open_mirror()
+    if rebuild:
+        mirror.reset()
+    _pull_with_progress(mirror, config.sync_workers)
+
+@mirror_group.command('disable')
+@click.option('--delete', is_flag=True, help='Also delete the mirror file')
+def mirror_disable(delete):
+    """Go back to asking the server"""
+    config.mirror = False
+    config.save_config()
+    if delete:
+        for path in (MIRROR_FILE, Path(f"{MIRROR_FILE}-wal"), Path(f"{MIRROR_FILE}-shm")):
+            if path.exists():
+                path.unlink()
+    click.echo("✅ Mirror disabled" + (" and deleted" if delete else ""))
+
+@mirror_group.command('status')
+def mirror_status():
+    """Show what the mirror holds"""
+    if not MIRROR_FILE.exists():
+        click.echo("📭 No mirror (run: message-hub mirror enable)")
+        return
+    mirror = open_mirror()
+    click.echo("📦 Local Mirror")
+    click.echo(f"   Enabled: {'yes' if config.mirror else 'no'}")
+    click.echo(f"   File: {MIRROR_FILE} ({MIRROR_FILE.stat().st_size / 2**20:.1f} MB)")
+    click.echo(f"   Server: {mirror.meta('server_url', 'unknown')} (client {mirror.meta('client_id', 'unknown')})")
+    click.echo(f"   Messages: {sum(mirror.counts().values())}")
+    click.echo(f"   Newest: {format_timestamp(mirror.latest_received_at())}")
+    click.echo(f"   Last sync: {format_timestamp(mirror.meta('synced_at'))}")
+
 @cli.command()
 @click.option('--server-url', prompt='Server URL', default=DEFAULT_SERVER_URL)
-def config_set(server_url):
+@click.option('--client-id', prompt='Client ID (read state)', default=DEFAULT_CLIENT_ID)
+def config_set(server_url, client_id):
     """Configure CLI settings"""
     
     config.server_url = server_url
+    config.client_id = client_id
     config.save_config()
     
     click.echo(f"✅ Configuration saved:")
     click.echo(f"   Server URL: {server_url}")
+    click.echo(f"   Client ID: {client_id}")
     click.echo(f"   Config file: {CONFIG_FILE}")
 
 @cli.command('config-show')
@@ -319,6 +970,11 @@ def config_show():
     
     click.echo("⚙️  Current Configuration:")
     click.echo(f"   Server URL: {config.server_url}")
+    click.echo(f"   Client ID: {config.client_id}")
+    click.echo(f"   Retries on 429/503: {config.retries} (backoff from {config.retry_backoff}s)")
+    click.echo(f"   Local mirror: {'enabled' if config.mirror else 'disabled'} "
+               f"(synced when older than {config.mirror_max_age}s)")
+    click.echo(f"   Full sync workers: {config.sync_workers}")
     click.echo(f"   Config file: {CONFIG_FILE}")
     
     if CONFIG_FILE.exists():
@@ -332,8 +988,12 @@ def test():
     
     click.echo(f"🔍 Testing connection to: {config.server_url}")
     
+    # The three checks don't depend on each other, so send them together
+    response, sync_response, messages_response = make_requests(
+        '/health', '/api/v1/sync/status', ('/api/v1/messages', {'per_page': 1})
+    )
+    
     # Test basic connectivity
-    response = make_request('/health')
     if not response:
         click.echo("❌ Cannot connect to server")
         return
@@ -348,7 +1008,6 @@ def test():
         return
     
     # Test sync status
-    sync_response = make_request('/api/v1/sync/status')
     if sync_response and sync_response.status_code == 200:
         click.echo("✅ Sync status endpoint working")
         sync_data = sync_response.json()
@@ -364,7 +1023,6 @@ def test():
                 click.echo(f"   Raw response: {sync_response.text}")
     
     # Test messages endpoint
-    messages_response = make_request('/api/v1/messages', params={'per_page': 1})
     if messages_response and messages_response.status_code == 200:
         click.echo("✅ Messages endpoint working")
     else:
@@ -0,0 +1,438 @@
+"""
+Local SQLite mirror of the server's messages for the CLI
+
+`message-hub mirror enable` copies every message into MIRROR_FILE. After that,
+each command pulls only what is new: a delta sync from the stored received_at
+cursor, re-reading watch.OVERLAP before it so late commits aren't missed.
+Every page is inserted in one transaction together with the new cursor, so an
+interrupted sync resumes where it stopped and never leaves half a page.
+
+messages, search and status then answer from local indexes, and still work
+when the server is unreachable. Per device and type counts are kept in their
+own table as pages arrive, so status doesn't count a million rows.
+
+Read state comes from the server as the client's watermark and exceptions
+(GET /api/v1/read-state?ids=true). Whether a message is read is computed from
+them, so marking everything read changes one row here too.
+
+A large gap (a new mirror, or weeks offline) is caught up by sequence ID
+instead: the IDs between the newest one here and the server's are split into
+one range per worker, fetched concurrently, and each range's position is
+stored with its pages. Sequence ranges hold about as many messages each
+however unevenly they arrived, where time ranges would not. The received_at
+cursor only moves past the ranges once they are all in.
+
+Messages archived on the server stay in the mirror; server search includes
+them as well. Purged ones stay until `mirror sync --rebuild`.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from cli.watch import OVERLAP, format_time, parse_time
+
+# The sync endpoint's largest page
+PAGE_SIZE = 1000
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    sequence_id INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    source_device TEXT NOT NULL,
+    type TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    received_at INTEGER NOT NULL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_received_at ON messages (received_at);
+CREATE INDEX IF NOT EXISTS messages_type ON messages (type, received_at);
+CREATE INDEX IF NOT EXISTS messages_device ON messages (source_device, received_at);
+CREATE TABLE IF NOT EXISTS counts (
+    source_device TEXT NOT NULL,
+    type TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (source_device, type)
+);
+CREATE TABLE IF NOT EXISTS read_exceptions (sequence_id INTEGER PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+-- Catch-up ranges: sequence IDs in (start, end], fetched up to position
+CREATE TABLE IF NOT EXISTS sync_ranges (
+    start INTEGER PRIMARY KEY,
+    end INTEGER NOT NULL,
+    position INTEGER NOT NULL
+);
+"""
+
+# Read when at or below the watermark, unless it is an exception (and the reverse above)
+IS_READ = ("((messages.sequence_id <= :watermark) != "
+           "(messages.sequence_id IN (SELECT sequence_id FROM read_exceptions)))")
+
+def to_micros(value):
+    return (parse_time(value) - EPOCH) // timedelta(microseconds=1)
+
+def from_micros(value):
+    return format_time(EPOCH + timedelta(microseconds=value))
+
+def _like(value):
+    return '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+class Mirror:
+    """The mirror database; one per CLI process"""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(str(path), isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def meta(self, key, default=None):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, **values):
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            [(key, None if value is None else str(value)) for key, value in values.items()]
+        )
+
+    def reset(self):
+        """Forget every message, the cursor and the read state"""
+        with self._transaction():
+            for table in ('messages', 'counts', 'read_exceptions', 'meta', 'sync_ranges'):
+                self.connection.execute(f'DELETE FROM {table}')
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+    # Sync
+
+    def synced_seconds_ago(self):
+        synced_at = self.meta('synced_at')
+        if not synced_at:
+            return None
+        return (datetime.now(timezone.utc) - parse_time(synced_at)).total_seconds()
+
+    def cursor(self):
+        value = self.meta('cursor')
+        return parse_time(value) if value else None
+
+    def pull(self, send, server_url, client_id, progress=None, workers=None):
+        """
+        Fetch messages newer than the cursor, page by page, then the read state
+        send(endpoint, params) returns a response or raises requests exceptions.
+        With workers, a gap of more than a page is first caught up that many
+        sequence ranges at a time; an interrupted catch-up is always finished.
+        progress(added, expected) follows every stored page, expected is None
+        when unknown. Returns the number of messages added.
+        """
+        # A mirror of one server (and client) is no use for another
+        if self.meta('server_url') not in (None, server_url) or self.meta('client_id') not in (None, client_id):
+            self.reset()
+        with self._transaction():
+            self._set_meta(server_url=server_url, client_id=client_id)
+
+        added = 0
+        if workers and not self.pending_ranges():
+            added += self.plan_catch_up(send, workers, progress)
+        if self.pending_ranges():
+            added += self.catch_up(send, progress, added)
+        cursor = self.cursor()
+        added = self._pull_since(send, cursor - OVERLAP if cursor else None, progress, added)
+
+        self.pull_read_state(send)
+        return added
+
+    def _pull_since(self, send, since, progress=None, added=0, params=None):
+        """Page through messages received after since, advancing the cursor; returns added plus the new ones"""
+        cursor = self.cursor()
+        page_params = dict(params or {}, limit=PAGE_SIZE, count='false')
+        if since is not None:
+            page_params['since'] = format_time(since)
+        while True:
+            response = send('/api/v1/sync/messages', page_params)
+            response.raise_for_status()
+            data = response.json()
+            messages = data['messages']
+            if messages:
+                last = parse_time(data['last_timestamp'])
+                with self._transaction():
+                    added += self.store(messages)
+                    if cursor is None or last > cursor:
+                        cursor = last
+                        self._set_meta(cursor=format_time(cursor))
+                if progress:
+                    progress(added, None)
+            if not data['has_more'] or not messages:
+                return added
+            # Resume after the page's last (received_at, sequence_id), so messages
+            # sharing one received_at aren't skipped however many there are
+            page_params.update(since=data['last_timestamp'], since_sequence=data['last_sequence_id'])
+
+    # Catch-up
+
+    def pending_ranges(self):
+        return self.connection.execute(
+            'SELECT start, end, position FROM sync_ranges WHERE position < end ORDER BY start'
+        ).fetchall()
+
+    def plan_catch_up(self, send, workers, progress=None):
+        """
+        Split the sequence IDs above the newest one here into up to workers ranges
+        Nothing is planned for a gap of a page or less. Returns the messages
+        added while planning (see below).
+        """
+        response = send('/api/v1/sync/status', None)
+        response.raise_for_status()
+        latest = response.json().get('latest_sequence_id')
+        low = self.connection.execute('SELECT coalesce(max(sequence_id), 0) FROM messages').fetchone()[0]
+        if latest is None or latest - low <= PAGE_SIZE:
+            return 0
+
+        # The ranges only hold IDs above low. Lower ones that committed late
+        # arrive within OVERLAP of the cursor, so re-read that window for them.
+        added = 0
+        cursor = self.cursor()
+        if cursor:
+            added = self._pull_since(send, cursor - OVERLAP, progress, params={'before_sequence': low + 1})
+
+        parts = min(workers, -(-(latest - low) // PAGE_SIZE))
+        bounds = [low + (latest - low) * part // parts for part in range(parts + 1)]
+        with self._transaction():
+            self.connection.execute('DELETE FROM sync_ranges')
+            self.connection.executemany(
+                'INSERT INTO sync_ranges VALUES (?, ?, ?)',
+                [(start, end, start) for start, end in zip(bounds, bounds[1:])]
+            )
+        return added
+
+    def catch_up(self, send, progress=None, added=0):
+        """
+        Fetch the pending ranges concurrently, one thread per range
+        The threads only fetch; pages are stored here, each in one transaction
+        with its range's new position, so an interrupted catch-up resumes from
+        the last stored page of every range. Returns added plus the new ones.
+        """
+        ranges = self.pending_ranges()
+        ends = {start: end for start, end, _ in ranges}
+        expected = added + sum(end - position for _, end, position in ranges)
+        # A few pages per range in flight keeps every connection busy while this thread writes
+        pages = queue.Queue(maxsize=2 * len(ranges))
+        stop = threading.Event()
+
+        def deliver(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def fetch(start, end, position):
+            try:
+                while position < end and not stop.is_set():
+                    response = send('/api/v1/sync/messages', {
+                        'after_sequence': position, 'before_sequence': end + 1, 'limit': PAGE_SIZE, 'count': 'false'
+                    })
+                    response.raise_for_status()
+                    data = response.json()
+                    position = data['last_sequence_id'] if data['has_more'] else end
+                    deliver((start, data['messages'], position))
+            except Exception as e:
+                deliver((start, e, None))
+
+        threads = [threading.Thread(target=fetch, args=range_, daemon=True) for range_ in ranges]
+        for thread in threads:
+            thread.start()
+        try:
+            remaining = len(ranges)
+            while remaining:
+                start, messages, position = pages.get()
+                if isinstance(messages, Exception):
+                    raise messages
+                with self._transaction():
+                    added += self.store(messages)
+                    self.connection.execute('UPDATE sync_ranges SET position = ? WHERE start = ?', (position, start))
+                if position == ends[start]:
+                    remaining -= 1
+                if progress:
+                    progress(added, expected)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        # Every range is in: incremental syncs go on from the newest message
+        with self._transaction():
+            self.connection.execute('DELETE FROM sync_ranges')
+            newest = self.connection.execute('SELECT max(received_at) FROM messages').fetchone()[0]
+            cursor = self.cursor()
+            if newest is not None and (cursor is None or parse_time(from_micros(newest)) > cursor):
+                self._set_meta(cursor=from_micros(newest))
+        return added
+
+    def store(self, messages):
+        """Insert messages not already here, replacing older versions, in the caller's transaction; returns how many were new"""
+        ids = [message['sequence_id'] for message in messages]
+        present = {row[0] for row in self.connection.execute(
+            f"SELECT sequence_id FROM messages WHERE sequence_id IN ({','.join('?' * len(ids))})", ids
+        )}
+        new = [message for message in messages if message['sequence_id'] not in present]
+        # A notification the server coalesced comes back with its id under a new sequence ID
+        replaced = {row[0] for row in self.connection.execute(
+            f"SELECT id FROM messages WHERE id IN ({','.join('?' * len(new))})",
+            [message['id'] for message in new]
+        )} if new else set()
+        if replaced:
+            self.connection.execute(
+                f"DELETE FROM messages WHERE id IN ({','.join('?' * len(replaced))})", list(replaced)
+            )
+        self.connection.executemany(
+            'INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(message['sequence_id'], message['id'], message['source_device'], message['type'],
+              message['sender'], message['content'], to_micros(message['timestamp']),
+              to_micros(message['received_at']), json.dumps(message.get('metadata') or {}))
+             for message in new]
+        )
+        counts = {}
+        for message in new:
+            if message['id'] in replaced:
+                continue
+            key = (message['source_device'], message['type'])
+            counts[key] = counts.get(key, 0) + 1
+        self.connection.executemany(
+            'INSERT INTO counts VALUES (?, ?, ?) '
+            'ON CONFLICT (source_device, type) DO UPDATE SET count = count + excluded.count',
+            [(device, message_type, count) for (device, message_type), count in counts.items()]
+        )
+        return len(new) - len(replaced)
+
+    def pull_read_state(self, send):
+        response = send('/api/v1/read-state', {'ids': 'true', 'count': 'false'})
+        response.raise_for_status()
+        data = response.json()
+        with self._transaction():
+            self.connection.execute('DELETE FROM read_exceptions')
+            self.connection.executemany(
+                'INSERT INTO read_exceptions VALUES (?)',
+                [(sequence_id,) for sequence_id in data['read_above_ids'] + data['unread_below_ids']]
+            )
+            self._set_meta(watermark=data['watermark'],
+                           synced_at=format_time(datetime.now(timezone.utc)))
+
+    # Queries, shaped like the API's messages
+
+    def _watermark(self):
+        return int(self.meta('watermark', 0))
+
+    def _select(self, where, params, limit):
+        rows = self.connection.execute(
+            f"SELECT id, sequence_id, source_device, type, sender, content, timestamp, received_at, "
+            f"metadata, {IS_READ} FROM messages WHERE {where} ORDER BY received_at DESC, sequence_id DESC "
+            f"LIMIT :limit",
+            dict(params, watermark=self._watermark(), limit=limit)
+        ).fetchall()
+        return [{
+            'id': message_id,
+            'sequence_id': sequence_id,
+            'source_device': device,
+            'type': message_type,
+            'sender': sender,
+            'content': content,
+            'timestamp': from_micros(timestamp),
+            'received_at': from_micros(received_at),
+            'metadata': json.loads(metadata or '{}'),
+            'is_read': bool(is_read)
+        } for (message_id, sequence_id, device, message_type, sender, content, timestamp, received_at,
+               metadata, is_read) in rows]
+
+    @staticmethod
+    def _filters(device, message_type):
+        clauses, params = ['1'], {}
+        if device:
+            clauses.append('source_device = :device')
+            params['device'] = device
+        if message_type:
+            clauses.append('type = :type')
+            params['type'] = message_type
+        return clauses, params
+
+    def messages(self, device=None, message_type=None, unread=False, limit=10):
+        """(newest messages, total matching), as /api/v1/messages lists them"""
+        clauses, params = self._filters(device, message_type)
+        if unread:
+            clauses.append(f'NOT {IS_READ}')
+        if unread and not (device or message_type):
+            total = self.unread_count()
+        elif unread:
+            total = self.connection.execute(
+                f"SELECT count(*) FROM messages WHERE {' AND '.join(clauses)}",
+                dict(params, watermark=self._watermark())
+            ).fetchone()[0]
+        else:
+            total = sum(count for (d, t), count in self.counts().items()
+                        if (not device or d == device) and (not message_type or t == message_type))
+        return self._select(' AND '.join(clauses), params, limit), total
+
+    def search(self, query, device=None, message_type=None, limit=20):
+        """Newest messages whose content or sender contains query (case-insensitive for ASCII)"""
+        clauses, params = self._filters(device, message_type)
+        clauses.append("(content LIKE :pattern ESCAPE '\\' OR sender LIKE :pattern ESCAPE '\\')")
+        params['pattern'] = _like(query)
+        return self._select(' AND '.join(clauses), params, limit)
+
+    def counts(self):
+        """{(device, type): count}"""
+        return {(device, message_type): count for device, message_type, count
+                in self.connection.execute('SELECT source_device, type, count FROM counts ORDER BY source_device, type')}
+
+    def unread_count(self):
+        """Messages above the watermark, minus read exceptions above it, plus unread ones below"""
+        watermark = self._watermark()
+        lowest, highest = self.connection.execute(
+            'SELECT (SELECT min(sequence_id) FROM messages), (SELECT max(sequence_id) FROM messages)'
+        ).fetchone()
+        if lowest is None:
+            return 0
+        # Counting walks the rows, so count whichever side of the watermark is shorter
+        if watermark - lowest < highest - watermark:
+            below = self.connection.execute(
+                'SELECT count(*) FROM messages WHERE sequence_id <= ?', (watermark,)
+            ).fetchone()[0]
+            above = sum(self.counts().values()) - below
+        else:
+            above = self.connection.execute(
+                'SELECT count(*) FROM messages WHERE sequence_id > ?', (watermark,)
+            ).fetchone()[0]
+        # CROSS JOIN keeps SQLite from scanning messages for the few exceptions
+        read_above, unread_below = self.connection.execute(
+            'SELECT count(*) FILTER (WHERE sequence_id > :watermark), count(*) FILTER (WHERE sequence_id <= :watermark) '
+            'FROM read_exceptions CROSS JOIN messages USING (sequence_id)', {'watermark': watermark}
+        ).fetchone()
+        return above - read_above + unread_below
+
+    def latest_received_at(self):
+        value = self.connection.execute('SELECT max(received_at) FROM messages').fetchone()[0]
+        return from_micros(value) if value is not None else None
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,75 @@
+"""
+Follow mode for `message-hub watch`
+
+The server has no push channel, and a long poll would hold a worker (gunicorn's
+sync workers serve one request at a time) for every open terminal. watch
+polls the delta sync endpoint instead, which the hot tail and the response
+cache answer without SQL while nothing changes. The interval stretches while
+the stream is idle and snaps back when messages arrive.
+
+received_at is assigned before the commit, so a message from another worker
+can become visible after later ones were fetched. Every poll re-reads the
+OVERLAP before the cursor and drops IDs it has already returned. Only the
+IDs inside that window are remembered, so memory stays bounded however long
+watch runs.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+OVERLAP = timedelta(seconds=5)
+PAGE_SIZE = 200
+# More IDs than this inside OVERLAP (2,000 messages/s) may be shown twice
+MAX_SEEN = 10_000
+
+def parse_time(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def format_time(value):
+    return value.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+class Follower:
+    """A received_at cursor over /api/v1/sync/messages that returns every message once"""
+
+    def __init__(self, send, since, device=None, message_type=None):
+        # send(endpoint, params) returns a response or raises requests exceptions
+        self.send = send
+        # Messages up to since are not returned, even from the overlap
+        self.since = since
+        self.cursor = since
+        self.filters = {key: value for key, value in (('device', device), ('type', message_type)) if value}
+        self.seen = OrderedDict()
+
+    def poll(self):
+        """Messages not returned before, oldest first; raises requests exceptions"""
+        params = dict(self.filters, since=format_time(self.cursor - OVERLAP), limit=PAGE_SIZE)
+        new = []
+        while True:
+            response = self.send('/api/v1/sync/messages', params)
+            response.raise_for_status()
+            data = response.json()
+            for message in data['messages']:
+                if message['id'] in self.seen:
+                    continue
+                received_at = parse_time(message['received_at'])
+                if received_at <= self.since:
+                    continue
+                self.seen[message['id']] = received_at
+                self.cursor = max(self.cursor, received_at)
+                new.append(message)
+            if not data['has_more'] or not data['messages']:
+                break
+            # Resume after the page's last (received_at, sequence_id), so a
+            # run of messages sharing one received_at spans pages
+            params.update(since=data['last_timestamp'], since_sequence=data['last_sequence_id'])
+        self._forget()
+        return new
+
+    def _forget(self):
+        horizon = self.cursor - OVERLAP
+        for message_id, received_at in list(self.seen.items()):
+            if received_at <= horizon:
+                del self.seen[message_id]
+        while len(self.seen) > MAX_SEEN:
+            self.seen.popitem(last=False)
@@ -1,8 +1,25 @@
+import json
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
 
 load_dotenv()
 
+def read_only_sqlite_url(url):
+    """The same SQLite file opened read-only, as the default read replica; None for other databases"""
+    if not url.startswith('sqlite:///') or url.startswith('sqlite:///file:') or url.endswith(':memory:'):
+        return None
+    path = url[len('sqlite:///'):].split('?')[0]
+    return f'sqlite:///file:{path}?mode=ro&uri=true'
+
+def sidecar_path(app, suffix, default_name):
+    """A file or directory beside a SQLite database (<database><suffix>), else instance/<default_name>"""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    database = url.database if url.get_backend_name() == 'sqlite' else None
+    if database and database != ':memory:' and not url.query.get('uri'):
+        return os.path.join(app.instance_path, database) + suffix
+    return os.path.join(app.instance_path, default_name)
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     
@@ -11,6 +28,13 @@ class Config:
         'sqlite:///message_hub.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Read replica - GET requests read through it, e.g. a Postgres streaming
+    # replica (default: a read-only connection pool on the same SQLite file).
+    # Clients read from the primary for READ_YOUR_WRITES_SECONDS after a write.
+    READ_DATABASE_URL = os.environ.get('READ_DATABASE_URL') or read_only_sqlite_url(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_BINDS = {'replica': READ_DATABASE_URL} if READ_DATABASE_URL else {}
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS') or 5)
+    
     # Application settings
     DEBUG = os.environ.get('FLASK_ENV') == 'development'
     HOST = os.environ.get('HOST') or '0.0.0.0'
@@ -22,4 +46,88 @@ class Config:
     
     # Pagination defaults
     DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE') or 50)
-    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE') or 1000)
\ No newline at end of file
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE') or 1000)
+    
+    # Partition settings - months older than the hot window are sealed into
+    # read-only monthly partitions by `flask partitions seal`
+    PARTITION_HOT_MONTHS = int(os.environ.get('PARTITION_HOT_MONTHS') or 2)
+    PARTITION_SEAL_CHUNK_SIZE = int(os.environ.get('PARTITION_SEAL_CHUNK_SIZE') or 5000)
+    PARTITION_CATALOG_TTL = float(os.environ.get('PARTITION_CATALOG_TTL') or 5)
+    
+    # Retention settings - JSON list of rules, first match wins, e.g.
+    # [{"type": "PUSH_NOTIFICATION", "days": 30}, {"device": "old-phone", "days": 90}, {"days": 365}]
+    # Expired messages move to compressed segment files (default: instance/archive)
+    RETENTION_RULES = json.loads(os.environ.get('RETENTION_RULES') or '[]')
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')
+    ARCHIVE_SEGMENT_BYTES = int(os.environ.get('ARCHIVE_SEGMENT_BYTES') or 64 * 1024 * 1024)
+    ARCHIVER_INTERVAL = int(os.environ.get('ARCHIVER_INTERVAL') or 300)
+    ARCHIVER_CHUNK_SIZE = int(os.environ.get('ARCHIVER_CHUNK_SIZE') or 500)
+    ARCHIVER_CHUNK_PAUSE = float(os.environ.get('ARCHIVER_CHUNK_PAUSE') or 0.05)
+    
+    # Hot tail - each worker keeps this many of the newest messages in memory
+    # for sync and the web views (0 disables)
+    HOT_TAIL_SIZE = int(os.environ.get('HOT_TAIL_SIZE') or 1000)
+    
+    # Result cache - per-worker LRU of list/sync response bytes (0 disables)
+    RESULT_CACHE_BYTES = int(os.environ.get('RESULT_CACHE_BYTES') or 16 * 1024 * 1024)
+    RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL') or 30)
+    
+    # Metrics - each worker records into a file in this directory, and
+    # /metrics sums them (default: <database>-metrics next to a SQLite file,
+    # else instance/metrics)
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    
+    # Slow-query log - statements over SLOW_QUERY_MS (0 = off) are logged with
+    # their query plan, and requests repeating one statement more than
+    # QUERY_REPEAT_LIMIT times are flagged as N+1 (default: <database>-queries.log)
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 0)
+    QUERY_REPEAT_LIMIT = int(os.environ.get('QUERY_REPEAT_LIMIT') or 10)
+    QUERY_LOG_PATH = os.environ.get('QUERY_LOG_PATH')
+    
+    # Debug pages (/debug/...) need this token; unset = they are disabled
+    DEBUG_TOKEN = os.environ.get('DEBUG_TOKEN')
+    
+    # Sampling profiler (/debug/profile) - workers write samples to PROFILE_DIR
+    # (default: <database>-profiles); keep PROFILE_MAX_SECONDS below the
+    # gunicorn --timeout
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS') or 10)
+    PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS') or 60)
+    
+    # Device API keys (X-API-Key) on /api/v1: off, optional (keys that are sent
+    # must be valid) or required. Each worker caches key lookups; revoking a
+    # key or deactivating a device reaches all workers on their next request.
+    API_AUTH = (os.environ.get('API_AUTH') or 'optional').lower()
+    API_KEY_CACHE_SIZE = int(os.environ.get('API_KEY_CACHE_SIZE') or 10000)
+    API_KEY_CACHE_TTL = float(os.environ.get('API_KEY_CACHE_TTL') or 300)
+    # Devices' last_sync_at is written in one batch per worker this often
+    LAST_SYNC_FLUSH_SECONDS = float(os.environ.get('LAST_SYNC_FLUSH_SECONDS') or 30)
+    
+    # Parsed per-client read states each worker keeps (services.read_state)
+    READ_STATE_CACHE_SIZE = int(os.environ.get('READ_STATE_CACHE_SIZE') or 1000)
+    
+    # Idempotent ingest - a POST /api/v1/messages repeating a stored message's
+    # client_message_id (or, without one, its device, type, sender, timestamp
+    # and content) returns that message. Each worker remembers recent keys in
+    # a Bloom filter of two generations of DEDUP_FILTER_KEYS keys.
+    DEDUP_CONTENT_HASH = (os.environ.get('DEDUP_CONTENT_HASH') or 'true').lower() == 'true'
+    DEDUP_FILTER_KEYS = int(os.environ.get('DEDUP_FILTER_KEYS') or 100000)
+    
+    # Notification coalescing - a PUSH_NOTIFICATION with the same device,
+    # metadata.app_package and metadata.notification_tag (or thread_id) as one
+    # timestamped within COALESCE_WINDOW_SECONDS replaces it (0 disables).
+    # Each worker remembers the newest row of COALESCE_CACHE_SIZE keys.
+    COALESCE_WINDOW_SECONDS = float(os.environ.get('COALESCE_WINDOW_SECONDS') or 0)
+    COALESCE_CACHE_SIZE = int(os.environ.get('COALESCE_CACHE_SIZE') or 10000)
+    
+    # Batch ingest - POST /api/v1/messages/batch takes at most this many messages
+    BATCH_MAX_MESSAGES = int(os.environ.get('BATCH_MAX_MESSAGES') or 1000)
+    
+    # Export - GET /api/v1/messages/export streams at most EXPORT_CHUNK_ROWS
+    # messages per response; keep one chunk well inside the gunicorn --timeout
+    EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS') or 250000)
+    
+    # Purge settings - DELETE /api/v1/messages deletes in short batches,
+    # pausing between them so ingest is never blocked for long
+    PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE') or 1000)
+    PURGE_BATCH_PAUSE = float(os.environ.get('PURGE_BATCH_PAUSE') or 0.05)
@@ -1,5 +1,9 @@
+import argparse
+import sys
 from app import create_app
 from models import db, Message, Device
+from models.device import hash_api_key
+from services.read_state import DEFAULT_CLIENT, read_state_changed, read_state_from_flags
 from datetime import datetime, timezone
 import uuid
 
@@ -15,7 +19,7 @@ def init_database():
             id='android-phone-1',
             name='John\'s Android Phone',
             type='android',
-            api_key='dev-key-android-phone-1',
+            api_key_hash=hash_api_key('dev-key-android-phone-1'),
             is_active=True
         )
         
@@ -23,7 +27,7 @@ def init_database():
             id='iphone-1',
             name='Jane\'s iPhone',
             type='ios',
-            api_key='dev-key-iphone-1',
+            api_key_hash=hash_api_key('dev-key-iphone-1'),
             is_active=True
         )
         
@@ -70,9 +74,82 @@ def init_database():
         db.session.add_all([device1, device2, message1, message2, message3])
         db.session.commit()
         
+        # The sample flags become the default client's read state
+        with db.engine.begin() as connection:
+            read_state_from_flags(connection, DEFAULT_CLIENT)
+        read_state_changed(DEFAULT_CLIENT)
+        
         print("Database initialized successfully!")
         print(f"Created {Device.query.count()} devices")
         print(f"Created {Message.query.count()} messages")
+        print("Sample API keys: dev-key-android-phone-1, dev-key-iphone-1")
+
+def parse_types(value):
+    """'SMS=20,EMAIL=5' -> {'SMS': 20.0, 'EMAIL': 5.0}"""
+    types = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        try:
+            types[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"expected TYPE=WEIGHT, got '{item}'")
+    return types
+
+def seed_database(args):
+    """Bulk-load synthetic devices and messages for capacity testing"""
+    from services.partitions import months_to_seal, seal_month
+    from services.seed import load_profile, seed_messages
+
+    try:
+        profile = load_profile(args.profile, types=args.types, device_skew=args.device_skew)
+    except (OSError, ValueError) as e:
+        print(f"❌ Invalid profile: {e}")
+        sys.exit(1)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"📦 Seeding {args.messages} messages from {args.devices} devices over {args.days} days")
+        started = datetime.now(timezone.utc)
+
+        def progress(loaded):
+            if loaded % 1_000_000 == 0 or loaded == args.messages:
+                elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+                print(f"   {loaded} messages, {loaded / elapsed:,.0f}/s")
+
+        added, loaded, seconds = seed_messages(
+            args.messages, started, args.days, args.devices, args.seed, profile,
+            batch_size=args.batch_size, transaction_rows=args.transaction_rows,
+            defer_indexes=not args.keep_indexes, progress=progress
+        )
+        print(f"✅ Seeded {loaded} messages and {added} new devices in {seconds:.1f}s "
+              f"({loaded / seconds:,.0f} messages/s, indexes included)")
+
+        if args.seal:
+            for month in months_to_seal():
+                moved = seal_month(month, wait_for_readers=False)
+                print(f"   Sealed {month:%Y-%m}: {moved} messages")
+        print(f"Total: {Device.query.count()} devices, {Message.query.count()} messages in the hot table")
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the database tables and sample data')
+    parser.add_argument('--messages', type=int, help='Seed this many synthetic messages instead of the samples')
+    parser.add_argument('--devices', type=int, default=25, help='Devices the seeded messages come from')
+    parser.add_argument('--days', type=int, default=90, help='Days before now the seeded messages spread over')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (the same seed gives the same data)')
+    parser.add_argument('--profile', help='JSON file overriding the distribution (see services/seed.py)')
+    parser.add_argument('--types', type=parse_types, help='Type mix, e.g. SMS=20,EMAIL=10,PUSH_NOTIFICATION=70')
+    parser.add_argument('--device-skew', type=float, help='Zipf exponent of messages per device (0 = even)')
+    parser.add_argument('--batch-size', type=int, default=10_000, help='Rows per executemany call')
+    parser.add_argument('--transaction-rows', type=int, default=1_000_000, help='Rows per transaction')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='Maintain indexes during the load instead of rebuilding them after')
+    parser.add_argument('--seal', action='store_true', help='Seal months outside the hot window afterwards')
+    args = parser.parse_args()
+    if args.messages:
+        seed_database(args)
+    else:
+        init_database()
 
 if __name__ == '__main__':
-    init_database()
\ No newline at end of file
+    main()
\ No newline at end of file
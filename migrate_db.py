@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Migrate an existing Message Hub database to the current schema
+Each migration checks whether it is needed, so the script is safe to re-run
+"""
+
+from sqlalchemy import inspect, text
+from app import create_app
+from models import db, Device, Message, MessagePartition, ReadState, Thread
+from models.device import hash_api_key
+from services.partitions import partition_table
+from services.read_state import DEFAULT_CLIENT, read_state_from_flags
+from services.threads import rebuild_threads
+
+def column_names(connection, table):
+    """Return the column names of a table, or an empty list if it does not exist"""
+    inspector = inspect(connection)
+    if not inspector.has_table(table):
+        return []
+    return [column['name'] for column in inspector.get_columns(table)]
+
+def needs_sequence_primary_key(connection):
+    columns = column_names(connection, 'messages')
+    return bool(columns) and 'sequence_id' not in columns
+
+def rebuild_messages_table(connection, order_by):
+    """Recreate messages with the current schema, copying rows over in the given order"""
+    legacy_columns = column_names(connection, 'messages')
+    inspector = inspect(connection)
+
+    connection.execute(text('ALTER TABLE messages RENAME TO messages_legacy'))
+    # Index names are schema-wide, drop the old ones before recreating the table
+    for index in inspector.get_indexes('messages_legacy'):
+        connection.execute(text(f'DROP INDEX IF EXISTS {index["name"]}'))
+
+    Message.__table__.create(connection)
+
+    columns = ', '.join(
+        column.name for column in Message.__table__.columns
+        if column.name in legacy_columns
+    )
+    connection.execute(text(
+        f'INSERT INTO messages ({columns}) '
+        f'SELECT {columns} FROM messages_legacy ORDER BY {order_by}'
+    ))
+    connection.execute(text('DROP TABLE messages_legacy'))
+
+def migrate_sequence_primary_key(connection):
+    """
+    Rebuild messages with an integer sequence primary key
+    Existing UUIDs are kept as the external ID, so old links keep resolving.
+    Rows are copied in arrival order so sequence IDs follow received_at.
+    """
+    rebuild_messages_table(connection, 'received_at, created_at')
+
+EPOCH_MICROS_COLUMNS = ['timestamp', 'received_at', 'created_at', 'updated_at']
+
+def needs_epoch_micros_timestamps(connection):
+    if not column_names(connection, 'messages'):
+        return False
+    if connection.dialect.name == 'sqlite':
+        # SQLite keeps the declared type, only the stored values change
+        checks = ' OR '.join(f"typeof({column}) = 'text'" for column in EPOCH_MICROS_COLUMNS)
+        return connection.execute(text(f'SELECT 1 FROM messages WHERE {checks} LIMIT 1')).first() is not None
+    columns = {column['name']: column for column in inspect(connection).get_columns('messages')}
+    return any('TIMESTAMP' in str(columns[column]['type']).upper() for column in EPOCH_MICROS_COLUMNS)
+
+def migrate_epoch_micros_timestamps(connection):
+    """Convert stored message timestamps to integer microseconds since the epoch (UTC)"""
+    for column in EPOCH_MICROS_COLUMNS:
+        if connection.dialect.name == 'sqlite':
+            # Stored as 'YYYY-MM-DD HH:MM:SS.ffffff' in UTC
+            connection.execute(text(
+                f"UPDATE messages SET {column} = "
+                f"CAST(strftime('%s', {column}) AS INTEGER) * 1000000 + "
+                f"CAST(COALESCE(NULLIF(substr({column}, 21, 6), ''), '0') AS INTEGER) "
+                f"WHERE typeof({column}) = 'text'"
+            ))
+        else:
+            connection.execute(text(
+                f"ALTER TABLE messages ALTER COLUMN {column} TYPE BIGINT "
+                f"USING (EXTRACT(EPOCH FROM {column}) * 1000000)::BIGINT"
+            ))
+
+def needs_autoincrement_sequence(connection):
+    if connection.dialect.name != 'sqlite' or not column_names(connection, 'messages'):
+        return False
+    sql = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages'"
+    )).scalar()
+    return 'AUTOINCREMENT' not in sql.upper()
+
+def migrate_autoincrement_sequence(connection):
+    """
+    Rebuild messages with AUTOINCREMENT so sequence IDs are never reused
+    once old months are sealed into partitions (sequence IDs are kept)
+    """
+    rebuild_messages_table(connection, 'sequence_id')
+
+def needs_hashed_api_keys(connection):
+    columns = column_names(connection, 'devices')
+    return 'api_key' in columns and 'api_key_hash' not in columns
+
+def migrate_hashed_api_keys(connection):
+    """Rebuild devices storing SHA-256 hashes of the API keys instead of the keys"""
+    legacy_columns = column_names(connection, 'devices')
+    connection.execute(text('ALTER TABLE devices RENAME TO devices_legacy'))
+    for index in inspect(connection).get_indexes('devices_legacy'):
+        connection.execute(text(f'DROP INDEX IF EXISTS {index["name"]}'))
+
+    Device.__table__.create(connection)
+
+    columns = [column.name for column in Device.__table__.columns if column.name in legacy_columns]
+    connection.execute(text(
+        f'INSERT INTO devices ({", ".join(columns)}, api_key_hash) '
+        f'SELECT {", ".join(columns)}, api_key FROM devices_legacy'
+    ))
+    # The database can't hash, so swap each key for its hash here
+    keys = connection.execute(text('SELECT id, api_key FROM devices_legacy')).all()
+    if keys:
+        connection.execute(text('UPDATE devices SET api_key_hash = :key_hash WHERE id = :id'), [
+            {'id': device_id, 'key_hash': hash_api_key(api_key)} for device_id, api_key in keys
+        ])
+    connection.execute(text('DROP TABLE devices_legacy'))
+
+def needs_read_states(connection):
+    return 'is_read' in column_names(connection, 'messages') and not column_names(connection, 'read_states')
+
+def migrate_read_states(connection):
+    """
+    Turn the shared is_read flags into the default client's read state
+    (a watermark and exceptions); other clients start with nothing read
+    """
+    # Partitions are read too; databases from before them get an empty catalog
+    MessagePartition.__table__.create(connection, checkfirst=True)
+    ReadState.__table__.create(connection)
+    state = read_state_from_flags(connection, DEFAULT_CLIENT)
+    print(f"   watermark {state.watermark}, {len(state)} exceptions")
+
+def needs_dedup_keys(connection):
+    columns = column_names(connection, 'messages')
+    return bool(columns) and 'dedup_key' not in columns
+
+def migrate_dedup_keys(connection):
+    """
+    Add the dedup_key column to messages and every partition table, and its
+    unique index on the hot table (existing messages keep no key)
+    """
+    tables = ['messages']
+    if inspect(connection).has_table('message_partitions'):
+        tables += connection.execute(text('SELECT name FROM message_partitions ORDER BY name')).scalars().all()
+    for table in tables:
+        if column_names(connection, table):
+            connection.execute(text(f'ALTER TABLE {table} ADD COLUMN dedup_key VARCHAR(32)'))
+    for index in Message.__table__.indexes:
+        if 'dedup_key' in index.columns:
+            index.create(connection)
+
+def message_tables(connection):
+    """The hot table and every partition table recorded in the catalog"""
+    tables = [Message.__table__]
+    if inspect(connection).has_table('message_partitions'):
+        names = connection.execute(text('SELECT name FROM message_partitions ORDER BY name')).scalars().all()
+        tables += [partition_table(name) for name in names]
+    return tables
+
+def needs_thread_keys(connection):
+    """
+    Needed without the column, and also when messages have it but no keys
+    or threads: rebuilding messages for the sequence key creates the table
+    with every current column, thread_key included
+    """
+    columns = column_names(connection, 'messages')
+    if not columns:
+        return False
+    if 'thread_key' not in columns or not inspect(connection).has_table('threads'):
+        return True
+    for table in message_tables(connection):
+        table_columns = column_names(connection, table.name)
+        if not table_columns:
+            continue
+        if 'thread_key' not in table_columns or connection.execute(
+            text(f'SELECT 1 FROM {table.name} WHERE thread_key IS NULL LIMIT 1')
+        ).first() is not None:
+            return True
+    has_messages = connection.execute(text('SELECT 1 FROM messages LIMIT 1')).first() is not None
+    return has_messages and connection.execute(text('SELECT 1 FROM threads LIMIT 1')).first() is None
+
+def migrate_thread_keys(connection):
+    """
+    Add the thread_key column and its index to messages and every partition
+    table missing them, then give every message its key and build the
+    threads table
+    """
+    for table in message_tables(connection):
+        columns = column_names(connection, table.name)
+        if not columns:
+            continue
+        if 'thread_key' not in columns:
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN thread_key VARCHAR(32)'))
+        for index in table.indexes:
+            if 'thread_key' in index.columns:
+                index.create(connection, checkfirst=True)
+    MessagePartition.__table__.create(connection, checkfirst=True)
+    Thread.__table__.create(connection, checkfirst=True)
+    filled, threads = rebuild_threads(connection)
+    print(f"   {filled} messages in {threads} threads")
+
+MIGRATIONS = [
+    ('integer sequence primary key for messages', needs_sequence_primary_key, migrate_sequence_primary_key),
+    ('epoch microsecond message timestamps', needs_epoch_micros_timestamps, migrate_epoch_micros_timestamps),
+    ('never-reused message sequence IDs', needs_autoincrement_sequence, migrate_autoincrement_sequence),
+    ('hashed device API keys', needs_hashed_api_keys, migrate_hashed_api_keys),
+    ('per-client read state', needs_read_states, migrate_read_states),
+    ('message dedup keys', needs_dedup_keys, migrate_dedup_keys),
+    ('conversation threads', needs_thread_keys, migrate_thread_keys),
+]
+
+def migrate_database():
+    app = create_app()
+
+    with app.app_context():
+        applied = 0
+        for description, is_needed, migrate in MIGRATIONS:
+            with db.engine.begin() as connection:
+                if not is_needed(connection):
+                    continue
+                print(f"Applying migration: {description}")
+                migrate(connection)
+                applied += 1
+
+        # Create any tables that did not exist yet
+        db.create_all()
+
+        if applied:
+            print(f"Applied {applied} migration(s)")
+        else:
+            print("Database schema is up to date")
+
+if __name__ == '__main__':
+    migrate_database()
@@ -1,6 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
+from .session import ReadRoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ReadRoutingSession})
 
 from .message import Message
-from .device import Device
\ No newline at end of file
+from .device import Device
+from .partition import MessagePartition
+from .archive import ArchiveBlock
+from .job import Job
+from .read_state import ReadState
+from .thread import Thread
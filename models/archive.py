@@ -0,0 +1,28 @@
+from . import db
+from .types import EpochMicros
+
+class ArchiveBlock(db.Model):
+    """
+    Sparse index entry for one compressed block of archived messages
+    Blocks are appended to segment files in the archive directory; each entry
+    records where its block lives and the ranges needed to skip it on lookups.
+    """
+    __tablename__ = 'archive_blocks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    segment = db.Column(db.String(64), nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False)
+    length = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False)
+    min_received_at = db.Column(EpochMicros, nullable=False)
+    max_received_at = db.Column(EpochMicros, nullable=False, index=True)
+    min_timestamp = db.Column(EpochMicros, nullable=False)
+    max_timestamp = db.Column(EpochMicros, nullable=False)
+    # Creation time range of the block's UUIDv7 IDs (epoch microseconds)
+    min_id_time = db.Column(db.BigInteger, index=True)
+    max_id_time = db.Column(db.BigInteger)
+    devices = db.Column(db.JSON, nullable=False, default=list)
+    types = db.Column(db.JSON, nullable=False, default=list)
+    # Bloom filter over the block's message IDs, for IDs without a time
+    id_filter = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(EpochMicros, nullable=False)
@@ -1,5 +1,14 @@
 from . import db
 from datetime import datetime
+import hashlib
+import secrets
+
+def generate_api_key(device_id):
+    return f"dev-key-{device_id}-{secrets.token_hex(16)}"
+
+def hash_api_key(api_key):
+    """SHA-256 hex digest; keys are random tokens, so no salt or slow hash is needed"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
 
 class Device(db.Model):
     __tablename__ = 'devices'
@@ -7,7 +16,8 @@ class Device(db.Model):
     id = db.Column(db.String(255), primary_key=True)
     name = db.Column(db.String(255), nullable=False)
     type = db.Column(db.String(50), nullable=False)
-    api_key = db.Column(db.String(255), unique=True, nullable=False)
+    # Only the hash is stored; the key itself is shown once, at registration
+    api_key_hash = db.Column(db.String(64), unique=True, nullable=False)
     last_sync_at = db.Column(db.DateTime(timezone=True))
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow)
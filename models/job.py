@@ -0,0 +1,39 @@
+from . import db
+from datetime import datetime
+from .ids import uuid7
+from .types import EpochMicros, isoformat_utc
+
+class Job(db.Model):
+    """Background job (e.g. a bulk purge) whose progress clients poll"""
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(36), primary_key=True, default=uuid7)
+    type = db.Column(db.String(50), nullable=False)
+    # pending -> running -> completed | failed
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    params = db.Column(db.JSON, default={})
+    total = db.Column(db.Integer)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    created_at = db.Column(EpochMicros, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(EpochMicros)
+    finished_at = db.Column(EpochMicros)
+    updated_at = db.Column(EpochMicros, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'params': self.params or {},
+            'total': self.total,
+            'processed': self.processed,
+            'progress': round(self.processed / self.total, 4) if self.total else None,
+            'result': self.result,
+            'error': self.error,
+            'created_at': isoformat_utc(self.created_at),
+            'started_at': isoformat_utc(self.started_at),
+            'finished_at': isoformat_utc(self.finished_at),
+            'updated_at': isoformat_utc(self.updated_at)
+        }
@@ -1,31 +1,86 @@
 from . import db
 from datetime import datetime
-import uuid
+from sqlalchemy import type_coerce
+from .ids import uuid7
+from .types import EpochMicros, isoformat_micros, isoformat_utc
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    # Sealing moves old rows into partitions; AUTOINCREMENT keeps SQLite from
+    # handing their sequence IDs out again if the hot table ever empties
+    __table_args__ = {'sqlite_autoincrement': True}
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    # Compact, append-only integer key (rowid alias on SQLite); the
+    # time-ordered external ID is what the API exposes
+    sequence_id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    id = db.Column(db.String(36), unique=True, nullable=False, default=uuid7)
     source_device_id = db.Column(db.String(255), nullable=False, index=True)
     type = db.Column(db.String(50), nullable=False, index=True)
     sender = db.Column(db.String(255), nullable=False)
     content = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
-    received_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow, index=True)
+    timestamp = db.Column(EpochMicros, nullable=False, index=True)
+    received_at = db.Column(EpochMicros, nullable=False, default=datetime.utcnow, index=True)
     message_metadata = db.Column(db.JSON, default={})
+    # Hash of the client_message_id or content (services.dedup); a repeated
+    # POST finds the first copy through this index
+    dedup_key = db.Column(db.String(32), unique=True, index=True)
+    # Conversation the message belongs to (services.threads); with the
+    # implicit rowid, the index lists a thread in sequence order
+    thread_key = db.Column(db.String(32), index=True)
+    # Shared read flag from before per-client read state (services.read_state);
+    # migrate_db.py turns it into the 'default' client's state
     is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(EpochMicros, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(EpochMicros, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def to_dict(self):
         return {
             'id': self.id,
+            'sequence_id': self.sequence_id,
             'source_device': self.source_device_id,
             'type': self.type,
             'sender': self.sender,
             'content': self.content,
-            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
-            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'timestamp': isoformat_utc(self.timestamp),
+            'received_at': isoformat_utc(self.received_at),
             'metadata': self.message_metadata or {},
             'is_read': self.is_read
-        }
\ No newline at end of file
+        }
+    
+    @classmethod
+    def serialized_columns(cls, table=None):
+        """
+        Columns for serialize_row(), with timestamps left as raw epoch microseconds
+        Pass a partition table to select the same columns from it.
+        """
+        columns = (table if table is not None else cls.__table__).c
+        return (
+            columns.id,
+            columns.sequence_id,
+            columns.source_device_id,
+            columns.type,
+            columns.sender,
+            columns.content,
+            type_coerce(columns.timestamp, db.BigInteger).label('timestamp'),
+            type_coerce(columns.received_at, db.BigInteger).label('received_at'),
+            columns.message_metadata,
+            columns.is_read
+        )
+    
+    @staticmethod
+    def serialize_row(row):
+        """Serialize a row selected with serialized_columns() - same output as to_dict()"""
+        (message_id, sequence_id, source_device_id, message_type, sender, content,
+         timestamp, received_at, metadata, is_read) = row
+        return {
+            'id': message_id,
+            'sequence_id': sequence_id,
+            'source_device': source_device_id,
+            'type': message_type,
+            'sender': sender,
+            'content': content,
+            'timestamp': isoformat_micros(timestamp),
+            'received_at': isoformat_micros(received_at),
+            'metadata': metadata or {},
+            'is_read': is_read
+        }
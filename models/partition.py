@@ -0,0 +1,36 @@
+from . import db
+from .types import EpochMicros
+
+class MessagePartition(db.Model):
+    """
+    Catalog entry for a monthly message partition (messages_YYYYMM)
+    The received_at/timestamp ranges and per device/type counts are zone maps
+    the query router uses to skip partitions without reading them.
+    """
+    __tablename__ = 'message_partitions'
+    
+    name = db.Column(db.String(64), primary_key=True)
+    month_start = db.Column(EpochMicros, nullable=False, unique=True)
+    month_end = db.Column(EpochMicros, nullable=False)
+    # Read-only triggers on the partition table check this flag
+    writable = db.Column(db.Boolean, nullable=False, default=True)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    min_received_at = db.Column(EpochMicros)
+    max_received_at = db.Column(EpochMicros)
+    min_timestamp = db.Column(EpochMicros)
+    max_timestamp = db.Column(EpochMicros)
+    # [[source_device_id, type, count, unread by the legacy is_read flag], ...]
+    stats = db.Column(db.JSON, default=list)
+    created_at = db.Column(EpochMicros, nullable=False)
+    sealed_at = db.Column(EpochMicros)
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'month_start': self.month_start.isoformat() if self.month_start else None,
+            'writable': self.writable,
+            'row_count': self.row_count,
+            'min_received_at': self.min_received_at.isoformat() if self.min_received_at else None,
+            'max_received_at': self.max_received_at.isoformat() if self.max_received_at else None,
+            'sealed_at': self.sealed_at.isoformat() if self.sealed_at else None
+        }
@@ -0,0 +1,19 @@
+from . import db
+from datetime import datetime
+
+class ReadState(db.Model):
+    """
+    What one client (phone, CLI, web dashboard) has read
+    Every message with sequence_id <= watermark is read, except those in
+    unread_below; above it only those in read_above are. Both are sorted
+    sequence ID arrays, packed as little-endian int64 (services.read_state).
+    """
+    __tablename__ = 'read_states'
+
+    client_id = db.Column(db.String(255), primary_key=True)
+    watermark = db.Column(db.BigInteger, nullable=False, default=0)
+    read_above = db.Column(db.LargeBinary, nullable=False, default=b'')
+    unread_below = db.Column(db.LargeBinary, nullable=False, default=b'')
+    # Bumped on every change; writers retry when another one got in between
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,16 @@
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+
+class ReadRoutingSession(Session):
+    """
+    Session that sends reads to the 'replica' bind when the request allows it
+    services.replica decides per request (read-only method, no recent write);
+    flushes, background jobs and CLI commands always use the primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('read_from_replica'):
+            engine = self._db.engines.get('replica')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
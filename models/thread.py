@@ -0,0 +1,52 @@
+from . import db
+from .types import EpochMicros, isoformat_utc
+
+class Thread(db.Model):
+    """
+    Summary of one conversation: a device's messages sharing a
+    metadata.thread_id, or from the same sender when they have none
+    Maintained at ingest (services.threads); the last_* columns describe the
+    newest message by arrival. Unread counts depend on the client, so they
+    are counted when threads are read.
+    """
+    __tablename__ = 'threads'
+    # Newest first listings walk one of these, the id breaking ties for keyset pagination
+    __table_args__ = (
+        db.Index('ix_threads_activity', 'last_activity', 'id'),
+        db.Index('ix_threads_device_activity', 'source_device_id', 'last_activity', 'id'),
+    )
+
+    # Thread key, also stored in messages.thread_key
+    id = db.Column(db.String(32), primary_key=True)
+    source_device_id = db.Column(db.String(255), nullable=False)
+    # metadata.thread_id of the messages, None for a thread keyed on its sender
+    thread_ref = db.Column(db.String(255))
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    # Lower bound on its messages' received_at, prunes partitions when listing them
+    first_received_at = db.Column(EpochMicros, nullable=False)
+    # received_at of the last message
+    last_activity = db.Column(EpochMicros, nullable=False)
+    last_sequence_id = db.Column(db.BigInteger, nullable=False)
+    last_message_id = db.Column(db.String(36), nullable=False)
+    last_sender = db.Column(db.String(255), nullable=False)
+    last_type = db.Column(db.String(50), nullable=False)
+    last_timestamp = db.Column(EpochMicros, nullable=False)
+    preview = db.Column(db.String(200), nullable=False)
+
+    def to_dict(self, unread_count=None):
+        return {
+            'id': self.id,
+            'source_device': self.source_device_id,
+            'thread_id': self.thread_ref,
+            'message_count': self.message_count,
+            'unread_count': unread_count,
+            'last_activity': isoformat_utc(self.last_activity),
+            'last_message': {
+                'id': self.last_message_id,
+                'sequence_id': self.last_sequence_id,
+                'sender': self.last_sender,
+                'type': self.last_type,
+                'timestamp': isoformat_utc(self.last_timestamp),
+                'preview': self.preview
+            }
+        }
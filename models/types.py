@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from sqlalchemy.types import TypeDecorator, BigInteger
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+def to_epoch_micros(value):
+    """Convert a datetime to integer microseconds since the Unix epoch (naive values are UTC)"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // ONE_MICROSECOND
+
+def from_epoch_micros(value):
+    """Convert integer epoch microseconds to an aware UTC datetime"""
+    return EPOCH + timedelta(0, 0, value)
+
+@lru_cache(maxsize=65536)
+def _iso_second(seconds):
+    return (EPOCH + timedelta(0, seconds)).strftime('%Y-%m-%dT%H:%M:%S')
+
+def isoformat_micros(value):
+    """
+    Render epoch microseconds as ISO 8601 UTC ("Z" suffix, URL safe)
+    Builds no datetime. Rows fetched together mostly share a second, so the
+    date/time prefix is cached.
+    """
+    if value is None:
+        return None
+    seconds, micros = divmod(value, 1_000_000)
+    if micros:
+        return f'{_iso_second(seconds)}.{micros:06d}Z'
+    return f'{_iso_second(seconds)}Z'
+
+def isoformat_utc(value):
+    """Render a datetime the same way as isoformat_micros()"""
+    if value is None:
+        return None
+    return isoformat_micros(to_epoch_micros(value))
+
+class EpochMicros(TypeDecorator):
+    """
+    Timestamp column stored as int64 microseconds since the Unix epoch (UTC)
+    Range filters compare integers, and values load as aware UTC datetimes.
+    """
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return to_epoch_micros(value)
+
+    def result_processor(self, dialect, coltype):
+        # Built directly rather than through process_result_value, which
+        # keeps hydration to a single call per value
+        def process(value):
+            if value is None:
+                return None
+            return EPOCH + timedelta(0, 0, value)
+        return process
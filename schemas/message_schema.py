@@ -7,9 +7,16 @@ class MessageCreateSchema(Schema):
     content = fields.Str(required=True, validate=validate.Length(min=1))
     timestamp = fields.DateTime(required=True)
     metadata = fields.Dict(missing=dict)
+    # Chosen by the sender so a retried POST returns the first copy
+    client_message_id = fields.Str(validate=validate.Length(min=1, max=255))
+
+class MessageBatchItemSchema(MessageCreateSchema):
+    # Chosen by the sender so a retried batch is recognized; a UUID
+    id = fields.Str(validate=validate.Regexp(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$'))
 
 class MessageResponseSchema(Schema):
     id = fields.Str()
+    sequence_id = fields.Int()
     source_device = fields.Str()
     type = fields.Str()
     sender = fields.Str()
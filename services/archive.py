@@ -0,0 +1,413 @@
+"""
+Retention and archival of old messages
+
+RETENTION_RULES decide how long messages stay live, by age, device or type.
+The first matching rule wins, and ``"days": null`` keeps matches forever:
+
+    [{"type": "PUSH_NOTIFICATION", "days": 30},
+     {"device": "old-phone", "days": 90},
+     {"days": 365}]
+
+The archiver moves expired rows out of the hot table and sealed partitions a
+chunk at a time. Each chunk is compressed into one block and appended to a
+segment file in ARCHIVE_DIR. It is then indexed in ``archive_blocks`` and
+deleted from its live table in one short transaction. Archived messages are
+only read on demand, by ID and by search.
+"""
+
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import BigInteger, and_, delete, func, insert, not_, or_, select, true, type_coerce, update
+
+from models import db, Message
+from models.archive import ArchiveBlock
+from models.ids import uuid7_time
+from models.types import EpochMicros, from_epoch_micros, to_epoch_micros
+from .bloom import BloomFilter
+from .versions import message_keys, publish_change
+from .partitions import (
+    HOT_TABLE, delete_from_partition, invalidate_catalog, load_catalog, partition_table, select_by_received_at
+)
+from .threads import remove_from_threads
+
+BLOCK_MAGIC = b'MHB1'
+SEGMENT_PATTERN = 'segment-{:06d}.mhseg'
+COLUMNS = [column.name for column in HOT_TABLE.columns]
+SERIALIZED_COLUMNS = [
+    'id', 'sequence_id', 'source_device_id', 'type', 'sender', 'content',
+    'timestamp', 'received_at', 'message_metadata', 'is_read'
+]
+
+_block_cache = OrderedDict()
+_block_cache_lock = threading.Lock()
+BLOCK_CACHE_SIZE = 32
+
+def archive_dir():
+    directory = current_app.config['ARCHIVE_DIR'] or os.path.join(current_app.instance_path, 'archive')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+@contextmanager
+def archive_lock(blocking=False):
+    """Yield True if this process holds the archive lock (one archive writer across workers)"""
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): single-process development server
+        yield True
+        return
+    with open(os.path.join(archive_dir(), '.archiver.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def expired_clause(table, rules, now):
+    """Rows of table past their retention, first matching rule wins"""
+    clauses = []
+    earlier = []
+    for rule in rules:
+        conditions = []
+        if rule.get('device'):
+            conditions.append(table.c.source_device_id == rule['device'])
+        if rule.get('type'):
+            conditions.append(table.c.type == rule['type'])
+        match = and_(*conditions) if conditions else true()
+        if rule.get('days') is not None:
+            cutoff = to_epoch_micros(now - timedelta(days=rule['days']))
+            unclaimed = not_(or_(*earlier)) if earlier else true()
+            clauses.append(and_(match, unclaimed, table.c.received_at < cutoff))
+        earlier.append(match)
+    return or_(*clauses) if clauses else None
+
+# Segment files
+
+def _current_segment(directory):
+    segments = sorted(name for name in os.listdir(directory) if name.endswith('.mhseg'))
+    if segments:
+        size = os.path.getsize(os.path.join(directory, segments[-1]))
+        if size < current_app.config['ARCHIVE_SEGMENT_BYTES']:
+            return segments[-1]
+        number = int(segments[-1][len('segment-'):-len('.mhseg')]) + 1
+    else:
+        number = 1
+    return SEGMENT_PATTERN.format(number)
+
+def _append_block(payload):
+    """
+    Append one framed block to the current segment and fsync it
+    Returns (segment, offset, length) of the payload. A crash before the index
+    commit leaves unreferenced bytes behind, never a dangling index entry.
+    """
+    directory = archive_dir()
+    segment = _current_segment(directory)
+    with open(os.path.join(directory, segment), 'ab') as segment_file:
+        segment_file.seek(0, os.SEEK_END)
+        offset = segment_file.tell()
+        segment_file.write(BLOCK_MAGIC + len(payload).to_bytes(4, 'big') + payload)
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+    return segment, offset + 8, len(payload)
+
+def _readable_rows(block):
+    """read_block(), logging and skipping a block whose segment cannot be read"""
+    try:
+        return read_block(block)
+    except (OSError, zlib.error, ValueError) as e:
+        current_app.logger.error(f"Error reading archive block {block.id} from {block.segment}: {str(e)}")
+        return []
+
+def read_block(block):
+    """Rows of an archived block as dicts keyed by column name (timestamps as epoch microseconds)"""
+    key = (block.segment, block.offset)
+    with _block_cache_lock:
+        if key in _block_cache:
+            _block_cache.move_to_end(key)
+            return _block_cache[key]
+
+    with open(os.path.join(archive_dir(), block.segment), 'rb') as segment_file:
+        segment_file.seek(block.offset)
+        payload = json.loads(zlib.decompress(segment_file.read(block.length)))
+    rows = [dict(zip(payload['columns'], values)) for values in payload['rows']]
+
+    with _block_cache_lock:
+        _block_cache[key] = rows
+        if len(_block_cache) > BLOCK_CACHE_SIZE:
+            _block_cache.popitem(last=False)
+    return rows
+
+# Archiving
+
+def _raw_columns(table):
+    return [
+        type_coerce(table.c[name], BigInteger).label(name)
+        if isinstance(table.c[name].type, EpochMicros) else table.c[name]
+        for name in COLUMNS
+    ]
+
+def _compress_rows(rows):
+    return zlib.compress(json.dumps(
+        {'columns': COLUMNS, 'rows': [[row[name] for name in COLUMNS] for row in rows]},
+        separators=(',', ':')
+    ).encode(), 6)
+
+def _block_entry(rows, segment, offset, length):
+    id_filter = BloomFilter.for_capacity(len(rows))
+    id_times = []
+    for row in rows:
+        id_filter.add(row['id'])
+        id_time = uuid7_time(row['id'])
+        if id_time is not None:
+            id_times.append(id_time)
+    return {
+        'segment': segment,
+        'offset': offset,
+        'length': length,
+        'message_count': len(rows),
+        'min_received_at': min(row['received_at'] for row in rows),
+        'max_received_at': max(row['received_at'] for row in rows),
+        'min_timestamp': min(row['timestamp'] for row in rows),
+        'max_timestamp': max(row['timestamp'] for row in rows),
+        'min_id_time': min(id_times) if id_times else None,
+        'max_id_time': max(id_times) if id_times else None,
+        'devices': sorted({row['source_device_id'] for row in rows}),
+        'types': sorted({row['type'] for row in rows}),
+        'id_filter': id_filter.to_bytes(),
+        'archived_at': datetime.now(timezone.utc)
+    }
+
+def archive_table(table, partition_name, rules, now):
+    """Archive the expired rows of one live table, one chunk per transaction"""
+    condition = expired_clause(table, rules, now)
+    if condition is None:
+        return 0
+
+    chunk_size = current_app.config['ARCHIVER_CHUNK_SIZE']
+    pause = current_app.config['ARCHIVER_CHUNK_PAUSE']
+    archived = 0
+    keys = set()
+    while True:
+        rows = [
+            row._asdict() for row in db.session.execute(
+                select(*_raw_columns(table)).where(condition).order_by(table.c.received_at).limit(chunk_size)
+            ).all()
+        ]
+        db.session.rollback()  # end the read transaction before writing
+        if not rows:
+            break
+
+        segment, offset, length = _append_block(_compress_rows(rows))
+
+        with db.engine.begin() as connection:
+            if partition_name:
+                delete_from_partition(connection, partition_name, rows)
+            else:
+                connection.execute(delete(table).where(table.c.sequence_id.in_([row['sequence_id'] for row in rows])))
+            remove_from_threads(connection, rows)
+            connection.execute(insert(ArchiveBlock.__table__).values(**_block_entry(rows, segment, offset, length)))
+
+        archived += len(rows)
+        for row in rows:
+            keys.update(message_keys(row['source_device_id'], row['type']))
+        # Give writers a turn between chunks
+        time.sleep(pause)
+    if archived:
+        publish_change(keys=keys, reload=True)
+    return archived
+
+def remove_from_block(block, predicate):
+    """
+    Drop the rows matching predicate from an archived block (caller holds archive_lock)
+    Segments are append-only, so the kept rows are appended as a new block and
+    the index entry is repointed, or removed if nothing is left. The old
+    block's bytes stay behind unreferenced. Returns the number of rows dropped.
+    """
+    rows = read_block(block)
+    kept = [row for row in rows if not predicate(row)]
+    if len(kept) == len(rows):
+        return 0
+
+    blocks = ArchiveBlock.__table__
+    if kept:
+        entry = _block_entry(kept, *_append_block(_compress_rows(kept)))
+        entry['archived_at'] = block.archived_at
+    with db.engine.begin() as connection:
+        if kept:
+            connection.execute(update(blocks).where(blocks.c.id == block.id).values(**entry))
+        else:
+            connection.execute(delete(blocks).where(blocks.c.id == block.id))
+    return len(rows) - len(kept)
+
+def run_archiver(now=None):
+    """Archive every expired message; returns how many were archived"""
+    rules = current_app.config['RETENTION_RULES']
+    if not rules:
+        return 0
+    now = now or datetime.now(timezone.utc)
+
+    with archive_lock() as locked:
+        if not locked:
+            current_app.logger.info('Archiver already running in another process')
+            return 0
+
+        archived = archive_table(HOT_TABLE, None, rules, now)
+        for partition in load_catalog():
+            # Partitions still being sealed are skipped until their next run
+            if partition.sealed:
+                archived += archive_table(partition_table(partition.name), partition.name, rules, now)
+        if archived:
+            invalidate_catalog()
+            current_app.logger.info(f"Archived {archived} expired messages")
+        return archived
+
+_archiver = {'pid': None}
+_archiver_lock = threading.Lock()
+
+def start_archiver(app):
+    """
+    Run the archiver every ARCHIVER_INTERVAL seconds in a daemon thread, one
+    per process. Returns the thread, None if this process already runs one.
+    """
+    with _archiver_lock:
+        if _archiver['pid'] == os.getpid():
+            return None
+        _archiver['pid'] = os.getpid()
+
+    def archive_forever():
+        while True:
+            time.sleep(app.config['ARCHIVER_INTERVAL'])
+            with app.app_context():
+                try:
+                    run_archiver()
+                except Exception as e:
+                    app.logger.error(f"Error archiving messages: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=archive_forever, name='message-archiver', daemon=True)
+    thread.start()
+    return thread
+
+def _ensure_archiver():
+    if _archiver['pid'] != os.getpid():
+        start_archiver(current_app._get_current_object())
+
+def init_archiver(app):
+    """
+    Archive in the background when a retention policy is configured, from
+    the first request each server process handles (gunicorn forks after the
+    app is created). Scripts and flask commands that build the app but serve
+    no requests, such as migrations and seeding, never start it.
+    """
+    if app.config['RETENTION_RULES'] and app.config['ARCHIVER_INTERVAL'] > 0:
+        app.before_request(_ensure_archiver)
+
+# Reading archived messages
+
+def archived_message(row):
+    """Detached Message built from an archived row (not part of the session)"""
+    values = dict(row)
+    for name in ('timestamp', 'received_at', 'created_at', 'updated_at'):
+        if values.get(name) is not None:
+            values[name] = from_epoch_micros(values[name])
+    return Message(**values)
+
+def serialize_archived(row):
+    return Message.serialize_row(tuple(row[name] for name in SERIALIZED_COLUMNS))
+
+def find_archived_message(message_id):
+    """
+    Look an archived message up by ID
+    UUIDv7 IDs narrow the search to blocks created around the same time;
+    every candidate block's ID filter is checked before it is decompressed.
+    """
+    id_time = uuid7_time(message_id)
+    query = db.session.query(ArchiveBlock.id, ArchiveBlock.id_filter)
+    if id_time is not None:
+        query = query.filter(ArchiveBlock.min_id_time <= id_time, ArchiveBlock.max_id_time >= id_time)
+
+    for block_id, id_filter in query.order_by(ArchiveBlock.id.desc()).all():
+        if message_id not in BloomFilter.from_bytes(id_filter):
+            continue
+        for row in _readable_rows(db.session.get(ArchiveBlock, block_id)):
+            if row['id'] == message_id:
+                return archived_message(row)
+    return None
+
+def search_messages(message_filter, limit, include_archived=True):
+    """
+    Newest matching messages by received_at, live and (optionally) archived
+    Archive blocks are read newest first, and only while they can still beat
+    the oldest result collected so far. Returns (messages, archived_count).
+    """
+    results = [
+        (row.received_at, Message.serialize_row(row), False)
+        for row in select_by_received_at(message_filter, limit=limit, newest_first=True)
+    ]
+    if not include_archived:
+        return [message for _, message, _ in results], 0
+
+    blocks = ArchiveBlock.query
+    if message_filter.received_after is not None:
+        blocks = blocks.filter(ArchiveBlock.max_received_at > message_filter.received_after)
+    for block in blocks.order_by(ArchiveBlock.max_received_at.desc()):
+        if len(results) >= limit and to_epoch_micros(block.max_received_at) < results[-1][0]:
+            break
+        if message_filter.device and message_filter.device not in block.devices:
+            continue
+        if message_filter.message_type and message_filter.message_type not in block.types:
+            continue
+        for row in _readable_rows(block):
+            if message_filter.matches(row):
+                results.append((row['received_at'], serialize_archived(row), True))
+        results.sort(key=lambda result: result[0], reverse=True)
+        del results[limit:]
+
+    return [message for _, message, _ in results], sum(1 for _, _, archived in results if archived)
+
+def archive_stats():
+    blocks, messages, compressed = db.session.query(
+        func.count(ArchiveBlock.id),
+        func.coalesce(func.sum(ArchiveBlock.message_count), 0),
+        func.coalesce(func.sum(ArchiveBlock.length), 0)
+    ).one()
+    return {'blocks': blocks, 'messages': messages, 'compressed_bytes': compressed}
+
+# Maintenance commands: flask archive ...
+
+archive_cli = AppGroup('archive', help='Archive messages past their retention')
+
+@archive_cli.command('run')
+@with_appcontext
+def run_archive():
+    """Archive every expired message now"""
+    if not current_app.config['RETENTION_RULES']:
+        click.echo('No RETENTION_RULES configured - nothing expires')
+        return
+    click.echo(f"Archived {run_archiver()} messages")
+
+@archive_cli.command('status')
+@with_appcontext
+def archive_status():
+    """Show archive size and retention rules"""
+    stats = archive_stats()
+    click.echo(f"Archive directory: {archive_dir()}")
+    click.echo(f"Archived messages: {stats['messages']} in {stats['blocks']} blocks "
+               f"({stats['compressed_bytes'] / 2**20:.1f} MiB compressed)")
+    for rule in current_app.config['RETENTION_RULES']:
+        click.echo(f"Rule: {json.dumps(rule)}")
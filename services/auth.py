@@ -0,0 +1,257 @@
+"""
+Device API-key authentication
+
+Devices send their key as X-API-Key (or Authorization: Bearer). Only its
+SHA-256 is stored. Keys are long random tokens, so a fast hash is enough;
+a slow password hash would cost milliseconds per request.
+
+Each worker resolves hashes through a bounded LRU (API_KEY_CACHE_SIZE
+entries, API_KEY_CACHE_TTL seconds), so a known key costs no SQL. Unknown
+keys are cached too. Any commit that adds a device, or changes its key or
+is_active, bumps a shared auth version (services.versions). Every worker
+compares that version on lookup, so a revoked key or deactivated device is
+refused by all workers from the next request on.
+
+API_AUTH sets the policy for /api/v1:
+- off: keys are ignored
+- optional: a key that is sent must be valid; requests without one pass
+- required: every request but device registration needs a valid key
+
+An authenticated device may only post messages as itself. Its last_sync_at
+is updated by a background flush every LAST_SYNC_FLUSH_SECONDS, one UPDATE
+per device per flush rather than one per request.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import click
+from flask import current_app, g, jsonify, request
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import bindparam, event, inspect, or_, select, update
+
+from models import db, Device
+from models.device import generate_api_key, hash_api_key
+from .versions import write_versions
+
+AUTH_VERSION = ('auth', 'devices')
+# Endpoints that never need a key
+PUBLIC_ENDPOINTS = {'api_v1.register_device'}
+
+class ApiKeyCache:
+    """LRU of key hash -> (device id or None, auth version, time cached)"""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, key_hash, version):
+        """(True, device id or None) on a hit, (False, None) on a miss"""
+        with self.lock:
+            entry = self.entries.get(key_hash)
+            if entry is not None and entry[1] == version and time.monotonic() - entry[2] < self.ttl:
+                self.entries.move_to_end(key_hash)
+                self.hits += 1
+                return True, entry[0]
+            if entry is not None:
+                del self.entries[key_hash]
+            self.misses += 1
+            return False, None
+
+    def put(self, key_hash, device_id, version):
+        with self.lock:
+            self.entries[key_hash] = (device_id, version, time.monotonic())
+            self.entries.move_to_end(key_hash)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+def api_key_cache():
+    cache = current_app.extensions.get('api_keys')
+    if cache is None:
+        cache = current_app.extensions.setdefault('api_keys', ApiKeyCache(
+            current_app.config['API_KEY_CACHE_SIZE'], current_app.config['API_KEY_CACHE_TTL']
+        ))
+    return cache
+
+def resolve_api_key(key):
+    """Device id of an active device with this key, else None"""
+    key_hash = hash_api_key(key)
+    versions = write_versions()
+    # Version first: a change committed during the query leaves the entry stale, never wrong
+    version = versions.version(*AUTH_VERSION)
+    cache = api_key_cache()
+    hit, device_id = cache.get(key_hash, version)
+    if hit:
+        return device_id
+    # The primary, never a lagging replica: the entry is trusted until the version moves
+    with db.engine.connect() as connection:
+        device_id = connection.execute(
+            select(Device.id).where(Device.api_key_hash == key_hash, Device.is_active == True)
+        ).scalar()
+    cache.put(key_hash, device_id, version)
+    return device_id
+
+def _request_key():
+    key = request.headers.get('X-API-Key')
+    if key:
+        return key
+    authorization = request.headers.get('Authorization', '')
+    if authorization.startswith('Bearer '):
+        return authorization[len('Bearer '):].strip()
+    return None
+
+def _authenticate():
+    if request.blueprint != 'api_v1' or request.endpoint in PUBLIC_ENDPOINTS:
+        return None
+    key = _request_key()
+    if key is None:
+        if current_app.config['API_AUTH'] == 'required':
+            return jsonify({'error': 'API key required'}), 401
+        return None
+    device_id = resolve_api_key(key)
+    if device_id is None:
+        return jsonify({'error': 'Invalid API key'}), 401
+    g.device_id = device_id
+    record_device_seen(device_id)
+    return None
+
+def authenticated_device():
+    """Id of the device the current request authenticated as, or None"""
+    return g.get('device_id')
+
+# Coalesced last_sync_at writes
+
+_seen = {}
+_seen_lock = threading.Lock()
+_flusher = {'pid': None}
+
+def record_device_seen(device_id):
+    with _seen_lock:
+        _seen[device_id] = datetime.now(timezone.utc)
+    if _flusher['pid'] != os.getpid():
+        _start_flusher(current_app._get_current_object())
+
+def flush_device_seen():
+    """Write the newest last_sync_at of every device seen since the last flush; returns how many"""
+    with _seen_lock:
+        seen = list(_seen.items())
+        _seen.clear()
+    if not seen:
+        return 0
+    table = Device.__table__
+    # Another worker may have written a later time already
+    statement = update(table).where(
+        table.c.id == bindparam('device_id'),
+        or_(table.c.last_sync_at.is_(None), table.c.last_sync_at < bindparam('seen_at'))
+    ).values(last_sync_at=bindparam('seen_at'))
+    with db.engine.begin() as connection:
+        connection.execute(statement, [{'device_id': device_id, 'seen_at': at} for device_id, at in seen])
+    return len(seen)
+
+def _start_flusher(app):
+    """One flush thread per process (gunicorn forks after the app is created)"""
+    with _seen_lock:
+        if _flusher['pid'] == os.getpid():
+            return
+        _flusher['pid'] = os.getpid()
+    interval = app.config['LAST_SYNC_FLUSH_SECONDS']
+
+    def flush():
+        with app.app_context():
+            try:
+                flush_device_seen()
+            except Exception as e:
+                app.logger.error(f"Error updating device last_sync_at: {str(e)}")
+
+    def run():
+        while True:
+            time.sleep(interval)
+            flush()
+
+    threading.Thread(target=run, name='last-sync-flush', daemon=True).start()
+    atexit.register(flush)
+
+# Invalidation: any commit touching device keys or activity
+
+def _after_flush(session, flush_context):
+    changed = [device for device in session.new if isinstance(device, Device)] + [
+        device for device in session.dirty
+        if isinstance(device, Device) and session.is_modified(device)
+        and any(inspect(device).attrs[name].history.has_changes() for name in ('api_key_hash', 'is_active'))
+    ] + [device for device in session.deleted if isinstance(device, Device)]
+    if changed:
+        session.info['auth_changed'] = True
+
+def _after_commit(session):
+    if session.info.pop('auth_changed', False):
+        invalidate_api_keys()
+
+def _after_rollback(session):
+    session.info.pop('auth_changed', None)
+
+def invalidate_api_keys():
+    """Make every worker look keys up again (call after changing devices with raw SQL)"""
+    write_versions().bump_key(*AUTH_VERSION)
+
+def rotate_api_key(device):
+    """Give a device a new key and commit; the old one stops working at once. Returns the new key."""
+    api_key = generate_api_key(device.id)
+    device.api_key_hash = hash_api_key(api_key)
+    db.session.commit()
+    return api_key
+
+def init_auth(app):
+    """Check API keys on /api/v1 requests, per API_AUTH"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+    if app.config['API_AUTH'] != 'off':
+        app.before_request(_authenticate)
+
+# Maintenance commands: flask devices ...
+
+devices_cli = AppGroup('devices', help='Manage device API keys')
+
+def _get_device(device_id):
+    device = db.session.get(Device, device_id)
+    if device is None:
+        raise click.ClickException(f"No device '{device_id}'")
+    return device
+
+@devices_cli.command('rotate-key')
+@click.argument('device_id')
+@with_appcontext
+def rotate_key_command(device_id):
+    """Issue a new API key for a device, revoking the old one"""
+    api_key = rotate_api_key(_get_device(device_id))
+    click.echo(f"New API key for {device_id} (shown once): {api_key}")
+
+@devices_cli.command('deactivate')
+@click.argument('device_id')
+@with_appcontext
+def deactivate_command(device_id):
+    """Refuse a device's API key until it is activated again"""
+    _get_device(device_id).is_active = False
+    db.session.commit()
+    click.echo(f"Deactivated {device_id}")
+
+@devices_cli.command('activate')
+@click.argument('device_id')
+@with_appcontext
+def activate_command(device_id):
+    """Accept a device's API key again"""
+    _get_device(device_id).is_active = True
+    db.session.commit()
+    click.echo(f"Activated {device_id}")
@@ -0,0 +1,42 @@
+"""
+Small Bloom filter for "definitely not here" checks on string keys
+"""
+
+import hashlib
+import math
+
+class BloomFilter:
+    def __init__(self, bits, hashes, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        """Size a filter for capacity keys at the given false positive rate"""
+        capacity = max(capacity, 1)
+        bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes)
+
+    def _positions(self, key):
+        # Double hashing over one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.data[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_bytes(self):
+        """Serialized as 4-byte bit count, 1-byte hash count, bit array"""
+        return self.bits.to_bytes(4, 'big') + bytes([self.hashes]) + bytes(self.data)
+
+    @classmethod
+    def from_bytes(cls, value):
+        return cls(int.from_bytes(value[:4], 'big'), value[4], value[5:])
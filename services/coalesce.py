@@ -0,0 +1,160 @@
+"""
+Near-duplicate notification coalescing at ingest
+
+Android apps re-post the same notification as it changes: WhatsApp turns
+"3 new messages" into "4 new messages" under the same tag. Each re-post used
+to become a row of its own, synced to every client and listed on the
+dashboard.
+
+With COALESCE_WINDOW_SECONDS set, a PUSH_NOTIFICATION is keyed on its device,
+metadata.app_package and metadata.notification_tag (or thread_id). When the
+newest notification with that key has a timestamp within the window of the
+new one, the new one replaces it: same id and created_at, its own content,
+metadata and timestamps, and a new sequence_id, so sequence and received_at
+sync deliver it again. The window slides with every replacement. An older
+one arriving late (a retry, or a forwarder catching up) is superseded by the
+stored one and not stored, so the outcome doesn't depend on arrival order.
+
+Replacing is a delete and an insert in one transaction. It is published as
+the insert alone: the new row carries the old one's id, and the hot tail
+swaps that entry in place (services.hot_tail), so no worker reloads.
+
+Each worker keeps an LRU of COALESCE_CACHE_SIZE keys and the sequence_id of
+their newest notification. On a miss, or when another worker has replaced
+that row since, the hot table is the shared fallback: one query on the
+device's recent notifications. Sealed partitions and the archive are never
+checked.
+"""
+
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import delete, func, select
+
+from models import db, Message
+from models.types import to_epoch_micros
+from .threads import remove_from_threads
+
+NOTIFICATION_TYPE = 'PUSH_NOTIFICATION'
+
+class RecentNotifications:
+    """LRU of coalescing key -> sequence_id of the newest notification with it"""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # Where the replaced notification was found; superseded: older re-posts not stored
+        self.coalesced = {'cache': 0, 'database': 0, 'superseded': 0}
+
+    def get(self, key):
+        with self.lock:
+            sequence_id = self.entries.get(key)
+            if sequence_id is not None:
+                self.entries.move_to_end(key)
+            return sequence_id
+
+    def put(self, key, sequence_id):
+        with self.lock:
+            self.entries[key] = sequence_id
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def count(self, source):
+        with self.lock:
+            self.coalesced[source] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.coalesced, entries=len(self.entries))
+
+def recent_notifications():
+    cache = current_app.extensions.get('notification_coalescing')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'notification_coalescing', RecentNotifications(current_app.config['COALESCE_CACHE_SIZE'])
+        )
+    return cache
+
+def coalescing_enabled():
+    return current_app.config['COALESCE_WINDOW_SECONDS'] > 0
+
+def coalesce_key(message):
+    """(device, app package, tag) for a notification that can be coalesced, else None"""
+    if message.type != NOTIFICATION_TYPE:
+        return None
+    metadata = message.message_metadata or {}
+    app_package = metadata.get('app_package')
+    tag = metadata.get('notification_tag') or metadata.get('thread_id')
+    if not isinstance(app_package, str) or not isinstance(tag, str):
+        return None
+    return message.source_device_id, app_package, tag
+
+def _newest_stored(key, timestamp, window):
+    """Newest notification with this key in the hot table within the window, else None"""
+    device, app_package, tag = key
+    metadata = Message.message_metadata
+    return db.session.execute(
+        select(Message).where(
+            Message.source_device_id == device,
+            Message.type == NOTIFICATION_TYPE,
+            Message.timestamp >= timestamp - window,
+            Message.timestamp <= timestamp + window,
+            metadata['app_package'].as_string() == app_package,
+            func.coalesce(metadata['notification_tag'].as_string(), metadata['thread_id'].as_string()) == tag
+        ).order_by(Message.sequence_id.desc()).limit(1)
+    ).scalar()
+
+def coalesce_notification(message):
+    """
+    Make a new, not yet added message replace the notification it coalesces with
+    The stored one is deleted (not committed) and the message takes its id
+    and created_at. Returns ('coalesced', message) if it replaced one,
+    ('superseded', stored) if the stored one is newer and the message is not
+    to be stored, None otherwise. Pass as before_insert to
+    services.dedup.insert_message.
+    """
+    key = coalesce_key(message)
+    if key is None:
+        return None
+    window = int(current_app.config['COALESCE_WINDOW_SECONDS'] * 1_000_000)
+    timestamp = to_epoch_micros(message.timestamp)
+    cache = recent_notifications()
+
+    sequence_id = cache.get(key)
+    stored = db.session.get(Message, sequence_id) if sequence_id is not None else None
+    source = 'cache'
+    if stored is None:
+        # Not seen by this worker, or replaced by another one since
+        stored = _newest_stored(key, timestamp, window)
+        source = 'database'
+    if stored is None:
+        return None
+    newer_by = timestamp - to_epoch_micros(stored.timestamp)
+    if abs(newer_by) > window:
+        return None
+    if newer_by < 0:
+        # Stale content; the stored notification already replaced it
+        cache.count('superseded')
+        return 'superseded', stored
+
+    table = Message.__table__
+    deleted = db.session.execute(delete(table).where(table.c.sequence_id == stored.sequence_id)).rowcount
+    if not deleted:
+        # Replaced by another worker in the meantime; store this one as new
+        return None
+    remove_from_threads(db.session.connection(), [
+        {'sequence_id': stored.sequence_id, 'thread_key': stored.thread_key}
+    ])
+    message.id = stored.id
+    message.created_at = stored.created_at
+    cache.count(source)
+    return 'coalesced', message
+
+def remember_notification(message):
+    """Record a committed notification as the newest one for its key"""
+    key = coalesce_key(message)
+    if key is not None:
+        recent_notifications().put(key, message.sequence_id)
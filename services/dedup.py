@@ -0,0 +1,138 @@
+"""
+Idempotent single-message ingest (POST /api/v1/messages)
+
+Forwarders retry a POST whose response they didn't get. Each message gets a
+dedup key, a hash of its device and client_message_id, or without one (and
+DEDUP_CONTENT_HASH on) of its device, type, sender, timestamp and content.
+The key is stored in messages.dedup_key under a unique index. Posting a key
+that is already stored returns the message stored first.
+
+Almost every post is new, so looking the key up first would be one index
+probe per message spent on nothing. Each worker instead remembers the keys
+it has handled recently in a rotating Bloom filter. A key it has not seen is
+inserted straight away; if another worker (or this one before a restart)
+stored it, the unique index rejects the insert and the original is looked
+up then. Only keys the filter may have seen are looked up before inserting.
+
+The filter has two generations of DEDUP_FILTER_KEYS keys each. When the
+current one is full, the older is dropped, so it always covers the last
+DEDUP_FILTER_KEYS to twice that many keys. Like the batch endpoint, only the
+hot table is checked: a message sealed into a partition or archived since
+its first post could be stored again.
+"""
+
+import hashlib
+import threading
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Message
+from models.types import to_epoch_micros
+from .bloom import BloomFilter
+
+FILTER_ERROR_RATE = 0.01
+
+class RecentKeys:
+    """Two-generation Bloom filter of recently seen dedup keys, with outcome counts"""
+
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        self.lock = threading.Lock()
+        self.current = BloomFilter.for_capacity(self.capacity, FILTER_ERROR_RATE)
+        self.previous = None
+        self.added = 0
+        # new: inserted unchecked, checked: looked up and not found, duplicate
+        self.outcomes = {'new': 0, 'checked': 0, 'duplicate': 0}
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.current or (self.previous is not None and key in self.previous)
+
+    def add(self, key):
+        with self.lock:
+            if self.added >= self.capacity:
+                self.previous = self.current
+                self.current = BloomFilter.for_capacity(self.capacity, FILTER_ERROR_RATE)
+                self.added = 0
+            self.current.add(key)
+            self.added += 1
+
+    def count(self, outcome):
+        with self.lock:
+            self.outcomes[outcome] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.outcomes)
+
+def recent_keys():
+    keys = current_app.extensions.get('message_dedup')
+    if keys is None:
+        keys = current_app.extensions.setdefault(
+            'message_dedup', RecentKeys(current_app.config['DEDUP_FILTER_KEYS'])
+        )
+    return keys
+
+def dedup_key(data):
+    """Dedup key for a validated message, or None when it has no client_message_id and content hashing is off"""
+    if data.get('client_message_id'):
+        parts = ('client', data['source_device_id'], data['client_message_id'])
+    elif current_app.config['DEDUP_CONTENT_HASH']:
+        parts = ('content', data['source_device_id'], data['type'], data['sender'],
+                 str(to_epoch_micros(data['timestamp'])), data['content'])
+    else:
+        return None
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=16).hexdigest()
+
+def _stored(key):
+    return db.session.execute(select(Message).where(Message.dedup_key == key)).scalar()
+
+def _insert(message, before_insert):
+    """(message returned, outcome)"""
+    result = before_insert(message) if before_insert else None
+    outcome, message = result or ('created', message)
+    if outcome == 'superseded':
+        return message, outcome
+    db.session.add(message)
+    db.session.commit()
+    return message, outcome
+
+def insert_message(message, before_insert=None):
+    """
+    Insert and commit message unless one with its dedup_key is stored
+    before_insert(message) runs once the message is known to be new, in the
+    same transaction; it returns None, or (outcome, message to return) when
+    the message replaces a stored one ('coalesced') or a stored one makes it
+    obsolete ('superseded', not inserted; see services.coalesce). Returns
+    (the stored message, 'created', 'coalesced', 'superseded' or 'duplicate').
+    """
+    key = message.dedup_key
+    if key is None:
+        return _insert(message, before_insert)
+
+    keys = recent_keys()
+    if key in keys:
+        original = _stored(key)
+        if original is not None:
+            keys.count('duplicate')
+            return original, 'duplicate'
+        outcome = 'checked'
+    else:
+        outcome = 'new'
+
+    try:
+        stored, result = _insert(message, before_insert)
+    except IntegrityError:
+        db.session.rollback()
+        # Stored by another worker, or before this worker's filter saw it
+        original = _stored(key)
+        if original is None:
+            raise
+        keys.add(key)
+        keys.count('duplicate')
+        return original, 'duplicate'
+    keys.add(key)
+    keys.count(outcome)
+    return stored, result
@@ -0,0 +1,103 @@
+"""
+Streaming message export (GET /api/v1/messages/export)
+
+An export walks the received_at index of each table it needs (see
+partitions.iter_by_received_at) and encodes rows a batch at a time as they
+come, so memory stays flat on the server however many rows match. With
+gzip, the encoded batches go through one zlib stream as well.
+
+gunicorn kills a sync worker that sends no heartbeat for --timeout
+seconds, and a worker busy streaming one response sends none. An export is
+therefore served in chunks of at most EXPORT_CHUNK_ROWS messages. The
+received_at of a chunk's last message is looked up first, an OFFSET over the
+index, so the response can name where the next chunk starts (X-Export-Next)
+before its body. Messages sharing that received_at all go in the same chunk.
+Each gzip chunk is a complete gzip member; members concatenate into one
+valid .gz file.
+
+Archived messages are not exported, as they are not listed or synced.
+"""
+
+import copy
+import csv
+import io
+import json
+import zlib
+
+from models import Message
+from models.types import isoformat_micros
+from .partitions import iter_by_received_at, select_by_received_at
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_COLUMNS = ['id', 'sequence_id', 'source_device', 'type', 'sender', 'content',
+               'timestamp', 'received_at', 'is_read', 'metadata']
+# Rows encoded (and fetched) together
+BATCH_SIZE = 1000
+
+def export_chunk(message_filter, chunk_rows):
+    """
+    (filter for the next chunk's messages, received_at the chunk after it starts from or None)
+    The chunk holds the first chunk_rows matching messages, plus any sharing
+    the last one's received_at.
+    """
+    last = select_by_received_at(message_filter, limit=1, offset=chunk_rows - 1)
+    if not last:
+        return message_filter, None
+    boundary = last[0].received_at
+    chunk_filter = copy.copy(message_filter)
+    chunk_filter.received_before = boundary + 1
+    rest_filter = copy.copy(message_filter)
+    rest_filter.received_after = boundary
+    more = select_by_received_at(rest_filter, limit=1)
+    return chunk_filter, isoformat_micros(boundary) if more else None
+
+def _batches(rows, state):
+    batch = []
+    for row in rows:
+        message = Message.serialize_row(row)
+        message['is_read'] = state.is_read(message['sequence_id'])
+        batch.append(message)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def encode_ndjson(messages):
+    return ''.join(json.dumps(message, separators=(',', ':'), ensure_ascii=False) + '\n'
+                   for message in messages)
+
+def encode_csv(messages, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    writer.writerows([
+        message['id'], message['sequence_id'], message['source_device'], message['type'],
+        message['sender'], message['content'], message['timestamp'], message['received_at'],
+        'true' if message['is_read'] else 'false', json.dumps(message['metadata'], separators=(',', ':'))
+    ] for message in messages)
+    return buffer.getvalue()
+
+def export_stream(message_filter, state, export_format, header=True, compress=False):
+    """Encoded bytes for every message the filter matches, with is_read from state"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encoded():
+        if export_format == 'csv' and header:
+            yield encode_csv([], header=True)
+        for batch in _batches(iter_by_received_at(message_filter, BATCH_SIZE), state):
+            yield encode_csv(batch) if export_format == 'csv' else encode_ndjson(batch)
+
+    for text in encoded():
+        data = text.encode()
+        if compressor:
+            data = compressor.compress(data)
+        # zlib holds output back until it has a block; an empty write would end a chunked body
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
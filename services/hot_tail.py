@@ -0,0 +1,323 @@
+"""
+In-process tail of the newest messages
+
+Each worker keeps the newest HOT_TAIL_SIZE messages in memory, serialized
+once, in two views: by received_at (sync) and by timestamp (web views). Each
+view is indexed by device and type. A view holds every message whose key is
+above its floor, so a query whose range lies above the floor is answered from
+memory. Anything older falls back to the database.
+
+Workers stay coherent through the shared write versions (services.versions).
+When the change count moves, the committing worker adds its own new messages
+directly, and the others fetch the new rows by sequence_id. A new row whose
+id is already in the tail replaces that entry in place: a coalesced
+notification is re-inserted under the id of the one it replaces
+(services.coalesce). When the generation moves (updates, deletes), every
+worker reloads its tail.
+
+Catching up by sequence_id relies on rows committing in sequence_id order,
+which only holds with SQLite's single writer. Elsewhere (PostgreSQL) a
+transaction holding a lower sequence_id can commit after a higher one, and
+its row would never reach the tail, so the tail is off and every query goes
+to the database.
+"""
+
+import bisect
+import threading
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, Message
+from models.types import from_epoch_micros
+from .partitions import HOT_TABLE, MAX_MICROS, catalog
+from .versions import on_publish, write_versions
+
+TailEntry = namedtuple('TailEntry', 'id sequence_id received_at timestamp device type row payload')
+
+def _entry(row):
+    """Tail entry for a row selected with Message.serialized_columns()"""
+    return TailEntry(row[0], row[1], row[7], row[6], row[2], row[3], tuple(row), Message.serialize_row(row))
+
+def _to_message(entry):
+    """Detached Message for the web views (not part of the session)"""
+    (message_id, sequence_id, source_device_id, message_type, sender, content,
+     timestamp, received_at, metadata, is_read) = entry.row
+    return Message(
+        id=message_id, sequence_id=sequence_id, source_device_id=source_device_id, type=message_type,
+        sender=sender, content=content, timestamp=from_epoch_micros(timestamp),
+        received_at=from_epoch_micros(received_at), message_metadata=metadata, is_read=is_read
+    )
+
+class _Series:
+    """Entries sorted by key, with cheap removal of the oldest"""
+
+    def __init__(self):
+        self.keys = []
+        self.entries = []
+        self.head = 0
+
+    def __len__(self):
+        return len(self.keys) - self.head
+
+    def add(self, key, entry):
+        # New messages almost always belong at the end
+        index = bisect.bisect_right(self.keys, key, self.head)
+        self.keys.insert(index, key)
+        self.entries.insert(index, entry)
+
+    def remove(self, key):
+        index = bisect.bisect_left(self.keys, key, self.head)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.entries[index]
+
+    def pop_oldest(self):
+        entry = self.entries[self.head]
+        self.head += 1
+        if self.head > 256 and self.head * 2 > len(self.keys):
+            del self.keys[:self.head]
+            del self.entries[:self.head]
+            self.head = 0
+        return entry
+
+    def after(self, key):
+        """Entries whose (time, sequence_id) key is above key, oldest first"""
+        return self.entries[bisect.bisect_right(self.keys, key, self.head):]
+
+    def newest_first(self):
+        return reversed(self.entries[self.head:])
+
+class _View:
+    """The newest entries by one time field, complete above floor (None: complete)"""
+
+    def __init__(self, field, capacity, floor):
+        self.field = field
+        self.capacity = capacity
+        self.floor = floor
+        self.all = _Series()
+        self.by_device = {}
+        self.by_type = {}
+        self.by_id = {}
+
+    def _key(self, entry):
+        return (getattr(entry, self.field), entry.sequence_id)
+
+    def add(self, entry):
+        # A message re-inserted under its id replaces its entry
+        self.discard(entry.id)
+        value = getattr(entry, self.field)
+        if self.floor is not None and value <= self.floor:
+            return
+        key = self._key(entry)
+        self.all.add(key, entry)
+        self.by_device.setdefault(entry.device, _Series()).add(key, entry)
+        self.by_type.setdefault(entry.type, _Series()).add(key, entry)
+        self.by_id[entry.id] = entry
+
+        if len(self.all) > self.capacity:
+            # The oldest entry overall is also the oldest of its device and type
+            oldest = self.all.pop_oldest()
+            for index, name in ((self.by_device, oldest.device), (self.by_type, oldest.type)):
+                index[name].pop_oldest()
+                if not index[name]:
+                    del index[name]
+            del self.by_id[oldest.id]
+            self.floor = getattr(oldest, self.field)
+
+    def discard(self, message_id):
+        """Remove the entry of a message, if held"""
+        entry = self.by_id.pop(message_id, None)
+        if entry is None:
+            return
+        key = self._key(entry)
+        self.all.remove(key)
+        for index, name in ((self.by_device, entry.device), (self.by_type, entry.type)):
+            index[name].remove(key)
+            if not index[name]:
+                del index[name]
+
+    def covers(self, value):
+        return self.floor is None or (value is not None and value >= self.floor)
+
+    def series(self, message_filter):
+        """Smallest series holding every entry the filter can match"""
+        candidates = []
+        if message_filter.device:
+            candidates.append(self.by_device.get(message_filter.device, _Series()))
+        if message_filter.message_type:
+            candidates.append(self.by_type.get(message_filter.message_type, _Series()))
+        return min(candidates, key=len) if candidates else self.all
+
+def _matches(message_filter, entry):
+    return (
+        (not message_filter.device or entry.device == message_filter.device)
+        and (not message_filter.message_type or entry.type == message_filter.message_type)
+        and (message_filter.unread_for is None or not message_filter.unread_for.is_read(entry.sequence_id))
+    )
+
+def _servable(message_filter, *range_fields):
+    """Whether the tail can answer a filter: device, type, unread and the given range fields only"""
+    unsupported = ('received_after', 'received_after_sequence', 'received_before', 'timestamp_after',
+                   'timestamp_before', 'text_query', 'device_pattern', 'sequence_after', 'sequence_before', 'thread')
+    return not any(getattr(message_filter, name) is not None
+                   for name in unsupported if name not in range_fields)
+
+class HotTail:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.versions = write_versions()
+        self.change = self.generation = None
+        self.synced_sequence_id = 0
+        self.by_received = self.by_timestamp = None
+        self.hits = self.misses = 0
+
+    def refresh(self):
+        """Bring the tail up to date with the write versions (caller holds the lock)"""
+        change, generation = self.versions.read()
+        if generation != self.generation:
+            self._reload(change, generation)
+        elif change != self.change:
+            self._catch_up(change, generation)
+
+    def _partition_floor(self, field):
+        """Newest field value in any partition; None without partitions"""
+        floor = None
+        for partition in catalog():
+            if partition.sealed:
+                value = partition.max_received_at if field == 'received_at' else partition.max_timestamp
+                if value is None:
+                    continue
+            else:
+                # Being sealed, no zone map yet
+                value = partition.month_end - 1 if field == 'received_at' else MAX_MICROS
+            floor = value if floor is None else max(floor, value)
+        return floor
+
+    def _load_view(self, connection, field):
+        column = HOT_TABLE.c[field]
+        rows = connection.execute(
+            select(*Message.serialized_columns()).order_by(column.desc()).limit(self.capacity)
+        ).all()
+        floors = [self._partition_floor(field)]
+        if len(rows) == self.capacity:
+            floors.append(rows[-1]._mapping[field])
+        floors = [floor for floor in floors if floor is not None]
+        view = _View(field, self.capacity, max(floors) if floors else None)
+        for row in reversed(rows):
+            view.add(_entry(row))
+        return view
+
+    def _reload(self, change, generation):
+        # A connection of its own, so the snapshot starts after the versions were read
+        with db.engine.connect() as connection:
+            self.synced_sequence_id = connection.execute(
+                select(func.coalesce(func.max(HOT_TABLE.c.sequence_id), 0))
+            ).scalar()
+            self.by_received = self._load_view(connection, 'received_at')
+            self.by_timestamp = self._load_view(connection, 'timestamp')
+        self.change, self.generation = change, generation
+
+    def _catch_up(self, change, generation):
+        # SQLite has a single writer, so rows commit in sequence_id order and
+        # nothing can appear below the cursor later
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(*Message.serialized_columns())
+                .where(HOT_TABLE.c.sequence_id > self.synced_sequence_id)
+                .order_by(HOT_TABLE.c.sequence_id)
+                .limit(self.capacity + 1)
+            ).all()
+        if len(rows) > self.capacity:
+            return self._reload(change, generation)
+        self._add([_entry(row) for row in rows])
+        self.change = change
+
+    def _add(self, entries):
+        for entry in entries:
+            self.by_received.add(entry)
+            self.by_timestamp.add(entry)
+            self.synced_sequence_id = max(self.synced_sequence_id, entry.sequence_id)
+
+    def published(self, before, entries):
+        """This worker committed new messages; take them directly when no other commit can be missing"""
+        with self.lock:
+            sequence_ids = [entry.sequence_id for entry in entries]
+            contiguous = sequence_ids == list(range(self.synced_sequence_id + 1,
+                                                    self.synced_sequence_id + 1 + len(sequence_ids)))
+            if contiguous and before == (self.change, self.generation):
+                self._add(entries)
+                self.change = before[0] + 1
+
+    def messages_after(self, message_filter):
+        with self.lock:
+            self.refresh()
+            received_after = message_filter.received_after
+            # Entries at the floor itself may have been dropped, a cursor inside them can't be served
+            if received_after is not None and message_filter.received_after_sequence is not None:
+                received_after -= 1
+            if not self.by_received.covers(received_after):
+                self.misses += 1
+                return None
+            self.hits += 1
+            series = self.by_received.series(message_filter)
+            if message_filter.received_after is not None:
+                entries = series.after(message_filter.received_cursor())
+            else:
+                entries = series.entries[series.head:]
+            return [entry for entry in entries if _matches(message_filter, entry)]
+
+    def newest(self, message_filter, wanted):
+        with self.lock:
+            self.refresh()
+            view = self.by_timestamp
+            found = []
+            for entry in view.series(message_filter).newest_first():
+                if _matches(message_filter, entry):
+                    found.append(entry)
+                    if len(found) == wanted:
+                        break
+            # Ties at the floor may have been left out
+            if view.floor is not None and not (len(found) == wanted and found[-1].timestamp > view.floor):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return found
+
+def _hot_tail():
+    capacity = current_app.config['HOT_TAIL_SIZE']
+    if capacity <= 0 or db.engine.dialect.name != 'sqlite':
+        return None
+    tail = current_app.extensions.get('hot_tail')
+    if tail is None:
+        tail = current_app.extensions.setdefault('hot_tail', HotTail(capacity))
+    return tail
+
+def messages_after(message_filter):
+    """
+    Entries matching a sync filter, oldest first by received_at, with no SQL
+    when nothing changed; None when received_after lies below the tail
+    """
+    tail = _hot_tail()
+    if tail is None or not _servable(message_filter, 'received_after', 'received_after_sequence'):
+        return None
+    return tail.messages_after(message_filter)
+
+def newest_from_tail(message_filter, limit, offset=0):
+    """Detached Messages newest first by timestamp (web views), or None if the tail can't tell"""
+    tail = _hot_tail()
+    if tail is None or not _servable(message_filter):
+        return None
+    entries = tail.newest(message_filter, offset + limit)
+    if entries is None:
+        return None
+    return [_to_message(entry) for entry in entries[offset:]]
+
+def _published(before, new_rows, reload):
+    tail = current_app.extensions.get('hot_tail')
+    if tail is not None and new_rows and not reload:
+        tail.published(before, sorted((_entry(row) for row in new_rows), key=lambda entry: entry.sequence_id))
+
+on_publish(_published)
@@ -0,0 +1,82 @@
+"""
+Batched message ingest (POST /api/v1/messages/batch)
+
+A batch is inserted in one transaction, so it costs one commit and one
+publish to the other workers instead of one per message. Its messages get
+received_at one microsecond apart, in batch order: sync pages on received_at,
+and a batch sharing one would be a run of ties larger than a page.
+
+Senders retry batches whose response they didn't get, so a batch may arrive
+again after it was committed. Each message can carry its own ID for that:
+IDs already in the hot table are skipped and reported back as existing, so a
+retry never inserts a message twice. Messages also get the dedup key of the
+single-message endpoint (services.dedup): one already stored, through either
+endpoint, is skipped the same way and reported with the stored message's ID.
+Messages that have moved to a sealed partition or the archive since are not
+checked.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Message
+from models.ids import uuid7
+from .dedup import dedup_key
+
+def _existing(ids, keys):
+    """(stored IDs, dedup key -> stored ID) among the given IDs and keys"""
+    if not ids and not keys:
+        return set(), {}
+    rows = db.session.execute(
+        select(Message.id, Message.dedup_key).where(or_(Message.id.in_(ids), Message.dedup_key.in_(keys)))
+    ).all()
+    return {row.id for row in rows}, {row.dedup_key: row.id for row in rows if row.dedup_key in keys}
+
+def insert_batch(items):
+    """
+    Insert validated messages in one transaction, skipping IDs and dedup keys
+    already stored. Returns (ID of every item in order, number created): an
+    item whose key is stored gets that message's ID, one without an ID a new one.
+    """
+    ids = [item.get('id') or uuid7() for item in items]
+    keys = [dedup_key(item) for item in items]
+    # Two requests carrying the same batch can race; the loser's insert fails
+    # on the unique ID or key and its second pass finds the winner's rows
+    for attempt in range(2):
+        existing, stored_keys = _existing([item['id'] for item in items if item.get('id')],
+                                          {key for key in keys if key is not None})
+        received_at = datetime.now(timezone.utc)
+        step = timedelta(microseconds=1)
+        created = 0
+        for index, (item, key) in enumerate(zip(items, keys)):
+            message_id = ids[index]
+            if message_id in existing:
+                continue
+            if key in stored_keys:
+                ids[index] = stored_keys[key]
+                continue
+            # Repeats inside one batch count as existing too
+            existing.add(message_id)
+            if key is not None:
+                stored_keys[key] = message_id
+            db.session.add(Message(
+                id=message_id,
+                source_device_id=item['source_device_id'],
+                type=item['type'],
+                sender=item['sender'],
+                content=item['content'],
+                timestamp=item['timestamp'],
+                message_metadata=item.get('metadata', {}),
+                received_at=received_at + step * created,
+                dedup_key=key
+            ))
+            created += 1
+        try:
+            db.session.commit()
+            return ids, created
+        except IntegrityError:
+            db.session.rollback()
+            if attempt:
+                raise
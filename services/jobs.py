@@ -0,0 +1,53 @@
+"""
+Background jobs with progress stored in the jobs table
+
+A job runs in a daemon thread of the process that started it. Its row is
+the source of truth for status and progress, so any worker can answer a
+status poll.
+"""
+
+import threading
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import update
+
+from models import db, Job
+
+def start_job(job_type, params, run):
+    """Record a pending job and call run(job_id) in a background thread with an app context"""
+    job = Job(type=job_type, status='pending', params=params)
+    db.session.add(job)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    job_id = job.id
+
+    def run_in_context():
+        with app.app_context():
+            try:
+                mark_job(job_id, status='running', started_at=datetime.now(timezone.utc))
+                result = run(job_id)
+                mark_job(job_id, status='completed', result=result, finished_at=datetime.now(timezone.utc))
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error in {job_type} job {job_id}: {str(e)}")
+                mark_job(job_id, status='failed', error=str(e), finished_at=datetime.now(timezone.utc))
+            finally:
+                db.session.remove()
+
+    threading.Thread(target=run_in_context, name=f'{job_type}-job-{job_id}', daemon=True).start()
+    return job
+
+def mark_job(job_id, connection=None, **values):
+    """Update a job row, inside the caller's transaction when a connection is given"""
+    values['updated_at'] = datetime.now(timezone.utc)
+    statement = update(Job.__table__).where(Job.__table__.c.id == job_id).values(**values)
+    if connection is not None:
+        connection.execute(statement)
+    else:
+        with db.engine.begin() as own_connection:
+            own_connection.execute(statement)
+
+def add_job_progress(connection, job_id, count):
+    mark_job(job_id, connection, processed=Job.__table__.c.processed + count)
@@ -0,0 +1,399 @@
+"""
+Prometheus metrics, aggregated across gunicorn workers
+
+Each worker records into its own file in METRICS_DIR: float64 values by key,
+updated in place through mmap, like the write versions. /metrics reads the
+files of every worker started by the same gunicorn master and sums them.
+Counters and histograms include workers that have exited, so totals never
+go backwards. Gauges only include live workers.
+
+Recorded per request: latency, request and response size, queries and DB
+time (SQLAlchemy cursor events). Gauges: requests in progress (the ingest
+queue is api_v1.create_message), pool connections checked out, pending and
+running jobs, and result cache size. Pool checkout wait comes from
+TimedQueuePool. Cache hit ratios are derived from the aggregated hit and
+miss counters when /metrics is scraped.
+"""
+
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+from config import sidecar_path
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'message_hub_request_duration_seconds': ('histogram', 'Request latency', LATENCY_BUCKETS),
+    'message_hub_request_size_bytes': ('histogram', 'Request body size', SIZE_BUCKETS),
+    'message_hub_response_size_bytes': ('histogram', 'Response body size', SIZE_BUCKETS),
+    'message_hub_request_db_queries': ('histogram', 'SQL statements per request', QUERY_BUCKETS),
+    'message_hub_request_db_seconds': ('histogram', 'Time spent in SQL per request', LATENCY_BUCKETS),
+    'message_hub_db_queries_total': ('counter', 'SQL statements executed', None),
+    'message_hub_db_seconds_total': ('counter', 'Time spent executing SQL', None),
+    'message_hub_db_pool_wait_seconds': ('histogram', 'Wait for a pooled connection', LATENCY_BUCKETS),
+    'message_hub_db_pool_checked_out': ('gauge', 'Pooled connections in use', None),
+    'message_hub_requests_in_progress': ('gauge', 'Requests being handled (create_message: ingest queue)', None),
+    'message_hub_jobs': ('gauge', 'Background jobs waiting or running', None),
+    'message_hub_result_cache_lookups_total': ('counter', 'Result cache lookups', None),
+    'message_hub_result_cache_hit_ratio': ('gauge', 'Result cache hits / lookups', None),
+    'message_hub_result_cache_bytes': ('gauge', 'Result cache memory', None),
+    'message_hub_result_cache_entries': ('gauge', 'Result cache entries', None),
+    'message_hub_hot_tail_lookups_total': ('counter', 'Hot tail lookups', None),
+    'message_hub_hot_tail_hit_ratio': ('gauge', 'Hot tail hits / lookups', None),
+    'message_hub_api_key_lookups_total': ('counter', 'API key lookups (miss: looked up in the database)', None),
+    'message_hub_ingest_dedup_total': ('counter', 'Posted messages by dedup outcome (new: not looked up)', None),
+    'message_hub_notifications_coalesced_total': ('counter', 'Notifications replaced by a re-post, by where it was found', None),
+    'message_hub_notifications_superseded_total': ('counter', 'Re-posts not stored, older than the stored notification', None),
+}
+
+RECORD_LENGTH = struct.Struct('<I')
+VALUE = struct.Struct('<d')
+USED = struct.Struct('<Q')
+INITIAL_SIZE = 64 * 1024
+SAMPLE_INTERVAL = 1.0
+
+def _family(sample_name):
+    for suffix in ('_bucket', '_sum', '_count', ''):
+        name = sample_name[:-len(suffix)] if suffix else sample_name
+        if (not suffix or sample_name.endswith(suffix)) and name in METRICS:
+            return name
+    return sample_name
+
+def _records(data):
+    """(key, value offset, value) for each record in a values file"""
+    used = USED.unpack_from(data)[0] if len(data) >= USED.size else 0
+    offset = USED.size
+    while offset < used:
+        length = RECORD_LENGTH.unpack_from(data, offset)[0]
+        key = bytes(data[offset + RECORD_LENGTH.size:offset + RECORD_LENGTH.size + length]).decode()
+        record = RECORD_LENGTH.size + length
+        position = offset + record + (-record % 8)
+        yield key, position, VALUE.unpack_from(data, position)[0]
+        offset = position + VALUE.size
+
+class ValuesFile:
+    """One process's float64 values by key; only the owning process writes"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < INITIAL_SIZE:
+            os.ftruncate(self.fd, INITIAL_SIZE)
+        self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+        if USED.unpack_from(self.map)[0] == 0:
+            USED.pack_into(self.map, 0, USED.size)
+        self.positions = {}
+        for key, position, _ in _records(self.map):
+            self.positions[key] = position
+            # A reused pid: gauges describe the process that wrote them
+            if METRICS.get(_family(json.loads(key)[0]), ('',))[0] == 'gauge':
+                VALUE.pack_into(self.map, position, 0.0)
+
+    def position(self, key):
+        """Offset of key's value, adding a record for a new key"""
+        with self.lock:
+            position = self.positions.get(key)
+            if position is None:
+                encoded = key.encode()
+                used = USED.unpack_from(self.map)[0]
+                record = RECORD_LENGTH.size + len(encoded)
+                position = used + record + (-record % 8)
+                if position + VALUE.size > len(self.map):
+                    size = max(position + VALUE.size, len(self.map) * 2)
+                    os.ftruncate(self.fd, size)
+                    self.map.close()
+                    self.map = mmap.mmap(self.fd, size)
+                RECORD_LENGTH.pack_into(self.map, used, len(encoded))
+                self.map[used + RECORD_LENGTH.size:used + record] = encoded
+                VALUE.pack_into(self.map, position, 0.0)
+                # Publish the record only once it is complete
+                USED.pack_into(self.map, 0, position + VALUE.size)
+                self.positions[key] = position
+            return position
+
+    def add(self, *updates):
+        """Add amounts to values, given as (position, amount) pairs"""
+        with self.lock:
+            for position, amount in updates:
+                VALUE.pack_into(self.map, position, VALUE.unpack_from(self.map, position)[0] + amount)
+
+    def set(self, position, value):
+        with self.lock:
+            VALUE.pack_into(self.map, position, value)
+
+def _key(sample_name, labels):
+    return json.dumps([sample_name, sorted(labels)], separators=(',', ':'))
+
+class Metrics:
+    """This process's recorder; files are named <gunicorn master pid>-<pid>"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.run = os.getppid()
+        self._remove_stale_runs()
+        self.values = ValuesFile(os.path.join(directory, f'{self.run}-{os.getpid()}.db'))
+        self.series = {}
+        self.sampled_at = 0.0
+
+    def _remove_stale_runs(self):
+        for path in glob.glob(os.path.join(self.directory, '*-*.db')):
+            run = int(os.path.basename(path).split('-')[0])
+            if run != self.run and not _alive(run):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _position(self, name, labels):
+        series = (name, tuple(labels.items()) if labels else ())
+        position = self.series.get(series)
+        if position is None:
+            position = self.series[series] = self.values.position(_key(name, series[1]))
+        return position
+
+    def inc(self, name, labels=None, amount=1.0):
+        self.values.add((self._position(name, labels), amount))
+
+    def set(self, name, labels=None, value=0.0):
+        self.values.set(self._position(name, labels), value)
+
+    def observe(self, name, labels, value):
+        """Count value in its own bucket; buckets are made cumulative when rendered"""
+        series = (name, tuple(labels.items()))
+        positions = self.series.get(series)
+        if positions is None:
+            bounds = [_format(bound) for bound in METRICS[name][2]] + ['+Inf']
+            positions = self.series[series] = (
+                [self.values.position(_key(f'{name}_bucket', series[1] + (('le', le),))) for le in bounds],
+                self.values.position(_key(f'{name}_sum', series[1])),
+                self.values.position(_key(f'{name}_count', series[1]))
+            )
+        buckets, total, count = positions
+        bucket = buckets[bisect.bisect_left(METRICS[name][2], value)]
+        self.values.add((bucket, 1.0), (total, value), (count, 1.0))
+
+    def collect(self):
+        """{(sample name, labels): value} summed over this run's workers"""
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, f'{self.run}-*.db')):
+            pid = int(os.path.basename(path)[:-3].split('-')[1])
+            live = pid == os.getpid() or _alive(pid)
+            try:
+                with open(path, 'rb') as values_file:
+                    data = values_file.read()
+            except OSError:
+                continue
+            for key, _, value in _records(data):
+                sample_name, labels = json.loads(key)
+                if not live and METRICS.get(_family(sample_name), ('',))[0] == 'gauge':
+                    continue
+                sample = (sample_name, tuple(tuple(label) for label in labels))
+                totals[sample] = totals.get(sample, 0.0) + value
+        return totals
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _format(bound):
+    return repr(float(bound))
+
+def metrics_dir(app):
+    return app.config['METRICS_DIR'] or sidecar_path(app, '-metrics', 'metrics')
+
+def recorder():
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+# Recording
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics = recorder()
+            if metrics is not None:
+                metrics.observe('message_hub_db_pool_wait_seconds', {}, time.perf_counter() - start)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + elapsed
+        return
+    # Background jobs, the archiver and CLI commands
+    metrics = recorder()
+    if metrics is not None:
+        metrics.inc('message_hub_db_queries_total', {'endpoint': 'background'})
+        metrics.inc('message_hub_db_seconds_total', {'endpoint': 'background'}, elapsed)
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.in_progress_endpoint = request.endpoint or 'unmatched'
+    current_app.extensions['metrics'].inc('message_hub_requests_in_progress', {'endpoint': g.in_progress_endpoint})
+
+def _record_request(response):
+    metrics = current_app.extensions['metrics']
+    endpoint = request.endpoint or 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': str(response.status_code)}
+    metrics.observe('message_hub_request_duration_seconds', labels, time.perf_counter() - g.request_start)
+    metrics.observe('message_hub_request_size_bytes', {'endpoint': endpoint}, request.content_length or 0)
+    if not response.is_streamed:
+        metrics.observe('message_hub_response_size_bytes', {'endpoint': endpoint}, response.calculate_content_length() or 0)
+
+    queries, seconds = g.get('db_queries', 0), g.get('db_seconds', 0.0)
+    metrics.observe('message_hub_request_db_queries', {'endpoint': endpoint}, queries)
+    metrics.observe('message_hub_request_db_seconds', {'endpoint': endpoint}, seconds)
+    if queries:
+        metrics.inc('message_hub_db_queries_total', {'endpoint': endpoint}, queries)
+        metrics.inc('message_hub_db_seconds_total', {'endpoint': endpoint}, seconds)
+    # Gauges and copied counters lag by at most SAMPLE_INTERVAL
+    now = time.monotonic()
+    if now - metrics.sampled_at >= SAMPLE_INTERVAL:
+        metrics.sampled_at = now
+        _sample_worker(metrics)
+    return response
+
+def _finish_request(exception):
+    endpoint = g.pop('in_progress_endpoint', None)
+    if endpoint is not None:
+        current_app.extensions['metrics'].inc('message_hub_requests_in_progress', {'endpoint': endpoint}, -1)
+
+def _sample_worker(metrics):
+    """Copy this worker's in-memory counters and sizes into its values file"""
+    from models import db
+
+    for bind, engine in db.engines.items():
+        if isinstance(engine.pool, QueuePool):
+            metrics.set('message_hub_db_pool_checked_out', {'bind': bind or 'primary'}, engine.pool.checkedout())
+
+    cache = current_app.extensions.get('result_cache')
+    if cache is not None:
+        stats = cache.stats()
+        metrics.set('message_hub_result_cache_lookups_total', {'result': 'hit'}, stats['hits'])
+        metrics.set('message_hub_result_cache_lookups_total', {'result': 'miss'}, stats['misses'])
+        metrics.set('message_hub_result_cache_bytes', {}, stats['bytes'])
+        metrics.set('message_hub_result_cache_entries', {}, stats['entries'])
+
+    tail = current_app.extensions.get('hot_tail')
+    if tail is not None:
+        metrics.set('message_hub_hot_tail_lookups_total', {'result': 'hit'}, tail.hits)
+        metrics.set('message_hub_hot_tail_lookups_total', {'result': 'miss'}, tail.misses)
+
+    keys = current_app.extensions.get('api_keys')
+    if keys is not None:
+        stats = keys.stats()
+        metrics.set('message_hub_api_key_lookups_total', {'result': 'hit'}, stats['hits'])
+        metrics.set('message_hub_api_key_lookups_total', {'result': 'miss'}, stats['misses'])
+
+    dedup = current_app.extensions.get('message_dedup')
+    if dedup is not None:
+        for outcome, count in dedup.stats().items():
+            metrics.set('message_hub_ingest_dedup_total', {'result': outcome}, count)
+
+    coalescing = current_app.extensions.get('notification_coalescing')
+    if coalescing is not None:
+        stats = coalescing.stats()
+        for source in ('cache', 'database'):
+            metrics.set('message_hub_notifications_coalesced_total', {'found_in': source}, stats[source])
+        metrics.set('message_hub_notifications_superseded_total', {}, stats['superseded'])
+
+def init_metrics(app):
+    """Per-worker recorder, request hooks, and a timed pool for engines that default to QueuePool"""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_dialect().get_pool_class(url) is QueuePool:
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {}).setdefault('poolclass', TimedQueuePool)
+
+    app.extensions['metrics'] = Metrics(metrics_dir(app))
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+# Exposition
+
+def _ratio(totals, family):
+    hits = sum(value for (name, labels), value in totals.items() if name == family and ('result', 'hit') in labels)
+    lookups = sum(value for (name, _), value in totals.items() if name == family)
+    return hits / lookups if lookups else None
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def render_metrics():
+    """All workers' metrics in the Prometheus text format (version 0.0.4)"""
+    from models import db, Job
+
+    metrics = current_app.extensions['metrics']
+    totals = metrics.collect()
+
+    # Whole-server values, computed at scrape time
+    for job_type, status, count in db.session.execute(
+        select(Job.type, Job.status, func.count()).where(Job.status.in_(('pending', 'running')))
+        .group_by(Job.type, Job.status)
+    ).all():
+        totals[('message_hub_jobs', (('status', status), ('type', job_type)))] = float(count)
+    for family in ('message_hub_result_cache', 'message_hub_hot_tail'):
+        ratio = _ratio(totals, f'{family}_lookups_total')
+        if ratio is not None:
+            totals[(f'{family}_hit_ratio', ())] = ratio
+
+    by_family = {}
+    for (sample_name, labels), value in totals.items():
+        by_family.setdefault(_family(sample_name), []).append((sample_name, labels, value))
+
+    lines = []
+    for name in sorted(by_family):
+        kind, help_text, _ = METRICS.get(name, ('untyped', '', None))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        series, cumulative = None, 0.0
+        for sample_name, labels, value in sorted(by_family[name], key=_sample_order):
+            if sample_name.endswith('_bucket') and kind == 'histogram':
+                other = tuple(label for label in labels if label[0] != 'le')
+                if other != series:
+                    series, cumulative = other, 0.0
+                cumulative += value
+                value = cumulative
+            label_text = ','.join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+            lines.append(f'{sample_name}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{sample_name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+def _sample_order(sample):
+    sample_name, labels, _ = sample
+    other = tuple(label for label in labels if label[0] != 'le')
+    le = dict(labels).get('le')
+    bound = float('inf') if le == '+Inf' else float(le) if le is not None else 0.0
+    return (other, sample_name, bound)
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
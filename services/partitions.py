@@ -0,0 +1,768 @@
+"""
+Monthly message partitions
+
+New messages always land in the hot ``messages`` table. Once a month falls
+out of the PARTITION_HOT_MONTHS window it is sealed: its rows move in small
+chunks into a ``messages_YYYYMM`` table, which is then reindexed, analyzed and
+made read-only. The hot table and its indexes only ever hold recent months.
+
+The ``message_partitions`` catalog keeps a zone map for every partition
+(received_at and timestamp ranges, per device/type counts). The router below
+uses it to skip partitions a query cannot match, answers counts for fully
+covered partitions from the catalog, and only reads several tables when a
+query really spans them.
+"""
+
+import heapq
+import itertools
+import re
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import BigInteger, MetaData, case, delete, func, or_, select, text, type_coerce, update
+from sqlalchemy.orm import aliased
+
+from models import db, Message, MessagePartition
+from models.ids import uuid7_time
+from models.types import from_epoch_micros, to_epoch_micros
+
+HOT_TABLE = Message.__table__
+MAX_MICROS = 2**63 - 1
+
+_partition_metadata = MetaData()
+
+PartitionInfo = namedtuple('PartitionInfo', [
+    'name', 'month_start', 'month_end', 'sealed', 'row_count',
+    'min_received_at', 'max_received_at', 'min_timestamp', 'max_timestamp', 'stats'
+])
+
+def month_start(value):
+    """First instant (UTC) of the month containing value"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+def partition_name(start):
+    return f'messages_{start.year:04d}{start.month:02d}'
+
+def partition_table(name):
+    """Table for a partition: the messages columns, with partition-local index names"""
+    table = _partition_metadata.tables.get(name)
+    if table is None:
+        table = HOT_TABLE.to_metadata(_partition_metadata, name=name)
+        # Partitions only receive rows with existing sequence IDs
+        table.dialect_options['sqlite']['autoincrement'] = False
+    return table
+
+def _micros(value):
+    if value is None or isinstance(value, int):
+        return value
+    return to_epoch_micros(value)
+
+# Catalog
+
+def catalog():
+    """
+    Partition catalog, cached per process for PARTITION_CATALOG_TTL seconds
+    Sealing waits out the TTL after registering a partition and before moving
+    any rows, so a cached catalog never misses a partition holding rows.
+    """
+    cache = current_app.extensions.setdefault('message_partitions', {'loaded_at': None, 'partitions': []})
+    ttl = current_app.config['PARTITION_CATALOG_TTL']
+    now = time.monotonic()
+    if cache['loaded_at'] is None or now - cache['loaded_at'] >= ttl:
+        cache['partitions'] = load_catalog()
+        cache['loaded_at'] = now
+    return cache['partitions']
+
+def load_catalog():
+    partitions = []
+    for entry in MessagePartition.query.order_by(MessagePartition.month_start).all():
+        partitions.append(PartitionInfo(
+            name=entry.name,
+            month_start=_micros(entry.month_start),
+            month_end=_micros(entry.month_end),
+            sealed=entry.sealed_at is not None,
+            row_count=entry.row_count,
+            min_received_at=_micros(entry.min_received_at),
+            max_received_at=_micros(entry.max_received_at),
+            min_timestamp=_micros(entry.min_timestamp),
+            max_timestamp=_micros(entry.max_timestamp),
+            stats=entry.stats or []
+        ))
+    return partitions
+
+def invalidate_catalog():
+    current_app.extensions.pop('message_partitions', None)
+
+# Routing
+
+def _like_pattern(value, wildcard=None):
+    """Escape a literal for LIKE (backslash escape), optionally mapping a wildcard character to %"""
+    escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped.replace(wildcard, '%') if wildcard else escaped
+
+class MessageFilter:
+    """Message query filters, applied to whichever tables the router picks"""
+
+    def __init__(self, device=None, message_type=None, unread_for=None,
+                 received_after=None, timestamp_after=None, timestamp_before=None, text_query=None,
+                 received_before=None, device_pattern=None, sequence_after=None, sequence_before=None,
+                 thread=None, received_after_sequence=None):
+        self.device = device or None
+        # Device ID with * wildcards (e.g. perf-device-*), case-insensitive like SQLite LIKE
+        self.device_pattern = device_pattern or None
+        self._device_regex = re.compile(
+            '.*'.join(re.escape(part) for part in device_pattern.split('*')), re.IGNORECASE
+        ) if device_pattern else None
+        self.message_type = message_type or None
+        # Only messages this read state (services.read_state.ReadSet) has not read
+        self.unread_for = unread_for
+        # Case-insensitive substring of content or sender
+        self.text_query = text_query or None
+        # received_after < received_at < received_before, timestamp_after <= timestamp < timestamp_before
+        self.received_after = _micros(received_after)
+        # With received_after, a keyset cursor: (received_at, sequence_id) > (received_after, this),
+        # so paging resumes inside a run of messages sharing one received_at
+        self.received_after_sequence = received_after_sequence
+        self.received_before = _micros(received_before)
+        self.timestamp_after = _micros(timestamp_after)
+        self.timestamp_before = _micros(timestamp_before)
+        # sequence_after < sequence_id < sequence_before
+        self.sequence_after = sequence_after
+        self.sequence_before = sequence_before
+        # Thread key (services.threads)
+        self.thread = thread or None
+
+    def received_cursor(self):
+        """(received_at, sequence_id) every match is above, with received_after set"""
+        sequence = MAX_MICROS if self.received_after_sequence is None else self.received_after_sequence
+        return (self.received_after, sequence)
+
+    def device_matches(self, device):
+        if self.device and device != self.device:
+            return False
+        if self._device_regex and not self._device_regex.fullmatch(device):
+            return False
+        return True
+
+    def clauses(self, table):
+        columns = table.c
+        clauses = []
+        if self.device:
+            clauses.append(columns.source_device_id == self.device)
+        if self.device_pattern:
+            clauses.append(columns.source_device_id.ilike(_like_pattern(self.device_pattern, '*'), escape='\\'))
+        if self.message_type:
+            clauses.append(columns.type == self.message_type)
+        if self.unread_for is not None:
+            clauses.append(self.unread_for.unread_clause(columns.sequence_id))
+        if self.received_after is not None and self.received_after_sequence is not None:
+            # A range on the received_at index, the tie resolved on its rows
+            clauses.append(columns.received_at >= self.received_after)
+            clauses.append(or_(columns.received_at > self.received_after,
+                               columns.sequence_id > self.received_after_sequence))
+        elif self.received_after is not None:
+            clauses.append(columns.received_at > self.received_after)
+        if self.received_before is not None:
+            clauses.append(columns.received_at < self.received_before)
+        if self.timestamp_after is not None:
+            clauses.append(columns.timestamp >= self.timestamp_after)
+        if self.timestamp_before is not None:
+            clauses.append(columns.timestamp < self.timestamp_before)
+        if self.sequence_after is not None:
+            clauses.append(columns.sequence_id > self.sequence_after)
+        if self.sequence_before is not None:
+            clauses.append(columns.sequence_id < self.sequence_before)
+        if self.thread:
+            clauses.append(columns.thread_key == self.thread)
+        if self.text_query:
+            pattern = '%' + _like_pattern(self.text_query) + '%'
+            clauses.append(or_(
+                columns.content.ilike(pattern, escape='\\'),
+                columns.sender.ilike(pattern, escape='\\')
+            ))
+        return clauses
+
+    def matches(self, message):
+        """Apply the filter to a row dict keyed by column name (timestamps as epoch microseconds)"""
+        if not self.device_matches(message['source_device_id']):
+            return False
+        if self.message_type and message['type'] != self.message_type:
+            return False
+        if self.unread_for is not None and self.unread_for.is_read(message['sequence_id']):
+            return False
+        if self.received_after is not None and (
+                (message['received_at'], message['sequence_id']) <= self.received_cursor()):
+            return False
+        if self.received_before is not None and message['received_at'] >= self.received_before:
+            return False
+        if self.timestamp_after is not None and message['timestamp'] < self.timestamp_after:
+            return False
+        if self.timestamp_before is not None and message['timestamp'] >= self.timestamp_before:
+            return False
+        if self.sequence_after is not None and message['sequence_id'] <= self.sequence_after:
+            return False
+        if self.sequence_before is not None and message['sequence_id'] >= self.sequence_before:
+            return False
+        if self.thread and message.get('thread_key') != self.thread:
+            return False
+        if self.text_query:
+            text_query = self.text_query.lower()
+            return text_query in message['content'].lower() or text_query in message['sender'].lower()
+        return True
+
+    def _stats_count(self, partition):
+        total = 0
+        for device, message_type, count, _ in partition.stats:
+            if not self.device_matches(device):
+                continue
+            if self.message_type and message_type != self.message_type:
+                continue
+            total += count
+        return total
+
+    def may_match(self, partition):
+        """Zone map check - False when the partition cannot hold a matching message"""
+        if not partition.sealed:
+            # Rows are still moving in, only the month bounds are known
+            if self.received_before is not None and partition.month_start >= self.received_before:
+                return False
+            return self.received_after is None or partition.month_end > self.received_after
+        if not partition.row_count:
+            return False
+        if self.received_after is not None and (
+                (partition.max_received_at, MAX_MICROS) <= self.received_cursor()):
+            return False
+        if self.received_before is not None and partition.min_received_at >= self.received_before:
+            return False
+        if self.timestamp_after is not None and partition.max_timestamp < self.timestamp_after:
+            return False
+        if self.timestamp_before is not None and partition.min_timestamp >= self.timestamp_before:
+            return False
+        return self._stats_count(partition) > 0
+
+    def known_count(self, partition):
+        """Exact match count from the catalog, or None when the rows have to be counted"""
+        if not partition.sealed or self.text_query or self.unread_for is not None or self.thread:
+            return None
+        if self.sequence_after is not None or self.sequence_before is not None:
+            return None
+        if self.received_after is not None and partition.min_received_at <= self.received_after:
+            return None
+        if self.received_before is not None and partition.max_received_at >= self.received_before:
+            return None
+        if self.timestamp_after is not None and partition.min_timestamp < self.timestamp_after:
+            return None
+        if self.timestamp_before is not None and partition.max_timestamp >= self.timestamp_before:
+            return None
+        return self._stats_count(partition)
+
+def routed_partitions(message_filter):
+    """Partitions a query has to read besides the hot table, oldest first"""
+    return [partition for partition in catalog() if message_filter.may_match(partition)]
+
+def _count(table, message_filter):
+    statement = select(func.count()).select_from(table).where(*message_filter.clauses(table))
+    return db.session.execute(statement).scalar() or 0
+
+def count_messages(message_filter):
+    """Count matching messages across the hot table and routed partitions"""
+    total = _count(HOT_TABLE, message_filter)
+    for partition in routed_partitions(message_filter):
+        known = message_filter.known_count(partition)
+        total += known if known is not None else _count(partition_table(partition.name), message_filter)
+    return total
+
+def _select_rows(table, message_filter, newest_first, limit, offset=0):
+    # sequence_id orders ties (it is the rowid the received_at index ends in)
+    if newest_first:
+        order = (table.c.received_at.desc(), table.c.sequence_id.desc())
+    else:
+        order = (table.c.received_at.asc(), table.c.sequence_id.asc())
+    statement = select(*Message.serialized_columns(table)).where(
+        *message_filter.clauses(table)
+    ).order_by(*order).limit(limit).offset(offset)
+    return db.session.execute(statement).all()
+
+def _received_at_groups(partitions, message_filter, newest_first):
+    """
+    Group the tables to read by received_at range, in read order
+    Sealed partitions never overlap, the hot table only overlaps a partition
+    that is being sealed. Tables in the same group have to be merged.
+    """
+    sources = []
+    for partition in partitions:
+        if partition.sealed:
+            low, high = partition.min_received_at, partition.max_received_at
+        else:
+            low, high = partition.month_start, partition.month_end - 1
+        sources.append((low, high, partition_table(partition.name), message_filter.known_count(partition)))
+
+    hot_low = db.session.execute(
+        select(func.min(type_coerce(HOT_TABLE.c.received_at, BigInteger)))
+    ).scalar()
+    if hot_low is not None:
+        sources.append((hot_low, MAX_MICROS, HOT_TABLE, None))
+
+    groups = []
+    group_high = None
+    for low, high, table, known in sorted(sources, key=lambda source: source[0]):
+        if groups and low <= group_high:
+            groups[-1].append((table, known))
+            group_high = max(group_high, high)
+        else:
+            groups.append([(table, known)])
+            group_high = high
+    if newest_first:
+        groups.reverse()
+    return groups
+
+def select_by_received_at(message_filter, limit, offset=0, newest_first=False):
+    """
+    Serialized rows (see Message.serialized_columns) ordered by received_at
+    Reads tables in received_at order and stops as soon as the page is full.
+    Whole partitions are skipped for an offset using their catalog counts.
+    """
+    partitions = routed_partitions(message_filter)
+    if not partitions:
+        return _select_rows(HOT_TABLE, message_filter, newest_first, limit, offset)
+
+    rows = []
+    for group in _received_at_groups(partitions, message_filter, newest_first):
+        wanted = limit - len(rows)
+        if wanted <= 0:
+            break
+        if offset:
+            group_count = sum(
+                known if known is not None else _count(table, message_filter)
+                for table, known in group
+            )
+            if group_count <= offset:
+                offset -= group_count
+                continue
+        if len(group) == 1:
+            rows.extend(_select_rows(group[0][0], message_filter, newest_first, wanted, offset))
+        else:
+            fetched = [_select_rows(table, message_filter, newest_first, offset + wanted) for table, _ in group]
+            merged = heapq.merge(*fetched, key=lambda row: (row.received_at, row.sequence_id),
+                                 reverse=newest_first)
+            rows.extend(itertools.islice(merged, offset, offset + wanted))
+        offset = 0
+    return rows
+
+def iter_by_received_at(message_filter, batch_size=1000):
+    """
+    Every matching serialized row, oldest first by received_at, as a stream
+    Each table is read by one query walking its received_at index, fetched
+    batch_size rows at a time, so memory stays flat however many rows match.
+    Tables that overlap (a month being sealed) are merged as they stream.
+    """
+    def rows(table):
+        statement = select(*Message.serialized_columns(table)).where(
+            *message_filter.clauses(table)
+        ).order_by(table.c.received_at, table.c.sequence_id)
+        yield from db.session.execute(statement, execution_options={'yield_per': batch_size})
+
+    for group in _received_at_groups(routed_partitions(message_filter), message_filter, newest_first=False):
+        if len(group) == 1:
+            yield from rows(group[0][0])
+        else:
+            yield from heapq.merge(*(rows(table) for table, _ in group),
+                                   key=lambda row: (row.received_at, row.sequence_id))
+
+def select_by_sequence(message_filter, limit, newest_first=False):
+    """
+    Serialized rows ordered by sequence_id, for fetching a sequence range
+    The zone maps don't cover sequence IDs, so every routed table is read, but
+    each read is a primary key range scan that stops after limit rows.
+    """
+    tables = [HOT_TABLE] + [partition_table(partition.name) for partition in routed_partitions(message_filter)]
+    fetched = []
+    for table in tables:
+        order = table.c.sequence_id.desc() if newest_first else table.c.sequence_id
+        statement = select(*Message.serialized_columns(table)).where(
+            *message_filter.clauses(table)
+        ).order_by(order).limit(limit)
+        fetched.append(db.session.execute(statement).all())
+    if len(fetched) == 1:
+        return fetched[0]
+    merged = heapq.merge(*fetched, key=lambda row: row.sequence_id, reverse=newest_first)
+    return list(itertools.islice(merged, limit))
+
+def newest_messages(message_filter, limit, offset=0):
+    """
+    Message objects ordered by timestamp, newest first (web views)
+    The hot table is read first; its last row's timestamp then prunes every
+    partition whose newest message is older (zone map) before fanning out.
+    """
+    # Recent pages come from the in-process tail when it can answer them
+    from .hot_tail import newest_from_tail
+    messages = newest_from_tail(message_filter, limit, offset)
+    if messages is not None:
+        return messages
+
+    wanted = offset + limit
+    messages = Message.query.filter(*message_filter.clauses(HOT_TABLE)).order_by(
+        Message.timestamp.desc()
+    ).limit(wanted).all()
+
+    partitions = routed_partitions(message_filter)
+    if len(messages) == wanted and messages:
+        floor = to_epoch_micros(messages[-1].timestamp)
+        partitions = [
+            partition for partition in partitions
+            if not partition.sealed or partition.max_timestamp >= floor
+        ]
+    if not partitions:
+        return messages[offset:]
+
+    fetched = [messages]
+    for partition in partitions:
+        table = partition_table(partition.name)
+        entity = aliased(Message, table, adapt_on_names=True)
+        fetched.append(
+            db.session.query(entity).filter(*message_filter.clauses(table)).order_by(
+                entity.timestamp.desc()
+            ).limit(wanted).all()
+        )
+    merged = heapq.merge(*fetched, key=lambda message: message.timestamp, reverse=True)
+    return list(itertools.islice(merged, offset, wanted))
+
+class RoutedPagination(Pagination):
+    """Flask-SQLAlchemy pagination over newest_messages()/count_messages()"""
+
+    def _query_items(self):
+        return newest_messages(self._query_args['message_filter'], self.per_page, self._query_offset)
+
+    def _query_count(self):
+        return count_messages(self._query_args['message_filter'])
+
+def paginate_messages(message_filter, page, per_page):
+    return RoutedPagination(
+        page=page, per_page=per_page, max_per_page=None, error_out=False, message_filter=message_filter
+    )
+
+def find_message(message_id):
+    """
+    Look a message up by external ID: the hot table, the partitions, then the archive
+    Returns (message, location) where location is None for the hot table, else
+    the partition name or 'archive'. A UUIDv7 ID embeds its creation time,
+    so the partition covering it is probed first.
+    """
+    message = Message.query.filter_by(id=message_id).first()
+    if message:
+        return message, None
+
+    partitions = catalog()
+    hint = uuid7_time(message_id)
+    if hint is not None:
+        def distance(partition):
+            if partition.month_start <= hint < partition.month_end:
+                return 0
+            return min(abs(hint - partition.month_start), abs(hint - partition.month_end))
+        partitions = sorted(partitions, key=distance)
+
+    for partition in partitions:
+        table = partition_table(partition.name)
+        entity = aliased(Message, table, adapt_on_names=True)
+        message = db.session.query(entity).filter(entity.id == message_id).first()
+        if message:
+            return message, partition.name
+
+    # Archived messages are read back from their segment file on demand
+    from .archive import find_archived_message
+    message = find_archived_message(message_id)
+    if message:
+        return message, 'archive'
+    return None, None
+
+def message_counts():
+    """
+    Message counts as {(device, type): count}
+    Grouped in SQL for the hot table (and partitions still being sealed),
+    read from the catalog for sealed partitions. Unread counts depend on the
+    client, see services.read_state.unread_counts.
+    """
+    counts = {}
+
+    def add(device, message_type, count):
+        counts[(device, message_type)] = counts.get((device, message_type), 0) + count
+
+    tables = [HOT_TABLE]
+    for partition in catalog():
+        if partition.sealed:
+            for device, message_type, count, _ in partition.stats:
+                add(device, message_type, count)
+        else:
+            tables.append(partition_table(partition.name))
+
+    for table in tables:
+        for row in db.session.execute(_group_counts(table)).all():
+            add(*row)
+    return counts
+
+def _group_counts(table):
+    return select(
+        table.c.source_device_id,
+        table.c.type,
+        func.count()
+    ).group_by(table.c.source_device_id, table.c.type)
+
+def _partition_stats(table):
+    # Catalog stats keep their [device, type, count, unread] shape; unread is
+    # the legacy is_read flag, still maintained but no longer read
+    return select(
+        table.c.source_device_id,
+        table.c.type,
+        func.count(),
+        func.sum(case((table.c.is_read == True, 0), else_=1))
+    ).group_by(table.c.source_device_id, table.c.type)
+
+def latest_time(column_name):
+    """Newest received_at or timestamp across all messages, as a UTC datetime"""
+    def table_max(table):
+        return db.session.execute(
+            select(func.max(type_coerce(table.c[column_name], BigInteger)))
+        ).scalar()
+
+    values = [table_max(HOT_TABLE)]
+    for partition in catalog():
+        if partition.sealed:
+            values.append(partition.max_received_at if column_name == 'received_at' else partition.max_timestamp)
+        else:
+            values.append(table_max(partition_table(partition.name)))
+    values = [value for value in values if value is not None]
+    return from_epoch_micros(max(values)) if values else None
+
+def latest_sequence_id():
+    """Highest sequence ID across all messages, None when there are none"""
+    values = [
+        db.session.execute(select(func.max(table.c.sequence_id))).scalar()
+        for table in [HOT_TABLE] + [partition_table(partition.name) for partition in catalog()]
+    ]
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+def delete_from_partition(connection, name, rows):
+    """
+    Delete rows from a sealed partition inside the caller's transaction
+    rows need sequence_id, source_device_id, type and is_read. The partition is
+    unlocked only for this transaction, and its catalog counts stay exact.
+    """
+    catalog_table = MessagePartition.__table__
+    table = partition_table(name)
+    # Unlock first: the write lock is taken before the counts are read
+    connection.execute(update(catalog_table).where(catalog_table.c.name == name).values(writable=True))
+    connection.execute(delete(table).where(table.c.sequence_id.in_([row['sequence_id'] for row in rows])))
+
+    entry = connection.execute(
+        select(catalog_table.c.row_count, catalog_table.c.stats).where(catalog_table.c.name == name)
+    ).one()
+    stats = {(device, message_type): [count, unread] for device, message_type, count, unread in entry.stats or []}
+    for row in rows:
+        counts = stats[(row['source_device_id'], row['type'])]
+        counts[0] -= 1
+        if not row['is_read']:
+            counts[1] -= 1
+    connection.execute(update(catalog_table).where(catalog_table.c.name == name).values(
+        writable=False,
+        row_count=entry.row_count - len(rows),
+        stats=[[device, message_type, count, unread]
+               for (device, message_type), (count, unread) in stats.items() if count > 0]
+    ))
+
+# Sealing
+
+SEALABLE_DIALECTS = ('sqlite', 'postgresql')
+
+# Shared by every partition on PostgreSQL; the table name comes from the trigger
+_POSTGRESQL_READ_ONLY_FUNCTION = """
+CREATE OR REPLACE FUNCTION message_partition_read_only() RETURNS trigger AS $$
+BEGIN
+    IF NOT (SELECT writable FROM message_partitions WHERE name = TG_TABLE_NAME) THEN
+        RAISE EXCEPTION '% is a sealed, read-only partition', TG_TABLE_NAME;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+def _create_partition_table(connection, name):
+    """The partition table and the triggers rejecting writes while it is sealed (writable false)"""
+    partition_table(name).create(connection, checkfirst=True)
+    if connection.dialect.name == 'sqlite':
+        for operation in ('INSERT', 'UPDATE', 'DELETE'):
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {name}_read_only_{operation.lower()} "
+                f"BEFORE {operation} ON {name} "
+                f"WHEN (SELECT writable FROM message_partitions WHERE name = '{name}') = 0 "
+                f"BEGIN SELECT RAISE(ABORT, '{name} is a sealed, read-only partition'); END"
+            ))
+    else:
+        connection.execute(text(_POSTGRESQL_READ_ONLY_FUNCTION))
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {name}_read_only ON {name}"))
+        connection.execute(text(
+            f"CREATE TRIGGER {name}_read_only BEFORE INSERT OR UPDATE OR DELETE ON {name} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION message_partition_read_only()"
+        ))
+
+def _compact_partition(connection, name):
+    """Rebuild the indexes densely packed and refresh the planner statistics"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f'REINDEX {name}'))
+    else:
+        connection.execute(text(f'REINDEX TABLE {name}'))
+    connection.execute(text(f'ANALYZE {name}'))
+
+def months_to_seal(now=None):
+    """Month starts with messages still in the hot table that are older than the hot window"""
+    now = now or datetime.now(timezone.utc)
+    cutoff = add_months(month_start(now), -(current_app.config['PARTITION_HOT_MONTHS'] - 1))
+    oldest = db.session.execute(
+        select(func.min(type_coerce(HOT_TABLE.c.received_at, BigInteger)))
+    ).scalar()
+    if oldest is None:
+        return []
+
+    months = []
+    start = month_start(from_epoch_micros(oldest))
+    while start < cutoff:
+        end = add_months(start, 1)
+        has_rows = db.session.execute(
+            select(HOT_TABLE.c.sequence_id).where(
+                HOT_TABLE.c.received_at >= start, HOT_TABLE.c.received_at < end
+            ).limit(1)
+        ).first()
+        if has_rows:
+            months.append(start)
+        start = end
+    return months
+
+def seal_month(start, chunk_size=None, wait_for_readers=True):
+    """
+    Move one month of messages out of the hot table into its partition,
+    then compact it (REINDEX + ANALYZE), record its zone map and make it read-only
+    Rows move in chunks of chunk_size, one short transaction each, so writers
+    are never blocked for long. Returns the number of rows moved.
+    Only SQLite and PostgreSQL can enforce read-only partitions; other
+    databases raise RuntimeError before anything is moved.
+    """
+    dialect = db.engine.dialect.name
+    if dialect not in SEALABLE_DIALECTS:
+        raise RuntimeError(f'Sealing partitions is not supported on {dialect}')
+    chunk_size = chunk_size or current_app.config['PARTITION_SEAL_CHUNK_SIZE']
+    start = month_start(start)
+    end = add_months(start, 1)
+    name = partition_name(start)
+    table = partition_table(name)
+
+    entry = db.session.get(MessagePartition, name)
+    if entry is None:
+        entry = MessagePartition(
+            name=name, month_start=start, month_end=end, writable=True,
+            stats=[], created_at=datetime.now(timezone.utc)
+        )
+        db.session.add(entry)
+        db.session.commit()
+        with db.engine.begin() as connection:
+            _create_partition_table(connection, name)
+        invalidate_catalog()
+        if wait_for_readers:
+            # Let every process pick the new partition up before rows leave the hot table
+            time.sleep(current_app.config['PARTITION_CATALOG_TTL'])
+    elif not entry.writable:
+        entry.writable = True
+        db.session.commit()
+
+    columns = ', '.join(column.name for column in HOT_TABLE.columns)
+    low, high = to_epoch_micros(start), to_epoch_micros(end)
+    moved = 0
+    while True:
+        with db.engine.begin() as connection:
+            sequence_ids = connection.execute(
+                select(HOT_TABLE.c.sequence_id).where(
+                    HOT_TABLE.c.received_at >= low, HOT_TABLE.c.received_at < high
+                ).order_by(HOT_TABLE.c.sequence_id).limit(chunk_size)
+            ).scalars().all()
+            if not sequence_ids:
+                break
+            first, last = sequence_ids[0], sequence_ids[-1]
+            chunk = (f"received_at >= {low} AND received_at < {high} "
+                     f"AND sequence_id BETWEEN {first} AND {last}")
+            connection.execute(text(
+                f"INSERT INTO {name} ({columns}) SELECT {columns} FROM messages WHERE {chunk}"
+            ))
+            connection.execute(text(f"DELETE FROM messages WHERE {chunk}"))
+        moved += len(sequence_ids)
+
+    with db.engine.begin() as connection:
+        _compact_partition(connection, name)
+
+        zone = connection.execute(select(
+            func.count(),
+            func.min(type_coerce(table.c.received_at, BigInteger)),
+            func.max(type_coerce(table.c.received_at, BigInteger)),
+            func.min(type_coerce(table.c.timestamp, BigInteger)),
+            func.max(type_coerce(table.c.timestamp, BigInteger))
+        )).one()
+        stats = [list(row) for row in connection.execute(_partition_stats(table)).all()]
+
+    entry = db.session.get(MessagePartition, name)
+    entry.row_count = zone[0]
+    entry.min_received_at, entry.max_received_at = zone[1], zone[2]
+    entry.min_timestamp, entry.max_timestamp = zone[3], zone[4]
+    entry.stats = stats
+    entry.writable = False
+    entry.sealed_at = datetime.now(timezone.utc)
+    db.session.commit()
+    invalidate_catalog()
+
+    current_app.logger.info(f"Sealed partition {name}: moved {moved} messages, {zone[0]} total")
+    return moved
+
+# Maintenance commands: flask partitions ...
+
+partitions_cli = AppGroup('partitions', help='Manage monthly message partitions')
+
+@partitions_cli.command('list')
+@with_appcontext
+def list_partitions():
+    """Show the partition catalog"""
+    entries = MessagePartition.query.order_by(MessagePartition.month_start).all()
+    if not entries:
+        click.echo('No partitions yet - all messages are in the hot table')
+        return
+    for entry in entries:
+        state = 'read-only' if not entry.writable else ('sealing' if not entry.sealed_at else 'writable')
+        click.echo(f"{entry.name}  {entry.row_count:>10} messages  {state}")
+
+@partitions_cli.command('seal')
+@click.option('--month', help='Seal one month (YYYY-MM) instead of every month outside the hot window')
+@click.option('--chunk-size', type=int, help='Messages moved per transaction')
+@with_appcontext
+def seal_partitions(month, chunk_size):
+    """Move months outside the hot window into read-only partitions (run from cron)"""
+    if month:
+        try:
+            months = [datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc)]
+        except ValueError:
+            raise click.BadParameter('Use YYYY-MM', param_hint='--month')
+    else:
+        months = months_to_seal()
+
+    if not months:
+        click.echo('Nothing to seal')
+        return
+    for start in months:
+        moved = seal_month(start, chunk_size=chunk_size)
+        click.echo(f"Sealed {partition_name(start)}: moved {moved} messages")
@@ -0,0 +1,207 @@
+"""
+On-demand stack sampling profiler for the server workers
+
+GET /debug/profile?seconds=30 arms a profile in PROFILE_DIR. Gunicorn sync
+workers serve one request at a time, so the worker answering the profile
+request would only sample itself waiting. Instead, every worker that notices
+the armed profile on its next request starts a sampler thread. The sampler
+reads sys._current_frames() every PROFILE_INTERVAL_MS and counts the stacks of
+threads that are serving a request, keyed by endpoint. When the window closes,
+each worker writes its counts next to the armed file, and the profiling worker
+merges them.
+
+The result is collapsed stacks ("endpoint;outer;...;inner count"), as read
+by flamegraph.pl, speedscope and similar tools, or a hot-function table per
+endpoint.
+"""
+
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from flask import current_app, request
+
+from config import sidecar_path
+
+# How often a worker looks for an armed profile (at most once per request)
+ARM_CHECK_INTERVAL = 0.5
+# Time for the other workers to write their samples once the window closes
+COLLECT_GRACE = 1.0
+
+# Thread ident -> endpoint of the request it is serving
+_active = {}
+_joined = set()
+_checked = {'at': 0.0, 'mtime': None}
+
+def profile_dir(app):
+    return app.config['PROFILE_DIR'] or sidecar_path(app, '-profiles', 'profiles')
+
+def _armed_path(directory):
+    return os.path.join(directory, 'armed.json')
+
+def _short_path(filename):
+    for prefix in sorted((p for p in sys.path if p and p != '.'), key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+class StackSampler:
+    """Counts the stacks of request threads (or all threads) until a deadline"""
+
+    def __init__(self, interval, deadline, skip=(), all_threads=False):
+        self.interval = interval
+        self.deadline = deadline
+        self.skip = set(skip)
+        self.all_threads = all_threads
+        self.counts = defaultdict(Counter)
+        self.ticks = 0
+        self.names = {}
+
+    def _name(self, code):
+        name = self.names.get(code)
+        if name is None:
+            name = self.names[code] = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+        return name
+
+    def sample(self):
+        skip = self.skip | {threading.get_ident()}
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()} if self.all_threads else {}
+        for ident, frame in sys._current_frames().items():
+            endpoint = _active.get(ident)
+            if endpoint is None and self.all_threads:
+                endpoint = f'thread:{thread_names.get(ident, ident)}'
+            if endpoint is None or ident in skip:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._name(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.counts[endpoint][';'.join(stack)] += 1
+        self.ticks += 1
+
+    def run(self):
+        """Sample on the calling thread until the deadline"""
+        while time.time() < self.deadline:
+            self.sample()
+            time.sleep(self.interval)
+
+def _track_request():
+    _active[threading.get_ident()] = request.endpoint or 'unmatched'
+    now = time.monotonic()
+    if now - _checked['at'] >= ARM_CHECK_INTERVAL:
+        _checked['at'] = now
+        _join_armed_profile(profile_dir(current_app))
+
+def _untrack_request(exception):
+    _active.pop(threading.get_ident(), None)
+
+def _join_armed_profile(directory):
+    """Sample this worker if a profile is armed and it hasn't joined yet"""
+    try:
+        mtime = os.stat(_armed_path(directory)).st_mtime
+    except FileNotFoundError:
+        return
+    if mtime == _checked['mtime']:
+        return
+    _checked['mtime'] = mtime
+    try:
+        with open(_armed_path(directory)) as armed_file:
+            armed = json.load(armed_file)
+    except (OSError, ValueError):
+        return
+    if armed['id'] in _joined or armed['until'] <= time.time():
+        return
+    _joined.add(armed['id'])
+    _start_sampler(directory, armed)
+
+def _start_sampler(directory, armed, skip=()):
+    sampler = StackSampler(armed['interval'], armed['until'], skip, armed['all_threads'])
+
+    def sample_and_write():
+        sampler.run()
+        path = os.path.join(directory, f"{armed['id']}-{os.getpid()}.json")
+        with open(f'{path}.tmp', 'w') as samples_file:
+            json.dump({'ticks': sampler.ticks, 'counts': sampler.counts}, samples_file)
+        os.replace(f'{path}.tmp', path)
+
+    thread = threading.Thread(target=sample_and_write, name='stack-sampler', daemon=True)
+    thread.start()
+    return thread
+
+class ProfileBusy(Exception):
+    pass
+
+def profile_workers(seconds, interval, all_threads=False):
+    """
+    Sample every worker that serves a request in the next `seconds`;
+    returns (merged counts by endpoint, workers sampled, ticks)
+    """
+    directory = profile_dir(current_app)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        with open(_armed_path(directory)) as armed_file:
+            if json.load(armed_file)['until'] + COLLECT_GRACE > time.time():
+                raise ProfileBusy()
+    except (OSError, ValueError):
+        pass
+
+    armed = {'id': uuid.uuid4().hex, 'until': time.time() + seconds, 'interval': interval,
+             'all_threads': all_threads}
+    with open(_armed_path(directory) + '.tmp', 'w') as armed_file:
+        json.dump(armed, armed_file)
+    os.replace(_armed_path(directory) + '.tmp', _armed_path(directory))
+
+    # This worker samples its other threads too; not the one waiting here
+    _joined.add(armed['id'])
+    _start_sampler(directory, armed, skip=[threading.get_ident()]).join()
+    time.sleep(COLLECT_GRACE)
+
+    counts, workers, ticks = defaultdict(Counter), 0, 0
+    for path in glob.glob(os.path.join(directory, f"{armed['id']}-*.json")):
+        with open(path) as samples_file:
+            samples = json.load(samples_file)
+        os.remove(path)
+        workers += 1
+        ticks = max(ticks, samples['ticks'])
+        for endpoint, stacks in samples['counts'].items():
+            counts[endpoint].update(stacks)
+    return counts, workers, ticks
+
+def collapsed_stacks(counts):
+    """One 'endpoint;frame;...;frame count' line per stack, most sampled first"""
+    lines = [(count, f'{endpoint};{stack}') for endpoint, stacks in counts.items()
+             for stack, count in stacks.items()]
+    return ''.join(f'{stack} {count}\n' for count, stack in sorted(lines, reverse=True))
+
+def hot_functions(counts, top=20):
+    """Per endpoint: samples, and the functions with the most self and total samples"""
+    table = {}
+    for endpoint, stacks in counts.items():
+        self_samples, total_samples = Counter(), Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            self_samples[frames[-1]] += count
+            for frame in set(frames):
+                total_samples[frame] += count
+        samples = sum(stacks.values())
+        table[endpoint] = {
+            'samples': samples,
+            'functions': [
+                {'function': name, 'self': self_samples[name], 'total': total,
+                 'self_percent': round(100 * self_samples[name] / samples, 1)}
+                for name, total in sorted(total_samples.items(),
+                                          key=lambda item: (self_samples[item[0]], item[1]), reverse=True)[:top]
+            ]
+        }
+    return dict(sorted(table.items(), key=lambda item: item[1]['samples'], reverse=True))
+
+def init_profiler(app):
+    """Track which endpoint each thread serves, and join armed profiles"""
+    app.before_request(_track_request)
+    app.teardown_request(_untrack_request)
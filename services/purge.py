@@ -0,0 +1,111 @@
+"""
+Bulk purge of messages in bounded batches
+
+A purge runs as a background job (see services.jobs). Each batch deletes at
+most PURGE_BATCH_SIZE messages in its own short transaction. The job sleeps
+PURGE_BATCH_PAUSE seconds between batches, so ingest always gets the write
+lock quickly. Batches walk each table by sequence_id, so a filter the
+indexes cannot serve still scans every table only once.
+
+Tables are purged hot table first, then partitions, then the archive, the
+same direction messages move, so one that is sealed or archived mid-purge is
+still caught. Job progress counts live messages; archived ones are reported
+in the result.
+"""
+
+import time
+
+from dateutil import parser
+from flask import current_app
+from sqlalchemy import delete, select
+
+from models import db, ArchiveBlock, Job
+from .archive import archive_lock, remove_from_block
+from .jobs import add_job_progress, mark_job
+from .partitions import (
+    HOT_TABLE, MessageFilter, count_messages, delete_from_partition,
+    invalidate_catalog, load_catalog, partition_table
+)
+from .threads import remove_from_threads
+from .versions import message_keys, publish_change
+
+def purge_filter(params):
+    """MessageFilter for purge job params: device (may contain *), type, before (received_at)"""
+    device = params.get('device')
+    wildcard = bool(device) and '*' in device
+    return MessageFilter(
+        device=None if wildcard else device,
+        device_pattern=device if wildcard else None,
+        message_type=params.get('type'),
+        received_before=parser.isoparse(params['before']) if params.get('before') else None
+    )
+
+def _purge_table(table, partition_name, message_filter, job_id):
+    batch_size = current_app.config['PURGE_BATCH_SIZE']
+    pause = current_app.config['PURGE_BATCH_PAUSE']
+    columns = table.c
+    last_sequence_id = 0
+    deleted = 0
+    while True:
+        rows = [row._asdict() for row in db.session.execute(
+            select(columns.sequence_id, columns.source_device_id, columns.type, columns.is_read, columns.thread_key)
+            .where(columns.sequence_id > last_sequence_id, *message_filter.clauses(table))
+            .order_by(columns.sequence_id)
+            .limit(batch_size)
+        ).all()]
+        db.session.rollback()  # end the read transaction before writing
+        if not rows:
+            return deleted
+
+        with db.engine.begin() as connection:
+            if partition_name:
+                delete_from_partition(connection, partition_name, rows)
+            else:
+                connection.execute(delete(table).where(columns.sequence_id.in_([row['sequence_id'] for row in rows])))
+            remove_from_threads(connection, rows)
+            add_job_progress(connection, job_id, len(rows))
+        publish_change(keys={key for row in rows for key in message_keys(row['source_device_id'], row['type'])},
+                       reload=True)
+
+        deleted += len(rows)
+        last_sequence_id = rows[-1]['sequence_id']
+        # Yield the write lock to ingest between batches
+        time.sleep(pause)
+
+def _purge_archive(message_filter):
+    blocks = ArchiveBlock.query
+    if message_filter.received_before is not None:
+        blocks = blocks.filter(ArchiveBlock.min_received_at < message_filter.received_before)
+    candidates = [
+        block.id for block in blocks.order_by(ArchiveBlock.id)
+        if any(message_filter.device_matches(device) for device in block.devices)
+        and (not message_filter.message_type or message_filter.message_type in block.types)
+    ]
+    db.session.rollback()
+
+    deleted = 0
+    with archive_lock(blocking=True):
+        for block_id in candidates:
+            block = db.session.get(ArchiveBlock, block_id)
+            if block is None:
+                continue
+            deleted += remove_from_block(block, message_filter.matches)
+            db.session.rollback()
+    return deleted
+
+def run_purge(job_id):
+    """Job body: delete every message matching the job's params, returns the result summary"""
+    job = db.session.get(Job, job_id)
+    message_filter = purge_filter(job.params)
+    mark_job(job_id, total=count_messages(message_filter))
+
+    deleted = _purge_table(HOT_TABLE, None, message_filter, job_id)
+    for partition in load_catalog():
+        if message_filter.may_match(partition):
+            name = partition.name if partition.sealed else None
+            deleted += _purge_table(partition_table(partition.name), name, message_filter, job_id)
+    invalidate_catalog()
+
+    archived_deleted = _purge_archive(message_filter)
+    current_app.logger.info(f"Purge job {job_id}: deleted {deleted} messages, {archived_deleted} archived")
+    return {'deleted': deleted, 'archived_deleted': archived_deleted}
@@ -0,0 +1,199 @@
+"""
+Slow-query log with query plans and N+1 detection
+
+Opt-in with SLOW_QUERY_MS. Every SQL statement slower than that is logged
+with its bound parameters and its query plan (EXPLAIN QUERY PLAN on SQLite,
+EXPLAIN elsewhere), flagged when the plan scans a whole table. A request that
+runs more than QUERY_REPEAT_LIMIT statements with the same shape (an N+1
+pattern: one query per row of a previous result) is logged once, with the
+count and total time.
+
+Entries are appended as JSON lines to QUERY_LOG_PATH, shared by all workers,
+and shown at /debug/queries and by `flask queries show`.
+"""
+
+import json
+import os
+import re
+import time
+from collections import deque
+from functools import lru_cache
+
+import click
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import sidecar_path
+
+# The log is rotated to <path>.1 past this size
+MAX_LOG_BYTES = 10 * 1024 * 1024
+MAX_PARAMETER_LENGTH = 200
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+FULL_SCAN = re.compile(r'^SCAN (TABLE )?\S+( AS \S+)?$|Seq Scan on ')
+
+def query_log_path(app):
+    return app.config['QUERY_LOG_PATH'] or sidecar_path(app, '-queries.log', 'slow_queries.log')
+
+def _enabled():
+    return has_app_context() and current_app.config['SLOW_QUERY_MS'] > 0
+
+@lru_cache(maxsize=4096)
+def statement_shape(statement):
+    """Statement with whitespace and IN lists collapsed, so repeats of one query compare equal"""
+    shape = re.sub(r'\s+', ' ', statement).strip()
+    return re.sub(r'\((\s*(\?|%\(\w+\)s|%s|:\w+)\s*,)+\s*(\?|%\(\w+\)s|%s|:\w+)\s*\)', '(?)', shape)
+
+def _parameter(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<{len(value)} bytes>'
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= MAX_PARAMETER_LENGTH else text[:MAX_PARAMETER_LENGTH] + '...'
+
+def _parameters(parameters):
+    if isinstance(parameters, dict):
+        return {name: _parameter(value) for name, value in parameters.items()}
+    return [_parameter(value) for value in parameters or ()]
+
+def explain(conn, cursor, statement, parameters):
+    """Query plan lines for a statement, run on the same DBAPI connection; None if it can't be explained"""
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    sqlite = conn.dialect.name == 'sqlite'
+    plan_cursor = cursor.connection.cursor()
+    try:
+        plan_cursor.execute(('EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN ') + statement, parameters)
+        return [row[3] if sqlite else row[0] for row in plan_cursor.fetchall()]
+    except Exception as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        plan_cursor.close()
+
+def _source():
+    if has_request_context():
+        return {'method': request.method, 'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint or 'unmatched'}
+    return {'endpoint': 'background'}
+
+def write_entry(entry):
+    """Append one entry to the shared log (small appends are atomic across workers)"""
+    path = query_log_path(current_app)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        if os.path.getsize(path) > MAX_LOG_BYTES:
+            os.replace(path, f'{path}.1')
+    except OSError:
+        pass
+    with open(path, 'a') as log_file:
+        log_file.write(json.dumps(entry, default=str) + '\n')
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _enabled():
+        conn.info.setdefault('query_log_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_log_start')
+    if not starts or not _enabled():
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+
+    if has_request_context():
+        shape = statement_shape(statement)
+        repeats = g.setdefault('query_repeats', {})
+        count, total_ms = repeats.get(shape, (0, 0.0))
+        repeats[shape] = (count + 1, total_ms + elapsed_ms)
+
+    if elapsed_ms < current_app.config['SLOW_QUERY_MS']:
+        return
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    plan = explain(conn, cursor, statement, parameters)
+    entry = dict(
+        _source(),
+        kind='slow', at=time.time(), duration_ms=round(elapsed_ms, 3), statement=statement,
+        parameters=_parameters(parameters), executemany=executemany, plan=plan,
+        full_scan=any(FULL_SCAN.search(line) for line in plan or ())
+    )
+    current_app.logger.warning(
+        f"Slow query {entry['duration_ms']} ms{' (full scan)' if entry['full_scan'] else ''} "
+        f"in {entry['endpoint']}: {statement_shape(statement)[:200]}"
+    )
+    write_entry(entry)
+
+def _check_repeats(response):
+    limit = current_app.config['QUERY_REPEAT_LIMIT']
+    for shape, (count, total_ms) in g.pop('query_repeats', {}).items():
+        if count > limit:
+            current_app.logger.warning(f"N+1: {count} x {shape[:200]} in {request.endpoint}")
+            write_entry(dict(_source(), kind='n_plus_one', at=time.time(), statement=shape,
+                             count=count, duration_ms=round(total_ms, 3)))
+    return response
+
+def init_query_log(app):
+    """Profile SQL for this app when SLOW_QUERY_MS is set"""
+    if app.config['SLOW_QUERY_MS'] <= 0:
+        return
+    app.after_request(_check_repeats)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+def read_query_log(limit=100, kind=None):
+    """Newest entries first"""
+    entries = deque(maxlen=limit)
+    try:
+        with open(query_log_path(current_app)) as log_file:
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line being written
+                if kind is None or entry.get('kind') == kind:
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return list(reversed(entries))
+
+query_log_cli = AppGroup('queries', help='Slow-query log')
+
+@query_log_cli.command('show')
+@click.option('--limit', '-l', default=20, help='Number of entries to show')
+@click.option('--kind', type=click.Choice(['slow', 'n_plus_one']), help='Only this kind of entry')
+@click.option('--json', 'as_json', is_flag=True, help='One JSON entry per line')
+@with_appcontext
+def show_queries(limit, kind, as_json):
+    """Newest entries of the slow-query log"""
+    entries = read_query_log(limit, kind)
+    if as_json:
+        for entry in entries:
+            click.echo(json.dumps(entry))
+        return
+    if not entries:
+        click.echo(f"No entries in {query_log_path(current_app)}")
+    for entry in entries:
+        at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['at']))
+        where = entry.get('path') or entry['endpoint']
+        if entry['kind'] == 'n_plus_one':
+            click.echo(f"{at}  N+1  {entry['count']} statements, {entry['duration_ms']} ms  {where}")
+            click.echo(f"    {entry['statement']}")
+        else:
+            scan = '  FULL SCAN' if entry['full_scan'] else ''
+            click.echo(f"{at}  {entry['duration_ms']} ms{scan}  {where}")
+            click.echo(f"    {entry['statement']}")
+            click.echo(f"    parameters: {json.dumps(entry['parameters'])}")
+            for line in entry['plan'] or ():
+                click.echo(f"    plan: {line}")
+        click.echo()
+
+@query_log_cli.command('clear')
+@with_appcontext
+def clear_queries():
+    """Empty the slow-query log"""
+    path = query_log_path(current_app)
+    for name in (path, f'{path}.1'):
+        if os.path.exists(name):
+            os.remove(name)
+    click.echo(f"Cleared {path}")
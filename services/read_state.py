@@ -0,0 +1,391 @@
+"""
+Per-client read state
+
+Each client (a device, the CLI, the web dashboard) has its own read state:
+a watermark and two sparse exception sets. Every message with a sequence_id
+at or below the watermark is read, except those in unread_below. Above the
+watermark, only those in read_above are read. Sequence IDs only grow, so
+marking everything read is a watermark move, however many messages that
+covers. Marking one message changes one exception.
+
+The sets are sorted int64 arrays stored as bytes on the read_states row.
+Marking a message read moves the watermark over runs of read messages that
+follow it. Whenever the exceptions double past COMPACT_EXCEPTIONS,
+compact() moves the watermark to where it leaves the fewest.
+
+Unread counts and filters come from the state: a primary-key range scan
+above the watermark, minus read_above, plus unread_below. Rows below the
+watermark are never read. Each worker caches parsed states, tagged with the
+client's slot in the versions file (services.versions). A change in any
+worker therefore reaches all of them on their next request.
+
+A request's client is its X-Client-Id header or ?client=, else the
+authenticated device, else 'default' (the web dashboard, and the state the
+old shared is_read flag was migrated to).
+"""
+
+import heapq
+import json
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app, request
+from sqlalchemy import ARRAY, BigInteger, and_, any_, delete, func, insert, literal, not_, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, MessagePartition
+from models.read_state import ReadState
+from .partitions import HOT_TABLE, catalog, partition_table
+from .versions import write_versions
+
+DEFAULT_CLIENT = 'default'
+COMPACT_EXCEPTIONS = 1024
+# Longer ID lists are bound as one parameter instead of one per ID
+INLINE_IDS = 500
+WRITE_ATTEMPTS = 5
+
+def pack_ids(ids):
+    packed = array('q', ids)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tobytes()
+
+def unpack_ids(data):
+    ids = array('q')
+    ids.frombytes(data or b'')
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids
+
+def _contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+def _in_ids(column, ids):
+    if len(ids) <= INLINE_IDS:
+        return column.in_(list(ids))
+    if db.engine.dialect.name == 'sqlite':
+        values = func.json_each(json.dumps(list(ids))).table_valued('value')
+        return column.in_(select(values.c.value))
+    return column == any_(literal(list(ids), ARRAY(BigInteger)))
+
+class ReadSet:
+    """A client's read state; copies from read_state() are shared, so only change ones being written"""
+
+    def __init__(self, client_id, watermark=0, read_above=b'', unread_below=b'', revision=None):
+        self.client_id = client_id
+        self.watermark = watermark
+        self.read_above = unpack_ids(read_above)
+        self.unread_below = unpack_ids(unread_below)
+        self.revision = revision
+
+    def __len__(self):
+        """Number of exceptions"""
+        return len(self.read_above) + len(self.unread_below)
+
+    def is_read(self, sequence_id):
+        if sequence_id <= self.watermark:
+            return not _contains(self.unread_below, sequence_id)
+        return _contains(self.read_above, sequence_id)
+
+    def mark_read(self, sequence_id):
+        if sequence_id <= self.watermark:
+            self._discard(self.unread_below, sequence_id)
+            return
+        self._add(self.read_above, sequence_id)
+        # Absorb the run of read messages right above the watermark
+        run = 0
+        while run < len(self.read_above) and self.read_above[run] == self.watermark + run + 1:
+            run += 1
+        if run:
+            self.watermark += run
+            del self.read_above[:run]
+
+    def mark_unread(self, sequence_id):
+        if sequence_id <= self.watermark:
+            self._add(self.unread_below, sequence_id)
+        else:
+            self._discard(self.read_above, sequence_id)
+
+    def mark_all_read(self, up_to):
+        """Everything up to sequence ID up_to is read"""
+        del self.unread_below[:bisect_left(self.unread_below, up_to + 1)]
+        if up_to > self.watermark:
+            del self.read_above[:bisect_left(self.read_above, up_to + 1)]
+            self.watermark = up_to
+
+    def unread_clauses(self, column):
+        """
+        Clauses whose union is the unread messages: above the watermark and not
+        read, and the unread exceptions below it. Kept apart so each can use
+        the primary key.
+        """
+        above = column > self.watermark
+        if self.read_above:
+            above = and_(above, not_(_in_ids(column, self.read_above)))
+        clauses = [above]
+        if self.unread_below:
+            clauses.append(_in_ids(column, self.unread_below))
+        return clauses
+
+    def unread_clause(self, column):
+        return or_(*self.unread_clauses(column))
+
+    def to_dict(self):
+        return {
+            'client_id': self.client_id,
+            'watermark': self.watermark,
+            'read_above': len(self.read_above),
+            'unread_below': len(self.unread_below)
+        }
+
+    @staticmethod
+    def _add(ids, value):
+        index = bisect_left(ids, value)
+        if index == len(ids) or ids[index] != value:
+            ids.insert(index, value)
+
+    @staticmethod
+    def _discard(ids, value):
+        index = bisect_left(ids, value)
+        if index < len(ids) and ids[index] == value:
+            del ids[index]
+
+def read_client():
+    """Client whose read state the current request uses"""
+    client_id = request.headers.get('X-Client-Id') or request.args.get('client')
+    if client_id:
+        return client_id[:255]
+    from .auth import authenticated_device
+    return authenticated_device() or DEFAULT_CLIENT
+
+def _load(connection, client_id):
+    table = ReadState.__table__
+    row = connection.execute(select(
+        table.c.watermark, table.c.read_above, table.c.unread_below, table.c.revision
+    ).where(table.c.client_id == client_id)).first()
+    if row is None:
+        return ReadSet(client_id)
+    return ReadSet(client_id, *row)
+
+class _ReadStateCache:
+    """LRU of client id -> (version, ReadSet)"""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, client_id, version):
+        with self.lock:
+            entry = self.entries.get(client_id)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(client_id)
+            return entry[1]
+
+    def put(self, client_id, version, state):
+        with self.lock:
+            self.entries[client_id] = (version, state)
+            self.entries.move_to_end(client_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+def read_version(client_id):
+    return write_versions().version('read', client_id)
+
+def read_state(client_id=None):
+    """The client's read state (default: the request's client), without SQL while it is unchanged"""
+    client_id = client_id or read_client()
+    cache = current_app.extensions.get('read_states')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'read_states', _ReadStateCache(current_app.config['READ_STATE_CACHE_SIZE'])
+        )
+    # Version first: a change committed during the load leaves the entry stale, never wrong
+    version = read_version(client_id)
+    state = cache.get(client_id, version)
+    if state is None:
+        # The primary, never a lagging replica: the entry is trusted until the version moves
+        with db.engine.connect() as connection:
+            state = _load(connection, client_id)
+        cache.put(client_id, version, state)
+    return state
+
+def _store(connection, state):
+    table = ReadState.__table__
+    values = {
+        'watermark': state.watermark,
+        'read_above': pack_ids(state.read_above),
+        'unread_below': pack_ids(state.unread_below),
+        'updated_at': datetime.now(timezone.utc)
+    }
+    if state.revision is None:
+        connection.execute(insert(table).values(client_id=state.client_id, revision=1, **values))
+        return True
+    result = connection.execute(update(table).where(
+        table.c.client_id == state.client_id, table.c.revision == state.revision
+    ).values(revision=state.revision + 1, **values))
+    return result.rowcount == 1
+
+class _ConcurrentChange(Exception):
+    """Another writer stored the state after it was loaded"""
+
+def update_read_state(client_id, change):
+    """
+    Apply change(state) to a client's stored read state and return the new
+    state. Concurrent writers are detected by the revision and retried.
+    """
+    for _ in range(WRITE_ATTEMPTS):
+        try:
+            with db.engine.begin() as connection:
+                state = _load(connection, client_id)
+                change(state)
+                exceptions = len(state)
+                if exceptions >= COMPACT_EXCEPTIONS and exceptions & (exceptions - 1) == 0:
+                    compact(connection, state)
+                if not _store(connection, state):
+                    raise _ConcurrentChange()
+        except (IntegrityError, _ConcurrentChange):
+            # A concurrent first insert, or a newer revision
+            continue
+        read_state_changed(client_id)
+        return state
+    raise RuntimeError(f'Could not update the read state of {client_id}: too many concurrent writers')
+
+def read_state_changed(client_id):
+    """Make every worker reload the client's state (after it was written directly)"""
+    write_versions().bump_key('read', client_id)
+
+def _message_tables(connection):
+    names = connection.execute(select(MessagePartition.__table__.c.name)).scalars().all()
+    return [HOT_TABLE] + [partition_table(name) for name in names]
+
+def newest_sequence_id(connection):
+    """Highest sequence ID of any live message, 0 when there are none"""
+    newest = 0
+    for table in _message_tables(connection):
+        value = connection.execute(select(func.max(table.c.sequence_id))).scalar()
+        newest = max(newest, value or 0)
+    return newest
+
+def compact(connection, state):
+    """
+    Move the watermark to where it leaves the fewest exceptions, looking at the
+    live messages between the lowest exception and the highest one. Exceptions
+    for messages that aren't live (archived) are kept where still needed.
+    """
+    low = state.unread_below[0] - 1 if state.unread_below else state.watermark
+    high = state.read_above[-1] if state.read_above else state.watermark
+    ids = sorted(
+        sequence_id
+        for table in _message_tables(connection)
+        for sequence_id in connection.execute(select(table.c.sequence_id).where(
+            table.c.sequence_id > low, table.c.sequence_id <= high
+        )).scalars()
+    )
+    read = [state.is_read(sequence_id) for sequence_id in ids]
+
+    # Exceptions for watermark w: unread at or below it plus read above it
+    best, best_delta, delta = low, 0, 0
+    for sequence_id, is_read in zip(ids, read):
+        delta += -1 if is_read else 1
+        if delta < best_delta:
+            best, best_delta = sequence_id, delta
+
+    live = set(ids)
+    unread_below = [sequence_id for sequence_id, is_read in zip(ids, read) if sequence_id <= best and not is_read]
+    read_above = [sequence_id for sequence_id, is_read in zip(ids, read) if sequence_id > best and is_read]
+    unread_below += [sequence_id for sequence_id in state.unread_below if sequence_id not in live and sequence_id <= best]
+    read_above += [sequence_id for sequence_id in state.read_above if sequence_id not in live and sequence_id > best]
+    state.watermark = best
+    state.unread_below = array('q', sorted(unread_below))
+    state.read_above = array('q', sorted(read_above))
+
+def _grouped_counts(table, clause):
+    # Materialized first: grouped directly, SQLite would walk the device index instead of the key range
+    rows = select(table.c.source_device_id, table.c.type).where(clause).cte('rows').prefix_with('MATERIALIZED')
+    statement = select(rows.c.source_device_id, rows.c.type, func.count()).group_by(
+        rows.c.source_device_id, rows.c.type
+    )
+    return db.session.execute(statement).all()
+
+def unread_counts(state):
+    """
+    Unread messages as {(device, type): count} for a read state (archived messages aside)
+    A sealed partition wholly above the watermark is its catalog counts minus
+    read_above; one wholly below only needs unread_below. Only rows above the
+    watermark are scanned.
+    """
+    counts = {}
+
+    def add(device, message_type, count):
+        counts[(device, message_type)] = counts.get((device, message_type), 0) + count
+
+    tables = [HOT_TABLE]
+    for partition in catalog():
+        table = partition_table(partition.name)
+        if not partition.sealed:
+            tables.append(table)
+            continue
+        low, high = db.session.execute(select(func.min(table.c.sequence_id), func.max(table.c.sequence_id))).one()
+        if low is None:
+            continue
+        if low > state.watermark:
+            for device, message_type, count, _ in partition.stats:
+                add(device, message_type, count)
+            if state.read_above:
+                for device, message_type, count in _grouped_counts(table, _in_ids(table.c.sequence_id, state.read_above)):
+                    add(device, message_type, -count)
+        elif high <= state.watermark:
+            if state.unread_below:
+                for row in _grouped_counts(table, _in_ids(table.c.sequence_id, state.unread_below)):
+                    add(*row)
+        else:
+            tables.append(table)
+
+    for table in tables:
+        for clause in state.unread_clauses(table.c.sequence_id):
+            for row in _grouped_counts(table, clause):
+                add(*row)
+    return {key: count for key, count in counts.items() if count}
+
+def with_read_state(messages, state=None):
+    """Copies of serialized messages with is_read as the requesting client sees it"""
+    state = state or read_state()
+    return [dict(message, is_read=state.is_read(message['sequence_id'])) for message in messages]
+
+def read_state_from_flags(connection, client_id=DEFAULT_CLIENT):
+    """
+    Store a client's read state built from the messages' legacy is_read flags
+    (migration, seeding) with the watermark placed for the fewest exceptions.
+    Callers call read_state_changed() once the transaction has committed.
+    """
+    def flags():
+        tables = _message_tables(connection)
+        return heapq.merge(*(
+            connection.execute(select(table.c.sequence_id, table.c.is_read).order_by(table.c.sequence_id))
+            for table in tables
+        ))
+
+    best, best_delta, delta = 0, 0, 0
+    for sequence_id, is_read in flags():
+        delta += -1 if is_read else 1
+        if delta < best_delta:
+            best, best_delta = sequence_id, delta
+
+    state = ReadSet(client_id, best)
+    for sequence_id, is_read in flags():
+        if sequence_id <= best and not is_read:
+            state.unread_below.append(sequence_id)
+        elif sequence_id > best and is_read:
+            state.read_above.append(sequence_id)
+
+    table = ReadState.__table__
+    connection.execute(delete(table).where(table.c.client_id == client_id))
+    _store(connection, state)
+    return state
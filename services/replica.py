@@ -0,0 +1,82 @@
+"""
+Read/write routing between the primary database and the read replica
+
+GET and HEAD requests read through the 'replica' bind (SQLALCHEMY_BINDS).
+After a successful write, the response sets a short-lived last_write cookie.
+While it is fresh, that client's reads go to the primary so it sees its own
+writes. Any client can also send X-Read-Your-Writes to read from the primary.
+"""
+
+import time
+
+from flask import current_app, g, request
+from sqlalchemy import func, select
+
+from models import db, Message
+
+READ_METHODS = ('GET', 'HEAD')
+WRITE_COOKIE = 'last_write'
+WRITE_HEADER = 'X-Read-Your-Writes'
+
+def reads_own_writes():
+    """Whether this request must see the client's own recent writes (read from the primary)"""
+    if request.headers.get(WRITE_HEADER):
+        return True
+    try:
+        last_write = float(request.cookies.get(WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - last_write < current_app.config['READ_YOUR_WRITES_SECONDS']
+
+def _choose_engine():
+    g.read_from_replica = (
+        'replica' in current_app.config['SQLALCHEMY_BINDS']
+        and request.method in READ_METHODS
+        and not reads_own_writes()
+    )
+
+def _remember_write(response):
+    if request.method not in READ_METHODS and request.method != 'OPTIONS' and response.status_code < 400:
+        response.set_cookie(
+            WRITE_COOKIE, f'{time.time():.6f}', max_age=max(1, int(current_app.config['READ_YOUR_WRITES_SECONDS'])),
+            httponly=True, samesite='Lax'
+        )
+    return response
+
+def init_read_routing(app):
+    app.before_request(_choose_engine)
+    app.after_request(_remember_write)
+
+def _newest(engine):
+    table = Message.__table__
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.max(table.c.sequence_id), func.max(table.c.received_at))
+        ).one()
+
+def replica_status():
+    """
+    Replica lag against the primary, from the newest message each one has
+    lag_messages counts hot-table rows the replica is missing; lag_seconds
+    is how much older its newest message is.
+    """
+    replica = db.engines.get('replica')
+    if replica is None:
+        return {'configured': False}
+    try:
+        primary_sequence, primary_received = _newest(db.engines[None])
+        replica_sequence, replica_received = _newest(replica)
+    except Exception as e:
+        current_app.logger.error(f"Error checking replica: {str(e)}")
+        return {'configured': True, 'status': 'unavailable', 'error': str(e)}
+
+    lag_messages = max(0, (primary_sequence or 0) - (replica_sequence or 0))
+    lag_seconds = 0.0
+    if lag_messages and primary_received is not None:
+        lag_seconds = (primary_received - (replica_received or primary_received)).total_seconds()
+    return {
+        'configured': True,
+        'status': 'ok',
+        'lag_messages': lag_messages,
+        'lag_seconds': round(max(lag_seconds, 0.0), 3)
+    }
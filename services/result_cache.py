@@ -0,0 +1,142 @@
+"""
+Per-worker LRU cache of serialized GET responses
+
+Identical list and sync requests within a short time are answered from the
+response bytes of the first one. The cache is bounded by RESULT_CACHE_BYTES.
+
+A key is the endpoint, the query parameters that shape its result, the
+requesting client's read-state version (services.read_state), and one
+write version: the counter of the device the request filters on, else of its
+type, else the global change count (services.versions). A write therefore
+leaves every entry that could include it under a stale version, and those
+entries age out of the LRU. Entries for other devices stay valid. Versions
+are shared by all gunicorn workers, so a write in one worker invalidates the
+caches of all of them.
+
+RESULT_CACHE_TTL bounds how long an entry can be served. That limits
+staleness from writers that don't publish versions, such as raw SQL, and from
+replica lag.
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from .read_state import read_client, read_version
+from .replica import reads_own_writes
+from .versions import write_versions
+
+# Rough per-entry cost of the key, tuple and dict slot, on top of the body
+ENTRY_OVERHEAD = 256
+
+class ResultCache:
+    def __init__(self, budget_bytes, ttl):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _remove(self, key):
+        body, _ = self.entries.pop(key)
+        self.bytes -= len(body) + ENTRY_OVERHEAD
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, body):
+        size = len(body) + ENTRY_OVERHEAD
+        # One huge response must not flush the whole cache
+        if size > self.budget_bytes // 4:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (body, time.monotonic())
+            self.bytes += size
+            while self.bytes > self.budget_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'budget_bytes': self.budget_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions
+            }
+
+def result_cache():
+    budget = current_app.config['RESULT_CACHE_BYTES']
+    if budget <= 0:
+        return None
+    cache = current_app.extensions.get('result_cache')
+    if cache is None:
+        cache = current_app.extensions.setdefault(
+            'result_cache', ResultCache(budget, current_app.config['RESULT_CACHE_TTL'])
+        )
+    return cache
+
+def result_cache_stats():
+    cache = result_cache()
+    return cache.stats() if cache is not None else {'enabled': False}
+
+def _write_version():
+    versions = write_versions()
+    device = request.args.get('device')
+    if device:
+        return versions.version('device', device)
+    message_type = request.args.get('type')
+    if message_type:
+        return versions.version('type', message_type)
+    return versions.read()[0]
+
+def cached_response(*params):
+    """Serve a JSON GET endpoint's 200 responses from the result cache, keyed on the given query params"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = result_cache()
+            # A client that just wrote must not get an entry computed before its write reached the replica
+            if cache is None or reads_own_writes():
+                return view(*args, **kwargs)
+
+            # Version first: a write during the view leaves the entry stale, never wrong
+            client_id = read_client()
+            key = (
+                request.endpoint,
+                tuple(kwargs.items()),
+                tuple(tuple(request.args.getlist(name)) for name in params),
+                _write_version(),
+                # Messages carry is_read for this client
+                (client_id, read_version(client_id))
+            )
+            body = cache.get(key)
+            if body is not None:
+                return current_app.response_class(body, mimetype='application/json', headers={'X-Cache': 'HIT'})
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                cache.put(key, response.get_data())
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
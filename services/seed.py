@@ -0,0 +1,282 @@
+"""
+Synthetic message seeding for capacity testing
+
+realistic_rows() generates messages in arrival order from a distribution
+profile. Each day's arrival hours, devices and types are drawn as whole
+batches, and devices and senders have a long tail. seed_messages() inserts
+them through the DBAPI in large transactions, with the secondary indexes of
+the messages table dropped during the load and rebuilt once at the end.
+
+Used by `python init_db.py --messages N` and by the benchmarks.
+"""
+
+import bisect
+import copy
+import itertools
+import json
+import random
+import time
+
+from models import db, Device, Message
+from models.device import hash_api_key
+from models.types import to_epoch_micros
+from .threads import thread_key
+
+DEVICE_KINDS = ['phone', 'tablet', 'laptop', 'watch', 'desktop']
+DEVICE_TYPES = {'phone': 'android', 'tablet': 'ios', 'laptop': 'web', 'watch': 'ios', 'desktop': 'web'}
+APPS = ['WhatsApp', 'Slack', 'Gmail', 'Telegram', 'Calendar', 'Uber', 'Bank', 'Instagram', 'Outlook',
+        'GitHub', 'Signal', 'Twitter', 'Maps', 'Weather', 'Spotify', 'Amazon', 'Teams', 'Discord']
+WORDS = ('meeting lunch tomorrow today call back please review the update project invoice delivery '
+         'order shipped code verify login alert reminder payment received thanks see you soon at office '
+         'home weekend train flight delayed gate boarding confirm schedule report draft notes build failed '
+         'passed deploy merged comment mention photo video link price offer').split()
+
+# A realistic mix: a few busy devices, mostly notifications, senders with a
+# long tail, arrivals following the time of day, some clients syncing late.
+# A profile file for init_db.py --profile overrides any of these keys.
+DEFAULT_PROFILE = {
+    # Share of messages per type
+    'types': {'PUSH_NOTIFICATION': 0.55, 'SMS': 0.2, 'EMAIL': 0.15, 'CALL_LOG': 0.1},
+    # Share of a day's messages per hour (UTC), quiet at night
+    'hour_weights': [1, 1, 1, 1, 1, 2, 4, 7, 9, 9, 8, 8, 9, 8, 8, 8, 8, 9, 9, 8, 7, 5, 3, 2],
+    # Share of messages per weekday, Monday first
+    'weekday_weights': [1, 1, 1, 1, 1, 1, 1],
+    # Zipf exponents: 0 spreads messages evenly, higher concentrates them on a few
+    'device_skew': 1.1,
+    'sender_skew': 1.1,
+    # [share, up to seconds] of timestamp-to-arrival delays: most clients
+    # send within seconds, some were offline
+    'delays': [[0.9, 5], [0.09, 600], [0.01, 43200]],
+    # The default client has read nearly everything older than read_after_days
+    'read_after_days': 2,
+    'read_share': {'recent': 0.05, 'older': 0.999},
+    # Metadata values and their shares
+    'priorities': {'normal': 0.6, 'high': 0.2, 'low': 0.2},
+    'categories': {'personal': 0.5, 'work': 0.3, 'promotions': 0.2},
+}
+
+COLUMNS = ('id', 'source_device_id', 'type', 'sender', 'content', 'timestamp', 'received_at',
+           'message_metadata', 'thread_key', 'is_read', 'created_at', 'updated_at')
+
+DAY = 86_400_000_000
+HOUR = 3_600_000_000
+
+def load_profile(path=None, **overrides):
+    """DEFAULT_PROFILE, updated from a JSON file and then from keyword overrides that aren't None"""
+    profile = copy.deepcopy(DEFAULT_PROFILE)
+    if path:
+        with open(path) as profile_file:
+            settings = json.load(profile_file)
+        unknown = set(settings) - set(DEFAULT_PROFILE)
+        if unknown:
+            raise ValueError(f"Unknown profile keys: {', '.join(sorted(unknown))}")
+        profile.update(settings)
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+    return profile
+
+def _zipf_weights(count, exponent=1.1):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+def _picker(rng, values, weights):
+    """Draw one value with bisect on cumulative weights (random.choices rebuilds them per call)"""
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    return lambda: values[bisect.bisect(cumulative, rng.random() * total)]
+
+def _text(rng, low, high):
+    words, size = [], 0
+    length = rng.randint(low, high)
+    while size < length:
+        words.append(rng.choice(WORDS))
+        size += len(words[-1]) + 1
+    return ' '.join(words).capitalize()
+
+def _uuid7_at(micros, random_bits):
+    """UUIDv7 string for a past arrival time, as the server would have assigned it"""
+    value = ((micros // 1000) << 80) | (0x7 << 76) | ((random_bits >> 62) << 64) | (0b10 << 62) | (
+        random_bits & 0x3FFFFFFFFFFFFFFF)
+    digits = f'{value:032x}'
+    return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+
+def _senders(rng, message_type):
+    if message_type in ('SMS', 'CALL_LOG'):
+        return [f'+1555{rng.randrange(10 ** 7):07d}' for _ in range(300)]
+    if message_type == 'EMAIL':
+        return [f'{rng.choice(WORDS)}.{rng.choice(WORDS)}@example.com' for _ in range(300)]
+    return APPS
+
+def _contents(rng, message_type, pool=500):
+    if message_type == 'SMS':
+        return [_text(rng, 10, 160) for _ in range(pool)]
+    if message_type == 'EMAIL':
+        return [f'Subject: {_text(rng, 15, 60)}\n\n{_text(rng, 80, 600)}' for _ in range(pool)]
+    if message_type == 'CALL_LOG':
+        return [f'{rng.choice(["Incoming", "Outgoing", "Missed"])} call ({rng.randrange(0, 1800)}s)'
+                for _ in range(pool)]
+    return [_text(rng, 20, 120) for _ in range(pool)]
+
+def realistic_devices(devices):
+    return [f'{DEVICE_KINDS[i % len(DEVICE_KINDS)]}-{i + 1}' for i in range(devices)]
+
+def _daily_counts(rows, first_day, days, weekday_weights):
+    """Messages per day, proportional to the weekday weights"""
+    weights = [weekday_weights[(first_day + day + 3) % 7] for day in range(days)]  # day 0 was a Thursday
+    total = sum(weights)
+    counts = [rows * weight // total for weight in weights]
+    for day in range(rows - sum(counts)):
+        counts[day % days] += 1
+    return counts
+
+def realistic_rows(rows, now, days=90, devices=25, seed=1, profile=None):
+    """
+    Yield message rows for Message.__table__ in arrival order over the
+    `days` before now, deterministic for a seed and profile
+    """
+    profile = profile or DEFAULT_PROFILE
+    rng = random.Random(seed)
+    device_names = realistic_devices(devices)
+    device_weights = _zipf_weights(devices, profile['device_skew'])
+    type_names, type_weights = list(profile['types']), list(profile['types'].values())
+    senders = {
+        message_type: _picker(rng, names, _zipf_weights(len(names), profile['sender_skew']))
+        for message_type, names in ((message_type, _senders(rng, message_type)) for message_type in type_names)
+    }
+    contents = {message_type: _contents(rng, message_type) for message_type in type_names}
+    priority = _picker(rng, list(profile['priorities']), list(profile['priorities'].values()))
+    category = _picker(rng, list(profile['categories']), list(profile['categories'].values()))
+    # Delay buckets as (cumulative share, share, longest delay in microseconds)
+    delays, share_so_far = [], 0.0
+    for share, seconds in profile['delays']:
+        share_so_far += share
+        delays.append((share_so_far, share, seconds * 1_000_000))
+    read_after = profile['read_after_days'] * DAY
+    read_recent, read_older = profile['read_share']['recent'], profile['read_share']['older']
+    now_micros = to_epoch_micros(now)
+    first_day = now_micros // DAY - days + 1
+
+    for day, count in enumerate(_daily_counts(rows, first_day, days, profile['weekday_weights'])):
+        day_start = (first_day + day) * DAY
+        hours = rng.choices(range(24), profile['hour_weights'], k=count)
+        # Today has only had the hours up to now: squeeze its curve into them
+        elapsed = min(DAY, now_micros - day_start)
+        arrivals = sorted(day_start + (hour * HOUR + rng.randrange(HOUR)) * elapsed // DAY for hour in hours)
+        devices_today = rng.choices(device_names, device_weights, k=count)
+        types_today = rng.choices(type_names, type_weights, k=count)
+        read_share = read_older if now_micros - day_start > read_after else read_recent
+        for received_at, device, message_type in zip(arrivals, devices_today, types_today):
+            lateness = rng.random()
+            for cumulative, share, longest in delays:
+                if lateness < cumulative or cumulative == delays[-1][0]:
+                    delay = int((1 - (cumulative - lateness) / share) * longest) if share else 0
+                    break
+            metadata = {'priority': priority()}
+            if message_type in ('EMAIL', 'PUSH_NOTIFICATION'):
+                metadata['category'] = category()
+            pool = contents[message_type]
+            sender = senders[message_type]()
+            yield {
+                'id': _uuid7_at(received_at, rng.getrandbits(74)), 'source_device_id': device,
+                'type': message_type, 'sender': sender,
+                'content': pool[int(rng.random() * len(pool))],
+                'timestamp': received_at - max(delay, 0), 'received_at': received_at,
+                'message_metadata': metadata, 'thread_key': thread_key(device, sender, metadata),
+                'is_read': rng.random() < read_share, 'created_at': received_at, 'updated_at': received_at
+            }
+
+def seed_devices(devices):
+    """Add a Device row for every realistic device name that doesn't have one yet; returns how many"""
+    existing = {device_id for device_id, in db.session.query(Device.id)}
+    added = 0
+    for name in realistic_devices(devices):
+        if name not in existing:
+            kind, number = name.rsplit('-', 1)
+            db.session.add(Device(id=name, name=f'{kind.capitalize()} {number}', type=DEVICE_TYPES[kind],
+                                  api_key_hash=hash_api_key(f'seed-key-{name}'), is_active=True))
+            added += 1
+    db.session.commit()
+    return added
+
+def _sqlite_bulk_settings(connection, settings):
+    """Apply PRAGMAs on a SQLite connection; returns the previous values"""
+    previous = {}
+    for name, value in settings.items():
+        previous[name] = connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+        connection.exec_driver_sql(f'PRAGMA {name} = {value}')
+    connection.commit()
+    return previous
+
+def load_realistic_messages(rows, now, days=90, devices=25, seed=1, profile=None, batch_size=10_000,
+                            transaction_rows=1_000_000, defer_indexes=False, progress=None):
+    """
+    Insert realistic_rows() in batches straight through the DBAPI, skipping
+    Core's per-row processing, one transaction per transaction_rows
+    With defer_indexes, the secondary indexes of the messages table are
+    dropped first and rebuilt once after the load. progress(loaded) is called
+    after each batch. Returns the number of rows inserted.
+    """
+    table = Message.__table__
+    indexes = sorted(table.indexes, key=lambda index: index.name) if defer_indexes else []
+    statement = None
+    loaded = 0
+    with db.engine.connect() as connection:
+        sqlite = connection.dialect.name == 'sqlite'
+        # Durability is pointless mid-load: a crash means seeding again
+        previous = _sqlite_bulk_settings(connection, {'synchronous': 'OFF', 'cache_size': -262144}) if sqlite else {}
+        try:
+            with connection.begin():
+                for index in indexes:
+                    index.drop(connection, checkfirst=True)
+            placeholder = '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+            statement = (f"INSERT INTO {table.name} ({', '.join(COLUMNS)}) "
+                         f"VALUES ({', '.join([placeholder] * len(COLUMNS))})")
+            generated = realistic_rows(rows, now, days, devices, seed, profile)
+            while loaded < rows:
+                with connection.begin():
+                    in_transaction = 0
+                    while in_transaction < transaction_rows:
+                        batch = [
+                            tuple(json.dumps(row[column]) if column == 'message_metadata' else row[column]
+                                  for column in COLUMNS)
+                            for row in itertools.islice(generated, min(batch_size, transaction_rows - in_transaction))
+                        ]
+                        if not batch:
+                            break
+                        connection.exec_driver_sql(statement, batch)
+                        in_transaction += len(batch)
+                        loaded += len(batch)
+                        if progress:
+                            progress(loaded)
+                    if not in_transaction:
+                        break
+        finally:
+            if indexes:
+                with connection.begin():
+                    for index in indexes:
+                        index.create(connection, checkfirst=True)
+            _sqlite_bulk_settings(connection, previous)
+    return loaded
+
+def seed_messages(rows, now, days=90, devices=25, seed=1, profile=None, batch_size=10_000,
+                  transaction_rows=1_000_000, defer_indexes=True, progress=None):
+    """
+    Seed devices and messages and build their threads, then tell running
+    workers to drop cached message state; returns (devices added, rows
+    inserted, seconds taken)
+    """
+    from .read_state import DEFAULT_CLIENT, read_state_changed, read_state_from_flags
+    from .threads import rebuild_threads
+    from .versions import message_keys, publish_change
+
+    started = time.perf_counter()
+    added = seed_devices(devices)
+    loaded = load_realistic_messages(rows, now, days, devices, seed, profile, batch_size, transaction_rows,
+                                     defer_indexes, progress)
+    # The generated is_read flags become the default client's read state
+    with db.engine.begin() as connection:
+        read_state_from_flags(connection, DEFAULT_CLIENT)
+        rebuild_threads(connection)
+    read_state_changed(DEFAULT_CLIENT)
+    profile = profile or DEFAULT_PROFILE
+    publish_change(keys={key for device in realistic_devices(devices) for message_type in profile['types']
+                         for key in message_keys(device, message_type)}, reload=True)
+    return added, loaded, time.perf_counter() - started
@@ -0,0 +1,349 @@
+"""
+Conversation index (the threads table)
+
+A message belongs to the thread of its device and metadata.thread_id, or
+without one, of its device and sender. Its thread key, a hash of those, is
+stored in messages.thread_key. The threads table keeps one summary row per
+key: message count, last message and preview, and last activity (received_at
+of the last message).
+
+Summaries are maintained where messages are written. ORM inserts (single and
+batch ingest) are folded in by session events within the same flush, one
+upsert per flush. Core deletes (purge, archiver, coalescing) call
+remove_from_threads in their transaction. Counts cover live messages:
+archived ones leave their thread, and a thread left with none is dropped.
+
+Listing threads newest first walks ix_threads_activity and stops after a
+page. Read state is per client, so unread counts are not stored: they are
+counted for the page's threads, skipping every thread whose last message is
+at or below the client's watermark when it has no unread exceptions there.
+"""
+
+import hashlib
+from collections import Counter
+
+import click
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy import BigInteger, and_, bindparam, case, delete, event, func, or_, select, type_coerce, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Message, MessagePartition, Thread
+from models.types import to_epoch_micros
+from .partitions import HOT_TABLE, catalog, partition_table
+
+THREADS = Thread.__table__
+PREVIEW_LENGTH = THREADS.c.preview.type.length
+LAST_COLUMNS = ['last_activity', 'last_sequence_id', 'last_message_id', 'last_sender', 'last_type',
+                'last_timestamp', 'preview']
+# Bound on IN lists, well under SQLite's variable limit
+CHUNK_SIZE = 500
+
+def thread_ref(metadata):
+    """metadata.thread_id as a string, None when the message has none"""
+    value = (metadata or {}).get('thread_id') if isinstance(metadata, dict) else None
+    return None if value is None or value == '' else str(value)
+
+def thread_key(device, sender, metadata):
+    reference = thread_ref(metadata)
+    parts = (device, 'thread', reference) if reference is not None else (device, 'sender', sender)
+    return hashlib.blake2b('\x1f'.join(parts).encode(), digest_size=16).hexdigest()
+
+def _summary(row):
+    """Thread columns a message row (dict, timestamps as epoch microseconds) contributes"""
+    return {
+        'id': row['thread_key'],
+        'source_device_id': row['source_device_id'],
+        'thread_ref': thread_ref(row['message_metadata']),
+        'message_count': 1,
+        'first_received_at': row['received_at'],
+        'last_activity': row['received_at'],
+        'last_sequence_id': row['sequence_id'],
+        'last_message_id': row['id'],
+        'last_sender': row['sender'],
+        'last_type': row['type'],
+        'last_timestamp': row['timestamp'],
+        'preview': row['content'][:PREVIEW_LENGTH]
+    }
+
+def _combine(summaries):
+    """One summary per thread: counts added up, the newest message's last_* columns"""
+    threads = {}
+    for summary in summaries:
+        current = threads.get(summary['id'])
+        if current is None:
+            threads[summary['id']] = dict(summary)
+            continue
+        count = current['message_count'] + summary['message_count']
+        first = min(current['first_received_at'], summary['first_received_at'])
+        if summary['last_sequence_id'] > current['last_sequence_id']:
+            current.update({name: summary[name] for name in LAST_COLUMNS})
+        current.update(message_count=count, first_received_at=first)
+    return threads
+
+_upserts = {}
+
+def _upsert(dialect_name):
+    """
+    INSERT ... ON CONFLICT adding a summary to its thread, built once per
+    dialect and run as an executemany so its compiled form is cached
+    """
+    statement = _upserts.get(dialect_name)
+    if statement is None:
+        insert = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}[dialect_name]
+        statement = insert(THREADS)
+        new = statement.excluded
+        newer = new.last_sequence_id > THREADS.c.last_sequence_id
+        values = {name: case((newer, new[name]), else_=THREADS.c[name]) for name in LAST_COLUMNS}
+        values['message_count'] = THREADS.c.message_count + new.message_count
+        # Scalar min() on SQLite, least() elsewhere
+        smaller = func.min if dialect_name == 'sqlite' else func.least
+        values['first_received_at'] = smaller(THREADS.c.first_received_at, new.first_received_at)
+        statement = _upserts.setdefault(
+            dialect_name, statement.on_conflict_do_update(index_elements=[THREADS.c.id], set_=values)
+        )
+    return statement
+
+def add_to_threads(connection, rows):
+    """Fold new message rows (dicts with thread_key, timestamps as epoch microseconds) into their threads"""
+    summaries = list(_combine(_summary(row) for row in rows if row['thread_key']).values())
+    if summaries:
+        connection.execute(_upsert(connection.dialect.name), summaries)
+
+def _live_tables(connection):
+    """Hot table first, then partitions newest first: the order sequence IDs descend in"""
+    names = connection.execute(
+        select(MessagePartition.__table__.c.name).order_by(MessagePartition.__table__.c.month_start.desc())
+    ).scalars().all()
+    return [HOT_TABLE] + [partition_table(name) for name in names]
+
+def _summary_columns(table):
+    columns = table.c
+    return (columns.id, columns.sequence_id, columns.thread_key, columns.source_device_id, columns.sender,
+            columns.type, columns.content, type_coerce(columns.timestamp, BigInteger).label('timestamp'),
+            type_coerce(columns.received_at, BigInteger).label('received_at'), columns.message_metadata)
+
+def _newest_message(connection, tables, key):
+    """The newest live message of a thread, or None"""
+    for table in tables:
+        row = connection.execute(
+            select(*_summary_columns(table)).where(table.c.thread_key == key)
+            .order_by(table.c.sequence_id.desc()).limit(1)
+        ).first()
+        if row is not None:
+            return row._asdict()
+    return None
+
+def remove_from_threads(connection, rows):
+    """
+    Take deleted message rows (dicts with sequence_id and thread_key) out of
+    their threads, in the deleting transaction
+    Threads left empty are dropped. A thread that lost its last message gets
+    its newest remaining one, found through messages.thread_key.
+    """
+    removed = Counter(row['thread_key'] for row in rows if row.get('thread_key'))
+    if not removed:
+        return
+    removed_ids = {row['sequence_id'] for row in rows}
+    keys = list(removed)
+    stale = []
+    connection.execute(
+        update(THREADS).where(THREADS.c.id == bindparam('thread_id')).values(
+            message_count=THREADS.c.message_count - bindparam('removed')
+        ),
+        [{'thread_id': key, 'removed': count} for key, count in removed.items()]
+    )
+    for start in range(0, len(keys), CHUNK_SIZE):
+        chunk = keys[start:start + CHUNK_SIZE]
+        connection.execute(delete(THREADS).where(THREADS.c.id.in_(chunk), THREADS.c.message_count <= 0))
+        stale += [
+            key for key, last_sequence_id in connection.execute(
+                select(THREADS.c.id, THREADS.c.last_sequence_id).where(THREADS.c.id.in_(chunk))
+            ) if last_sequence_id in removed_ids
+        ]
+    if not stale:
+        return
+    tables = _live_tables(connection)
+    for key in stale:
+        newest = _newest_message(connection, tables, key)
+        if newest is None:
+            connection.execute(delete(THREADS).where(THREADS.c.id == key))
+        else:
+            summary = _summary(newest)
+            connection.execute(update(THREADS).where(THREADS.c.id == key).values(
+                **{name: summary[name] for name in LAST_COLUMNS}
+            ))
+
+# Session events: ORM inserts keep their threads current in the same flush
+
+def _before_flush(session, flush_context, instances):
+    for message in session.new:
+        if isinstance(message, Message) and message.thread_key is None:
+            message.thread_key = thread_key(message.source_device_id, message.sender, message.message_metadata)
+
+def _after_flush(session, flush_context):
+    rows = [
+        {
+            'id': message.id, 'sequence_id': message.sequence_id, 'thread_key': message.thread_key,
+            'source_device_id': message.source_device_id, 'sender': message.sender, 'type': message.type,
+            'content': message.content, 'timestamp': to_epoch_micros(message.timestamp),
+            'received_at': to_epoch_micros(message.received_at), 'message_metadata': message.message_metadata
+        }
+        for message in session.new if isinstance(message, Message)
+    ]
+    if rows:
+        add_to_threads(session.connection(), rows)
+
+def init_threads():
+    """Maintain threads for messages added through db.session (any process using the app)"""
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+        event.listen(db.session, 'after_flush', _after_flush)
+
+# Reading
+
+def encode_cursor(thread):
+    return f'{to_epoch_micros(thread.last_activity)}.{thread.id}'
+
+def decode_cursor(cursor):
+    """(last_activity micros, id) from encode_cursor(); raises ValueError"""
+    micros, _, key = cursor.partition('.')
+    if not key:
+        raise ValueError(cursor)
+    return int(micros), key
+
+def list_threads(limit, before=None, device=None):
+    """
+    Threads by last activity, newest first, after the keyset cursor before
+    ((last_activity micros, id), see decode_cursor); one index range scan
+    """
+    query = select(Thread)
+    if device:
+        query = query.where(Thread.source_device_id == device)
+    if before is not None:
+        last_activity, key = before
+        query = query.where(or_(
+            Thread.last_activity < last_activity,
+            and_(Thread.last_activity == last_activity, Thread.id < key)
+        ))
+    query = query.order_by(Thread.last_activity.desc(), Thread.id.desc()).limit(limit)
+    return db.session.execute(query).scalars().all()
+
+def _newest_sequence_id(table):
+    return db.session.execute(select(func.max(table.c.sequence_id))).scalar()
+
+def thread_unread_counts(threads, state):
+    """
+    {thread id: unread count} for a read state (services.read_state.ReadSet)
+    Without unread exceptions nothing at or below the watermark is unread, so
+    only threads (and partitions) with messages above it are counted.
+    """
+    counts = {thread.id: 0 for thread in threads}
+    keys = [thread.id for thread in threads if state.unread_below or thread.last_sequence_id > state.watermark]
+    if not keys:
+        return counts
+    tables = [HOT_TABLE]
+    for partition in catalog():
+        table = partition_table(partition.name)
+        if state.unread_below or (_newest_sequence_id(table) or 0) > state.watermark:
+            tables.append(table)
+    for table in tables:
+        for start in range(0, len(keys), CHUNK_SIZE):
+            statement = select(table.c.thread_key, func.count()).where(
+                table.c.thread_key.in_(keys[start:start + CHUNK_SIZE]),
+                state.unread_clause(table.c.sequence_id)
+            ).group_by(table.c.thread_key)
+            for key, count in db.session.execute(statement):
+                counts[key] += count
+    return counts
+
+# Rebuilding (migration, seeding, and `flask threads rebuild`)
+
+def _backfill_keys(connection, table, partition_name, batch_size):
+    """Set thread_key on a table's messages that have none; returns how many"""
+    catalog_table = MessagePartition.__table__
+    if partition_name:
+        # Sealed partitions are read-only unless their catalog entry says otherwise
+        writable = connection.execute(
+            select(catalog_table.c.writable).where(catalog_table.c.name == partition_name)
+        ).scalar()
+        connection.execute(update(catalog_table).where(catalog_table.c.name == partition_name).values(writable=True))
+    filled = 0
+    last_sequence_id = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.sequence_id, table.c.source_device_id, table.c.sender, table.c.message_metadata)
+            .where(table.c.sequence_id > last_sequence_id, table.c.thread_key.is_(None))
+            .order_by(table.c.sequence_id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            update(table).where(table.c.sequence_id == bindparam('row_sequence_id')).values(
+                thread_key=bindparam('row_thread_key')
+            ),
+            [{'row_sequence_id': sequence_id, 'row_thread_key': thread_key(device, sender, metadata)}
+             for sequence_id, device, sender, metadata in rows]
+        )
+        filled += len(rows)
+        last_sequence_id = rows[-1].sequence_id
+    if partition_name:
+        connection.execute(update(catalog_table).where(catalog_table.c.name == partition_name).values(
+            writable=writable
+        ))
+    return filled
+
+def rebuild_threads(connection, batch_size=10_000):
+    """
+    Recompute every thread from the live messages, first giving messages
+    stored without a thread_key (bulk loads, older databases) theirs
+    Returns (keys filled in, threads).
+    """
+    names = connection.execute(select(MessagePartition.__table__.c.name)).scalars().all()
+    filled = _backfill_keys(connection, HOT_TABLE, None, batch_size)
+    for name in names:
+        filled += _backfill_keys(connection, partition_table(name), name, batch_size)
+
+    # Counts and first arrival per thread, then each thread's last message by primary key
+    partial = []
+    for table in _live_tables(connection):
+        partial += [
+            {'id': key, 'message_count': count, 'first_received_at': first, 'last_sequence_id': last}
+            for key, count, first, last in connection.execute(
+                select(table.c.thread_key, func.count(), func.min(type_coerce(table.c.received_at, BigInteger)),
+                       func.max(table.c.sequence_id)).group_by(table.c.thread_key)
+            ) if key is not None
+        ]
+    threads = {}
+    for entry in partial:
+        current = threads.setdefault(entry['id'], dict(entry, message_count=0))
+        current['message_count'] += entry['message_count']
+        current['first_received_at'] = min(current['first_received_at'], entry['first_received_at'])
+        current['last_sequence_id'] = max(current['last_sequence_id'], entry['last_sequence_id'])
+
+    connection.execute(delete(THREADS))
+    last_ids = sorted(thread['last_sequence_id'] for thread in threads.values())
+    for table in _live_tables(connection):
+        for start in range(0, len(last_ids), CHUNK_SIZE):
+            rows = connection.execute(select(*_summary_columns(table)).where(
+                table.c.sequence_id.in_(last_ids[start:start + CHUNK_SIZE])
+            )).all()
+            if not rows:
+                continue
+            summaries = []
+            for row in rows:
+                summary = _summary(row._asdict())
+                thread = threads[summary['id']]
+                summary.update(message_count=thread['message_count'], first_received_at=thread['first_received_at'])
+                summaries.append(summary)
+            connection.execute(THREADS.insert(), summaries)
+    return filled, len(threads)
+
+threads_cli = AppGroup('threads', help='Conversation index')
+
+@threads_cli.command('rebuild')
+@with_appcontext
+def rebuild_command():
+    """Recompute the threads table from the live messages"""
+    with db.engine.begin() as connection:
+        filled, count = rebuild_threads(connection)
+    click.echo(f"Rebuilt {count} threads ({filled} messages given a thread key)")
@@ -0,0 +1,145 @@
+"""
+Message write versions shared by every worker
+
+A small file next to the database holds a change count, a reload generation
+and a ring of counters hashed by device and by message type. Each worker maps
+it into memory, so reading a version needs no syscall and no SQL.
+
+Every commit that touches messages bumps the change count, and the counters of
+the devices and types it touched. Updates and deletes also bump the
+generation. ORM commits are published through session events. Bulk Core
+writes (purge, archiver) call publish_change themselves. The hot tail and the
+result cache read these versions to stay coherent across gunicorn workers.
+"""
+
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+
+from flask import current_app
+from sqlalchemy import event
+
+from models import db, Message
+from models.types import to_epoch_micros
+
+# change count, reload generation
+HEADER = struct.Struct('<QQ')
+COUNTER = struct.Struct('<Q')
+SLOTS = 4096
+STATE_SIZE = HEADER.size + SLOTS * COUNTER.size
+
+_listeners = []
+
+def _slot_offset(kind, value):
+    return HEADER.size + zlib.crc32(f'{kind}:{value}'.encode()) % SLOTS * COUNTER.size
+
+def _state_path():
+    database = db.engine.url.database if db.engine.url.get_backend_name() == 'sqlite' else None
+    if database and database != ':memory:':
+        return f'{database}-versions'
+    os.makedirs(current_app.instance_path, exist_ok=True)
+    return os.path.join(current_app.instance_path, 'message_versions')
+
+class WriteVersions:
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < STATE_SIZE:
+            os.ftruncate(self.fd, STATE_SIZE)
+        self.state = mmap.mmap(self.fd, STATE_SIZE)
+
+    def read(self):
+        """(change count, reload generation)"""
+        return HEADER.unpack_from(self.state)
+
+    def version(self, kind, value):
+        """Counter for a device or type; distinct keys may share one, which only costs extra misses"""
+        return COUNTER.unpack_from(self.state, _slot_offset(kind, value))[0]
+
+    def bump(self, keys, reload):
+        """Bump the change count and the given (kind, value) counters; returns the versions before"""
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            change, generation = HEADER.unpack_from(self.state)
+            HEADER.pack_into(self.state, 0, change + 1, generation + bool(reload))
+            for offset in {_slot_offset(kind, value) for kind, value in keys}:
+                COUNTER.pack_into(self.state, offset, COUNTER.unpack_from(self.state, offset)[0] + 1)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return change, generation
+
+    def bump_key(self, kind, value):
+        """Bump one (kind, value) counter alone, without announcing a message change"""
+        offset = _slot_offset(kind, value)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            COUNTER.pack_into(self.state, offset, COUNTER.unpack_from(self.state, offset)[0] + 1)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+def write_versions():
+    versions = current_app.extensions.get('message_versions')
+    if versions is None:
+        versions = current_app.extensions.setdefault('message_versions', WriteVersions(_state_path()))
+    return versions
+
+def message_keys(device, message_type):
+    return [('device', device), ('type', message_type)]
+
+def on_publish(listener):
+    """Call listener(versions_before, new_rows, reload) after every publish in this process"""
+    _listeners.append(listener)
+
+def publish_change(new_rows=(), keys=(), reload=False):
+    """
+    Announce a committed message write to every worker
+    new_rows are inserted messages as Message.serialized_columns() tuples;
+    keys are (kind, value) pairs of updated or deleted messages, which also
+    need reload=True.
+    """
+    keys = set(keys)
+    for row in new_rows:
+        keys.update(message_keys(row[2], row[3]))
+    before = write_versions().bump(keys, reload)
+    for listener in _listeners:
+        listener(before, new_rows, reload)
+
+def _message_row(message):
+    return (
+        message.id, message.sequence_id, message.source_device_id, message.type, message.sender,
+        message.content, to_epoch_micros(message.timestamp), to_epoch_micros(message.received_at),
+        message.message_metadata, message.is_read
+    )
+
+def _after_flush(session, flush_context):
+    new_rows = [_message_row(message) for message in session.new if isinstance(message, Message)]
+    changed = [
+        message for message in session.dirty
+        if isinstance(message, Message) and session.is_modified(message)
+    ] + [message for message in session.deleted if isinstance(message, Message)]
+    if new_rows or changed:
+        changes = session.info.setdefault('message_changes', {'new_rows': [], 'keys': set()})
+        changes['new_rows'].extend(new_rows)
+        for message in changed:
+            changes['keys'].update(message_keys(message.source_device_id, message.type))
+
+def record_change(session, keys):
+    """Publish an update or delete made with a Core statement in session when it commits"""
+    changes = session.info.setdefault('message_changes', {'new_rows': [], 'keys': set()})
+    changes['keys'].update(keys)
+
+def _after_commit(session):
+    changes = session.info.pop('message_changes', None)
+    if changes:
+        publish_change(changes['new_rows'], changes['keys'], reload=bool(changes['keys']))
+
+def _after_rollback(session):
+    session.info.pop('message_changes', None)
+
+def init_write_versions():
+    """Publish ORM message changes made through db.session (any process using the app)"""
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
@@ -6,7 +6,7 @@ Run this after starting the server to test functionality
 
 import requests
 import json
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 # Configuration
 BASE_URL = "http://127.0.0.1:5001"
@@ -78,6 +78,150 @@ def test_create_message():
     print()
     return None
 
+def test_create_batch():
+    """Test batch creation, and that resending a batch creates nothing"""
+    print("📦 Testing batch message creation...")
+    import uuid
+    messages = [{
+        "id": str(uuid.uuid4()),
+        "source_device_id": "test-device-1",
+        "type": "SMS",
+        "sender": "+1234567890",
+        "content": f"Batch message {i}",
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    } for i in range(3)]
+    
+    first = requests.post(f"{BASE_URL}/api/v1/messages/batch", json={"messages": messages})
+    print(f"Status: {first.status_code}, created {first.json().get('created')} (expected 3)")
+    retry = requests.post(f"{BASE_URL}/api/v1/messages/batch", json={"messages": messages})
+    print(f"Resent: {retry.status_code}, created {retry.json().get('created')}, "
+          f"existing {retry.json().get('existing')} (expected 0 and 3)")
+    print()
+
+def test_idempotent_create():
+    """Test that reposting a message returns the stored one instead of a copy"""
+    print("🔁 Testing idempotent message creation...")
+    import uuid
+    message_data = {
+        "client_message_id": str(uuid.uuid4()),
+        "source_device_id": "test-device-1",
+        "type": "SMS",
+        "sender": "+1234567890",
+        "content": "Posted twice, stored once",
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    
+    first = requests.post(f"{BASE_URL}/api/v1/messages", json=message_data)
+    retry = requests.post(f"{BASE_URL}/api/v1/messages", json=message_data)
+    print(f"Status: {first.status_code}, resent: {retry.status_code} (expected 201 and 200)")
+    assert first.status_code == 201 and retry.status_code == 200
+    assert retry.json()['id'] == first.json()['id']
+    print()
+
+def test_batch_dedup():
+    """Test that a message is stored once whether it comes through a batch or a single POST"""
+    print("🔁 Testing dedup across the batch and single endpoints...")
+    import uuid
+    def message(content):
+        return {
+            "client_message_id": str(uuid.uuid4()),
+            "source_device_id": "test-device-1",
+            "type": "SMS",
+            "sender": "+1234567890",
+            "content": content,
+            "timestamp": datetime.now(timezone.utc).isoformat()
+        }
+    batched, posted = message("Batch first, then single"), message("Single first, then batch")
+
+    batch = requests.post(f"{BASE_URL}/api/v1/messages/batch", json={"messages": [batched]})
+    single = requests.post(f"{BASE_URL}/api/v1/messages", json=batched)
+    print(f"Batch then single: {single.status_code} (expected 200)")
+    assert single.status_code == 200 and single.json()['id'] == batch.json()['ids'][0]
+
+    single = requests.post(f"{BASE_URL}/api/v1/messages", json=posted)
+    batch = requests.post(f"{BASE_URL}/api/v1/messages/batch", json={"messages": [posted, posted]})
+    print(f"Single then batch: created {batch.json()['created']}, existing {batch.json()['existing']} "
+          f"(expected 0 and 2)")
+    assert batch.json()['created'] == 0 and batch.json()['ids'] == [single.json()['id']] * 2
+    print()
+
+def test_coalesce_notifications():
+    """Test that a re-posted notification replaces the earlier one (COALESCE_WINDOW_SECONDS set)"""
+    print("🔀 Testing notification coalescing...")
+    import uuid
+    tag = f"chat-{uuid.uuid4()}"
+    ids = []
+    for count in (3, 4):
+        response = requests.post(f"{BASE_URL}/api/v1/messages", json={
+            "source_device_id": "test-device-1",
+            "type": "PUSH_NOTIFICATION",
+            "sender": "WhatsApp",
+            "content": f"{count} new messages",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "metadata": {"app_package": "com.whatsapp", "notification_tag": tag}
+        })
+        ids.append((response.status_code, response.json().get('id')))
+    if ids[1][0] == 201:
+        print("Skipped: coalescing is off (COALESCE_WINDOW_SECONDS=0)")
+        print()
+        return
+    print(f"Status: {ids[0][0]}, re-post: {ids[1][0]} (expected 201 and 200)")
+    assert ids[1] == (200, ids[0][1])
+    print()
+
+def test_coalesce_out_of_order():
+    """Test that an older re-post arriving late doesn't replace newer content"""
+    print("🔀 Testing out-of-order notification re-posts...")
+    import uuid
+    tag = f"chat-{uuid.uuid4()}"
+    now = datetime.now(timezone.utc)
+    responses = []
+    for count, age in ((3, 0), (2, 5)):
+        responses.append(requests.post(f"{BASE_URL}/api/v1/messages", json={
+            "source_device_id": "test-device-1",
+            "type": "PUSH_NOTIFICATION",
+            "sender": "WhatsApp",
+            "content": f"{count} new messages",
+            "timestamp": (now - timedelta(seconds=age)).isoformat(),
+            "metadata": {"app_package": "com.whatsapp", "notification_tag": tag}
+        }))
+    if responses[1].status_code == 201:
+        print("Skipped: coalescing is off (COALESCE_WINDOW_SECONDS=0)")
+        print()
+        return
+    stored = requests.get(f"{BASE_URL}/api/v1/messages/{responses[0].json()['id']}").json()
+    print(f"Late older re-post: {responses[1].status_code} {responses[1].json()['message']}")
+    print(f"Stored content: {stored['content']!r} (expected '3 new messages')")
+    assert responses[1].json()['id'] == responses[0].json()['id']
+    assert stored['content'] == "3 new messages"
+    print()
+
+def test_api_key_auth(api_key):
+    """Test posting with the device's API key"""
+    print("🔑 Testing API key authentication...")
+    if api_key is None:
+        print("Skipped: the device was already registered, so its key is not known")
+        print()
+        return
+    message_data = {
+        "source_device_id": "test-device-1",
+        "type": "SMS",
+        "sender": "+1234567890",
+        "content": "Sent with the device's API key",
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    
+    response = requests.post(f"{BASE_URL}/api/v1/messages", json=message_data,
+                             headers={"X-API-Key": api_key})
+    print(f"Valid key status: {response.status_code}")
+    assert response.status_code == 201
+    
+    response = requests.post(f"{BASE_URL}/api/v1/messages", json=message_data,
+                             headers={"X-API-Key": "dev-key-not-a-real-key"})
+    print(f"Invalid key status: {response.status_code}")
+    assert response.status_code == 401
+    print()
+
 def test_list_messages():
     """Test listing messages"""
     print("📝 Testing message list...")
@@ -113,6 +257,30 @@ def test_mark_read(message_id):
     print(f"Response: {response.json()}")
     print()
 
+def test_per_client_read_state(message_id):
+    """Test that read state is kept per client"""
+    if not message_id:
+        print("⚠️  Skipping per-client read state test (no message ID)")
+        return
+        
+    print("👥 Testing per-client read state...")
+    phone = {'X-Client-Id': 'test-phone'}
+    laptop = {'X-Client-Id': 'test-laptop'}
+    response = requests.put(f"{BASE_URL}/api/v1/messages/{message_id}/read", headers=phone)
+    print(f"Mark read as test-phone: {response.status_code}")
+    
+    phone_view = requests.get(f"{BASE_URL}/api/v1/messages/{message_id}", headers=phone).json()
+    laptop_view = requests.get(f"{BASE_URL}/api/v1/messages/{message_id}", headers=laptop).json()
+    print(f"is_read for test-phone: {phone_view.get('is_read')} (expected True)")
+    print(f"is_read for test-laptop: {laptop_view.get('is_read')} (expected False)")
+    
+    response = requests.put(f"{BASE_URL}/api/v1/messages/{message_id}/unread", headers=phone)
+    print(f"Mark unread as test-phone: {response.status_code}")
+    
+    data = requests.get(f"{BASE_URL}/api/v1/read-state", headers=laptop).json()
+    print(f"test-laptop read state: watermark {data.get('watermark')}, {data.get('unread_count')} unread")
+    print()
+
 def test_message_filtering():
     """Test message filtering"""
     print("🔎 Testing message filtering...")
@@ -131,6 +299,84 @@ def test_message_filtering():
     print(f"Page 1 (limit 2): {len(data.get('messages', []))} messages, has_more: {data.get('has_more', False)}")
     print()
 
+def test_search_messages():
+    """Test message search (live and archived messages)"""
+    print("🔍 Testing message search...")
+    
+    response = requests.get(f"{BASE_URL}/api/v1/messages/search?q=hello")
+    data = response.json()
+    print(f"Status: {response.status_code}")
+    print(f"Matches for 'hello': {data.get('returned', 0)} ({data.get('archived_returned', 0)} archived)")
+    
+    # Missing query is rejected
+    response = requests.get(f"{BASE_URL}/api/v1/messages/search")
+    print(f"Search without q: {response.status_code} (expected 400)")
+    print()
+
+def test_export_messages():
+    """Test the streaming export, followed chunk by chunk"""
+    print("📤 Testing message export...")
+    
+    total = requests.get(f"{BASE_URL}/api/v1/sync/status").json()['total_messages']
+    params = {'format': 'ndjson', 'limit': max(total // 3, 1)}
+    lines, chunks = [], 0
+    while True:
+        response = requests.get(f"{BASE_URL}/api/v1/messages/export", params=params, stream=True)
+        lines.extend(line for line in response.iter_lines() if line)
+        chunks += 1
+        next_since = response.headers.get('X-Export-Next')
+        if not next_since:
+            break
+        params['since'] = next_since
+    ids = [json.loads(line)['id'] for line in lines]
+    print(f"Exported {len(ids)} of {total} messages in {chunks} chunks, {len(set(ids))} distinct")
+    
+    # Unknown formats are rejected
+    response = requests.get(f"{BASE_URL}/api/v1/messages/export?format=xml")
+    print(f"Export as xml: {response.status_code} (expected 400)")
+    print()
+
+def test_threads():
+    """Test the conversation index: a thread's summary, its messages, and keyset paging"""
+    print("💬 Testing conversation threads...")
+    import uuid
+    thread_id = f"thread-{uuid.uuid4()}"
+    for i in range(3):
+        requests.post(f"{BASE_URL}/api/v1/messages", json={
+            "source_device_id": "test-device-1",
+            "type": "SMS",
+            "sender": f"+155500000{i}",
+            "content": f"Group message {i}",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "metadata": {"thread_id": thread_id}
+        })
+    
+    # The thread just posted to has the newest activity
+    response = requests.get(f"{BASE_URL}/api/v1/threads", params={"limit": 1, "device": "test-device-1"})
+    data = response.json()
+    thread = data['threads'][0]
+    print(f"Status: {response.status_code}, newest thread {thread['thread_id']}: "
+          f"{thread['message_count']} messages, {thread['unread_count']} unread")
+    assert thread['thread_id'] == thread_id and thread['message_count'] == 3
+    assert thread['last_message']['preview'] == "Group message 2"
+    
+    # Newest first, two at a time
+    response = requests.get(f"{BASE_URL}/api/v1/threads/{thread['id']}/messages", params={"limit": 2})
+    first = response.json()
+    response = requests.get(f"{BASE_URL}/api/v1/threads/{thread['id']}/messages",
+                            params={"limit": 2, "before": first['next_before']})
+    contents = [m['content'] for m in first['messages'] + response.json()['messages']]
+    print(f"Thread messages: {contents}")
+    assert contents == ["Group message 2", "Group message 1", "Group message 0"]
+    
+    # The next page of threads starts after the cursor
+    if data['next_before']:
+        response = requests.get(f"{BASE_URL}/api/v1/threads", params={"limit": 1, "before": data['next_before']})
+        assert response.json()['threads'][0]['id'] != thread['id']
+    response = requests.get(f"{BASE_URL}/api/v1/threads/unknown/messages")
+    print(f"Unknown thread: {response.status_code} (expected 404)")
+    print()
+
 def check_database_status():
     """Check if database has been initialized"""
     print("🔍 Checking database status...")
@@ -164,10 +410,20 @@ def main():
         
         # Message tests
         message_id = test_create_message()
+        test_create_batch()
+        test_idempotent_create()
+        test_batch_dedup()
+        test_coalesce_notifications()
+        test_coalesce_out_of_order()
+        test_api_key_auth(api_key)
         test_list_messages()
         test_get_message(message_id)
         test_mark_read(message_id)
+        test_per_client_read_state(message_id)
         test_message_filtering()
+        test_search_messages()
+        test_export_messages()
+        test_threads()
         
         print("✅ All tests completed successfully!")
         print("📝 Note: Test data is NOT deleted - it remains in the database")
@@ -3,9 +3,12 @@
 Test script for Message Hub CLI functionality
 """
 
+import json
+import requests
 import subprocess
 import sys
 import os
+import tempfile
 import time
 
 def run_cli_command(command, capture_output=True):
@@ -111,6 +114,151 @@ def test_cli_sync():
         print(f"❌ Sync command failed: {stderr}")
         return False
 
+def test_cli_watch():
+    """Test that watch shows a message posted while it runs, once"""
+    print("👀 Testing watch command...")
+    
+    watch = subprocess.Popen(
+        "python cli/main.py watch --duration 4 --interval 0.5",
+        shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    time.sleep(1.5)
+    content = f"watch test {time.time()}"
+    requests.post("http://127.0.0.1:5001/api/v1/messages", json={
+        "source_device_id": "cli-test", "type": "SMS", "sender": "test",
+        "content": content, "timestamp": "2024-01-01T00:00:00Z"
+    }, timeout=10)
+    stdout, stderr = watch.communicate(timeout=30)
+    if watch.returncode == 0 and stdout.count(content) == 1:
+        print("✅ Watch command working")
+        return True
+    else:
+        print(f"❌ Watch command failed: {stderr or stdout[-200:]}")
+        return False
+
+def test_cli_watch_batch():
+    """Test that watch shows every message of a batch larger than its page"""
+    print("👀 Testing watch with a 500-message batch...")
+    
+    device = f"cli-watch-batch-{int(time.time() * 1000)}"
+    watch = subprocess.Popen(
+        f"python cli/main.py watch --device {device} --duration 5 --interval 0.5",
+        shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    time.sleep(1.5)
+    requests.post("http://127.0.0.1:5001/api/v1/messages/batch", json={"messages": [{
+        "source_device_id": device, "type": "SMS", "sender": "test",
+        "content": f"watch batch {i:03d}.", "timestamp": "2024-01-01T00:00:00Z"
+    } for i in range(500)]}, timeout=30)
+    stdout, stderr = watch.communicate(timeout=30)
+    shown = sum(stdout.count(f"watch batch {i:03d}.") == 1 for i in range(500))
+    if watch.returncode == 0 and shown == 500:
+        print("✅ Watch showed the whole batch")
+        return True
+    else:
+        print(f"❌ Watch showed {shown} of 500 batch messages: {stderr[-200:]}")
+        return False
+
+def test_cli_mirror():
+    """Test that the local mirror answers like the server (in a throwaway HOME)"""
+    print("📦 Testing local mirror...")
+    
+    env = dict(os.environ, HOME=tempfile.mkdtemp(prefix="message-hub-cli-test-"))
+    def run(command):
+        result = subprocess.run(f"python cli/main.py {command}", shell=True, capture_output=True,
+                                text=True, timeout=120, env=env)
+        return result.returncode, result.stdout
+    
+    code, _ = run("mirror enable")
+    if code != 0:
+        print("❌ Mirror enable failed")
+        return False
+    local = run("messages --limit 5")[1]
+    remote = run("messages --limit 5 --remote")[1]
+    run("mirror disable --delete")
+    if local == remote:
+        print("✅ Mirror answers match the server")
+        return True
+    else:
+        print(f"❌ Mirror and server differ:\n{local}\n{remote}")
+        return False
+
+def test_cli_full_sync():
+    """Test that sync --full fetches every message into the mirror, and a second run nothing"""
+    print("🔄 Testing full sync...")
+    
+    env = dict(os.environ, HOME=tempfile.mkdtemp(prefix="message-hub-cli-test-"))
+    def run(command):
+        result = subprocess.run(f"python cli/main.py {command}", shell=True, capture_output=True,
+                                text=True, timeout=300, env=env)
+        return result.returncode, result.stdout + result.stderr
+    
+    code, first = run("sync --full --workers 3")
+    total = requests.get("http://127.0.0.1:5001/api/v1/sync/status", timeout=10).json()['total_messages']
+    second = run("sync --full --workers 3")[1]
+    run("mirror disable --delete")
+    if code == 0 and f"Mirror holds {total:,} messages" in first and "✅ 0 new messages" in second:
+        print(f"✅ Full sync working: {total} messages")
+        return True
+    else:
+        print(f"❌ Full sync failed:\n{first[-300:]}\n{second[-300:]}")
+        return False
+
+def test_cli_export():
+    """Test that export writes every message, as NDJSON and as gzipped CSV"""
+    print("📤 Testing export...")
+    
+    import gzip
+    directory = tempfile.mkdtemp(prefix="message-hub-cli-test-")
+    ndjson_path = os.path.join(directory, "messages.ndjson")
+    csv_path = os.path.join(directory, "messages.csv.gz")
+    code, _, stderr = run_cli_command(f"export -o {ndjson_path}")
+    code_csv, _, stderr_csv = run_cli_command(f"export --format csv --gzip -o {csv_path}")
+    if code != 0 or code_csv != 0:
+        print(f"❌ Export failed: {stderr or stderr_csv}")
+        return False
+    
+    total = requests.get("http://127.0.0.1:5001/api/v1/sync/status", timeout=10).json()['total_messages']
+    with open(ndjson_path) as f:
+        ndjson_rows = sum(1 for _ in f)
+    with gzip.open(csv_path, 'rt') as f:
+        csv_lines = f.read().splitlines()
+    if ndjson_rows == total and csv_lines[0].startswith("id,") and len(csv_lines) - 1 >= total:
+        print(f"✅ Export working: {total} messages")
+        return True
+    else:
+        print(f"❌ Export wrote {ndjson_rows} NDJSON / {len(csv_lines) - 1} CSV lines for {total} messages")
+        return False
+
+def test_cli_import():
+    """Test that import creates every message, and that importing its export again adds none"""
+    print("📥 Testing import...")
+    
+    directory = tempfile.mkdtemp(prefix="message-hub-cli-test-")
+    path = os.path.join(directory, "dump.ndjson")
+    with open(path, "w") as f:
+        for i in range(1200):
+            f.write(json.dumps({"source_device": "import-test", "type": "SMS", "sender": "+1555",
+                                "content": f"Imported message {i}", "timestamp": "2023-05-01T12:00:00Z"}) + "\n")
+    status_url = "http://127.0.0.1:5001/api/v1/sync/status"
+    before = requests.get(status_url, timeout=10).json()['total_messages']
+    
+    code, _, stderr = run_cli_command(f"import {path} --batch-size 100")
+    after = requests.get(status_url, timeout=10).json()['total_messages']
+    
+    # Exported messages keep their IDs, so importing them again adds nothing
+    exported = os.path.join(directory, "export.ndjson")
+    run_cli_command(f"export --device import-test -o {exported}")
+    code_again, _, stderr_again = run_cli_command(f"import {exported}")
+    again = requests.get(status_url, timeout=10).json()['total_messages']
+    if code == 0 and code_again == 0 and after - before == 1200 and again == after \
+            and not os.path.exists(f"{path}.import-checkpoint"):
+        print("✅ Import working: 1200 messages, none twice")
+        return True
+    else:
+        print(f"❌ Import added {after - before} then {again - after}: {stderr[-200:]} {stderr_again[-200:]}")
+        return False
+
 def test_cli_config():
     """Test CLI configuration"""
     print("⚙️  Testing configuration...")
@@ -126,6 +274,26 @@ def test_cli_config():
         print(f"❌ Config show failed: {stderr}")
         return False
 
+def test_cli_bench():
+    """Test the open-loop load generator against the local stand-in server"""
+    print("📈 Testing bench command...")
+    
+    code, stdout, stderr = run_cli_command("bench --local --rate 20 --duration 2 --warmup 0 --seed 1 --json")
+    if code != 0:
+        print(f"❌ Bench command failed: {stderr}")
+        return False
+    try:
+        results = json.loads(stdout)
+    except ValueError:
+        print(f"❌ Bench output is not JSON: {stdout[:200]}")
+        return False
+    overall = results['requests']['all']
+    if overall['count'] > 0 and overall['errors'] == 0 and overall['p99.9_ms'] >= overall['p50_ms']:
+        print(f"✅ Bench working: {overall['count']} requests, p99 {overall['p99_ms']} ms")
+        return True
+    print(f"❌ Unexpected bench results: {overall}")
+    return False
+
 def test_executable():
     """Test the message-hub executable"""
     print("🚀 Testing message-hub executable...")
@@ -157,6 +325,11 @@ def run_interactive_demo():
     print("  ./message-hub messages --verbose --limit 3")
     print("  ./message-hub messages --type SMS")
     print("  ./message-hub sync")
+    print("  ./message-hub sync --full")
+    print("  ./message-hub watch")
+    print("  ./message-hub mirror enable")
+    print("  ./message-hub export --format csv --gzip -o messages.csv.gz")
+    print("  ./message-hub import messages.ndjson")
     print("  ./message-hub config-show")
     print()
 
@@ -179,7 +352,14 @@ def main():
         test_cli_messages_verbose,
         test_cli_messages_filtered,
         test_cli_sync,
+        test_cli_watch,
+        test_cli_watch_batch,
+        test_cli_mirror,
+        test_cli_full_sync,
+        test_cli_export,
+        test_cli_import,
         test_cli_config,
+        test_cli_bench,
         test_executable
     ]
     
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test script for migrate_db.py
+Upgrades a database with the original (pre-migration) schema and checks the
+result. Runs on its own, no server needed.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+# The schema the first release created, before any migration existed
+BASELINE_SCHEMA = """
+CREATE TABLE messages (
+    id VARCHAR(36) NOT NULL,
+    source_device_id VARCHAR(255) NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    sender VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    timestamp DATETIME NOT NULL,
+    received_at DATETIME NOT NULL,
+    message_metadata JSON,
+    is_read BOOLEAN,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE INDEX ix_messages_received_at ON messages (received_at);
+CREATE INDEX ix_messages_timestamp ON messages (timestamp);
+CREATE INDEX ix_messages_type ON messages (type);
+CREATE INDEX ix_messages_source_device_id ON messages (source_device_id);
+CREATE TABLE devices (
+    id VARCHAR(255) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    api_key VARCHAR(255) NOT NULL,
+    last_sync_at DATETIME,
+    is_active BOOLEAN,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE (api_key)
+);
+"""
+
+# (id, sender, metadata, minute): two sender threads and one metadata thread
+BASELINE_MESSAGES = [
+    ('6f1c2f0e-0000-4000-8000-000000000001', 'Alice', '{}', 0),
+    ('6f1c2f0e-0000-4000-8000-000000000002', 'Bob', '{}', 1),
+    ('6f1c2f0e-0000-4000-8000-000000000003', 'Alice', '{}', 2),
+    ('6f1c2f0e-0000-4000-8000-000000000004', 'Carol', '{"thread_id": "family"}', 3),
+    ('6f1c2f0e-0000-4000-8000-000000000005', 'Dave', '{"thread_id": "family"}', 4),
+]
+
+def create_baseline_database(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(BASELINE_SCHEMA)
+    connection.execute(
+        "INSERT INTO devices VALUES ('phone', 'Phone', 'android', 'secret-key', NULL, 1, "
+        "'2024-01-01 00:00:00.000000', '2024-01-01 00:00:00.000000')"
+    )
+    for message_id, sender, metadata, minute in BASELINE_MESSAGES:
+        stamp = f'2024-01-01 12:{minute:02d}:00.000000'
+        connection.execute(
+            "INSERT INTO messages VALUES (?, 'phone', 'SMS', ?, ?, ?, ?, ?, 0, ?, ?)",
+            (message_id, sender, f'Message from {sender}', stamp, stamp, metadata, stamp, stamp)
+        )
+    connection.commit()
+    connection.close()
+
+def run_migrations(path):
+    """Run migrate_db.py against the database; returns (exit code, output)"""
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    result = subprocess.run(
+        [sys.executable, 'migrate_db.py'], env=env, capture_output=True, text=True, timeout=60,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return result.returncode, result.stdout + result.stderr
+
+def test_migrate_from_baseline(directory):
+    """Upgrading the original schema fills every thread key and builds the conversation index"""
+    print("🔄 Testing migration from the baseline schema...")
+    path = os.path.join(directory, 'baseline.db')
+    create_baseline_database(path)
+
+    code, output = run_migrations(path)
+    if code != 0:
+        print(f"❌ Migration failed: {output}")
+        return False
+
+    connection = sqlite3.connect(path)
+    total, keyed = connection.execute('SELECT COUNT(*), COUNT(thread_key) FROM messages').fetchone()
+    counts = sorted(row[0] for row in connection.execute('SELECT message_count FROM threads'))
+    hashed = connection.execute("SELECT api_key_hash != 'secret-key' FROM devices").fetchone()[0]
+    connection.close()
+
+    if total != len(BASELINE_MESSAGES) or keyed != total:
+        print(f"❌ {keyed} of {total} messages have a thread key")
+        return False
+    if counts != [1, 2, 2]:
+        print(f"❌ Expected threads of 1, 2 and 2 messages, got {counts}")
+        return False
+    if not hashed:
+        print("❌ Device API key was not hashed")
+        return False
+    print(f"✅ {total} messages migrated into {len(counts)} threads")
+    return True
+
+def test_migrate_is_idempotent(directory):
+    """A second run finds nothing to do"""
+    print("🔁 Testing that migrations can be re-run...")
+    path = os.path.join(directory, 'baseline.db')
+    code, output = run_migrations(path)
+    if code == 0 and 'Database schema is up to date' in output:
+        print("✅ Second run made no changes")
+        return True
+    print(f"❌ Second run was not a no-op: {output}")
+    return False
+
+def main():
+    print("🚀 Starting Message Hub Migration Tests")
+    print("=" * 50)
+
+    tests = [test_migrate_from_baseline, test_migrate_is_idempotent]
+    passed = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for test in tests:
+            try:
+                if test(directory):
+                    passed += 1
+                print()
+            except Exception as e:
+                print(f"❌ Test failed with exception: {e}")
+                print()
+
+    print("=" * 50)
+    print(f"📊 Test Results: {passed}/{len(tests)} tests passed")
+    if passed != len(tests):
+        sys.exit(1)
+    print("🎉 All migration tests passed!")
+
+if __name__ == "__main__":
+    main()
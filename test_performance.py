@@ -218,9 +218,28 @@ def test_concurrent_sync():
     print()
 
 def cleanup_test_data():
-    """Note: We don't have a delete API, so test data will remain"""
-    print("🧹 Note: Test data remains in database (no bulk delete API)")
-    print("   You can restart with a fresh database if needed")
+    """Purge the perf-device-* messages with the bulk delete API"""
+    print("🧹 Purging test data...")
+    
+    start_time = time.time()
+    response = requests.delete(f"{BASE_URL}/api/v1/messages?device=perf-device-*")
+    if response.status_code != 202:
+        print(f"    ❌ Purge failed to start: {response.status_code}")
+        print()
+        return
+    
+    # Poll the purge job until it finishes
+    status_url = f"{BASE_URL}{response.json()['status_url']}"
+    job = response.json()['job']
+    while job['status'] in ('pending', 'running'):
+        time.sleep(0.2)
+        job = requests.get(status_url).json()
+    
+    if job['status'] == 'completed':
+        deleted = job['result']['deleted'] + job['result']['archived_deleted']
+        print(f"    ✅ Deleted {deleted} messages in {time.time() - start_time:.2f}s")
+    else:
+        print(f"    ❌ Purge failed: {job['error']}")
     print()
 
 def main():
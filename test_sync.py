@@ -131,6 +131,61 @@ def test_overlapping_ranges():
                 print("✅ Overlapping ranges handled successfully")
     print()
 
+def test_sequence_ranges():
+    """Test that adjoining sequence ID ranges together return every message once"""
+    print("🔢 Testing sequence ID ranges...")
+    
+    status = requests.get(f"{BASE_URL}/api/v1/sync/status").json()
+    latest = status['latest_sequence_id']
+    middle = latest // 2
+    ids = []
+    for after, before in ((0, middle + 1), (middle, latest + 1)):
+        while True:
+            response = requests.get(f"{BASE_URL}/api/v1/sync/messages", params={
+                'after_sequence': after, 'before_sequence': before, 'limit': 1000, 'count': 'false'
+            })
+            data = response.json()
+            ids.extend(message['sequence_id'] for message in data['messages'])
+            if not data['has_more']:
+                break
+            after = data['last_sequence_id']
+    print(f"Ranges (0, {middle}] and ({middle}, {latest}]: {len(ids)} messages, total {status['total_messages']}")
+    if len(ids) == len(set(ids)) == status['total_messages'] and 'total_count' not in data:
+        print("✅ Sequence ranges cover every message once")
+    else:
+        print("❌ Sequence ranges missed or repeated messages")
+    print()
+
+def test_batch_paging():
+    """Test that paging a batch larger than the page returns every message once"""
+    print("📦 Testing sync paging through a batch...")
+    
+    device = f"sync-batch-{int(time.time() * 1000)}"
+    since = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    messages = [{
+        "source_device_id": device,
+        "type": "SMS",
+        "sender": "+1222222222",
+        "content": f"Sync batch message {i}",
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    } for i in range(100)]
+    created = requests.post(f"{BASE_URL}/api/v1/messages/batch", json={"messages": messages}).json()['ids']
+    
+    ids = []
+    params = {'since': since, 'device': device, 'limit': 30, 'count': 'false'}
+    while True:
+        data = requests.get(f"{BASE_URL}/api/v1/sync/messages", params=params).json()
+        ids.extend(message['id'] for message in data['messages'])
+        if not data['has_more']:
+            break
+        params.update(since=data['last_timestamp'], since_sequence=data['last_sequence_id'])
+    print(f"Batch of {len(created)}, paged 30 at a time: {len(ids)} messages")
+    if ids == created:
+        print("✅ Every batch message synced once, in order")
+    else:
+        print("❌ Paging skipped or repeated batch messages")
+    print()
+
 def test_invalid_timestamp():
     """Test sync with invalid timestamp format"""
     print("❌ Testing invalid timestamp handling...")
@@ -206,6 +261,12 @@ def main():
         # Test overlapping ranges
         test_overlapping_ranges()
         
+        # Test sequence ID ranges
+        test_sequence_ranges()
+        
+        # Test paging through a batch
+        test_batch_paging()
+        
         # Test error handling
         test_invalid_timestamp()
         
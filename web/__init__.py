@@ -2,4 +2,4 @@ from flask import Blueprint
 
 web = Blueprint('web', __name__, template_folder='../templates', static_folder='../static')
 
-from . import views
\ No newline at end of file
+from . import views, debug
\ No newline at end of file
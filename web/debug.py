@@ -0,0 +1,70 @@
+import functools
+import secrets
+from datetime import datetime
+
+from flask import Response, abort, current_app, jsonify, render_template, request
+
+from services.profiler import ProfileBusy, collapsed_stacks, hot_functions, profile_workers
+from services.query_log import query_log_path, read_query_log
+from . import web
+
+def debug_token_required(view):
+    """Debug pages need DEBUG_TOKEN as X-Debug-Token or ?token=; without one configured they don't exist"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config['DEBUG_TOKEN']
+        if not expected:
+            abort(404)
+        given = request.headers.get('X-Debug-Token') or request.args.get('token') or ''
+        if not secrets.compare_digest(given.encode(), expected.encode()):
+            abort(403)
+        return view(*args, **kwargs)
+    return wrapper
+
+@web.route('/debug/queries')
+@debug_token_required
+def debug_queries():
+    """Slow-query log: slow statements with their plans, and N+1 patterns"""
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    kind = request.args.get('kind') or None
+    entries = read_query_log(limit, kind)
+    if request.args.get('format') == 'json':
+        return jsonify({'entries': entries, 'enabled': current_app.config['SLOW_QUERY_MS'] > 0})
+    for entry in entries:
+        entry['at'] = datetime.fromtimestamp(entry['at'])
+    return render_template(
+        'debug_queries.html', entries=entries, kind=kind,
+        threshold_ms=current_app.config['SLOW_QUERY_MS'],
+        repeat_limit=current_app.config['QUERY_REPEAT_LIMIT'],
+        log_path=query_log_path(current_app), token=request.args.get('token')
+    )
+
+@web.route('/debug/profile')
+@debug_token_required
+def debug_profile():
+    """Sample the stacks of every worker serving requests for ?seconds=; collapsed stacks or ?format=table"""
+    seconds = request.args.get('seconds', 30, type=float)
+    if not 0 < seconds <= current_app.config['PROFILE_MAX_SECONDS']:
+        return jsonify({'error': f"seconds must be between 0 and {current_app.config['PROFILE_MAX_SECONDS']}"}), 400
+    interval = request.args.get('interval_ms', current_app.config['PROFILE_INTERVAL_MS'], type=float) / 1000
+    if not 0.001 <= interval <= 1:
+        return jsonify({'error': 'interval_ms must be between 1 and 1000'}), 400
+
+    try:
+        counts, workers, ticks = profile_workers(seconds, interval, request.args.get('threads') == 'all')
+    except ProfileBusy:
+        return jsonify({'error': 'Another profile is running'}), 409
+    except Exception as e:
+        current_app.logger.error(f"Error profiling workers: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+    if request.args.get('format') == 'table':
+        return jsonify({
+            'seconds': seconds,
+            'interval_ms': interval * 1000,
+            'workers': workers,
+            'ticks': ticks,
+            'endpoints': hot_functions(counts, request.args.get('top', 20, type=int))
+        })
+    return Response(collapsed_stacks(counts), mimetype='text/plain',
+                    headers={'X-Profile-Workers': str(workers), 'X-Profile-Ticks': str(ticks)})
@@ -1,58 +1,58 @@
 from flask import render_template, request, jsonify, flash, redirect, url_for
 from sqlalchemy import desc, func
 from datetime import datetime, timezone, timedelta
-from models import db, Message, Device
+from models import db, Message, Device, Thread
+from models.types import to_epoch_micros
+from services.partitions import (
+    MessageFilter, count_messages, find_message, latest_time, message_counts,
+    newest_messages, paginate_messages
+)
+from services.read_state import read_client, read_state, unread_counts, update_read_state
+from services.threads import decode_cursor, encode_cursor, list_threads, thread_unread_counts
 from . import web
 import requests
 import json
 
+@web.app_template_global()
+def is_read(message):
+    """Whether the viewing client has read a message (templates)"""
+    return read_state().is_read(message.sequence_id)
+
+def _count_by(counts, key_index):
+    """Collapse message_counts() to totals per device (0) or type (1)"""
+    totals = {}
+    for key, count in counts.items():
+        totals[key[key_index]] = totals.get(key[key_index], 0) + count
+    return totals
+
 @web.route('/')
 @web.route('/dashboard')
 def dashboard():
     """Dashboard showing message overview and statistics - mirrors CLI status command"""
     try:
-        # Get total message count
-        total_messages = db.session.query(func.count(Message.id)).scalar() or 0
-        
-        # Get unread message count
-        unread_count = db.session.query(func.count(Message.id)).filter(
-            Message.is_read == False
-        ).scalar() or 0
+        # Get total, unread, per-type and per-device counts in one pass
+        # (sealed partitions come from the catalog)
+        counts = message_counts()
+        total_messages = sum(counts.values())
+        unread_count = sum(unread_counts(read_state()).values())
         
         # Get recent messages (last 24 hours)
         last_24h = datetime.now(timezone.utc) - timedelta(hours=24)
-        recent_count = db.session.query(func.count(Message.id)).filter(
-            Message.timestamp >= last_24h
-        ).scalar() or 0
-        
-        # Get messages by type
-        type_stats = db.session.query(
-            Message.type,
-            func.count(Message.id).label('count')
-        ).group_by(Message.type).all()
-        
-        # Get messages by device (mirrors CLI device stats)
-        device_stats = db.session.query(
-            Message.source_device_id,
-            func.count(Message.id).label('count')
-        ).group_by(Message.source_device_id).all()
+        recent_count = count_messages(MessageFilter(timestamp_after=last_24h))
         
         # Get latest message timestamp
-        latest_message = db.session.query(Message).order_by(desc(Message.timestamp)).first()
-        latest_timestamp = latest_message.timestamp if latest_message else None
+        latest_timestamp = latest_time('timestamp')
         
         # Get recent messages for preview (mirrors CLI messages --limit 5)
-        recent_messages = db.session.query(Message).order_by(
-            desc(Message.timestamp)
-        ).limit(5).all()
+        recent_messages = newest_messages(MessageFilter(), limit=5)
         
         stats = {
             'total_messages': total_messages,
             'unread_count': unread_count,
             'recent_count': recent_count,
             'latest_timestamp': latest_timestamp,
-            'type_stats': {stat.type: stat.count for stat in type_stats},
-            'device_stats': {stat.source_device_id: stat.count for stat in device_stats}
+            'type_stats': _count_by(counts, 1),
+            'device_stats': _count_by(counts, 0)
         }
         
         return render_template('dashboard.html', 
@@ -72,47 +72,42 @@ def messages():
     message_type = request.args.get('type', '').strip()
     device = request.args.get('device', '').strip()
     unread_only = request.args.get('unread') == 'on'
+    thread_id = request.args.get('thread', '').strip()
     
     try:
-        # Build query
-        query = db.session.query(Message)
-        
-        # Apply filters (same logic as CLI)
-        if message_type:
-            query = query.filter(Message.type == message_type)
-        if device:
-            query = query.filter(Message.source_device_id == device)
-        if unread_only:
-            query = query.filter(Message.is_read == False)
-        
-        # Order by timestamp (newest first)
-        query = query.order_by(desc(Message.timestamp))
-        
-        # Paginate
-        pagination = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        # One conversation's messages when opened from the conversations view
+        thread = db.session.get(Thread, thread_id) if thread_id else None
+        
+        # Apply filters (same logic as CLI), routed across partitions
+        message_filter = MessageFilter(
+            device=device,
+            message_type=message_type,
+            unread_for=read_state() if unread_only else None,
+            thread=thread_id,
+            received_after=to_epoch_micros(thread.first_received_at) - 1 if thread else None
         )
         
+        # Paginate, newest timestamp first
+        pagination = paginate_messages(message_filter, page=page, per_page=per_page)
+        
         messages = pagination.items
         
         # Get filter options
-        message_types = db.session.query(Message.type).distinct().all()
-        message_types = [t[0] for t in message_types if t[0]]
-        
-        devices = db.session.query(Message.source_device_id).distinct().all()
-        devices = [d[0] for d in devices if d[0]]
+        counts = message_counts()
+        message_types = sorted({t for _, t in counts if t})
+        devices = sorted({d for d, _ in counts if d})
         
         return render_template('messages.html',
                              messages=messages,
                              pagination=pagination,
                              message_types=message_types,
                              devices=devices,
+                             thread=thread,
                              current_filters={
                                  'type': message_type,
                                  'device': device,
                                  'unread': unread_only,
+                                 'thread': thread_id,
                                  'limit': per_page
                              })
     
@@ -123,13 +118,50 @@ def messages():
                              pagination=None,
                              message_types=[],
                              devices=[],
+                             thread=None,
+                             current_filters={})
+
+@web.route('/conversations')
+def conversations():
+    """List conversations by last activity, newest first, from the threads index"""
+    per_page = int(request.args.get('limit', 20))
+    device = request.args.get('device', '').strip()
+    before = request.args.get('before', '').strip()
+    
+    try:
+        # Keyset pages: "Older" carries the last thread shown as the cursor
+        threads = list_threads(per_page + 1, before=decode_cursor(before) if before else None, device=device)
+        next_before = encode_cursor(threads[per_page - 1]) if len(threads) > per_page else None
+        threads = threads[:per_page]
+        unread = thread_unread_counts(threads, read_state())
+        
+        devices = sorted({d for d, _ in message_counts() if d})
+        
+        return render_template('conversations.html',
+                             threads=threads,
+                             unread=unread,
+                             next_before=next_before,
+                             devices=devices,
+                             current_filters={
+                                 'device': device,
+                                 'before': before,
+                                 'limit': per_page
+                             })
+    
+    except Exception as e:
+        flash(f'Error loading conversations: {str(e)}', 'error')
+        return render_template('conversations.html',
+                             threads=[],
+                             unread={},
+                             next_before=None,
+                             devices=[],
                              current_filters={})
 
 @web.route('/messages/<message_id>')
 def message_detail(message_id):
     """Show detailed message view"""
     try:
-        message = db.session.query(Message).filter(Message.id == message_id).first()
+        message, _ = find_message(message_id)
         if not message:
             flash('Message not found', 'error')
             return redirect(url_for('web.messages'))
@@ -144,12 +176,12 @@ def message_detail(message_id):
 def mark_read(message_id):
     """Mark message as read - mirrors CLI mark-read command"""
     try:
-        message = db.session.query(Message).filter(Message.id == message_id).first()
+        message, _ = find_message(message_id)
         if not message:
             return jsonify({'error': 'Message not found'}), 404
         
-        message.is_read = True
-        db.session.commit()
+        sequence_id = message.sequence_id
+        update_read_state(read_client(), lambda state: state.mark_read(sequence_id))
         
         # Return JSON for AJAX requests, redirect for form submissions
         if request.is_json or request.headers.get('Accept', '').startswith('application/json'):
@@ -170,21 +202,15 @@ def status():
     """Show server status and statistics - mirrors CLI status command"""
     try:
         # Get sync status (same as CLI)
-        total_messages = db.session.query(func.count(Message.id)).scalar() or 0
-        latest_message = db.session.query(Message).order_by(desc(Message.timestamp)).first()
-        latest_timestamp = latest_message.timestamp if latest_message else None
+        counts = message_counts()
+        total_messages = sum(counts.values())
+        latest_timestamp = latest_time('timestamp')
         
         # Get device stats (mirrors CLI status device stats)
-        device_stats = db.session.query(
-            Message.source_device_id,
-            func.count(Message.id).label('count')
-        ).group_by(Message.source_device_id).all()
+        device_stats = _count_by(counts, 0)
         
         # Get message type distribution
-        type_stats = db.session.query(
-            Message.type,
-            func.count(Message.id).label('count')
-        ).group_by(Message.type).all()
+        type_stats = _count_by(counts, 1)
         
         # Get recent activity (last 7 days)
         activity_data = []
@@ -193,10 +219,7 @@ def status():
             day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
             day_end = day_start + timedelta(days=1)
             
-            count = db.session.query(func.count(Message.id)).filter(
-                Message.timestamp >= day_start,
-                Message.timestamp < day_end
-            ).scalar() or 0
+            count = count_messages(MessageFilter(timestamp_after=day_start, timestamp_before=day_end))
             
             activity_data.append({
                 'date': day_start.strftime('%Y-%m-%d'),
@@ -209,8 +232,8 @@ def status():
             'healthy': True,
             'total_messages': total_messages,
             'latest_timestamp': latest_timestamp,
-            'device_stats': {stat.source_device_id: stat.count for stat in device_stats},
-            'type_stats': {stat.type: stat.count for stat in type_stats},
+            'device_stats': device_stats,
+            'type_stats': type_stats,
             'activity_data': activity_data
         }
         